@@ -0,0 +1,133 @@
+"""pytest-benchmark suite for the Lambda handlers.
+
+    python -m pytest benchmarks --benchmark-save=baseline
+    python -m pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:10%
+"""
+
+import pytest
+from conftest import (
+    RECORD_COUNTS,
+    cold_import_seconds,
+    load_lambda,
+    stream_payload,
+    transform_payload,
+)
+
+
+class StubFirehoseClient:
+    def put_record_batch(self, DeliveryStreamName, Records):
+        return {
+            "FailedPutCount": 0,
+            "RequestResponses": [{"RecordId": "id"} for _ in Records],
+        }
+
+
+class StubPaginator:
+    # ListTableBuckets returns at most 1000 buckets per page
+    def __init__(self, buckets, page_size=1000):
+        self.buckets = buckets
+        self.page_size = page_size
+
+    def paginate(self, **kwargs):
+        for start in range(0, max(len(self.buckets), 1), self.page_size):
+            yield {"tableBuckets": self.buckets[start : start + self.page_size]}
+
+
+class StubS3TablesClient:
+    def __init__(self, bucket_count=1):
+        self.buckets = [
+            {"name": f"bucket-{i}", "arn": f"arn:aws:s3tables:::bucket/bucket-{i}"}
+            for i in range(bucket_count)
+        ]
+
+    def create_table_bucket(self, name):
+        return {"arn": f"arn:aws:s3tables:::bucket/{name}"}
+
+    def create_namespace(self, tableBucketARN, namespace):
+        return {"namespace": namespace}
+
+    def create_table(self, **kwargs):
+        return {"tableArn": f"{kwargs['tableBucketARN']}/table/{kwargs['name']}"}
+
+    def list_table_buckets(self, **kwargs):
+        return {"tableBuckets": self.buckets}
+
+    def get_paginator(self, operation_name):
+        return StubPaginator(self.buckets)
+
+    def delete_table(self, **kwargs):
+        return {}
+
+    def delete_namespace(self, **kwargs):
+        return {}
+
+    def delete_table_bucket(self, **kwargs):
+        return {}
+
+
+def custom_resource_event(request_type, bucket_name):
+    return {
+        "RequestType": request_type,
+        "StackId": "arn:aws:cloudformation:us-east-1:000000000000:stack/benchmark/1",
+        "ResourceProperties": {
+            "table_bucket_name": bucket_name,
+            "table_name": "transactions",
+            "namespace": "analytics",
+        },
+    }
+
+
+@pytest.mark.parametrize("records", RECORD_COUNTS)
+def test_transform_handler(benchmark, monkeypatch, record_peak_memory, records):
+    transform = load_lambda("transform", monkeypatch)
+    event = transform_payload(records)
+    benchmark.extra_info["records"] = records
+    record_peak_memory(transform.handler, event, None)
+
+    result = benchmark(transform.handler, event, None)
+
+    assert len(result["records"]) == records
+
+
+@pytest.mark.parametrize("records", RECORD_COUNTS)
+def test_firehose_handler(benchmark, monkeypatch, record_peak_memory, records):
+    forwarder = load_lambda(
+        "firehose", monkeypatch, {"FIREHOSE_MAX_CONCURRENCY": "1"}
+    )
+    forwarder.firehose_client = StubFirehoseClient()
+    event = stream_payload(records)
+    benchmark.extra_info["records"] = records
+    record_peak_memory(forwarder.handler, event, None)
+
+    result = benchmark(forwarder.handler, event, None)
+
+    assert result["batchItemFailures"] == []
+
+
+@pytest.mark.parametrize("request_type", ["Create", "Delete"])
+@pytest.mark.parametrize("buckets", RECORD_COUNTS)
+def test_custom_resource_handler(
+    benchmark, monkeypatch, record_peak_memory, request_type, buckets
+):
+    # Without a function ARN, Delete pages through the table bucket listing, so
+    # it scales with the bucket count
+    custom_resource = load_lambda("custom_resource", monkeypatch)
+    client = StubS3TablesClient(buckets)
+    monkeypatch.setattr(custom_resource, "s3tables_client", client)
+    event = custom_resource_event(request_type, f"bucket-{buckets - 1}")
+    benchmark.extra_info["records"] = buckets
+    record_peak_memory(custom_resource.handler, event, None)
+
+    benchmark(custom_resource.handler, event, None)
+
+
+@pytest.mark.parametrize("name", ["transform", "firehose", "custom_resource"])
+def test_cold_import(benchmark, name):
+    import_seconds = []
+    benchmark.pedantic(
+        lambda: import_seconds.append(cold_import_seconds(name)),
+        rounds=5,
+        iterations=1,
+    )
+    # The timed value includes interpreter start; this is the module import alone
+    benchmark.extra_info["import_ms"] = min(import_seconds) * 1e3
@@ -0,0 +1,117 @@
+import importlib.util
+import os
+import subprocess
+import sys
+import tracemalloc
+from datetime import datetime, timezone
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+sys.path.append(os.path.join(PROJECT_ROOT, "scripts"))
+from generation_profiles import TransactionEventGenerator, get_profile
+from harness.events import (
+    StreamRecordBuilder,
+    kinesis_payload,
+    stream_event,
+    transform_event,
+)
+
+RECORD_COUNTS = [100, 1000, 10000]
+
+LAMBDA_ENVIRONMENT = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "FIREHOSE_DELIVERY_STREAM": "benchmark",
+    "DESTINATION_DATABASE": "benchmark",
+    "DESTINATION_TABLE": "transactions",
+    "DEBUG_SAMPLE_RATE": "0",
+}
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def stream_records(count, seed=0):
+    # Fixed-seed change events with updates and deletes mixed in
+    generator = TransactionEventGenerator(get_profile("cdc", seed))
+    builder = StreamRecordBuilder()
+    start_ms = int(START.timestamp() * 1000)
+    return [
+        builder.build(event_name, item, start_ms + index)
+        for index, (event_name, item) in enumerate(
+            generator.events(count, start_time=START)
+        )
+    ]
+
+
+def transform_payload(count):
+    return transform_event(
+        [
+            (str(index), int(START.timestamp() * 1000), kinesis_payload(record))
+            for index, record in enumerate(stream_records(count))
+        ]
+    )
+
+
+def stream_payload(count):
+    return stream_event(stream_records(count))
+
+
+def load_lambda(name, monkeypatch, environment=None):
+    for key, value in dict(LAMBDA_ENVIRONMENT, **(environment or {})).items():
+        monkeypatch.setenv(key, value)
+    path = os.path.join(PROJECT_ROOT, "lambda", name, "index.py")
+    spec = importlib.util.spec_from_file_location(f"{name}_index", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def cold_import_seconds(name):
+    # Imports the handler module in a fresh interpreter, as in a new container
+    script = (
+        "import importlib.util, sys, time\n"
+        f"sys.path.append({os.path.join(PROJECT_ROOT, 'lambda', 'shared', 'python')!r})\n"
+        "started = time.perf_counter()\n"
+        f"spec = importlib.util.spec_from_file_location('index', {os.path.join(PROJECT_ROOT, 'lambda', name, 'index.py')!r})\n"
+        "spec.loader.exec_module(importlib.util.module_from_spec(spec))\n"
+        "print(time.perf_counter() - started)\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        env=dict(os.environ, **LAMBDA_ENVIRONMENT),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def peak_traced_bytes(func, *args):
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_benchmark_update_json(config, benchmarks, output_json):
+    # Per-record latency, so runs with different payload sizes can be compared
+    for bench in output_json["benchmarks"]:
+        records = bench["extra_info"].get("records")
+        if records:
+            for stat in ("min", "mean", "median"):
+                bench["extra_info"][f"per_record_{stat}_us"] = (
+                    bench["stats"][stat] / records * 1e6
+                )
+
+
+@pytest.fixture
+def record_peak_memory(benchmark):
+    def record(func, *args):
+        benchmark.extra_info["peak_traced_bytes"] = peak_traced_bytes(func, *args)
+
+    return record
@@ -0,0 +1,81 @@
+"""Microbenchmark: shared DynamoDB-JSON decoder vs the original comprehension.
+
+    python benchmarks/decoder_bench.py --images 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from boto3.dynamodb.types import TypeSerializer
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+sys.path.append(os.path.join(PROJECT_ROOT, "scripts"))
+from create_sample_data import CreateSampleData
+from ddb_decoder import decode_image, load_decode_plan
+
+
+def build_images(count):
+    serializer = TypeSerializer()
+    start = datetime(2024, 1, 1)
+    images = []
+    for i in range(count):
+        transaction = CreateSampleData.generate_transaction(
+            start + timedelta(milliseconds=i * 37)
+        )
+        images.append({k: serializer.serialize(v) for k, v in transaction.items()})
+    return images
+
+
+def comprehension(images):
+    for new_image in images:
+        {k: list(v.values())[0] for k, v in new_image.items()}
+
+
+def shared_decoder(images, plan):
+    for new_image in images:
+        decode_image(new_image, plan)
+
+
+def best_of(repeat, func, *args):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    images = build_images(args.images)
+
+    start = time.perf_counter()
+    plan = load_decode_plan()
+    plan_seconds = time.perf_counter() - start
+
+    baseline = best_of(args.repeat, comprehension, images)
+    decoder = best_of(args.repeat, shared_decoder, images, plan)
+
+    print(f"images:                {args.images}")
+    print(f"decode plan build:     {plan_seconds * 1e3:.2f} ms (once per container)")
+    print(
+        f"comprehension:         {baseline:.3f} s "
+        f"({baseline / args.images * 1e6:.2f} us/image, untyped strings)"
+    )
+    print(
+        f"shared decoder:        {decoder:.3f} s "
+        f"({decoder / args.images * 1e6:.2f} us/image, Iceberg-typed values)"
+    )
+    print(f"speedup:               {baseline / decoder:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Microbenchmark: KPL aggregation of the Kinesis change records.
+
+Compares single-record PUTs with KPL aggregation for change records generated
+with the cdc profile. For each it reports the Kinesis records and PUT payload
+units per million rows, the rows/sec one shard accepts under its write limits,
+and the transform invocations per million rows under the deployment profile's
+processor buffer. It also times aggregation (producer) and de-aggregation
+(what Firehose does) per row.
+
+    python benchmarks/kpl_bench.py --rows 100000 --max-bytes 51200
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+sys.path.append(os.path.join(PROJECT_ROOT, "scripts"))
+from generation_profiles import get_profile
+from harness.buffering import MIB, Buffer
+from kinesis_producer import DEFAULT_MAX_BYTES, ShardAggregator, change_records
+from kpl import deaggregate
+from stack.kinesis_capacity import (
+    SHARD_WRITE_BYTES_PER_SECOND,
+    SHARD_WRITE_RECORDS_PER_SECOND,
+)
+from stack.profiles import get_deployment_profile
+
+# Kinesis bills PUTs in 25 KB payload units, rounded up per record
+PUT_PAYLOAD_UNIT_BYTES = 25 * 1024
+
+# A single shard covering the whole hash key range
+ONE_SHARD = [{"HashKeyRange": {"StartingHashKey": "0"}}]
+
+
+def single_records(records):
+    return [{"Data": data, "PartitionKey": key} for key, data in records]
+
+
+def aggregated_records(records, max_bytes):
+    aggregator = ShardAggregator(ONE_SHARD, max_bytes)
+    entries = []
+    for partition_key, data in records:
+        entry = aggregator.add(partition_key, data)
+        if entry:
+            entries.append(entry)
+    entries.extend(aggregator.flush())
+    return entries
+
+
+def transform_invocations(payload_sizes, rows_per_second, deployment_profile):
+    # Firehose fills the processor buffer with de-aggregated records, so only
+    # the arrival rate can change how often the interval flushes it first
+    buffer = Buffer(
+        deployment_profile.processor_buffer_size_mb * MIB,
+        deployment_profile.processor_buffer_interval_seconds,
+    )
+    invocations = 0
+    for index, size in enumerate(payload_sizes):
+        now_ms = int(index * 1000 / rows_per_second)
+        if buffer.expired(now_ms):
+            buffer.flush()
+            invocations += 1
+        if buffer.add(None, size, now_ms):
+            invocations += 1
+    return invocations + (1 if buffer.records else 0)
+
+
+def report(name, entries, rows, payload_sizes, deployment_profile):
+    sizes = [len(entry["Data"]) + len(entry["PartitionKey"]) for entry in entries]
+    rows_per_record = rows / len(entries)
+    bytes_per_row = sum(sizes) / rows
+    shard_rows_per_second = min(
+        SHARD_WRITE_RECORDS_PER_SECOND * rows_per_record,
+        SHARD_WRITE_BYTES_PER_SECOND / bytes_per_row,
+    )
+    per_million = 1_000_000 / rows
+    units = sum(math.ceil(size / PUT_PAYLOAD_UNIT_BYTES) for size in sizes)
+    invocations = transform_invocations(
+        payload_sizes, shard_rows_per_second, deployment_profile
+    )
+    print(f"{name}:")
+    print(f"  Kinesis records per 1M rows:        {len(entries) * per_million:,.0f}")
+    print(f"  PUT payload units per 1M rows:      {units * per_million:,.0f}")
+    print(f"  rows/sec per shard (write limits):  {shard_rows_per_second:,.0f}")
+    print(f"  transform invocations per 1M rows:  {invocations * per_million:,.0f}")
+
+
+def best_of(repeat, func, *args):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def deaggregate_all(entries):
+    for entry in entries:
+        deaggregate(entry["Data"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--max-bytes", type=int, default=DEFAULT_MAX_BYTES)
+    parser.add_argument("--deployment-profile", default="balanced")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    start_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    records = list(change_records(get_profile("cdc", 0), args.rows, start_time))
+    payload_sizes = [len(data) for _, data in records]
+    deployment_profile = get_deployment_profile(args.deployment_profile)
+
+    single = single_records(records)
+    aggregated = aggregated_records(records, args.max_bytes)
+    print(
+        f"rows: {args.rows}, {sum(payload_sizes) / args.rows:.0f} bytes/row, "
+        f"{args.deployment_profile} profile"
+    )
+    report("single-record PUTs", single, args.rows, payload_sizes, deployment_profile)
+    report(
+        f"KPL aggregation (max {args.max_bytes} bytes)",
+        aggregated,
+        args.rows,
+        payload_sizes,
+        deployment_profile,
+    )
+
+    aggregate_seconds = best_of(
+        args.repeat, aggregated_records, records, args.max_bytes
+    )
+    deaggregate_seconds = best_of(args.repeat, deaggregate_all, aggregated)
+    print(f"aggregate:   {aggregate_seconds / args.rows * 1e6:.2f} us/row")
+    print(f"deaggregate: {deaggregate_seconds / args.rows * 1e6:.2f} us/row")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark: date/hour/minute derivation in the transform Lambda.
+
+Compares the original datetime.fromtimestamp + strftime path with the cached
+UTC derivation in partitions.py, over a sorted and a shuffled stream of
+timestamps built by CreateSampleData.generate_timestamps.
+
+    python benchmarks/partition_bench.py --timestamps 1000000 --window-hours 1
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+sys.path.append(os.path.join(PROJECT_ROOT, "scripts"))
+from create_sample_data import CreateSampleData
+from partitions import minute_partition, partition_fields
+
+
+def datetime_path(timestamps):
+    for ts in timestamps:
+        dt = datetime.datetime.fromtimestamp(ts / 1000.0)
+        (dt.strftime("%Y-%m-%d"), dt.hour, dt.minute)
+
+
+def cached_path(timestamps):
+    for ts in timestamps:
+        partition_fields(ts)
+
+
+def measure(func, timestamps):
+    minute_partition.cache_clear()
+    start = time.perf_counter()
+    func(timestamps)
+    elapsed = time.perf_counter() - start
+    return elapsed / len(timestamps) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--timestamps", type=int, default=1_000_000)
+    parser.add_argument("--window-hours", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    sorted_stream = [
+        int(ts.timestamp() * 1000)
+        # Sub-second jitter, since generate_timestamps has one second resolution
+        + random.randint(0, 999)
+        for ts in CreateSampleData.generate_timestamps(
+            args.timestamps, window=datetime.timedelta(hours=args.window_hours)
+        )
+    ]
+    random_stream = list(sorted_stream)
+    random.shuffle(random_stream)
+
+    print(f"timestamps: {args.timestamps}, window: {args.window_hours} h")
+    for name, stream in (("sorted", sorted_stream), ("random", random_stream)):
+        baseline = measure(datetime_path, stream)
+        cached = measure(cached_path, stream)
+        info = minute_partition.cache_info()
+        hit_rate = info.hits / (info.hits + info.misses)
+        print(
+            f"{name:>6}: datetime {baseline:6.0f} ns/record, "
+            f"cached {cached:6.0f} ns/record ({baseline / cached:.1f}x), "
+            f"cache hit rate {hit_rate:.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Per-record CPU time of the transform Lambda's decode/encode path.
+
+"before" is the original pipeline: b64decode, decode('utf-8'), json.loads, the
+list(v.values())[0] comprehension, json.dumps(cls=DecimalEncoder), encode and
+b64encode. "after" is the current path with each serializer backend that is
+installed.
+
+    python benchmarks/transform_serialize_bench.py --records 50000
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from boto3.dynamodb.types import TypeSerializer
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+sys.path.append(os.path.join(PROJECT_ROOT, "scripts"))
+from create_sample_data import CreateSampleData
+from ddb_decoder import decode_image, load_decode_plan
+from serializer import BACKENDS, get_serializer
+
+
+class DecimalEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return float(obj)
+        return super(DecimalEncoder, self).default(obj)
+
+
+def build_records(count):
+    serializer = TypeSerializer()
+    start = datetime(2024, 1, 1)
+    records = []
+    for i in range(count):
+        transaction = CreateSampleData.generate_transaction(
+            start + timedelta(milliseconds=i * 37)
+        )
+        change = {
+            "eventName": "INSERT",
+            "tableName": "financial-transactions",
+            "dynamodb": {
+                "NewImage": {
+                    k: serializer.serialize(v) for k, v in transaction.items()
+                }
+            },
+        }
+        records.append(base64.b64encode(json.dumps(change).encode("utf-8")))
+    return records
+
+
+def before(records):
+    for data in records:
+        payload = json.loads(base64.b64decode(data).decode("utf-8"))
+        new_image = payload["dynamodb"]["NewImage"]
+        item = {k: list(v.values())[0] for k, v in new_image.items()}
+        base64.b64encode(json.dumps(item, cls=DecimalEncoder).encode("utf-8")).decode(
+            "utf-8"
+        )
+
+
+def after(records, serializer, plan):
+    loads = serializer.loads
+    dumps = serializer.dumps
+    for data in records:
+        payload = loads(base64.b64decode(data))
+        item = decode_image(payload["dynamodb"]["NewImage"], plan)
+        base64.b64encode(dumps(item)).decode("ascii")
+
+
+def cpu_per_record(repeat, count, func, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.process_time()
+        func(*args)
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    records = build_records(args.records)
+    plan = load_decode_plan()
+
+    baseline = cpu_per_record(args.repeat, args.records, before, records)
+    print(f"records: {args.records}")
+    print(f"before (json + DecimalEncoder): {baseline:6.2f} us CPU/record")
+    for name in BACKENDS:
+        try:
+            serializer = get_serializer(name)
+        except ImportError:
+            print(f"after  ({name}): not installed")
+            continue
+        cost = cpu_per_record(
+            args.repeat, args.records, after, records, serializer, plan
+        )
+        print(
+            f"after  ({name}): {cost:6.2f} us CPU/record ({baseline / cost:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
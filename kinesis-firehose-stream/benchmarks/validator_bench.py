@@ -0,0 +1,81 @@
+"""Microbenchmark: per-record cost of the schema validator in the transform Lambda.
+
+    python benchmarks/validator_bench.py --records 100000 --check
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from boto3.dynamodb.types import TypeSerializer
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+sys.path.append(os.path.join(PROJECT_ROOT, "scripts"))
+from create_sample_data import CreateSampleData
+from ddb_decoder import decode_image, load_decode_plan
+from partitions import partition_fields
+from validator import load_validation_plan, validate
+
+# Per-record budget for validation, in microseconds
+BUDGET_US = 2.0
+
+
+def build_items(count):
+    # Decoded items as the transform Lambda validates them
+    serializer = TypeSerializer()
+    plan = load_decode_plan()
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    items = []
+    for i in range(count):
+        transaction = CreateSampleData.generate_transaction(
+            start + timedelta(milliseconds=i * 37)
+        )
+        item = decode_image(
+            {k: serializer.serialize(v) for k, v in transaction.items()}, plan
+        )
+        item["date"], item["hour"], item["minute"] = partition_fields(
+            item["timestamp"]
+        )
+        items.append(item)
+    return items
+
+
+def validate_all(items, plan):
+    for item in items:
+        validate(item, plan)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--check", action="store_true", help="enforce the budget")
+    args = parser.parse_args()
+
+    items = build_items(args.records)
+
+    start = time.perf_counter()
+    plan = load_validation_plan()
+    plan_seconds = time.perf_counter() - start
+
+    invalid = sum(validate(item, plan) is not None for item in items)
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        validate_all(items, plan)
+        timings.append(time.perf_counter() - start)
+    per_record_us = min(timings) / args.records * 1e6
+
+    print(f"records:               {args.records} ({invalid} invalid)")
+    print(f"validation plan build: {plan_seconds * 1e3:.2f} ms (once per container)")
+    print(f"validate:              {per_record_us:.2f} us/record (budget {BUDGET_US} us)")
+
+    if args.check and per_record_us > BUDGET_US:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
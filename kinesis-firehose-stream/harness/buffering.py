@@ -0,0 +1,36 @@
+MIB = 1024 * 1024
+
+
+class Buffer:
+    # Collects records until the buffered size or record count reaches its limit,
+    # or the oldest record has waited interval_seconds, whichever comes first.
+    # Time is the simulated arrival clock in milliseconds.
+    def __init__(self, size_bytes, interval_seconds, max_records=None):
+        self.size_bytes = size_bytes
+        self.interval_ms = interval_seconds * 1000
+        self.max_records = max_records
+        self.records = []
+        self.buffered_bytes = 0
+        self.oldest_ms = None
+
+    def expired(self, now_ms):
+        return bool(self.records) and now_ms - self.oldest_ms >= self.interval_ms
+
+    def add(self, record, size, now_ms):
+        # Returns the flushed batch when this record fills the buffer
+        if not self.records:
+            self.oldest_ms = now_ms
+        self.records.append(record)
+        self.buffered_bytes += size
+        if self.buffered_bytes >= self.size_bytes or (
+            self.max_records and len(self.records) >= self.max_records
+        ):
+            return self.flush()
+        return None
+
+    def flush(self):
+        batch = self.records
+        self.records = []
+        self.buffered_bytes = 0
+        self.oldest_ms = None
+        return batch
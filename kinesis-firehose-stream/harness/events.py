@@ -0,0 +1,94 @@
+import base64
+import json
+
+from boto3.dynamodb.types import TypeSerializer
+
+# Primary key of the financial-transactions table
+KEY_ATTRIBUTES = ("transaction_id", "timestamp")
+
+_type_serializer = TypeSerializer()
+
+
+def to_attribute_values(item):
+    return {name: _type_serializer.serialize(value) for name, value in item.items()}
+
+
+class StreamRecordBuilder:
+    # Turns (event_name, item) pairs from the data generators into DynamoDB Streams
+    # records with NEW_AND_OLD_IMAGES, tracking the current image of every key
+    def __init__(self, table_name="financial-transactions", region="us-east-1"):
+        self.table_name = table_name
+        self.region = region
+        self.images = {}
+        self.sequence = 0
+
+    def build(self, event_name, item, arrival_ms):
+        key = {name: item[name] for name in KEY_ATTRIBUTES}
+        key_id = tuple(key.values())
+        old_image = self.images.get(key_id)
+        self.sequence += 1
+
+        dynamodb = {
+            "ApproximateCreationDateTime": arrival_ms // 1000,
+            "Keys": to_attribute_values(key),
+            "SequenceNumber": f"{self.sequence:021d}",
+            "StreamViewType": "NEW_AND_OLD_IMAGES",
+        }
+        if event_name == "REMOVE":
+            self.images.pop(key_id, None)
+        else:
+            dynamodb["NewImage"] = self.images[key_id] = to_attribute_values(item)
+        if old_image is not None:
+            dynamodb["OldImage"] = old_image
+
+        return {
+            "eventID": f"{self.sequence:032x}",
+            "eventName": event_name,
+            "eventVersion": "1.1",
+            "eventSource": "aws:dynamodb",
+            "awsRegion": self.region,
+            "dynamodb": dynamodb,
+        }
+
+
+def kinesis_payload(stream_record, table_name="financial-transactions"):
+    # The JSON document DynamoDB writes to a Kinesis data stream for a change
+    dynamodb = dict(stream_record["dynamodb"])
+    dynamodb["ApproximateCreationDateTime"] *= 1000
+    del dynamodb["SequenceNumber"]
+    del dynamodb["StreamViewType"]
+    payload = {
+        "awsRegion": stream_record["awsRegion"],
+        "eventID": stream_record["eventID"],
+        "eventName": stream_record["eventName"],
+        "userIdentity": None,
+        "recordFormat": "application/json",
+        "tableName": table_name,
+        "dynamodb": dynamodb,
+        "eventSource": "aws:dynamodb",
+    }
+    return json.dumps(payload).encode("utf-8")
+
+
+def transform_event(records):
+    # A Firehose data transformation invocation; records are (record_id,
+    # arrival_ms, payload) tuples
+    return {
+        "invocationId": "local",
+        "deliveryStreamArn": "arn:aws:firehose:local:000000000000:deliverystream/local",
+        "sourceKinesisStreamArn": "arn:aws:kinesis:local:000000000000:stream/local",
+        "region": "local",
+        "records": [
+            {
+                "recordId": record_id,
+                "approximateArrivalTimestamp": arrival_ms,
+                "data": base64.b64encode(payload).decode("ascii"),
+            }
+            for record_id, arrival_ms, payload in records
+        ],
+    }
+
+
+def stream_event(stream_records):
+    # A DynamoDB Streams event source mapping invocation
+    return {"Records": stream_records}
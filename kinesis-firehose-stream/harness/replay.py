@@ -0,0 +1,466 @@
+"""Offline end-to-end replay of the stream pipeline.
+
+Turns generator output into DynamoDB Streams or Kinesis events and runs the
+Lambda handlers in process. Their output is buffered the way the Firehose
+settings in stack/firehose.py do, using the deployment profile and event
+source settings from cdk.json/cdk.context.json. Each destination buffer flush
+is committed to a local Iceberg table (pyiceberg with a SQLite catalog).
+
+The replay reports records/sec and bytes/sec for every stage. It then checks
+the table against the final state of the source table: one row per live
+transaction_id, carrying its latest values.
+
+    python -m harness.replay --stream-type kinesis --profile cdc --count 20000
+
+With --aggregate, the Kinesis source records are KPL-aggregated and
+de-aggregated again before the transform Lambda, as Firehose does.
+"""
+
+import argparse
+import base64
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+sys.path.append(os.path.join(PROJECT_ROOT, "scripts"))
+from generation_profiles import TransactionEventGenerator, get_profile
+from harness.buffering import MIB, Buffer
+from harness.events import (
+    StreamRecordBuilder,
+    kinesis_payload,
+    stream_event,
+    transform_event,
+)
+from harness.warehouse import LocalWarehouse
+from kinesis_producer import ShardAggregator
+from kpl import deaggregate
+from partitions import partition_fields
+from routing import OPERATION_FIELD
+from serializer import loads
+from stack.event_source import get_stream_event_source_settings
+from stack.profiles import get_deployment_profile
+
+# Lambda invocation payload limit, which also caps an event source mapping batch
+MAX_INVOCATION_BYTES = 6 * MIB
+
+# The DynamoDB Streams poller checks each shard about four times per second
+STREAM_POLL_SECONDS = 0.25
+
+# Operation Firehose applies to records that carry no otfMetadata
+DEFAULT_OPERATION = "insert"
+# Operation the Direct PUT delivery stream applies to rows without a marker
+DIRECT_PUT_OPERATION = "update"
+
+# Columns compared between the Iceberg table and the source table
+CHECKED_COLUMNS = ("timestamp", "status", "amount", "processing_timestamp")
+
+
+def load_context(project_root=PROJECT_ROOT):
+    with open(os.path.join(project_root, "cdk.json")) as f:
+        context = json.load(f).get("context", {})
+    context_path = os.path.join(project_root, "cdk.context.json")
+    if os.path.exists(context_path):
+        with open(context_path) as f:
+            context.update(json.load(f))
+    return context
+
+
+def load_lambda(name, environment):
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.update(environment)
+    path = os.path.join(PROJECT_ROOT, "lambda", name, "index.py")
+    spec = importlib.util.spec_from_file_location(f"{name}_index", path)
+    module = importlib.util.module_from_spec(spec)
+    with contextlib.redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(module)
+    return module
+
+
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.records = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def report(self):
+        seconds = self.seconds or float("nan")
+        return {
+            "records": self.records,
+            "bytes": self.bytes,
+            "seconds": self.seconds,
+            "records_per_second": self.records / seconds,
+            "bytes_per_second": self.bytes / seconds,
+        }
+
+
+class LocalFirehoseClient:
+    # Accepts PutRecordBatch calls from the forwarder; the replay moves the records
+    # into the destination buffer once the invocation returns
+    def __init__(self):
+        self.pending = []
+
+    def put_record_batch(self, DeliveryStreamName, Records):
+        # list.extend is atomic, so forwarder lanes can call this concurrently
+        self.pending.extend(record["Data"] for record in Records)
+        return {
+            "FailedPutCount": 0,
+            "RequestResponses": [{"RecordId": str(i)} for i in range(len(Records))],
+        }
+
+
+class Replay:
+    def __init__(
+        self,
+        stream_type,
+        warehouse,
+        deployment_profile,
+        event_source_settings,
+        firehose_max_concurrency=4,
+        source_rate=1000,
+        aggregate=False,
+        collapse_updates=False,
+        verbose=False,
+    ):
+        self.stream_type = stream_type
+        self.warehouse = warehouse
+        self.source_rate = source_rate
+        self.verbose = verbose
+        self.builder = StreamRecordBuilder()
+        self.stages = {name: Stage(name) for name in ("source", "lambda", "iceberg")}
+        self.invocations = 0
+        self.lambda_failures = 0
+        self.kinesis_records = 0
+        # KPL aggregation of the Kinesis source records, on a single shard
+        self.aggregator = None
+        if aggregate and stream_type == "kinesis":
+            self.aggregator = ShardAggregator(
+                [{"HashKeyRange": {"StartingHashKey": "0"}}]
+            )
+
+        self.destination = Buffer(
+            deployment_profile.destination_buffer_size_mb * MIB,
+            deployment_profile.destination_buffer_interval_seconds,
+        )
+        if stream_type == "kinesis":
+            self.transform = load_lambda(
+                "transform",
+                {
+                    "DESTINATION_DATABASE": "local",
+                    "DESTINATION_TABLE": warehouse.table.name()[-1],
+                    "COLLAPSE_UPDATES": str(collapse_updates).lower(),
+                },
+            )
+            self.lambda_buffer = Buffer(
+                deployment_profile.processor_buffer_size_mb * MIB,
+                deployment_profile.processor_buffer_interval_seconds,
+            )
+        else:
+            self.forwarder = load_lambda(
+                "firehose",
+                {
+                    "FIREHOSE_DELIVERY_STREAM": "local",
+                    "FIREHOSE_MAX_CONCURRENCY": str(firehose_max_concurrency),
+                    "REPORT_BATCH_ITEM_FAILURES": str(
+                        event_source_settings.report_batch_item_failures
+                    ).lower(),
+                },
+            )
+            self.firehose_client = LocalFirehoseClient()
+            self.forwarder.firehose_client = self.firehose_client
+            self.lambda_buffer = Buffer(
+                MAX_INVOCATION_BYTES,
+                max(
+                    event_source_settings.max_batching_window_seconds,
+                    STREAM_POLL_SECONDS,
+                ),
+                max_records=deployment_profile.event_source_batch_size,
+            )
+
+    def run(self, events, start_ms):
+        now_ms = start_ms
+        source = self.stages["source"]
+        for index, (event_name, item) in enumerate(events):
+            now_ms = start_ms + index * 1000 // self.source_rate
+            self.tick(now_ms)
+
+            started = time.perf_counter()
+            stream_record = self.builder.build(event_name, item, now_ms)
+            if self.stream_type == "kinesis":
+                payload = kinesis_payload(stream_record)
+                size = len(payload)
+            else:
+                size = len(json.dumps(stream_record))
+            source.seconds += time.perf_counter() - started
+            source.records += 1
+            source.bytes += size
+
+            if self.stream_type != "kinesis":
+                self.buffer(stream_record, size, now_ms)
+            elif self.aggregator is None:
+                self.read_kinesis(payload, now_ms)
+            else:
+                entry = self.aggregator.add(item["transaction_id"], payload)
+                if entry:
+                    self.read_kinesis(entry["Data"], now_ms)
+
+        # End of input: everything still buffered is delivered
+        if self.aggregator:
+            for entry in self.aggregator.flush():
+                self.read_kinesis(entry["Data"], now_ms)
+        if self.lambda_buffer.records:
+            self.invoke(self.lambda_buffer.flush(), now_ms)
+        if self.destination.records:
+            self.commit(self.destination.flush())
+
+    def read_kinesis(self, data, now_ms):
+        # Firehose de-aggregates KPL records before they reach the processor
+        self.kinesis_records += 1
+        payloads = [data]
+        if self.aggregator:
+            payloads = [user_data for _, user_data in deaggregate(data)]
+        for index, payload in enumerate(payloads):
+            record_id = f"{self.kinesis_records}.{index}"
+            self.buffer((record_id, now_ms, payload), len(payload), now_ms)
+
+    def buffer(self, record, size, now_ms):
+        batch = self.lambda_buffer.add(record, size, now_ms)
+        if batch:
+            self.invoke(batch, now_ms)
+
+    def tick(self, now_ms):
+        if self.lambda_buffer.expired(now_ms):
+            self.invoke(self.lambda_buffer.flush(), now_ms)
+        if self.destination.expired(now_ms):
+            self.commit(self.destination.flush())
+
+    def invoke(self, batch, now_ms):
+        stage = self.stages["lambda"]
+        if self.stream_type == "kinesis":
+            event = transform_event(batch)
+            stage.bytes += sum(len(payload) for _, _, payload in batch)
+            started = time.perf_counter()
+            with self.lambda_output():
+                response = self.transform.handler(event, None)
+            stage.seconds += time.perf_counter() - started
+            outputs = []
+            for output_record in response["records"]:
+                if output_record["result"] == "ProcessingFailed":
+                    self.lambda_failures += 1
+                if output_record["result"] != "Ok":
+                    continue
+                otf_metadata = output_record.get("metadata", {}).get("otfMetadata", {})
+                outputs.append(
+                    (
+                        otf_metadata.get("operation", DEFAULT_OPERATION),
+                        base64.b64decode(output_record["data"]),
+                    )
+                )
+        else:
+            event = stream_event(batch)
+            stage.bytes += len(json.dumps(event))
+            started = time.perf_counter()
+            with self.lambda_output():
+                response = self.forwarder.handler(event, None)
+            stage.seconds += time.perf_counter() - started
+            self.lambda_failures += len(response["batchItemFailures"])
+            # The delivery stream's JQ query reads the operation of each row
+            outputs = [
+                (loads(data).get(OPERATION_FIELD, DIRECT_PUT_OPERATION), data)
+                for data in self.firehose_client.pending
+            ]
+            self.firehose_client.pending = []
+
+        stage.records += len(batch)
+        self.invocations += 1
+        for operation, data in outputs:
+            flushed = self.destination.add((operation, data), len(data), now_ms)
+            if flushed:
+                self.commit(flushed)
+
+    def lambda_output(self):
+        # Handlers print a metrics line per invocation, which drowns the report
+        if self.verbose:
+            return contextlib.nullcontext()
+        return contextlib.redirect_stdout(io.StringIO())
+
+    def commit(self, batch):
+        stage = self.stages["iceberg"]
+        started = time.perf_counter()
+        self.warehouse.commit([(operation, loads(data)) for operation, data in batch])
+        stage.seconds += time.perf_counter() - started
+        stage.records += len(batch)
+        stage.bytes += sum(len(data) for _, data in batch)
+
+    def report(self):
+        return {
+            "stream_type": self.stream_type,
+            "kinesis_records": self.kinesis_records,
+            "lambda_invocations": self.invocations,
+            "lambda_failures": self.lambda_failures,
+            "iceberg_commits": self.warehouse.commits,
+            "stages": {name: stage.report() for name, stage in self.stages.items()},
+        }
+
+
+def source_state(events):
+    # Final contents of the source table, keyed by transaction_id
+    state = {}
+    for event_name, item in events:
+        if event_name == "REMOVE":
+            state.pop(item["transaction_id"], None)
+        else:
+            state[item["transaction_id"]] = item
+    return state
+
+
+def verify(rows, expected, check_partitions=False):
+    seen = {}
+    duplicates = 0
+    stale = 0
+    bad_partitions = 0
+    for row in rows:
+        key = row["transaction_id"]
+        if key in seen:
+            duplicates += 1
+        seen[key] = row
+        item = expected.get(key)
+        if item is not None and any(
+            row[column] != item[column] for column in CHECKED_COLUMNS
+        ):
+            stale += 1
+        if check_partitions:
+            day, hour, minute = partition_fields(row["timestamp"])
+            if (row["date"].isoformat(), row["hour"], row["minute"]) != (
+                day,
+                hour,
+                minute,
+            ):
+                bad_partitions += 1
+
+    checks = {
+        "rows": len(rows),
+        "expected_rows": len(expected),
+        "missing": len(expected.keys() - seen.keys()),
+        "unexpected": len(seen.keys() - expected.keys()),
+        "duplicates": duplicates,
+        "stale": stale,
+        "bad_partitions": bad_partitions,
+    }
+    checks["consistent"] = not any(
+        checks[name]
+        for name in ("missing", "unexpected", "duplicates", "stale", "bad_partitions")
+    )
+    return checks
+
+
+def replay(
+    stream_type,
+    warehouse_path,
+    profile="cdc",
+    count=10000,
+    seed=0,
+    source_rate=1000,
+    context=None,
+    aggregate=False,
+    verbose=False,
+):
+    context = load_context() if context is None else context
+    generator = TransactionEventGenerator(get_profile(profile, seed))
+    # A fixed start keeps the replay reproducible for a seed
+    start_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    events = list(generator.events(count, start_time=start_time))
+
+    pipeline = Replay(
+        stream_type,
+        LocalWarehouse(warehouse_path),
+        get_deployment_profile(context.get("deployment_profile")),
+        get_stream_event_source_settings(context.get("stream_event_source")),
+        firehose_max_concurrency=context.get("firehose_max_concurrency") or 4,
+        source_rate=source_rate,
+        aggregate=aggregate,
+        collapse_updates=bool(context.get("collapse_updates")),
+        verbose=verbose,
+    )
+    pipeline.run(events, int(start_time.timestamp() * 1000))
+
+    report = pipeline.report()
+    report["checks"] = verify(
+        pipeline.warehouse.rows(),
+        source_state(events),
+        check_partitions=stream_type == "kinesis",
+    )
+    return report
+
+
+def print_report(report):
+    print(
+        f"{report['stream_type']}: {report['lambda_invocations']} Lambda invocations, "
+        f"{report['lambda_failures']} failed records, "
+        f"{report['iceberg_commits']} Iceberg commits"
+    )
+    if report["kinesis_records"]:
+        print(f"Kinesis records: {report['kinesis_records']}")
+    print(f"{'stage':<8} {'records':>9} {'MiB':>8} {'records/s':>11} {'MiB/s':>8}")
+    for name, stage in report["stages"].items():
+        print(
+            f"{name:<8} {stage['records']:>9} {stage['bytes'] / MIB:>8.2f} "
+            f"{stage['records_per_second']:>11.0f} "
+            f"{stage['bytes_per_second'] / MIB:>8.2f}"
+        )
+    checks = dict(report["checks"])
+    consistent = checks.pop("consistent")
+    print(f"{'consistent' if consistent else 'INCONSISTENT'}: {checks}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stream-type", choices=["kinesis", "dynamodb"])
+    parser.add_argument("--profile", default="cdc", help="generation profile")
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--source-rate",
+        type=int,
+        default=1000,
+        help="simulated change events per second, which drives the buffer intervals",
+    )
+    parser.add_argument(
+        "--aggregate",
+        action="store_true",
+        help="KPL-aggregate the Kinesis source records (kinesis only)",
+    )
+    parser.add_argument("--warehouse", default=".replay-warehouse")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show Lambda logs")
+    args = parser.parse_args()
+
+    context = load_context()
+    report = replay(
+        args.stream_type or context.get("stream_type", "kinesis"),
+        args.warehouse,
+        profile=args.profile,
+        count=args.count,
+        seed=args.seed,
+        source_rate=args.source_rate,
+        context=context,
+        aggregate=args.aggregate,
+        verbose=args.verbose,
+    )
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+    else:
+        print_report(report)
+    return 0 if report["checks"]["consistent"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+import os
+import sys
+import warnings
+from datetime import date
+from decimal import Decimal
+from functools import reduce
+
+import pyarrow as pa
+from pyiceberg.catalog.sql import SqlCatalog
+from pyiceberg.expressions import And, EqualTo, In, IsNull, Or
+from pyiceberg.partitioning import PartitionField, PartitionSpec
+from pyiceberg.schema import Schema
+from pyiceberg.table.sorting import NullOrder, SortDirection, SortField, SortOrder
+from pyiceberg.transforms import parse_transform
+from pyiceberg.types import (
+    BooleanType,
+    DateType,
+    DecimalType,
+    DoubleType,
+    FloatType,
+    IntegerType,
+    LongType,
+    NestedField,
+    StringType,
+)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+from table_spec import (
+    DECIMAL_TYPE,
+    field_id,
+    load_table_definition,
+    schema_fields,
+)
+
+ICEBERG_TYPES = {
+    "string": StringType,
+    "long": LongType,
+    "int": IntegerType,
+    "date": DateType,
+    "boolean": BooleanType,
+    "float": FloatType,
+    "double": DoubleType,
+}
+
+
+def iceberg_type(type_name):
+    match = DECIMAL_TYPE.match(type_name)
+    if match:
+        return DecimalType(int(match.group(1)), int(match.group(2)))
+    return ICEBERG_TYPES[type_name]()
+
+
+def iceberg_schema(fields):
+    return Schema(
+        *(
+            NestedField(
+                field_id=field_id(field, position),
+                name=field["name"],
+                field_type=iceberg_type(field["type"]),
+                required=field.get("required", False),
+            )
+            for position, field in enumerate(fields, start=1)
+        )
+    )
+
+
+def iceberg_partition_spec(spec):
+    return PartitionSpec(
+        *(
+            PartitionField(
+                source_id=field["sourceId"],
+                field_id=field["fieldId"],
+                transform=parse_transform(field["transform"]),
+                name=field["name"],
+            )
+            for field in spec.get("fields", [])
+        )
+    )
+
+
+def iceberg_sort_order(order):
+    if not order.get("fields"):
+        return SortOrder()
+    return SortOrder(
+        *(
+            SortField(
+                source_id=field["sourceId"],
+                transform=parse_transform(field["transform"]),
+                direction=SortDirection(field["direction"]),
+                null_order=NullOrder(field["nullOrder"]),
+            )
+            for field in order["fields"]
+        ),
+        order_id=order.get("orderId", 1),
+    )
+
+
+def _converter(iceberg_field_type):
+    # Parses a JSON value from a Firehose record into the column's Python type
+    if isinstance(iceberg_field_type, DecimalType):
+        exponent = Decimal(1).scaleb(-iceberg_field_type.scale)
+        return lambda value: Decimal(str(value)).quantize(exponent)
+    if isinstance(iceberg_field_type, DateType):
+        return lambda value: date.fromisoformat(str(value))
+    if isinstance(iceberg_field_type, (IntegerType, LongType)):
+        return int
+    if isinstance(iceberg_field_type, (FloatType, DoubleType)):
+        return float
+    if isinstance(iceberg_field_type, StringType):
+        return str
+    return lambda value: value
+
+
+class LocalWarehouse:
+    # Stand-in for the S3 table: an Iceberg table in a local directory with a
+    # SQLite catalog, recreated empty for every replay
+    def __init__(self, path, table_definition=None, unique_key="transaction_id"):
+        table_definition = table_definition or load_table_definition()
+        path = os.path.abspath(path)
+        os.makedirs(path, exist_ok=True)
+        self.catalog = SqlCatalog(
+            "local",
+            uri=f"sqlite:///{os.path.join(path, 'catalog.db')}",
+            warehouse=f"file://{path}",
+        )
+        namespace = table_definition["namespace"]
+        identifier = (namespace, table_definition["name"])
+        self.catalog.create_namespace_if_not_exists(namespace)
+        if self.catalog.table_exists(identifier):
+            self.catalog.drop_table(identifier)
+        iceberg = table_definition["metadata"]["iceberg"]
+        self.table = self.catalog.create_table(
+            identifier,
+            schema=iceberg_schema(schema_fields(table_definition)),
+            partition_spec=iceberg_partition_spec(iceberg.get("partitionSpec", {})),
+            sort_order=iceberg_sort_order(iceberg.get("writeOrder", {})),
+        )
+        self.unique_key = unique_key
+        # Columns that place a row in its partition. Firehose applies the
+        # equality delete of an update or delete only within the partition of
+        # the row it sends, which the commit reproduces by matching them.
+        schema = self.table.schema()
+        self.partition_columns = [
+            schema.find_column_name(field.source_id)
+            for field in self.table.spec().fields
+        ]
+        self.arrow_schema = self.table.schema().as_arrow()
+        self.converters = {
+            field.name: _converter(field.field_type)
+            for field in self.table.schema().fields
+        }
+        self.commits = 0
+
+    def to_row(self, item):
+        # Columns that are not in the table are ignored, missing ones are null
+        row = {}
+        for name, convert in self.converters.items():
+            value = item.get(name)
+            row[name] = None if value is None else convert(value)
+        return row
+
+    def commit(self, records):
+        # Applies one destination buffer flush of (operation, item) pairs in a single
+        # Iceberg commit. update and delete remove the rows with the same unique
+        # key in their partition, insert appends, and the last update or delete
+        # of a key within a flush decides whether it gets a row.
+        inserts = []
+        latest = {}
+        deleted = []
+        for operation, item in records:
+            if operation == "insert":
+                inserts.append(item)
+            else:
+                key = item[self.unique_key]
+                latest.pop(key, None)
+                latest[key] = (operation, item)
+                deleted.append(item)
+
+        rows = [self.to_row(item) for item in inserts]
+        rows.extend(
+            self.to_row(item)
+            for operation, item in latest.values()
+            if operation == "update"
+        )
+        with self.table.transaction() as transaction:
+            if deleted:
+                # New keys have nothing to delete, which pyiceberg warns about
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", UserWarning)
+                    transaction.delete(self.delete_filter(deleted))
+            if rows:
+                transaction.append(pa.Table.from_pylist(rows, schema=self.arrow_schema))
+        self.commits += 1
+
+    def delete_filter(self, items):
+        # Rows with the key of one of the items, in the partition of that item.
+        # A bucket or truncate partition is matched on its source column, which
+        # only differs for other values that fall in the same partition.
+        keys_by_partition = {}
+        for item in items:
+            partition = tuple(
+                None if item.get(name) is None else self.converters[name](item[name])
+                for name in self.partition_columns
+            )
+            keys = keys_by_partition.setdefault(partition, {})
+            keys[item[self.unique_key]] = None
+        return reduce(
+            Or,
+            (
+                reduce(
+                    And,
+                    (
+                        IsNull(name) if value is None else EqualTo(name, value)
+                        for name, value in zip(self.partition_columns, partition)
+                    ),
+                    In(self.unique_key, list(keys)),
+                )
+                for partition, keys in keys_by_partition.items()
+            ),
+        )
+
+    def rows(self):
+        return self.table.scan().to_arrow().to_pylist()
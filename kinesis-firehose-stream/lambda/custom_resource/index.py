@@ -1,7 +1,25 @@
 # lambda/index.py
 import boto3
 import json
+import os
 from botocore.exceptions import ClientError
+from iceberg_metadata import commit_table_metadata
+from instrumentation import InvocationMetrics
+from table_resolver import NOT_FOUND_ERROR_CODES, TableResolver
+from table_spec import definition_path, load_table_definition, table_metadata
+
+# Created once per container and reused across invocations
+s3tables_client = boto3.client("s3tables")
+s3_client = boto3.client("s3")
+# Listings of the resolver, shared by the invocations of the container
+table_resolver_cache = {}
+
+# S3 Tables reports a table bucket, namespace or table that already exists as
+# a ConflictException
+ALREADY_EXISTS_ERROR_CODES = {"ConflictException", "ResourceAlreadyExistsException"}
+
+# Schema, partition spec and write order of the table, from the shared layer
+TABLE_DEFINITION = load_table_definition()
 
 
 # Add cfnresponse
@@ -19,37 +37,76 @@ def send_cfn_response(event, context, response_status, response_data, reason=Non
 
 
 def handler(event, context):
-    print(event)
-    print(context)
-    s3tables = boto3.client("s3tables")
+    metrics = InvocationMetrics("custom_resource", context)
+    metrics.debug("event", event=event)
+    s3tables = s3tables_client
+    # The function ARN names the account, so table bucket ARNs can be built
+    # directly instead of listing every table bucket
+    account = context.invoked_function_arn.split(":")[4] if context else None
+    table_resolver = TableResolver(
+        s3tables,
+        region=os.environ.get("AWS_REGION"),
+        account=account,
+        cache=table_resolver_cache,
+    )
 
     # Extract properties from the event
     props = event["ResourceProperties"]
     table_bucket_name = props["table_bucket_name"]
-    table_name = props["table_name"]
     namespace = props["namespace"]
+    tables = props.get("tables") or [props]
 
     # Ensure namespace is a list
     if isinstance(namespace, str):
         namespace = [namespace]
 
     request_type = event["RequestType"]
+    metrics.count(f"requests_{request_type.lower()}")
 
     try:
         if request_type == "Create":
-            response_data = create_table(
-                s3tables,
-                table_bucket_name,
-                namespace,
-                table_name,
-            )
+            with metrics.timer("s3tables"):
+                response_data = create_tables(
+                    s3tables,
+                    table_resolver,
+                    table_bucket_name,
+                    namespace,
+                    [(table["table_name"], create_metadata(table)) for table in tables],
+                )
             send_cfn_response(event, context, "SUCCESS", response_data)
         elif request_type == "Update":
+            # Creates the tables of routes added since, then applies the
+            # schema and layout of the definitions to the tables that existed
+            with metrics.timer("s3tables"):
+                response_data = create_tables(
+                    s3tables,
+                    table_resolver,
+                    table_bucket_name,
+                    namespace,
+                    [(table["table_name"], create_metadata(table)) for table in tables],
+                )
+                existing = set(response_data["ExistingTables"])
+                response_data["UpdatedTables"] = update_tables(
+                    s3tables,
+                    s3_client,
+                    table_resolver.table_bucket_arn(table_bucket_name),
+                    namespace,
+                    [
+                        (table["table_name"], create_metadata(table))
+                        for table in tables
+                        if table["table_name"] in existing
+                    ],
+                )
             send_cfn_response(event, context, "SUCCESS", response_data)
         elif request_type == "Delete":
-            response_data = delete_table(
-                s3tables, table_bucket_name, namespace, table_name
-            )
+            with metrics.timer("s3tables"):
+                response_data = delete_tables(
+                    s3tables,
+                    table_resolver,
+                    table_bucket_name,
+                    namespace,
+                    [table["table_name"] for table in tables],
+                )
             send_cfn_response(event, context, "SUCCESS", response_data)
         else:
             send_cfn_response(
@@ -57,107 +114,131 @@ def handler(event, context):
             )
     except Exception as e:
         print(f"Error: {str(e)}")
+        metrics.count("errors")
         send_cfn_response(event, context, "FAILED", {"Error": str(e)})
+    finally:
+        metrics.emit()
+
+
+def create_metadata(table):
+    # CreateTable metadata of one entry of the tables list: its definition in
+    # tabledefinitions/, or tabledefinition.json, with the layout overrides
+    definition = table.get("definition")
+    table_definition = (
+        load_table_definition(definition_path(definition))
+        if definition
+        else TABLE_DEFINITION
+    )
+    return table_metadata(
+        table_definition, table.get("partition_by"), table.get("sort_by")
+    )
 
 
-def create_table(
-    s3tables,
-    table_bucket_name,
-    namespace,
-    table_name,
-):
+def already_exists(error):
+    return error.response["Error"]["Code"] in ALREADY_EXISTS_ERROR_CODES
+
+
+def create_tables(s3tables, resolver, table_bucket_name, namespace, tables):
+    # tables is a list of (table_name, metadata), created in the same namespace.
+    # The table bucket, the namespace and each table are only created when
+    # they do not exist yet, so a table added to an existing bucket is created
+    # as well. Existing tables are left as they are.
+
+    # Step 1: Create the table bucket
     try:
-        # Step 1: Create the table bucket
-        table_bucket = s3tables.create_table_bucket(name=table_bucket_name)
-        print(table_bucket)
-        print(f"S3 Table Bucket '{table_bucket}' created successfully")
-
-        # Step 2: Create the namespace
-        ns = s3tables.create_namespace(
-            tableBucketARN=table_bucket["arn"], namespace=namespace
-        )
+        table_bucket_arn = s3tables.create_table_bucket(name=table_bucket_name)["arn"]
+        print(f"S3 Table Bucket '{table_bucket_arn}' created successfully")
+    except ClientError as e:
+        if not already_exists(e):
+            raise
+        table_bucket_arn = resolver.table_bucket_arn(table_bucket_name)
+        print(f"S3 Table Bucket '{table_bucket_arn}' already exists")
+
+    # Step 2: Create the namespace
+    try:
+        s3tables.create_namespace(tableBucketARN=table_bucket_arn, namespace=namespace)
         print(
             f"Namespace '{namespace}' created successfully in bucket '{table_bucket_name}'"
         )
+    except ClientError as e:
+        if not already_exists(e):
+            raise
+        print(f"Namespace '{namespace}' already exists. Skipping creation.")
 
-        print(namespace[0])
-
-        # Step 3: Create the table
-        response = s3tables.create_table(
-            tableBucketARN=table_bucket["arn"],
-            namespace=namespace[0],
-            name=table_name,
-            format="ICEBERG",
-            metadata={
-                "iceberg": {
-                    "schema": {
-                        "fields": [
-                            {
-                                "name": "transaction_id",
-                                "type": "string",
-                                "required": True,
-                            },
-                            {"name": "timestamp", "type": "long"},
-                            {"name": "customer_id", "type": "string"},
-                            {"name": "date", "type": "date"},
-                            {"name": "hour", "type": "int"},
-                            {"name": "minute", "type": "int"},
-                            {"name": "transaction_type", "type": "string"},
-                            {"name": "amount", "type": "decimal(12,2)"},
-                            {"name": "currency", "type": "string"},
-                            {"name": "merchant_category", "type": "string"},
-                            {"name": "payment_method", "type": "string"},
-                            {"name": "region", "type": "string"},
-                            {"name": "risk_score", "type": "string"},
-                            {"name": "status", "type": "string"},
-                            {"name": "processing_timestamp", "type": "long"},
-                            {"name": "device_type", "type": "string"},
-                            {"name": "authentication_method", "type": "string"},
-                            {"name": "merchant_id", "type": "string"},
-                            {"name": "velocity_check", "type": "string"},
-                            {"name": "amount_threshold", "type": "string"},
-                            {"name": "location_risk", "type": "string"},
-                            {"name": "pattern_match", "type": "string"},
-                        ]
-                    }
-                }
-            },
-        )
+    # Step 3: Create the tables
+    table_arns = []
+    existing = []
+    for table_name, metadata in tables:
+        try:
+            response = s3tables.create_table(
+                tableBucketARN=table_bucket_arn,
+                namespace=namespace[0],
+                name=table_name,
+                format="ICEBERG",
+                metadata=metadata,
+            )
+            print(f"S3 Table '{table_name}' created successfully")
+            table_arns.append(response.get("tableARN"))
+        except ClientError as e:
+            if not already_exists(e):
+                raise
+            print(f"S3 Table '{table_name}' already exists. Skipping creation.")
+            existing.append(table_name)
+            response = s3tables.get_table(
+                tableBucketARN=table_bucket_arn, namespace=namespace[0], name=table_name
+            )
+            table_arns.append(response["tableARN"])
+    resolver.invalidate(table_bucket_name)
 
-        print(f"S3 Table '{table_name}' created successfully")
-        return {
-            "Message": "S3 Table created successfully",
-            "TableArn": response.get("tableArn"),
-        }
-    except ClientError as e:
-        if e.response["Error"]["Code"] == "ResourceAlreadyExistsException":
-            print(f"Table {table_name} already exists. Skipping creation.")
-            return {"Message": f"S3 Table {table_name} already exists"}
+    return {
+        "Message": "S3 Table created successfully",
+        "TableArn": table_arns[0],
+        "TableArns": table_arns,
+        "ExistingTables": existing,
+    }
+
+
+def update_tables(s3tables, s3, table_bucket_arn, namespace, tables):
+    # Commits the schema, partition spec and write order of each existing
+    # table's definition. Returns the names of the tables that changed.
+    updated = []
+    for table_name, metadata in tables:
+        location = commit_table_metadata(
+            s3tables,
+            s3,
+            table_bucket_arn,
+            namespace[0],
+            table_name,
+            metadata["iceberg"],
+        )
+        if location is None:
+            print(f"S3 Table '{table_name}' is up to date")
         else:
-            raise
+            print(f"S3 Table '{table_name}' updated to {location}")
+            updated.append(table_name)
+    return updated
 
 
-def delete_table(s3tables, table_bucket_name, namespace, table_name):
+def delete_tables(s3tables, resolver, table_bucket_name, namespace, table_names):
     try:
+        table_bucket_arn = resolver.table_bucket_arn(table_bucket_name)
+        if table_bucket_arn is None:
+            print(f"Table bucket {table_bucket_name} not found. Skipping deletion.")
+            return {"Message": f"S3 Table {table_names[0]} does not exist"}
 
-        # List all table buckets
-        response = s3tables.list_table_buckets()
-        print(response)
-        table_bucket_arn = None
-        # Loop through the table buckets to find the matching one
-        for table_bucket in response.get("tableBuckets", []):
-            if table_bucket["name"] == table_bucket_name:
-                table_bucket_arn = table_bucket["arn"]
-                break
-        print(namespace)
-
-        # Step 1: Delete the table
-        response = s3tables.delete_table(
-            tableBucketARN=table_bucket_arn,
-            namespace=namespace[0],
-            name=table_name,
-        )
-        print(f"Deleted table {table_name} in namespace {namespace}")
+        # Step 1: Delete the tables; one that was never created is skipped
+        for table_name in table_names:
+            try:
+                s3tables.delete_table(
+                    tableBucketARN=table_bucket_arn,
+                    namespace=namespace[0],
+                    name=table_name,
+                )
+                print(f"Deleted table {table_name} in namespace {namespace}")
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in NOT_FOUND_ERROR_CODES:
+                    raise
+                print(f"Table {table_name} not found. Skipping deletion.")
 
         # Step 2: Delete the namespace
         s3tables.delete_namespace(
@@ -167,10 +248,11 @@ def delete_table(s3tables, table_bucket_name, namespace, table_name):
 
         # Step 3: Delete the table bucket
         s3tables.delete_table_bucket(tableBucketARN=table_bucket_arn)
+        resolver.invalidate(table_bucket_name)
         return {"Message": "S3 Table deleted successfully"}
     except ClientError as e:
-        if e.response["Error"]["Code"] == "ResourceNotFoundException":
-            print(f"Table {table_name} not found. Skipping deletion.")
-            return {"Message": f"S3 Table {table_name} does not exist"}
+        if e.response["Error"]["Code"] in NOT_FOUND_ERROR_CODES:
+            print(f"Namespace or table bucket {table_bucket_name} not found.")
+            return {"Message": f"S3 Table {table_names[0]} does not exist"}
         else:
             raise
@@ -1,29 +1,344 @@
-import json
 import boto3
 import os
+import random
+import time
+import zlib
+from functools import partial
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from ddb_decoder import decode_image
+from explode import explode, split_image, stale_rows
+from instrumentation import InvocationMetrics
+from routing import OPERATION_FIELD, load_routes
+from serializer import dumps
 
-firehose_client = boto3.client("firehose")
 FIREHOSE_DELIVERY_STREAM = os.environ["FIREHOSE_DELIVERY_STREAM"]
 
+# When the event source mapping ignores batchItemFailures, a failure must fail the
+# whole invocation so that the batch is retried instead of silently dropped
+REPORT_BATCH_ITEM_FAILURES = (
+    os.environ.get("REPORT_BATCH_ITEM_FAILURES", "true").lower() == "true"
+)
+
+# Number of PutRecordBatch calls kept in flight at once
+MAX_CONCURRENCY = max(1, int(os.environ.get("FIREHOSE_MAX_CONCURRENCY", "1")))
+
+# One client for the whole container, with enough pooled connections for every lane
+firehose_client = boto3.client(
+    "firehose", config=Config(max_pool_connections=max(10, MAX_CONCURRENCY))
+)
+executor = None
+if MAX_CONCURRENCY > 1:
+    # Only imported when lanes are sent in parallel
+    from concurrent.futures import ThreadPoolExecutor
+
+    executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY)
+
+try:
+    # Provided by the Lambda Python runtime when SnapStart is enabled
+    from snapshot_restore_py import register_after_restore
+except ImportError:
+    register_after_restore = None
+
+if register_after_restore is not None:
+    # Every environment restored from the same snapshot starts with the same random
+    # state, which would make their retry jitter identical
+    register_after_restore(random.seed)
+
+# Built once per container from the table definition of the delivery stream's
+# only route, shipped in the shared layer
+(ROUTE,) = load_routes(os.environ.get("TABLE_ROUTES")).values()
+DECODE_PLAN = ROUTE.decode_plan
+# Set when the route writes a nested list attribute to a child table as well
+EXPLODE_PLAN = ROUTE.explode_plan
+
+# Records that can never be delivered, such as one with a value the table
+# cannot hold or a row over the record size limit, are sent here instead of
+# being retried until they expire. The on-failure queue of the event source
+# mapping is used when it is enabled.
+FAILURE_QUEUE_URL = os.environ.get("FAILURE_QUEUE_URL")
+sqs_client = boto3.client("sqs") if FAILURE_QUEUE_URL else None
+
+# SendMessageBatch service limit
+MAX_QUEUE_BATCH_ENTRIES = 10
+
+# PutRecordBatch service limits
+MAX_BATCH_RECORDS = 500
+MAX_BATCH_BYTES = 4 * 1024 * 1024
+MAX_RECORD_BYTES = 1000 * 1024
+
+# Retry settings for entries that Firehose rejects within a batch
+MAX_ATTEMPTS = int(os.environ.get("FIREHOSE_MAX_ATTEMPTS", "5"))
+BASE_BACKOFF_SECONDS = 0.05
+MAX_BACKOFF_SECONDS = 2.0
+RETRYABLE_ERROR_CODES = {"ServiceUnavailableException", "ThrottlingException"}
+
 
 def handler(event, context):
-    print(f"Received {len(event['Records'])} records")
+    metrics = InvocationMetrics("firehose", context)
+    metrics.count("records_in", len(event["Records"]))
+    entries = []
+    failed_sequence_numbers = []
+    rejected = []
+
     for record in event["Records"]:
-        if record["eventName"] == "INSERT" or record["eventName"] == "MODIFY":
-            # Get the new image of the item
-            new_image = record["dynamodb"]["NewImage"]
+        event_name = record["eventName"]
+        if event_name in ("INSERT", "MODIFY", "REMOVE"):
+            sequence_number = record["dynamodb"]["SequenceNumber"]
+
+            # Convert DynamoDB JSON to regular JSON with the table's column types.
+            # A value the table cannot hold fails the same way on every retry.
+            started = time.perf_counter()
+            try:
+                rows, deletes = change_rows(event_name, record["dynamodb"])
+                decoded = time.perf_counter()
+                # Deletes go first, so that an upsert of the same row in its
+                # new partition is not deleted again
+                data = [
+                    dumps(dict(row, **{OPERATION_FIELD: "delete"})) for row in deletes
+                ]
+                data.extend(dumps(row) for row in rows)
+            except Exception as e:
+                metrics.add_time("decode", time.perf_counter() - started)
+                rejected.append((record, "invalid", str(e)))
+                continue
+            metrics.add_time("decode", decoded - started)
+            metrics.add_time("encode", time.perf_counter() - decoded)
+            if len(rows) > 1:
+                metrics.count("rows_exploded", len(rows) - 1)
+            if deletes:
+                metrics.count("rows_deleted", len(deletes))
+
+            # A row over the Firehose record size limit can never be sent, and
+            # replaying it would hold back the rest of the shard
+            largest = max(len(row_data) for row_data in data)
+            if largest > MAX_RECORD_BYTES:
+                rejected.append(
+                    (
+                        record,
+                        "oversized",
+                        f"{largest} bytes exceeds the Firehose record size limit",
+                    )
+                )
+                continue
+            # Child rows and deletes share the lane of their parent row
+            key = ROUTE.key((rows or deletes)[0])
+            for row_data in data:
+                metrics.bytes_out += len(row_data)
+                entries.append((key, sequence_number, row_data))
+        else:
+            metrics.count("records_skipped")
+
+    # Records that cannot be recorded on the failure queue are retried instead
+    failed_sequence_numbers.extend(reject_records(rejected, metrics))
+
+    # Send the items to Kinesis Firehose in as few calls as the limits allow
+    rows_sent = len(entries)
+    lanes = split_into_lanes(entries, MAX_CONCURRENCY)
+    with metrics.timer("send"):
+        if executor is None or len(lanes) == 1:
+            results = map(partial(send_lane, metrics=metrics), lanes)
+        else:
+            results = executor.map(partial(send_lane, metrics=metrics), lanes)
+        for failed in results:
+            rows_sent -= len(failed)
+            failed_sequence_numbers.extend(failed)
+    # A record is replayed as a whole when any of its rows failed
+    failed_sequence_numbers = list(dict.fromkeys(failed_sequence_numbers))
+    # Stream records all of whose rows were delivered; a record can have
+    # several rows, with child rows and deletes
+    records_sent = len(
+        {sequence_number for _, sequence_number, _ in entries}.difference(
+            failed_sequence_numbers
+        )
+    )
+
+    metrics.count("records_sent", records_sent)
+    metrics.count("rows_sent", rows_sent)
+    metrics.count("records_failed", len(failed_sequence_numbers))
+    metrics.emit()
+
+    if failed_sequence_numbers and not REPORT_BATCH_ITEM_FAILURES:
+        raise RuntimeError(
+            f"{len(failed_sequence_numbers)} records could not be sent to Firehose"
+        )
+    # Only the failed records are replayed by the event source mapping
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": sequence_number}
+            for sequence_number in failed_sequence_numbers
+        ]
+    }
 
-            # Convert DynamoDB JSON to regular JSON
-            item = {k: list(v.values())[0] for k, v in new_image.items()}
 
-            # Send the item to Kinesis Firehose
-            firehose_client.put_record(
+def image_rows(image):
+    # The parent row of an item image, followed by its child rows
+    elements = ()
+    if EXPLODE_PLAN is not None:
+        image, elements = split_image(image, EXPLODE_PLAN)
+    item = decode_image(image, DECODE_PLAN)
+    if not elements:
+        return [item]
+    return [item, *explode(item, elements, EXPLODE_PLAN)]
+
+
+def change_rows(event_name, change):
+    # Returns (rows to upsert, rows to delete) for one stream record. A
+    # removed item deletes its rows. A modified item deletes the rows of its
+    # old image that its new rows do not replace: child rows past the end of
+    # a shorter list, and rows whose partition changed. A delete row holds
+    # the old values, so that it applies in the partition of the old row.
+    rows = image_rows(change["NewImage"]) if event_name != "REMOVE" else []
+    old_image = change.get("OldImage")
+    if event_name == "INSERT" or (old_image is None and event_name == "MODIFY"):
+        return rows, []
+    if old_image is None:
+        raise ValueError("REMOVE record without an OldImage")
+    old_rows = image_rows(old_image)
+    deletes = stale_rows(
+        old_rows[:1], rows[:1], ROUTE.unique_keys, ROUTE.partition_columns
+    )
+    if EXPLODE_PLAN is not None:
+        deletes.extend(
+            stale_rows(
+                old_rows[1:],
+                rows[1:],
+                EXPLODE_PLAN.unique_keys,
+                EXPLODE_PLAN.partition_columns,
+            )
+        )
+    return rows, deletes
+
+
+def reject_records(rejected, metrics):
+    # Counts and logs (record, reason, detail) triples and sends them to the
+    # failure queue. Returns the sequence numbers that could not be sent.
+    for record, reason, detail in rejected:
+        metrics.count(f"rejected_{reason}")
+        print(
+            f"Rejected record {record['dynamodb']['SequenceNumber']} ({reason}) "
+            f"with keys {dumps(record['dynamodb'].get('Keys')).decode()}: {detail}"
+        )
+    metrics.count("records_rejected", len(rejected))
+    if not rejected or sqs_client is None:
+        return []
+    unsent = []
+    for start in range(0, len(rejected), MAX_QUEUE_BATCH_ENTRIES):
+        chunk = rejected[start : start + MAX_QUEUE_BATCH_ENTRIES]
+        queue_entries = [
+            {
+                "Id": str(position),
+                "MessageBody": dumps(
+                    {
+                        "reason": reason,
+                        "detail": detail,
+                        "eventID": record.get("eventID"),
+                        "eventSourceARN": record.get("eventSourceARN"),
+                        "sequenceNumber": record["dynamodb"]["SequenceNumber"],
+                        "keys": record["dynamodb"].get("Keys"),
+                    }
+                ).decode(),
+            }
+            for position, (record, reason, detail) in enumerate(chunk)
+        ]
+        try:
+            response = sqs_client.send_message_batch(
+                QueueUrl=FAILURE_QUEUE_URL, Entries=queue_entries
+            )
+            failed = [int(entry["Id"]) for entry in response.get("Failed", [])]
+        except ClientError as e:
+            print(f"Error sending rejected records to the failure queue: {str(e)}")
+            failed = range(len(chunk))
+        unsent.extend(
+            chunk[position][0]["dynamodb"]["SequenceNumber"] for position in failed
+        )
+    metrics.count("records_dead_lettered", len(rejected) - len(unsent))
+    return unsent
+
+
+def split_into_lanes(entries, lane_count):
+    # Every record for a unique key lands in the same lane, and a lane sends its
+    # batches one after another, so per-key ordering follows the stream order
+    if lane_count == 1:
+        return [entries]
+    lanes = [[] for _ in range(lane_count)]
+    for entry in entries:
+        lane = zlib.crc32(str(entry[0]).encode("utf-8")) % lane_count
+        lanes[lane].append(entry)
+    return [lane for lane in lanes if lane]
+
+
+def send_lane(lane, metrics):
+    # Returns the sequence numbers of the entries that were not delivered. A
+    # lane stops at the first batch that gives up: its later entries are
+    # replayed with the failed ones, so that no later change of a key is
+    # delivered before an earlier one
+    sent = 0
+    for batch in chunk_entries(lane):
+        failed = put_batch_with_retry(batch, metrics)
+        sent += len(batch)
+        if failed:
+            return failed + [sequence_number for _, sequence_number, _ in lane[sent:]]
+    return []
+
+
+def chunk_entries(entries):
+    batch = []
+    batch_bytes = 0
+    for entry in entries:
+        size = len(entry[2])
+        if batch and (
+            len(batch) == MAX_BATCH_RECORDS or batch_bytes + size > MAX_BATCH_BYTES
+        ):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(entry)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def put_batch_with_retry(batch, metrics):
+    # Takes (key, sequence number, data) entries and returns the sequence
+    # numbers of the entries that could not be delivered
+    pending = batch
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt:
+            metrics.count("records_retried", len(pending))
+            time.sleep(backoff_seconds(attempt))
+        metrics.count("put_record_batch_calls")
+        try:
+            response = firehose_client.put_record_batch(
                 DeliveryStreamName=FIREHOSE_DELIVERY_STREAM,
-                Record={"Data": json.dumps(item)}
+                Records=[{"Data": data} for _, _, data in pending],
             )
+        except ClientError as e:
+            if e.response["Error"]["Code"] in RETRYABLE_ERROR_CODES:
+                print(f"PutRecordBatch attempt {attempt + 1} failed: {str(e)}")
+                continue
+            print(f"Error sending records to Firehose: {str(e)}")
+            return [sequence_number for _, sequence_number, _ in pending]
 
-    print(f"Successfully Sent {len(event['Records'])} records to Firehose")
-    return {
-        "statusCode": 200,
-        "body": json.dumps("Successfully processed DynamoDB stream events"),
-    }
\ No newline at end of file
+        if response["FailedPutCount"] == 0:
+            return []
+
+        # RequestResponses is positional. An entry that carries an error is
+        # resent with every later entry of its key, delivered or not, so that
+        # the key's last change still lands last.
+        failed_keys = set()
+        retry = []
+        for entry, result in zip(pending, response["RequestResponses"]):
+            if "ErrorCode" in result or entry[0] in failed_keys:
+                failed_keys.add(entry[0])
+                retry.append(entry)
+        pending = retry
+
+    return [sequence_number for _, sequence_number, _ in pending]
+
+
+def backoff_seconds(attempt):
+    # Exponential backoff with full jitter
+    return random.uniform(
+        0, min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * (2**attempt))
+    )
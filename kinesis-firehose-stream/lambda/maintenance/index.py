@@ -0,0 +1,58 @@
+import boto3
+import json
+import os
+from instrumentation import InvocationMetrics
+from maintenance import apply_maintenance, job_status, read_table_metadata, table_stats
+
+TABLE_BUCKET_ARN = os.environ["TABLE_BUCKET_ARN"]
+NAMESPACE = os.environ["NAMESPACE"]
+TABLE_NAME = os.environ["TABLE_NAME"]
+SETTINGS = json.loads(os.environ["MAINTENANCE_SETTINGS"])
+
+# Created once per container and reused across invocations
+s3tables_client = boto3.client("s3tables")
+s3_client = boto3.client("s3")
+
+
+def handler(event, context):
+    metrics = InvocationMetrics("maintenance", context)
+    table = (TABLE_BUCKET_ARN, NAMESPACE, TABLE_NAME)
+    try:
+        with metrics.timer("configure"):
+            changed = apply_maintenance(s3tables_client, *table, SETTINGS)
+        metrics.count("configurations_updated", len(changed))
+        for maintenance_type in changed:
+            print(f"Updated the {maintenance_type} maintenance configuration")
+
+        with metrics.timer("job_status"):
+            statuses = job_status(s3tables_client, *table)
+        for maintenance_type, status in statuses.items():
+            if status.get("status") == "Failed":
+                metrics.count("jobs_failed")
+                print(f"{maintenance_type} failed: {status.get('failureMessage')}")
+
+        with metrics.timer("stats"):
+            stats = table_stats(read_table_metadata(s3tables_client, s3_client, *table))
+        record_stats(metrics, stats)
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        metrics.count("errors")
+        raise
+    finally:
+        metrics.emit()
+
+    return {"changed": changed, "stats": stats}
+
+
+def record_stats(metrics, stats):
+    # File counts and average file size now, and around the last compaction
+    compaction = stats["last_compaction"] or {}
+    for prefix, file_stats in (
+        ("current", stats["current"]),
+        ("compaction_before", compaction.get("before")),
+        ("compaction_after", compaction.get("after")),
+    ):
+        if file_stats:
+            metrics.gauge(f"{prefix}_data_files", file_stats["data_files"])
+            metrics.gauge(f"{prefix}_delete_files", file_stats["delete_files"])
+            metrics.gauge(f"{prefix}_avg_file_bytes", file_stats["avg_file_bytes"])
@@ -0,0 +1,236 @@
+"""Decode DynamoDB-JSON images into Iceberg-typed values.
+
+A decode plan maps every column of the table schema to a converter for its
+Iceberg type. Build it once per container with load_decode_plan() and pass it
+to decode_image() for each record. Attributes that are not in the schema are
+decoded generically, including nested M/L values.
+
+Each column has a fast converter that assumes the attribute carries the
+expected DynamoDB type tag, and a tolerant one that handles NULL and
+mismatched tags. An image is decoded with the fast converters and only falls
+back to the tolerant ones when one of them rejects a value.
+"""
+
+from decimal import Decimal, InvalidOperation
+from operator import itemgetter
+
+from table_spec import DECIMAL_TYPE, load_table_definition, schema_fields
+
+
+def decode_value(av):
+    # Generic decoder for a single DynamoDB attribute value
+    for tag, value in av.items():
+        if tag == "S":
+            return value
+        if tag == "N":
+            return _number(value)
+        if tag == "BOOL":
+            return value
+        if tag == "NULL":
+            return None
+        if tag == "M":
+            return {k: decode_value(v) for k, v in value.items()}
+        if tag == "L":
+            return [decode_value(v) for v in value]
+        if tag == "NS":
+            return [_number(v) for v in value]
+        if tag == "SS" or tag == "BS" or tag == "B":
+            return value
+    raise ValueError(f"Unsupported DynamoDB attribute value: {av}")
+
+
+def _number(value):
+    if "." in value or "e" in value or "E" in value:
+        return Decimal(value)
+    return int(value)
+
+
+def _to_string(av):
+    value = av.get("S")
+    if value is None:
+        value = decode_value(av)
+        return None if value is None else str(value)
+    return value
+
+
+def _to_integer(av):
+    value = av.get("N")
+    if value is None:
+        value = decode_value(av)
+        if value is None:
+            return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    # "12.0" and "1e3" are integers written another way; "12.7" is not, and
+    # is rejected rather than truncated
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"Invalid integer value: {value}")
+    if number != number.to_integral_value():
+        raise ValueError(f"Non-integral value for an integer column: {value}")
+    return int(number)
+
+
+def _to_float(av):
+    value = av.get("N")
+    if value is None:
+        value = decode_value(av)
+        if value is None:
+            return None
+    return float(value)
+
+
+def _to_boolean(av):
+    value = av.get("BOOL")
+    if value is None:
+        return decode_value(av)
+    return value
+
+
+def _fast_integer(av):
+    return int(av["N"])
+
+
+def _fast_float(av):
+    return float(av["N"])
+
+
+def _decimal_converters(scale):
+    exponent = Decimal(1).scaleb(-scale)
+
+    def _fast_decimal(av):
+        return Decimal(av["N"]).quantize(exponent)
+
+    def _to_decimal(av):
+        value = av.get("N")
+        if value is None:
+            value = av.get("S")
+            if value is None:
+                return decode_value(av)
+        try:
+            return Decimal(value).quantize(exponent)
+        except InvalidOperation:
+            raise ValueError(f"Invalid decimal value: {value}")
+
+    return _fast_decimal, _to_decimal
+
+
+# Iceberg type -> (fast converter, tolerant converter)
+CONVERTERS = {
+    "string": (itemgetter("S"), _to_string),
+    "date": (itemgetter("S"), _to_string),
+    "uuid": (itemgetter("S"), _to_string),
+    "int": (_fast_integer, _to_integer),
+    "long": (_fast_integer, _to_integer),
+    "float": (_fast_float, _to_float),
+    "double": (_fast_float, _to_float),
+    "boolean": (itemgetter("BOOL"), _to_boolean),
+}
+
+# Element tag of each DynamoDB set type, which can fill an Iceberg list column
+SET_ELEMENT_TAGS = {"SS": "S", "NS": "N", "BS": "B"}
+
+
+def _converter(field_type):
+    # Tolerant converter for any column type, including nested ones
+    if not isinstance(field_type, str):
+        return _nested_converter(field_type)
+    match = DECIMAL_TYPE.match(field_type)
+    if match:
+        return _decimal_converters(int(match.group(2)))[1]
+    return CONVERTERS.get(field_type, (decode_value, decode_value))[1]
+
+
+def _nested_converter(field_type):
+    # Converts an L or M value to an Iceberg list, struct or map in one pass:
+    # the converters of the members are built here, once per plan, and each
+    # member is converted straight into the result
+    kind = field_type["type"]
+    if kind == "list":
+        element = _converter(field_type["element"])
+
+        def convert(av):
+            values = av.get("L")
+            if values is None:
+                for tag, element_tag in SET_ELEMENT_TAGS.items():
+                    if tag in av:
+                        return [element({element_tag: v}) for v in av[tag]]
+                return _not_nested(av, kind)
+            return [element(v) for v in values]
+
+    elif kind == "struct":
+        members = [(f["name"], _converter(f["type"])) for f in field_type["fields"]]
+
+        def convert(av):
+            value = av.get("M")
+            if value is None:
+                return _not_nested(av, kind)
+            # Attributes that are not struct fields are left out
+            return {
+                name: member(value[name]) for name, member in members if name in value
+            }
+
+    elif kind == "map":
+        key = _converter(field_type["key"])
+        map_value = _converter(field_type["value"])
+
+        def convert(av):
+            value = av.get("M")
+            if value is None:
+                return _not_nested(av, kind)
+            return {key({"S": k}): map_value(v) for k, v in value.items()}
+
+    else:
+        raise ValueError(f"Unsupported nested type: {kind!r}")
+    return convert
+
+
+def _not_nested(av, kind):
+    if av.get("NULL"):
+        return None
+    raise ValueError(f"Expected a {kind} value: {av}")
+
+
+# Raised by a fast converter when the attribute does not have the expected shape
+FAST_PATH_ERRORS = (KeyError, TypeError, ValueError, ArithmeticError)
+
+
+class DecodePlan:
+    __slots__ = ("fast", "tolerant")
+
+    def __init__(self, fast, tolerant):
+        self.fast = fast
+        self.tolerant = tolerant
+
+
+def build_decode_plan(fields):
+    fast = {}
+    tolerant = {}
+    for field in fields:
+        field_type = field["type"]
+        match = DECIMAL_TYPE.match(field_type) if isinstance(field_type, str) else None
+        if not isinstance(field_type, str):
+            converter = _nested_converter(field_type)
+            converters = (converter, converter)
+        elif match:
+            converters = _decimal_converters(int(match.group(2)))
+        else:
+            converters = CONVERTERS.get(field_type, (decode_value, decode_value))
+        fast[field["name"]], tolerant[field["name"]] = converters
+    return DecodePlan(fast, tolerant)
+
+
+def load_decode_plan(path=None):
+    return build_decode_plan(schema_fields(load_table_definition(path)))
+
+
+def decode_image(image, plan):
+    try:
+        get = plan.fast.get
+        return {name: get(name, decode_value)(av) for name, av in image.items()}
+    except FAST_PATH_ERRORS:
+        get = plan.tolerant.get
+        return {name: get(name, decode_value)(av) for name, av in image.items()}
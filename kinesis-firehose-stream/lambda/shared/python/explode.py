@@ -0,0 +1,129 @@
+"""Explode a nested list attribute into the rows of a child table.
+
+A route in TABLE_ROUTES can give an explode setting, written by
+stack/table_routes.py from the table_routes context:
+
+    {"attribute": "items", "table_name": "order_items",
+     "definition": "order_items.json", "index_column": "itemIndex",
+     "unique_keys": ["orderId", "itemIndex"]}
+
+Each map in the attribute's L value becomes one row of the child table,
+typed by the child's table definition. The row also gets its position in
+the list in index_column, and every column of the parent row that the child
+table has as well, such as orderId. Elements that are not maps are skipped;
+the positions of the other elements are kept.
+
+split_image() hands the parent image to the parent's decode plan without
+the attribute, unless the parent table has it as a column, and returns the
+list elements as they are. explode() decodes each element straight into its
+row, so the nested value is read once and never copied.
+
+An upsert only replaces the row with the same unique keys in its own
+partition. stale_rows() returns the rows of an old image that the rows of
+the new image do not replace, such as the items past the end of a shortened
+list, so that they can be deleted.
+"""
+
+from ddb_decoder import build_decode_plan, decode_image
+from table_spec import (
+    definition_path,
+    load_table_definition,
+    partition_columns,
+    schema_fields,
+)
+
+
+class ExplodePlan:
+    __slots__ = (
+        "attribute",
+        "table_name",
+        "index_column",
+        "unique_keys",
+        "partition_columns",
+        "keep_attribute",
+        "parent_columns",
+        "decode_plan",
+    )
+
+    def __init__(
+        self,
+        attribute,
+        table_name,
+        index_column,
+        unique_keys,
+        partition_columns,
+        keep_attribute,
+        parent_columns,
+        decode_plan,
+    ):
+        self.attribute = attribute
+        self.table_name = table_name
+        self.index_column = index_column
+        # Unique keys and partition source columns of the child table
+        self.unique_keys = unique_keys
+        self.partition_columns = partition_columns
+        # Whether the parent row keeps the attribute as a nested column
+        self.keep_attribute = keep_attribute
+        # Columns copied from the parent row into every child row
+        self.parent_columns = parent_columns
+        self.decode_plan = decode_plan
+
+
+def build_explode_plan(explode, parent_fields, parent_unique_keys=()):
+    definition = load_table_definition(definition_path(explode["definition"]))
+    fields = schema_fields(definition)
+    parent_names = {field["name"] for field in parent_fields}
+    index_column = explode["index_column"]
+    return ExplodePlan(
+        explode["attribute"],
+        explode["table_name"],
+        index_column,
+        tuple(explode.get("unique_keys") or (*parent_unique_keys, index_column)),
+        tuple(partition_columns(definition["metadata"]["iceberg"])),
+        explode["attribute"] in parent_names,
+        tuple(
+            field["name"]
+            for field in fields
+            if field["name"] in parent_names and field["name"] != index_column
+        ),
+        build_decode_plan(fields),
+    )
+
+
+def split_image(image, plan):
+    # Returns (parent image, list elements). The parent image is a shallow
+    # copy without the attribute when the parent table does not store it.
+    value = image.get(plan.attribute)
+    if value is None:
+        return image, ()
+    if not plan.keep_attribute:
+        image = {name: av for name, av in image.items() if name != plan.attribute}
+    return image, value.get("L") or ()
+
+
+def explode(parent_item, elements, plan):
+    inherited = {
+        name: parent_item[name] for name in plan.parent_columns if name in parent_item
+    }
+    rows = []
+    for index, element in enumerate(elements):
+        value = element.get("M")
+        if value is None:
+            continue
+        row = decode_image(value, plan.decode_plan)
+        row.update(inherited)
+        row[plan.index_column] = index
+        rows.append(row)
+    return rows
+
+
+def stale_rows(old_rows, new_rows, unique_keys, partition_columns):
+    # Rows of old_rows that no row of new_rows replaces: one with other
+    # unique keys, or the same keys in another partition
+    columns = (*unique_keys, *partition_columns)
+    replaced = {tuple(row.get(name) for name in columns) for row in new_rows}
+    return [
+        row
+        for row in old_rows
+        if tuple(row.get(name) for name in columns) not in replaced
+    ]
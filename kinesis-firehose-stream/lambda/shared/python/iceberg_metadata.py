@@ -0,0 +1,371 @@
+"""Write Iceberg table metadata for an S3 table without a query engine.
+
+Builds the table's metadata.json (schema, partition spec, sort order and
+properties) from the "metadata" argument of CreateTable, as produced by
+table_spec.table_metadata(). For a table that already has metadata, the
+current file is evolved instead: a changed schema, spec or sort order is
+added and made the default, and snapshots and history are kept.
+
+commit_table_metadata() writes the new file to the table's warehouse
+location and points the table at it with UpdateTableMetadataLocation. The
+version token from GetTableMetadataLocation makes the update conditional:
+when another writer committed in between, S3 Tables rejects it with a
+ConflictException. The metadata is then rebuilt from the new current file
+and committed again.
+"""
+
+import gzip
+import json
+import random
+import time
+import uuid
+from urllib.parse import urlparse
+
+from botocore.exceptions import ClientError
+from table_spec import DECIMAL_TYPE, iceberg_fields, is_nested, nested_field_ids
+
+FORMAT_VERSION = 2
+
+# Field ids of partition fields start after 999; an unpartitioned table's
+# last-partition-id is 999
+PARTITION_FIELD_ID_START = 1000
+
+BASE_BACKOFF_SECONDS = 0.1
+MAX_BACKOFF_SECONDS = 5.0
+
+# Type changes Iceberg allows for an existing column
+TYPE_PROMOTIONS = {("int", "long"), ("float", "double")}
+
+# Keys that change on every commit and are ignored when checking for changes
+VOLATILE_KEYS = ("last-updated-ms", "metadata-log")
+
+
+def iceberg_schema(fields, schema_id):
+    return {
+        "type": "struct",
+        "schema-id": schema_id,
+        "fields": [
+            {
+                "id": field["id"],
+                "name": field["name"],
+                "required": field.get("required", False),
+                "type": field["type"],
+            }
+            for field in fields
+        ],
+    }
+
+
+def iceberg_partition_spec(spec, spec_id):
+    return {
+        "spec-id": spec_id,
+        "fields": [
+            {
+                "source-id": field["sourceId"],
+                "field-id": field["fieldId"],
+                "name": field["name"],
+                "transform": field["transform"],
+            }
+            for field in spec.get("fields", [])
+        ],
+    }
+
+
+def iceberg_sort_order(order, order_id):
+    return {
+        "order-id": order_id if order.get("fields") else 0,
+        "fields": [
+            {
+                "source-id": field["sourceId"],
+                "transform": field["transform"],
+                "direction": field["direction"],
+                "null-order": field["nullOrder"],
+            }
+            for field in order.get("fields", [])
+        ],
+    }
+
+
+def _last_column_id(fields):
+    # Struct fields, list elements and map keys and values are numbered from
+    # the same sequence as the columns
+    return max(
+        i for field in fields for i in [field["id"], *nested_field_ids(field["type"])]
+    )
+
+
+def _last_partition_id(specs):
+    field_ids = [field["field-id"] for spec in specs for field in spec["fields"]]
+    return max(field_ids, default=PARTITION_FIELD_ID_START - 1)
+
+
+def new_table_metadata(iceberg, location, properties=None, now_ms=None):
+    fields = iceberg_fields(iceberg)
+    spec = iceberg_partition_spec(iceberg.get("partitionSpec", {}), 0)
+    order = iceberg_sort_order(iceberg.get("writeOrder", {}), 1)
+    sort_orders = [{"order-id": 0, "fields": []}]
+    if order["order-id"]:
+        sort_orders.append(order)
+    return {
+        "format-version": FORMAT_VERSION,
+        "table-uuid": str(uuid.uuid4()),
+        "location": location,
+        "last-sequence-number": 0,
+        "last-updated-ms": now_ms or int(time.time() * 1000),
+        "last-column-id": _last_column_id(fields),
+        "current-schema-id": 0,
+        "schemas": [iceberg_schema(fields, 0)],
+        "default-spec-id": 0,
+        "partition-specs": [spec],
+        "last-partition-id": _last_partition_id([spec]),
+        "default-sort-order-id": order["order-id"],
+        "sort-orders": sort_orders,
+        "properties": dict(properties or {}),
+        "current-snapshot-id": -1,
+        "refs": {},
+        "snapshots": [],
+        "statistics": [],
+        "snapshot-log": [],
+        "metadata-log": [],
+    }
+
+
+def _check_type_change(name, current_type, new_type):
+    if _type_shape(current_type) == _type_shape(new_type):
+        return
+    if is_nested(current_type) or is_nested(new_type):
+        raise ValueError(f"Nested column {name!r} cannot change its type")
+    if (current_type, new_type) in TYPE_PROMOTIONS:
+        return
+    current_decimal = DECIMAL_TYPE.match(current_type)
+    new_decimal = DECIMAL_TYPE.match(new_type)
+    if (
+        current_decimal
+        and new_decimal
+        and current_decimal.group(2) == new_decimal.group(2)
+        and int(new_decimal.group(1)) >= int(current_decimal.group(1))
+    ):
+        return
+    raise ValueError(f"Column {name!r} cannot change from {current_type} to {new_type}")
+
+
+def _check_schema_evolution(current, fields):
+    schema = next(
+        s for s in current["schemas"] if s["schema-id"] == current["current-schema-id"]
+    )
+    existing = {field["id"]: field for field in schema["fields"]}
+    for field in fields:
+        previous = existing.get(field["id"])
+        if previous:
+            _check_type_change(field["name"], previous["type"], field["type"])
+            if field.get("required", False) and not previous["required"]:
+                raise ValueError(f"Column {field['name']!r} cannot become required")
+        elif field["id"] <= current["last-column-id"]:
+            # Ids of dropped columns are never reused, or old data files would
+            # be read into the new column
+            raise ValueError(
+                f"Column {field['name']!r} reuses field id {field['id']}; new "
+                f"columns need ids above {current['last-column-id']}"
+            )
+        elif field.get("required", False):
+            raise ValueError(f"New column {field['name']!r} must be optional")
+
+
+def _find_or_add(entries, id_key, wanted, shape=None):
+    # Returns the id of the entry with the same shape as wanted, adding wanted
+    # with the next free id when there is none. By default an entry's shape is
+    # the entry apart from its id.
+    wanted_shape = shape(wanted) if shape else {**wanted, id_key: None}
+    for entry in entries:
+        if (shape(entry) if shape else {**entry, id_key: None}) == wanted_shape:
+            return entry[id_key]
+    wanted[id_key] = max(entry[id_key] for entry in entries) + 1
+    entries.append(wanted)
+    return wanted[id_key]
+
+
+def _schema_shape(schema):
+    # Schemas are the same when their columns have the same names, types and
+    # required flags in the same order. Schema and field ids, and keys that
+    # other writers add such as doc or identifier-field-ids, are ignored.
+    return _type_shape({"type": "struct", "fields": schema["fields"]})
+
+
+def _type_shape(field_type):
+    if not is_nested(field_type):
+        return field_type
+    kind = field_type["type"]
+    if kind == "struct":
+        return (
+            kind,
+            tuple(
+                (
+                    field["name"],
+                    _type_shape(field["type"]),
+                    field.get("required", False),
+                )
+                for field in field_type["fields"]
+            ),
+        )
+    if kind == "list":
+        return (
+            kind,
+            _type_shape(field_type["element"]),
+            field_type.get("element-required", False),
+        )
+    if kind == "map":
+        return (
+            kind,
+            _type_shape(field_type["key"]),
+            _type_shape(field_type["value"]),
+            field_type.get("value-required", False),
+        )
+    raise ValueError(f"Unsupported nested type: {kind!r}")
+
+
+def updated_table_metadata(
+    current, iceberg, metadata_location, properties=None, now_ms=None
+):
+    # current is the metadata at metadata_location
+    fields = iceberg_fields(iceberg)
+    _check_schema_evolution(current, fields)
+    metadata = json.loads(json.dumps(current))
+
+    metadata["current-schema-id"] = _find_or_add(
+        metadata["schemas"], "schema-id", iceberg_schema(fields, None), _schema_shape
+    )
+    metadata["last-column-id"] = max(
+        metadata["last-column-id"], _last_column_id(fields)
+    )
+
+    # Partition fields that existed before keep their field id, new ones get
+    # the next unused id
+    spec = iceberg_partition_spec(iceberg.get("partitionSpec", {}), None)
+    known = {
+        (field["source-id"], field["transform"]): field["field-id"]
+        for existing in metadata["partition-specs"]
+        for field in existing["fields"]
+    }
+    last_partition_id = metadata.get("last-partition-id", PARTITION_FIELD_ID_START - 1)
+    for field in spec["fields"]:
+        key = (field["source-id"], field["transform"])
+        if key not in known:
+            last_partition_id += 1
+            known[key] = last_partition_id
+        field["field-id"] = known[key]
+    metadata["default-spec-id"] = _find_or_add(
+        metadata["partition-specs"], "spec-id", spec
+    )
+    metadata["last-partition-id"] = last_partition_id
+
+    order = iceberg_sort_order(iceberg.get("writeOrder", {}), None)
+    if order["fields"]:
+        metadata["default-sort-order-id"] = _find_or_add(
+            metadata["sort-orders"], "order-id", order
+        )
+    else:
+        metadata["default-sort-order-id"] = 0
+
+    metadata["properties"].update(properties or {})
+    if _without_volatile_keys(metadata) == _without_volatile_keys(current):
+        return None
+    metadata["last-updated-ms"] = now_ms or int(time.time() * 1000)
+    metadata["metadata-log"].append(
+        {"metadata-file": metadata_location, "timestamp-ms": current["last-updated-ms"]}
+    )
+    return metadata
+
+
+def _without_volatile_keys(metadata):
+    return {k: v for k, v in metadata.items() if k not in VOLATILE_KEYS}
+
+
+def read_metadata_file(s3, location):
+    url = urlparse(location)
+    body = s3.get_object(Bucket=url.netloc, Key=url.path.lstrip("/"))["Body"].read()
+    if location.endswith(".gz.metadata.json"):
+        body = gzip.decompress(body)
+    return json.loads(body)
+
+
+def metadata_file_location(warehouse_location, previous_location=None):
+    # <warehouse>/metadata/<version>-<uuid>.metadata.json, one version after
+    # the previous file
+    version = 0
+    if previous_location:
+        name = previous_location.rsplit("/", 1)[-1]
+        prefix = name.split("-", 1)[0]
+        version = int(prefix) + 1 if prefix.isdigit() else 1
+    return (
+        f"{warehouse_location.rstrip('/')}/metadata/"
+        f"{version:05d}-{uuid.uuid4()}.metadata.json"
+    )
+
+
+def write_metadata_file(s3, location, metadata):
+    url = urlparse(location)
+    s3.put_object(
+        Bucket=url.netloc,
+        Key=url.path.lstrip("/"),
+        Body=json.dumps(metadata).encode(),
+        ContentType="application/json",
+    )
+
+
+def backoff_seconds(attempt):
+    # Exponential backoff with full jitter
+    return random.uniform(
+        0, min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * (2**attempt))
+    )
+
+
+def commit_table_metadata(
+    s3tables,
+    s3,
+    table_bucket_arn,
+    namespace,
+    name,
+    iceberg,
+    properties=None,
+    max_attempts=5,
+):
+    # Returns the new metadata location, or None when the table already has
+    # this schema, partition spec, sort order and properties
+    table = {"tableBucketARN": table_bucket_arn, "namespace": namespace, "name": name}
+    for attempt in range(max_attempts):
+        response = s3tables.get_table_metadata_location(**table)
+        current_location = response.get("metadataLocation")
+        if current_location:
+            metadata = updated_table_metadata(
+                read_metadata_file(s3, current_location),
+                iceberg,
+                current_location,
+                properties,
+            )
+            if metadata is None:
+                return None
+        else:
+            metadata = new_table_metadata(
+                iceberg, response["warehouseLocation"], properties
+            )
+
+        location = metadata_file_location(
+            response["warehouseLocation"], current_location
+        )
+        write_metadata_file(s3, location, metadata)
+        try:
+            s3tables.update_table_metadata_location(
+                **table,
+                versionToken=response["versionToken"],
+                metadataLocation=location,
+            )
+            return location
+        except ClientError as e:
+            # The file written for the lost attempt is never referenced, so
+            # unreferenced file removal deletes it
+            if e.response["Error"]["Code"] != "ConflictException":
+                raise
+            if attempt == max_attempts - 1:
+                raise
+            print(f"Table {name} changed during the commit, retrying")
+            time.sleep(backoff_seconds(attempt))
@@ -0,0 +1,116 @@
+"""Per-invocation metrics for the Lambdas.
+
+Each invocation writes one structured JSON summary line: record counts, bytes
+in and out, and time spent per stage. Per-record debug lines are sampled.
+
+Environment:
+    DEBUG_SAMPLE_RATE   fraction of debug() calls that are logged (default 0)
+    METRICS_NAMESPACE   when set, the summary line is also written in CloudWatch
+                        Embedded Metric Format under this namespace, so metrics
+                        are charted without PutMetricData calls
+"""
+
+import json
+import os
+import random
+import threading
+import time
+
+DEBUG_SAMPLE_RATE = float(os.environ.get("DEBUG_SAMPLE_RATE", "0"))
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE")
+
+
+class InvocationMetrics:
+    def __init__(self, function, context=None):
+        self.function = function
+        self.request_id = getattr(context, "aws_request_id", None)
+        self.counts = {}
+        self.gauges = {}
+        self.timings = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def count(self, name, value=1):
+        # Safe to call from worker threads
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def gauge(self, name, value):
+        # Last value wins, for ratios and other per-invocation values
+        with self._lock:
+            self.gauges[name] = value
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def timer(self, name):
+        return _Timer(self, name)
+
+    def debug(self, message, **fields):
+        if DEBUG_SAMPLE_RATE and random.random() < DEBUG_SAMPLE_RATE:
+            print(json.dumps({"message": message, **fields}, default=str))
+
+    def summary(self):
+        summary = {
+            "function": self.function,
+            "request_id": self.request_id,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "duration_ms": round((time.perf_counter() - self.started) * 1e3, 3),
+        }
+        summary.update(self.counts)
+        for name, value in self.gauges.items():
+            summary[name] = round(value, 6)
+        for name, seconds in self.timings.items():
+            summary[f"{name}_ms"] = round(seconds * 1e3, 3)
+        return summary
+
+    def emit(self):
+        summary = self.summary()
+        if METRICS_NAMESPACE:
+            summary["_aws"] = {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": METRICS_NAMESPACE,
+                        "Dimensions": [["function"]],
+                        "Metrics": [
+                            {"Name": name, "Unit": _unit(name)}
+                            for name, value in summary.items()
+                            if isinstance(value, (int, float))
+                            and not isinstance(value, bool)
+                        ],
+                    }
+                ],
+            }
+        print(json.dumps(summary))
+        return summary
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.add_time(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def _unit(name):
+    if name.endswith("_ms"):
+        return "Milliseconds"
+    if name.startswith("bytes_") or name.endswith("_bytes"):
+        return "Bytes"
+    if name.endswith("_ratio"):
+        return "None"
+    return "Count"
@@ -0,0 +1,169 @@
+"""Kinesis Producer Library (KPL) record aggregation.
+
+An aggregated Kinesis record packs many user records into one. It is the KPL
+magic number, followed by an AggregatedRecord protobuf message and the MD5
+digest of that message:
+
+    message AggregatedRecord {
+        repeated string partition_key_table = 1;
+        repeated string explicit_hash_key_table = 2;
+        repeated Record records = 3;
+    }
+    message Record {
+        required uint64 partition_key_index = 1;
+        optional uint64 explicit_hash_key_index = 2;
+        required bytes data = 3;
+        repeated Tag tags = 4;
+    }
+
+The few fields involved are encoded by hand, so neither the KPL nor protobuf
+is needed in the Lambda layer. Explicit hash keys and tags are skipped when
+reading and never written.
+"""
+
+import hashlib
+
+MAGIC = b"\xf3\x89\x9a\xc2"
+DIGEST_SIZE = 16
+
+# Wire types
+VARINT = 0
+LENGTH_DELIMITED = 2
+FIXED64 = 1
+FIXED32 = 5
+
+
+def is_aggregated(data):
+    return (
+        len(data) > len(MAGIC) + DIGEST_SIZE
+        and data[: len(MAGIC)] == MAGIC
+        and hashlib.md5(data[len(MAGIC) : -DIGEST_SIZE]).digest()
+        == data[-DIGEST_SIZE:]
+    )
+
+
+# Single-byte varints, which cover field keys and most lengths and indexes
+_SMALL_VARINTS = [bytes((value,)) for value in range(0x80)]
+
+
+def _varint(value):
+    if value < 0x80:
+        return _SMALL_VARINTS[value]
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _field_header(number, size):
+    return _varint(number << 3 | LENGTH_DELIMITED) + _varint(size)
+
+
+def _field(number, payload):
+    return _field_header(number, len(payload)) + payload
+
+
+def _read_varint(buffer, position):
+    result = shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def _fields(buffer):
+    # Yields (field number, value) for a message; values of length-delimited
+    # fields are memoryview slices, varints are ints, fixed-width fields are skipped
+    position = 0
+    end = len(buffer)
+    while position < end:
+        key, position = _read_varint(buffer, position)
+        number, wire_type = key >> 3, key & 0x7
+        if wire_type == VARINT:
+            value, position = _read_varint(buffer, position)
+        elif wire_type == LENGTH_DELIMITED:
+            size, position = _read_varint(buffer, position)
+            value = buffer[position : position + size]
+            position += size
+        elif wire_type == FIXED64:
+            position += 8
+            continue
+        elif wire_type == FIXED32:
+            position += 4
+            continue
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        yield number, value
+
+
+class AggregatedRecord:
+    # Builds an aggregated payload one user record at a time, so a producer can
+    # check the size before adding the next one
+    def __init__(self):
+        self.keys = {}
+        self.key_table = []
+        self.records = []
+        self.size = len(MAGIC) + DIGEST_SIZE
+
+    def __len__(self):
+        return len(self.records)
+
+    def encoded_size(self, partition_key, data):
+        # Bytes the payload grows by when the record is added
+        index = self.keys.get(partition_key)
+        size = 0
+        if index is None:
+            index = len(self.key_table)
+            size += len(_field(1, partition_key.encode("utf-8")))
+        record_size = (
+            1 + len(_varint(index)) + len(_field_header(3, len(data))) + len(data)
+        )
+        return size + len(_field_header(3, record_size)) + record_size
+
+    def add(self, partition_key, data):
+        index = self.keys.get(partition_key)
+        if index is None:
+            index = self.keys[partition_key] = len(self.key_table)
+            entry = _field(1, partition_key.encode("utf-8"))
+            self.key_table.append(entry)
+            self.size += len(entry)
+        record = _field(3, b"\x08" + _varint(index) + _field(3, data))
+        self.records.append(record)
+        self.size += len(record)
+
+    def payload(self):
+        message = b"".join(self.key_table) + b"".join(self.records)
+        return MAGIC + message + hashlib.md5(message).digest()
+
+
+def aggregate(records):
+    # records are (partition_key, data) pairs; returns the aggregated payload
+    aggregated = AggregatedRecord()
+    for partition_key, data in records:
+        aggregated.add(partition_key, data)
+    return aggregated.payload()
+
+
+def deaggregate(data):
+    # Returns the (partition_key, data) user records of an aggregated payload
+    message = memoryview(data)[len(MAGIC) : -DIGEST_SIZE]
+    key_table = []
+    records = []
+    for number, value in _fields(message):
+        if number == 1:
+            key_table.append(str(value, "utf-8"))
+        elif number == 3:
+            key_index = 0
+            record_data = b""
+            for record_number, record_value in _fields(value):
+                if record_number == 1:
+                    key_index = record_value
+                elif record_number == 3:
+                    record_data = bytes(record_value)
+            records.append((key_index, record_data))
+    return [(key_table[key_index], record_data) for key_index, record_data in records]
@@ -0,0 +1,160 @@
+"""S3 Tables maintenance configuration and Iceberg file statistics.
+
+S3 Tables compacts a table and expires its snapshots itself, and removes
+unreferenced files for the whole table bucket. This module builds those
+maintenance configurations from a settings dict (the fields of
+stack.maintenance.TableMaintenanceSettings) and applies the ones that
+differ from what is set.
+
+It also reads the table's current Iceberg metadata file. Statistics come from
+snapshot summaries: the current snapshot for the table as it is now, and the
+last compaction (a "replace" snapshot) compared with its parent for the
+effect of that compaction.
+"""
+
+from iceberg_metadata import read_metadata_file
+
+COMPACTION = "icebergCompaction"
+SNAPSHOT_MANAGEMENT = "icebergSnapshotManagement"
+UNREFERENCED_FILE_REMOVAL = "icebergUnreferencedFileRemoval"
+
+
+def _value(enabled, settings_type, settings):
+    return {
+        "status": "enabled" if enabled else "disabled",
+        "settings": {settings_type: settings},
+    }
+
+
+def table_configuration(settings):
+    compaction = {"targetFileSizeMB": settings["target_file_size_mb"]}
+    if settings.get("compaction_strategy"):
+        compaction["strategy"] = settings["compaction_strategy"]
+    return {
+        COMPACTION: _value(settings["compaction"], COMPACTION, compaction),
+        SNAPSHOT_MANAGEMENT: _value(
+            settings["snapshot_management"],
+            SNAPSHOT_MANAGEMENT,
+            {
+                "minSnapshotsToKeep": settings["min_snapshots_to_keep"],
+                "maxSnapshotAgeHours": settings["max_snapshot_age_hours"],
+            },
+        ),
+    }
+
+
+def bucket_configuration(settings):
+    return {
+        UNREFERENCED_FILE_REMOVAL: _value(
+            settings["unreferenced_file_removal"],
+            UNREFERENCED_FILE_REMOVAL,
+            {
+                "unreferencedDays": settings["unreferenced_days"],
+                "nonCurrentDays": settings["non_current_days"],
+            },
+        )
+    }
+
+
+def _needs_update(current, value):
+    # Only the settings given here are compared; S3 Tables also returns defaults
+    # for the ones that were never set
+    if not current or current.get("status") != value["status"]:
+        return True
+    for settings_type, wanted in value["settings"].items():
+        actual = current.get("settings", {}).get(settings_type, {})
+        if any(actual.get(key) != setting for key, setting in wanted.items()):
+            return True
+    return False
+
+
+def apply_maintenance(s3tables, table_bucket_arn, namespace, name, settings):
+    # Returns the maintenance types whose configuration was changed
+    changed = []
+    current = s3tables.get_table_maintenance_configuration(
+        tableBucketARN=table_bucket_arn, namespace=namespace, name=name
+    )["configuration"]
+    for maintenance_type, value in table_configuration(settings).items():
+        if _needs_update(current.get(maintenance_type), value):
+            s3tables.put_table_maintenance_configuration(
+                tableBucketARN=table_bucket_arn,
+                namespace=namespace,
+                name=name,
+                type=maintenance_type,
+                value=value,
+            )
+            changed.append(maintenance_type)
+
+    current = s3tables.get_table_bucket_maintenance_configuration(
+        tableBucketARN=table_bucket_arn
+    )["configuration"]
+    for maintenance_type, value in bucket_configuration(settings).items():
+        if _needs_update(current.get(maintenance_type), value):
+            s3tables.put_table_bucket_maintenance_configuration(
+                tableBucketARN=table_bucket_arn, type=maintenance_type, value=value
+            )
+            changed.append(maintenance_type)
+    return changed
+
+
+def job_status(s3tables, table_bucket_arn, namespace, name):
+    # Maintenance type -> {"status", "lastRunTimestamp", "failureMessage"}
+    return s3tables.get_table_maintenance_job_status(
+        tableBucketARN=table_bucket_arn, namespace=namespace, name=name
+    )["status"]
+
+
+def read_table_metadata(s3tables, s3, table_bucket_arn, namespace, name):
+    location = s3tables.get_table_metadata_location(
+        tableBucketARN=table_bucket_arn, namespace=namespace, name=name
+    ).get("metadataLocation")
+    if not location:
+        # Firehose has not committed to the table yet
+        return None
+    return read_metadata_file(s3, location)
+
+
+def file_stats(summary):
+    # Totals that Iceberg keeps in every snapshot summary
+    data_files = int(summary.get("total-data-files", 0))
+    delete_files = int(summary.get("total-delete-files", 0))
+    total_bytes = int(summary.get("total-files-size", 0))
+    files = data_files + delete_files
+    return {
+        "data_files": data_files,
+        "delete_files": delete_files,
+        "records": int(summary.get("total-records", 0)),
+        "total_bytes": total_bytes,
+        "avg_file_bytes": total_bytes // files if files else 0,
+    }
+
+
+def table_stats(metadata):
+    # Statistics of the current snapshot, and of the table before and after
+    # the last compaction that is still in the snapshot history
+    stats = {"current": None, "last_compaction": None}
+    if not metadata:
+        return stats
+    snapshots = {
+        snapshot["snapshot-id"]: snapshot for snapshot in metadata.get("snapshots", [])
+    }
+    current = snapshots.get(metadata.get("current-snapshot-id"))
+    if current:
+        stats["current"] = file_stats(current.get("summary", {}))
+
+    compactions = [
+        snapshot
+        for snapshot in snapshots.values()
+        if snapshot.get("summary", {}).get("operation") == "replace"
+        and snapshot.get("parent-snapshot-id") in snapshots
+    ]
+    if compactions:
+        compaction = max(compactions, key=lambda snapshot: snapshot["timestamp-ms"])
+        parent = snapshots[compaction["parent-snapshot-id"]]
+        stats["last_compaction"] = {
+            "snapshot_id": compaction["snapshot-id"],
+            "timestamp_ms": compaction["timestamp-ms"],
+            "before": file_stats(parent.get("summary", {})),
+            "after": file_stats(compaction["summary"]),
+        }
+    return stats
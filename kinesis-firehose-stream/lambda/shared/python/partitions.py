@@ -0,0 +1,161 @@
+"""UTC date/hour/minute partition fields derived from epoch milliseconds.
+
+The fields only change once a minute, and records in a batch are close together
+in time, so results are cached per epoch minute. Dates are computed with integer
+arithmetic rather than datetime, so the container's local timezone never leaks
+into the partition values.
+
+build_partition_plan() reads a table's partition spec, and partition_of()
+returns the partition a row lands in, with Iceberg's identity, bucket,
+truncate, year, month and day transforms. Two rows are in the same partition
+when their results are equal.
+"""
+
+import re
+from decimal import Decimal
+from functools import lru_cache
+
+from table_spec import DECIMAL_TYPE, field_id, iceberg_fields
+
+MILLIS_PER_MINUTE = 60_000
+MINUTES_PER_DAY = 1440
+
+
+def civil_date(days):
+    # ISO date for a count of days since 1970-01-01 (proleptic Gregorian calendar)
+    z = days + 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = mp + 3 if mp < 10 else mp - 9
+    year = yoe + era * 400 + (month <= 2)
+    return f"{year:04d}-{month:02d}-{day:02d}"
+
+
+def epoch_day(year, month, day):
+    # Count of days since 1970-01-01 of a date; the inverse of civil_date().
+    # Days past the end of the month carry over into the next one.
+    year -= month <= 2
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+@lru_cache(maxsize=128)
+def minute_partition(epoch_minute):
+    days, minute_of_day = divmod(epoch_minute, MINUTES_PER_DAY)
+    hour, minute = divmod(minute_of_day, 60)
+    return civil_date(days), hour, minute
+
+
+def partition_fields(epoch_millis):
+    # Returns the (date, hour, minute) triple in UTC
+    return minute_partition(epoch_millis // MILLIS_PER_MINUTE)
+
+
+TRANSFORM = re.compile(r"^(\w+)(?:\[(\d+)\])?$")
+
+
+def murmur3_32(data):
+    # 32-bit MurmurHash3 with seed 0, the hash of Iceberg's bucket transform
+    h = 0
+    length = len(data)
+    for offset in range(0, length, 4):
+        k = int.from_bytes(data[offset : offset + 4], "little")
+        k = (k * 0xCC9E2D51) & 0xFFFFFFFF
+        k = ((k << 15) | (k >> 17)) & 0xFFFFFFFF
+        k = (k * 0x1B873593) & 0xFFFFFFFF
+        h ^= k
+        if offset + 4 <= length:
+            h = ((h << 13) | (h >> 19)) & 0xFFFFFFFF
+            h = (h * 5 + 0xE6546B64) & 0xFFFFFFFF
+    h ^= length
+    h ^= h >> 16
+    h = (h * 0x85EBCA6B) & 0xFFFFFFFF
+    h ^= h >> 13
+    h = (h * 0xC2B2AE35) & 0xFFFFFFFF
+    return h ^ (h >> 16)
+
+
+def _date_day(value):
+    return epoch_day(int(value[:4]), int(value[5:7]), int(value[8:10]))
+
+
+def _unscaled(value, scale):
+    return int(Decimal(value).scaleb(scale))
+
+
+def _hash_bytes(value, field_type):
+    # Bytes that Iceberg hashes for a value of a column type
+    if field_type in ("int", "long"):
+        return int(value).to_bytes(8, "little", signed=True)
+    if field_type == "date":
+        return _date_day(value).to_bytes(8, "little", signed=True)
+    if field_type == "string":
+        return value.encode("utf-8")
+    decimal = DECIMAL_TYPE.match(field_type)
+    if decimal:
+        # Minimal big-endian two's complement of the unscaled value
+        unscaled = _unscaled(value, int(decimal.group(2)))
+        size = (unscaled if unscaled >= 0 else ~unscaled).bit_length() // 8 + 1
+        return unscaled.to_bytes(size, "big", signed=True)
+    raise ValueError(f"Cannot bucket a {field_type} column")
+
+
+def partition_transform(transform, field_type):
+    # Function from a column value to its partition value
+    match = TRANSFORM.match(transform)
+    if not match:
+        raise ValueError(f"Unknown partition transform: {transform!r}")
+    name, width = match.group(1), int(match.group(2) or 0)
+    if name == "identity":
+        return lambda value: value
+    if name == "bucket":
+        return (
+            lambda value: (murmur3_32(_hash_bytes(value, field_type)) & 0x7FFFFFFF)
+            % width
+        )
+    if name == "truncate":
+        if field_type == "string":
+            return lambda value: value[:width]
+        decimal = DECIMAL_TYPE.match(field_type)
+        if decimal:
+            scale = int(decimal.group(2))
+            return lambda value: _unscaled(value, scale) // width * width
+        return lambda value: int(value) // width * width
+    # year, month and day of a date column, which holds ISO dates
+    lengths = {"year": 4, "month": 7, "day": 10}
+    if name in lengths:
+        return lambda value: value[: lengths[name]]
+    raise ValueError(f"Unknown partition transform: {transform!r}")
+
+
+def build_partition_plan(iceberg):
+    # (column, transform function) for each field of the partition spec
+    fields = {
+        field_id(field, position): field
+        for position, field in enumerate(iceberg_fields(iceberg), 1)
+    }
+    plan = []
+    for spec_field in iceberg.get("partitionSpec", {}).get("fields", []):
+        field = fields[spec_field["sourceId"]]
+        plan.append(
+            (
+                field["name"],
+                partition_transform(spec_field["transform"], field["type"]),
+            )
+        )
+    return tuple(plan)
+
+
+def partition_of(item, plan):
+    # Partition values of a row; a missing column is the null partition
+    return tuple(
+        None if item.get(column) is None else transform(item[column])
+        for column, transform in plan
+    )
@@ -0,0 +1,117 @@
+"""Route DynamoDB changes to the S3 tables of one delivery stream.
+
+TABLE_ROUTES is a JSON list written by stack/firehose.py from the
+table_routes context. Each route names the DynamoDB table the changes come
+from, the S3 table they are written to, the table definition that types its
+columns, and the unique keys Firehose upserts and deletes on:
+
+    [{"source_table": "orders", "table_name": "orders",
+      "definition": "orders.json", "unique_keys": ["orderId"]}]
+
+A source_table of "*" takes the changes of every DynamoDB table without a
+route of its own. Decode and validation plans are built once per table
+definition, so routes that share a definition share their plans. A route
+with an explode setting also writes a nested list attribute to a child
+table; see explode.py.
+"""
+
+import json
+
+from ddb_decoder import build_decode_plan
+from explode import build_explode_plan
+from partitions import build_partition_plan
+from table_spec import (
+    OPERATION_FIELD,
+    definition_path,
+    load_table_definition,
+    partition_columns,
+    schema_fields,
+)
+from validator import build_validation_plan
+
+ANY_SOURCE = "*"
+DEFAULT_UNIQUE_KEYS = ("transaction_id",)
+
+
+class Route:
+    __slots__ = (
+        "table_name",
+        "unique_keys",
+        "decode_plan",
+        "validation_plan",
+        "partition_columns",
+        "partition_plan",
+        "explode_plan",
+    )
+
+    def __init__(
+        self,
+        table_name,
+        unique_keys,
+        decode_plan,
+        validation_plan,
+        partition_columns=(),
+        partition_plan=(),
+        explode_plan=None,
+    ):
+        self.table_name = table_name
+        self.unique_keys = unique_keys
+        self.decode_plan = decode_plan
+        self.validation_plan = validation_plan
+        # Columns a row needs for Iceberg to place it, and its deletes, in a
+        # partition
+        self.partition_columns = partition_columns
+        # (column, transform) pairs that give the partition of a row
+        self.partition_plan = partition_plan
+        self.explode_plan = explode_plan
+
+    def key(self, item):
+        # Identifies the row a change applies to, within this route's table
+        return (self.table_name, *(item.get(name) for name in self.unique_keys))
+
+
+def load_routes(routes_json=None, default_table=None):
+    # Returns {source_table: Route}. Without routes_json every change goes to
+    # default_table, typed by tabledefinition.json; a default_table of None
+    # leaves the table to the Firehose destination configuration.
+    routes = json.loads(routes_json) if routes_json else []
+    if not routes:
+        routes = [{"source_table": ANY_SOURCE, "table_name": default_table}]
+    plans = {}
+    loaded = {}
+    for route in routes:
+        definition = route.get("definition")
+        if definition not in plans:
+            table_definition = load_table_definition(definition_path(definition))
+            iceberg = table_definition["metadata"]["iceberg"]
+            fields = schema_fields(table_definition)
+            plans[definition] = (
+                fields,
+                build_decode_plan(fields),
+                build_validation_plan(fields),
+                tuple(partition_columns(iceberg)),
+                build_partition_plan(iceberg),
+            )
+        fields, decode_plan, validation_plan, partitioned_by, partition_plan = plans[
+            definition
+        ]
+        explode = route.get("explode")
+        unique_keys = tuple(route.get("unique_keys") or DEFAULT_UNIQUE_KEYS)
+        loaded[route.get("source_table", ANY_SOURCE)] = Route(
+            route["table_name"],
+            unique_keys,
+            decode_plan,
+            validation_plan,
+            partitioned_by,
+            partition_plan,
+            build_explode_plan(explode, fields, unique_keys) if explode else None,
+        )
+    return loaded
+
+
+def route_for(routes, source_table):
+    # The route of a DynamoDB table, or None when nothing takes its changes
+    route = routes.get(source_table)
+    if route is None:
+        route = routes.get(ANY_SOURCE)
+    return route
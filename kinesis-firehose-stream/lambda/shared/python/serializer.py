@@ -0,0 +1,73 @@
+"""JSON serialization backends for the stream Lambdas.
+
+orjson or msgspec is used when the layer provides one, otherwise the standard
+library. Set JSON_BACKEND to "orjson", "msgspec" or "json" to pin a backend.
+
+Every backend reads bytes and writes bytes. Decimal values are written as exact
+strings, for example "12.50" for a decimal(12,2) column, never as floats.
+"""
+
+import json
+import os
+
+
+class Serializer:
+    __slots__ = ("name", "loads", "dumps")
+
+    def __init__(self, name, loads, dumps):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+
+
+def _default(obj):
+    # Decimal is the only non-JSON type the decoder produces
+    if hasattr(obj, "as_tuple"):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _orjson():
+    import orjson
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default)
+
+    return Serializer("orjson", orjson.loads, dumps)
+
+
+def _msgspec():
+    import msgspec
+
+    encoder = msgspec.json.Encoder(decimal_format="string")
+    decoder = msgspec.json.Decoder()
+    return Serializer("msgspec", decoder.decode, encoder.encode)
+
+
+def _stdlib():
+    encoder = json.JSONEncoder(default=_default, separators=(",", ":"))
+
+    def dumps(obj):
+        return encoder.encode(obj).encode("utf-8")
+
+    return Serializer("json", json.loads, dumps)
+
+
+BACKENDS = {"orjson": _orjson, "msgspec": _msgspec, "json": _stdlib}
+
+
+def get_serializer(name="auto"):
+    if name != "auto":
+        return BACKENDS[name]()
+    for candidate in ("orjson", "msgspec"):
+        try:
+            return BACKENDS[candidate]()
+        except ImportError:
+            continue
+    return _stdlib()
+
+
+SERIALIZER = get_serializer(os.environ.get("JSON_BACKEND", "auto"))
+BACKEND = SERIALIZER.name
+loads = SERIALIZER.loads
+dumps = SERIALIZER.dumps
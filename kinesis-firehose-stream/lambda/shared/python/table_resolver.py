@@ -0,0 +1,127 @@
+"""Resolve S3 Tables ARNs by name, with a per-process cache.
+
+Table bucket ARNs are found with a paginated ListTableBuckets, indexed by
+bucket name. Table ARNs are found with a paginated ListTables per bucket,
+indexed by namespace and table name. Each listing is kept for ttl_seconds.
+A name that is not in a cached listing triggers one fresh listing, because
+the bucket or table may have been created since. invalidate() drops cached
+listings, for example after creating or deleting a bucket.
+
+When the region and account are known, a table bucket ARN is built directly
+and confirmed with GetTableBucket, so nothing is listed.
+"""
+
+import time
+
+from botocore.exceptions import ClientError
+
+DEFAULT_TTL_SECONDS = 300
+
+NOT_FOUND_ERROR_CODES = {"NotFoundException", "ResourceNotFoundException"}
+
+
+def table_bucket_arn_for(region, account, table_bucket_name):
+    return f"arn:aws:s3tables:{region}:{account}:bucket/{table_bucket_name}"
+
+
+class TableResolver:
+    def __init__(
+        self,
+        s3tables,
+        region=None,
+        account=None,
+        ttl_seconds=DEFAULT_TTL_SECONDS,
+        clock=time.monotonic,
+        cache=None,
+    ):
+        self.s3tables = s3tables
+        self.region = region
+        self.account = account
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        # key -> (loaded_at, value); keys are "buckets", ("bucket", name) and
+        # ("tables", table_bucket_arn). Resolvers of the same client can share
+        # one cache.
+        self.cache = {} if cache is None else cache
+
+    def _cached(self, key, load, refresh=False):
+        entry = self.cache.get(key)
+        if refresh or entry is None or self.clock() - entry[0] >= self.ttl_seconds:
+            entry = (self.clock(), load())
+            self.cache[key] = entry
+        return entry[1]
+
+    def _list_table_buckets(self):
+        buckets = {}
+        paginator = self.s3tables.get_paginator("list_table_buckets")
+        for page in paginator.paginate():
+            for table_bucket in page.get("tableBuckets", []):
+                buckets[table_bucket["name"]] = table_bucket["arn"]
+        return buckets
+
+    def _get_table_bucket(self, table_bucket_name):
+        arn = table_bucket_arn_for(self.region, self.account, table_bucket_name)
+        try:
+            return self.s3tables.get_table_bucket(tableBucketARN=arn)["arn"]
+        except ClientError as e:
+            if e.response["Error"]["Code"] in NOT_FOUND_ERROR_CODES:
+                return None
+            raise
+
+    def table_bucket_arn(self, table_bucket_name):
+        # Returns None when the account has no table bucket with this name
+        if self.region and self.account:
+            arn = self._cached(
+                ("bucket", table_bucket_name),
+                lambda: self._get_table_bucket(table_bucket_name),
+            )
+            if arn is None:
+                self.cache.pop(("bucket", table_bucket_name))
+            return arn
+
+        buckets = self._cached("buckets", self._list_table_buckets)
+        if table_bucket_name not in buckets:
+            buckets = self._cached("buckets", self._list_table_buckets, refresh=True)
+        return buckets.get(table_bucket_name)
+
+    def _list_tables(self, table_bucket_arn):
+        tables = {}
+        paginator = self.s3tables.get_paginator("list_tables")
+        for page in paginator.paginate(tableBucketARN=table_bucket_arn):
+            for table in page.get("tables", []):
+                # The API returns the namespace as a one-element list
+                tables[(table["namespace"][0], table["name"])] = table["tableARN"]
+        return tables
+
+    def tables(self, table_bucket_name):
+        # {(namespace, name): table ARN} for every table in the bucket
+        table_bucket_arn = self.table_bucket_arn(table_bucket_name)
+        if table_bucket_arn is None:
+            return {}
+        return self._cached(
+            ("tables", table_bucket_arn), lambda: self._list_tables(table_bucket_arn)
+        )
+
+    def table_arn(self, table_bucket_name, namespace, name):
+        # Returns None when the bucket or table does not exist
+        table_bucket_arn = self.table_bucket_arn(table_bucket_name)
+        if table_bucket_arn is None:
+            return None
+        key = ("tables", table_bucket_arn)
+        tables = self._cached(key, lambda: self._list_tables(table_bucket_arn))
+        if (namespace, name) not in tables:
+            tables = self._cached(
+                key, lambda: self._list_tables(table_bucket_arn), refresh=True
+            )
+        return tables.get((namespace, name))
+
+    def invalidate(self, table_bucket_name=None):
+        # Drops every cached listing, or only those of one table bucket
+        if table_bucket_name is None:
+            self.cache.clear()
+            return
+        self.cache.pop("buckets", None)
+        self.cache.pop(("bucket", table_bucket_name), None)
+        for key in [k for k in self.cache if k[0] == "tables"]:
+            if key[1].endswith(f":bucket/{table_bucket_name}"):
+                del self.cache[key]
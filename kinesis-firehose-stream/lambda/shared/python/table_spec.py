@@ -0,0 +1,288 @@
+import json
+import os
+import re
+
+# tabledefinition.json is the single description of the S3 table. The layer ships
+# a copy of it next to this module; TABLE_DEFINITION_PATH overrides the location.
+DEFAULT_TABLE_DEFINITION_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "tabledefinition.json"
+)
+
+# Definitions of the further tables that table_routes sends changes to, by file
+# name. The layer ships the directory next to this module as well.
+DEFAULT_TABLE_DEFINITIONS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "tabledefinitions"
+)
+
+DECIMAL_TYPE = re.compile(r"^decimal\((\d+),\s*(\d+)\)$")
+
+# Partition and sort expressions use the Athena DDL syntax: a column name for
+# identity, "day(date)", "bucket(16, customer_id)" or "truncate(4, region)"
+EXPRESSION = re.compile(r"^\s*(?:(\w+)\(\s*(?:(\d+)\s*,\s*)?(\w+)\s*\)|(\w+))\s*$")
+SORT_EXPRESSION = re.compile(r"^(.*?)(?:\s+(asc|desc))?\s*$", re.IGNORECASE)
+
+# Column types each Iceberg transform accepts; a transform that needs a width
+# is written with it, as in bucket[16]
+TRANSFORM_TYPES = {
+    "identity": None,
+    "bucket": {"int", "long", "decimal", "date", "string"},
+    "truncate": {"int", "long", "decimal", "string"},
+    "year": {"date"},
+    "month": {"date"},
+    "day": {"date"},
+}
+WIDTH_TRANSFORMS = {"bucket", "truncate"}
+
+# Direct PUT rows carry no otfMetadata. The DynamoDB Streams Lambda marks the
+# rows to delete with this field, and the delivery stream's JQ query reads
+# the operation from it. Firehose leaves fields that are not columns out of
+# the table.
+OPERATION_FIELD = "_operation"
+
+# Iceberg numbers partition fields from 1000
+PARTITION_FIELD_ID_START = 1000
+
+ATHENA_TYPES = {
+    "string": "STRING",
+    "long": "BIGINT",
+    "int": "INT",
+    "date": "DATE",
+    "boolean": "BOOLEAN",
+    "float": "FLOAT",
+    "double": "DOUBLE",
+}
+
+
+def load_table_definition(path=None):
+    path = (
+        path or os.environ.get("TABLE_DEFINITION_PATH") or DEFAULT_TABLE_DEFINITION_PATH
+    )
+    with open(path) as f:
+        return json.load(f)
+
+
+def definition_path(definition=None):
+    # None is tabledefinition.json; other names are files in tabledefinitions/
+    if definition is None:
+        return None
+    return os.path.join(DEFAULT_TABLE_DEFINITIONS_DIR, os.path.basename(definition))
+
+
+def schema_key(iceberg):
+    # Tables with nested columns are described by schemaV2, which accepts
+    # Iceberg struct, list and map types; other tables by schema
+    return "schemaV2" if "schemaV2" in iceberg else "schema"
+
+
+def iceberg_fields(iceberg):
+    return iceberg[schema_key(iceberg)]["fields"]
+
+
+def schema_fields(table_definition):
+    return iceberg_fields(table_definition["metadata"]["iceberg"])
+
+
+def is_nested(field_type):
+    # Primitive types are strings; struct, list and map types are JSON objects
+    return not isinstance(field_type, str)
+
+
+def nested_field_ids(field_type):
+    # Ids of the struct fields, list elements and map keys and values inside a
+    # nested type
+    if not is_nested(field_type):
+        return []
+    kind = field_type["type"]
+    if kind == "struct":
+        return [
+            i
+            for field in field_type["fields"]
+            for i in [field["id"], *nested_field_ids(field["type"])]
+        ]
+    if kind == "list":
+        return [field_type["element-id"], *nested_field_ids(field_type["element"])]
+    if kind == "map":
+        return [
+            field_type["key-id"],
+            field_type["value-id"],
+            *nested_field_ids(field_type["key"]),
+            *nested_field_ids(field_type["value"]),
+        ]
+    raise ValueError(f"Unsupported nested type: {kind!r}")
+
+
+def field_id(field, position):
+    # Fields without an explicit id are numbered from 1 in schema order
+    return field.get("id", position)
+
+
+def _base_type(field_type):
+    return "decimal" if DECIMAL_TYPE.match(field_type) else field_type
+
+
+def parse_expression(expression, fields):
+    # Returns (Iceberg transform, field) for a partition or sort expression
+    match = EXPRESSION.match(expression)
+    if not match:
+        raise ValueError(f"Invalid expression: {expression!r}")
+    name, width, argument, column = match.groups()
+    name = name.lower() if name else "identity"
+    column = column or argument
+    by_name = {field["name"]: field for field in fields}
+    if column not in by_name:
+        raise ValueError(f"Unknown column {column!r} in {expression!r}")
+    if name not in TRANSFORM_TYPES:
+        raise ValueError(f"Unsupported transform {name!r} in {expression!r}")
+    if (name in WIDTH_TRANSFORMS) != (width is not None):
+        raise ValueError(f"Wrong number of arguments in {expression!r}")
+    allowed = TRANSFORM_TYPES[name]
+    field = by_name[column]
+    if is_nested(field["type"]):
+        raise ValueError(f"{name} cannot be applied to nested column {column!r}")
+    if allowed is not None and _base_type(field["type"]) not in allowed:
+        raise ValueError(
+            f"{name} cannot be applied to {field['type']} column {column!r}"
+        )
+    transform = f"{name}[{width}]" if width else name
+    return transform, field
+
+
+def format_expression(transform, column):
+    # Inverse of parse_expression, for Athena DDL
+    if transform == "identity":
+        return column
+    name, _, width = transform.partition("[")
+    if width:
+        return f"{name}({width.rstrip(']')}, {column})"
+    return f"{name}({column})"
+
+
+def partition_spec(fields, expressions):
+    ids = {field["name"]: field_id(field, i) for i, field in enumerate(fields, 1)}
+    spec_fields = []
+    for offset, expression in enumerate(expressions):
+        transform, field = parse_expression(expression, fields)
+        name = field["name"]
+        if transform != "identity":
+            name = f"{name}_{transform.split('[')[0]}"
+        spec_fields.append(
+            {
+                "sourceId": ids[field["name"]],
+                "transform": transform,
+                "name": name,
+                "fieldId": PARTITION_FIELD_ID_START + offset,
+            }
+        )
+    return {"specId": 0, "fields": spec_fields}
+
+
+def sort_order(fields, expressions):
+    # Each expression may end in asc (the default) or desc; nulls sort first
+    # in ascending order and last in descending order, as in Iceberg
+    ids = {field["name"]: field_id(field, i) for i, field in enumerate(fields, 1)}
+    sort_fields = []
+    for expression in expressions:
+        expression, direction = SORT_EXPRESSION.match(expression).groups()
+        direction = (direction or "asc").lower()
+        transform, field = parse_expression(expression, fields)
+        sort_fields.append(
+            {
+                "sourceId": ids[field["name"]],
+                "transform": transform,
+                "direction": direction,
+                "nullOrder": "nulls-first" if direction == "asc" else "nulls-last",
+            }
+        )
+    return {"orderId": 1 if sort_fields else 0, "fields": sort_fields}
+
+
+def table_metadata(table_definition, partition_by=None, sort_by=None):
+    # The "metadata" argument of CreateTable. partition_by and sort_by replace
+    # the partition spec and write order of the table definition when given.
+    iceberg = dict(table_definition["metadata"]["iceberg"])
+    key = schema_key(iceberg)
+    fields = iceberg[key]["fields"]
+    numbered = [dict(field, id=field_id(field, i)) for i, field in enumerate(fields, 1)]
+    if key == "schemaV2":
+        # schemaV2 needs the struct type and the required flag of every field
+        iceberg[key] = {
+            "type": "struct",
+            "fields": [
+                dict(field, required=field.get("required", False)) for field in numbered
+            ],
+        }
+    else:
+        iceberg[key] = {"fields": numbered}
+    if partition_by is not None:
+        iceberg["partitionSpec"] = partition_spec(fields, partition_by)
+    if sort_by is not None:
+        iceberg["writeOrder"] = sort_order(fields, sort_by)
+    return {"iceberg": iceberg}
+
+
+def partition_expressions(iceberg, quote=False):
+    # Partition spec of table_metadata()["iceberg"] as Athena expressions.
+    # quote puts column names in backticks, which DDL needs for date and
+    # timestamp.
+    names = {
+        field["id"]: f"`{field['name']}`" if quote else field["name"]
+        for field in iceberg_fields(iceberg)
+    }
+    return [
+        format_expression(spec_field["transform"], names[spec_field["sourceId"]])
+        for spec_field in iceberg.get("partitionSpec", {}).get("fields", [])
+    ]
+
+
+def partition_columns(iceberg):
+    # Names of the columns the partition spec reads, in spec order
+    names = {
+        field_id(field, i): field["name"]
+        for i, field in enumerate(iceberg_fields(iceberg), 1)
+    }
+    return [
+        names[spec_field["sourceId"]]
+        for spec_field in iceberg.get("partitionSpec", {}).get("fields", [])
+    ]
+
+
+def athena_type(field_type):
+    if is_nested(field_type):
+        kind = field_type["type"]
+        if kind == "struct":
+            members = ", ".join(
+                f"{field['name']}:{athena_type(field['type'])}"
+                for field in field_type["fields"]
+            )
+            return f"STRUCT<{members}>"
+        if kind == "list":
+            return f"ARRAY<{athena_type(field_type['element'])}>"
+        if kind == "map":
+            key, value = athena_type(field_type["key"]), athena_type(
+                field_type["value"]
+            )
+            return f"MAP<{key},{value}>"
+        raise ValueError(f"Unsupported nested type: {kind!r}")
+    match = DECIMAL_TYPE.match(field_type)
+    if match:
+        return f"DECIMAL({match.group(1)},{match.group(2)})"
+    return ATHENA_TYPES[field_type]
+
+
+def athena_ddl(table_definition, database, table, location):
+    # CREATE TABLE statement for an Iceberg table with the same schema and
+    # partition spec. Athena DDL has no write order, so that is left out.
+    iceberg = table_metadata(table_definition)["iceberg"]
+    columns = ",\n".join(
+        f"    `{field['name']}` {athena_type(field['type'])}"
+        for field in iceberg_fields(iceberg)
+    )
+    statement = f"CREATE TABLE IF NOT EXISTS {database}.{table} (\n{columns}\n)\n"
+    partitions = partition_expressions(iceberg, quote=True)
+    if partitions:
+        statement += f"PARTITIONED BY ({', '.join(partitions)})\n"
+    return (
+        statement
+        + f"LOCATION '{location}'\n"
+        + "TBLPROPERTIES ('table_type' = 'ICEBERG')"
+    )
@@ -0,0 +1,112 @@
+"""Check decoded records against the Iceberg schema before delivery.
+
+The decoder already converts every column to its Iceberg type. The validator
+catches what a type conversion cannot: missing required columns, int and long
+values outside their range, decimals with more digits than the column's
+precision, and dates that are not a YYYY-MM-DD day of the calendar. Build the
+plan once per container with load_validation_plan(). validate() returns None
+for a valid item, or a (column, reason) pair for the first problem found.
+
+Reason codes:
+    missing_required   a required column is absent or null
+    out_of_range       an int or long value does not fit the column
+    precision_overflow a decimal value has too many integer digits
+    bad_format         a date is not a YYYY-MM-DD string of a calendar day
+    wrong_type         the value cannot be compared with the column type
+"""
+
+import re
+from decimal import Decimal
+from functools import lru_cache
+
+from partitions import civil_date, epoch_day
+from table_spec import DECIMAL_TYPE, load_table_definition, schema_fields
+
+DATE_FORMAT = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2}")
+
+INT_RANGE = (-(2**31), 2**31 - 1)
+LONG_RANGE = (-(2**63), 2**63 - 1)
+
+
+def _bounds(field_type):
+    # Exclusive (lower, upper) bounds and reason code for numeric columns
+    if field_type == "int":
+        return INT_RANGE[0] - 1, INT_RANGE[1] + 1, "out_of_range"
+    if field_type == "long":
+        return LONG_RANGE[0] - 1, LONG_RANGE[1] + 1, "out_of_range"
+    match = DECIMAL_TYPE.match(field_type)
+    if match:
+        # After quantizing to the scale, at most precision - scale integer digits fit
+        # Decimal bounds compare with decimal values faster than int bounds
+        limit = Decimal(10 ** (int(match.group(1)) - int(match.group(2))))
+        return -limit, limit, "precision_overflow"
+    return None
+
+
+@lru_cache(maxsize=1024)
+def is_calendar_date(value):
+    # A record batch holds few distinct dates, so each is checked once. The
+    # date is valid when it survives the round trip through its day number,
+    # which rules out days such as 2024-02-31.
+    if DATE_FORMAT.fullmatch(value) is None:
+        return False
+    days = epoch_day(int(value[:4]), int(value[5:7]), int(value[8:]))
+    return civil_date(days) == value
+
+
+class ValidationPlan:
+    __slots__ = ("required", "bounded", "dates")
+
+    def __init__(self, required, bounded, dates):
+        # Column names, (name, lower, upper, reason) and column names
+        self.required = required
+        self.bounded = bounded
+        self.dates = dates
+
+
+def build_validation_plan(fields):
+    required = []
+    bounded = []
+    dates = []
+    for field in fields:
+        name = field["name"]
+        field_type = field["type"]
+        if field.get("required"):
+            required.append(name)
+        if not isinstance(field_type, str):
+            continue
+        if field_type == "date":
+            dates.append(name)
+            continue
+        # Strings and booleans are guaranteed by the decoder
+        bounds = _bounds(field_type)
+        if bounds:
+            bounded.append((name, *bounds))
+    return ValidationPlan(tuple(required), tuple(bounded), tuple(dates))
+
+
+def load_validation_plan(path=None):
+    return build_validation_plan(schema_fields(load_table_definition(path)))
+
+
+def validate(item, plan, is_date=is_calendar_date):
+    # The checks are inlined rather than one callable per column: this runs for
+    # every record and a function call per column doubles its cost
+    get = item.get
+    for name in plan.required:
+        if get(name) is None:
+            return name, "missing_required"
+    name = None
+    try:
+        for name, lower, upper, reason in plan.bounded:
+            value = get(name)
+            if value is not None and not lower < value < upper:
+                return name, reason
+        for name in plan.dates:
+            value = get(name)
+            if value is not None and not is_date(value):
+                return name, "bad_format"
+    except (TypeError, ArithmeticError):
+        # A value that cannot be compared with the column type
+        return name, "wrong_type"
+    return None
@@ -1,51 +1,371 @@
-import json
 import base64
-import datetime
-from decimal import Decimal
+import os
+import random
+import time
+from ddb_decoder import decode_image
+from instrumentation import InvocationMetrics
+from kpl import deaggregate, is_aggregated
+from partitions import partition_fields, partition_of
+from routing import load_routes, route_for
+from serializer import dumps, loads
+from validator import validate
 
 print("Loading function")
 
+# Iceberg destination that receives the per-record operation in otfMetadata
+DESTINATION_DATABASE = os.environ.get("DESTINATION_DATABASE")
+DESTINATION_TABLE = os.environ.get("DESTINATION_TABLE")
 
-# Custom JSON encoder to handle Decimal types
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        return super(DecimalEncoder, self).default(obj)
+# S3 table, unique keys and decode and validation plans for each DynamoDB source
+# table, built once per container from the table definitions in the shared layer.
+# Without TABLE_ROUTES every change goes to DESTINATION_TABLE.
+ROUTES = load_routes(os.environ.get("TABLE_ROUTES"), DESTINATION_TABLE)
+
+# Keep only the newest change per key in each batch, so a burst of updates to
+# one transaction becomes a single upsert
+COLLAPSE_UPDATES = os.environ.get("COLLAPSE_UPDATES", "false").lower() == "true"
+
+# An upsert only deletes the old row in the partition of the new row, and a
+# transform returns one row per record. A MODIFY that moves an item to another
+# partition therefore puts a REMOVE of its old image back on the source stream,
+# which deletes the old row when it comes through here.
+SOURCE_STREAM_ARN = os.environ.get("SOURCE_STREAM_ARN")
+# Marks the REMOVE records this function writes
+PARTITION_MOVE_FIELD = "partitionMove"
+# Created on the first move, to keep boto3 out of the cold start
+kinesis_client = None
+
+# PutRecords service limit and retry settings
+MAX_PUT_RECORDS = 500
+MAX_ATTEMPTS = 5
+BASE_BACKOFF_SECONDS = 0.05
+MAX_BACKOFF_SECONDS = 2.0
+
+RESULT_COUNTERS = {
+    "Ok": "records_ok",
+    "Dropped": "records_dropped",
+    "ProcessingFailed": "records_failed",
+}
 
 
 def handler(event, context):
+    metrics = InvocationMetrics("transform", context)
+    records = event["records"]
+    metrics.count("records_in", len(records))
+
+    changes = [decode_record(record, metrics) for record in records]
+    superseded = superseded_changes(changes, metrics) if COLLAPSE_UPDATES else ()
+    # Before any row is returned, so that a failed put retries the whole batch
+    moves = partition_moves(changes)
+    if moves:
+        put_partition_moves(moves, metrics)
+
+    # Firehose expects exactly one result per input recordId
     output = []
+    for index, (record, change) in enumerate(zip(records, changes)):
+        if not isinstance(change, Change):
+            output_record = change
+        elif index in superseded:
+            metrics.debug("superseded", recordId=record["recordId"])
+            output_record = {
+                "recordId": record["recordId"],
+                "result": "Dropped",
+                "data": record["data"],
+            }
+        else:
+            output_record = encode_record(record["recordId"], change, metrics)
+        output.append(output_record)
+
+    for output_record in output:
+        metrics.count(RESULT_COUNTERS[output_record["result"]])
+    metrics.emit()
+
+    return {"records": output}
+
+
+class Change:
+    __slots__ = ("item", "operation", "created_ms", "route", "moved_from", "move")
+
+    def __init__(self, item, operation, created_ms, route, moved_from=None, move=False):
+        self.item = item
+        self.operation = operation
+        self.created_ms = created_ms
+        self.route = route
+        # For a MODIFY that moved the item to another partition, (old row,
+        # PutRecords entry that removes it)
+        self.moved_from = moved_from
+        # Whether this is the REMOVE of a moved item's old row
+        self.move = move
+
+
+def superseded_changes(changes, metrics):
+    # Indexes of the changes that a newer change to the same key replaces in
+    # this batch. Changes are ordered by ApproximateCreationDateTime, then by
+    # their position, which is the shard order for a key.
+    newest = {}
+    superseded = set()
+    for index, change in enumerate(changes):
+        # The delete of a moved row is in another partition than the key's
+        # newest row, so it neither replaces nor is replaced by other changes
+        if not isinstance(change, Change) or change.move:
+            continue
+        key = change.route.key(change.item)
+        previous = newest.get(key)
+        if previous is None:
+            newest[key] = index
+        elif change.created_ms >= changes[previous].created_ms:
+            superseded.add(previous)
+            newest[key] = index
+        else:
+            superseded.add(index)
+
+    keyed = len(superseded) + len(newest)
+    metrics.count("records_superseded", len(superseded))
+    metrics.gauge("collapse_ratio", len(superseded) / keyed if keyed else 0.0)
+    return superseded
 
-    for record in event["records"]:
-        print(record["recordId"])
-        payload = base64.b64decode(record["data"]).decode("utf-8")
-        payload = json.loads(payload)
 
-        if payload.get("eventName") == "INSERT" or payload.get("eventName") == "MODIFY":
+def partition_moves(changes):
+    # PutRecords entries for the old rows of moved items, one per key and old
+    # partition. An old row in the partition of a later row of the same key in
+    # this batch is left alone, or its delete would remove that row.
+    latest = {}
+    moves = {}
+    for change in changes:
+        if not isinstance(change, Change) or change.move:
+            continue
+        key = change.route.key(change.item)
+        latest[key] = partition_of(change.item, change.route.partition_plan)
+        if change.moved_from is not None:
+            old_item, entry = change.moved_from
+            old = partition_of(old_item, change.route.partition_plan)
+            moves.setdefault((key, old), entry)
+    return [entry for (key, old), entry in moves.items() if old != latest[key]]
+
+
+def moved_from(record, payload, item, route):
+    # (old row, PutRecords entry) when a MODIFY moves the item to another
+    # partition, otherwise None
+    change = payload["dynamodb"]
+    old_image = change.get("OldImage")
+    if not old_image or not route.table_name or not route.partition_plan:
+        return None
+    # Partition columns come from the image; date, hour and minute from timestamp
+    new_image = change["NewImage"]
+    if all(
+        old_image.get(name) == new_image.get(name)
+        for name in (*route.partition_columns, "timestamp")
+    ):
+        return None
+    old_item = add_partition_fields(decode_image(old_image, route.decode_plan))
+    plan = route.partition_plan
+    if partition_of(old_item, plan) == partition_of(item, plan):
+        return None
+    remove = {
+        "eventName": "REMOVE",
+        "tableName": payload.get("tableName"),
+        "dynamodb": {
+            "ApproximateCreationDateTime": change.get("ApproximateCreationDateTime"),
+            "Keys": change.get("Keys"),
+            "OldImage": old_image,
+        },
+        PARTITION_MOVE_FIELD: True,
+    }
+    # The record's own partition key keeps the REMOVE on the shard of its key
+    partition_key = record.get("kinesisRecordMetadata", {}).get("partitionKey")
+    return old_item, {
+        "Data": dumps(remove),
+        "PartitionKey": partition_key or str(route.key(item)),
+    }
+
+
+def put_partition_moves(entries, metrics):
+    # Raises when the entries cannot be written, so that Firehose invokes the
+    # function again with the same records
+    global kinesis_client
+    if SOURCE_STREAM_ARN is None:
+        metrics.count("partition_moves_unhandled", len(entries))
+        return
+    if kinesis_client is None:
+        import boto3
+
+        kinesis_client = boto3.client("kinesis")
+    metrics.count("partition_moves", len(entries))
+    with metrics.timer("move"):
+        for start in range(0, len(entries), MAX_PUT_RECORDS):
+            pending = entries[start : start + MAX_PUT_RECORDS]
+            for attempt in range(MAX_ATTEMPTS):
+                if attempt:
+                    time.sleep(backoff_seconds(attempt))
+                response = kinesis_client.put_records(
+                    StreamARN=SOURCE_STREAM_ARN, Records=pending
+                )
+                # Failed entries keep their position in the response
+                pending = [
+                    entry
+                    for entry, result in zip(pending, response["Records"])
+                    if "ErrorCode" in result
+                ]
+                if not pending:
+                    break
+            else:
+                raise RuntimeError(
+                    f"{len(pending)} partition moves could not be written to the "
+                    "source stream"
+                )
+
+
+def backoff_seconds(attempt):
+    # Exponential backoff with full jitter
+    return random.uniform(
+        0, min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * (2**attempt))
+    )
+
+
+def decode_record(record, metrics):
+    # Returns a Change, or the result for a record that is not delivered
+    record_id = record["recordId"]
+    started = time.perf_counter()
+    try:
+        raw = base64.b64decode(record["data"])
+        metrics.bytes_in += len(raw)
+        if is_aggregated(raw):
+            # Firehose de-aggregates KPL records it reads from a Kinesis stream,
+            # so an aggregate here was sent some other way. Only a single user
+            # record fits the one-result-per-recordId contract.
+            user_records = deaggregate(raw)
+            if len(user_records) != 1:
+                metrics.count("aggregated_not_expanded")
+                print(
+                    f"Failed to transform record {record_id}: KPL aggregate "
+                    f"of {len(user_records)} records"
+                )
+                return {
+                    "recordId": record_id,
+                    "result": "ProcessingFailed",
+                    "data": record["data"],
+                }
+            metrics.count("aggregated_in")
+            raw = user_records[0][1]
+        payload = loads(raw)
+        event_name = payload.get("eventName")
+
+        # Records from DynamoDB carry the name of their source table
+        route = route_for(ROUTES, payload.get("tableName"))
+        if route is None:
+            metrics.count("records_unrouted")
+            metrics.debug(
+                "unrouted", recordId=record_id, tableName=payload.get("tableName")
+            )
+            return {"recordId": record_id, "result": "Dropped", "data": record["data"]}
+
+        if event_name == "INSERT" or event_name == "MODIFY":
             # Get the new image of the item
             new_image = payload["dynamodb"]["NewImage"]
 
-            # Convert DynamoDB JSON to regular JSON
-            item = {k: list(v.values())[0] for k, v in new_image.items()}
+            # Convert DynamoDB JSON to regular JSON with the table's column types
+            item = add_partition_fields(decode_image(new_image, route.decode_plan))
 
-            # Add processing timestamp and format date fields
-            if "timestamp" in item:
-                dt = datetime.datetime.fromtimestamp(int(item["timestamp"]) / 1000.0)
-                item["date"] = dt.strftime("%Y-%m-%d")
-                item["hour"] = dt.hour
-                item["minute"] = dt.minute
+            # Upsert on the unique keys, so replayed INSERTs do not duplicate rows
+            operation = "update"
+            moved = (
+                moved_from(record, payload, item, route)
+                if event_name == "MODIFY"
+                else None
+            )
+        elif event_name == "REMOVE" and route.table_name:
+            # Iceberg applies an equality delete only within the partition of
+            # the delete row, so the delete carries the removed item with its
+            # partition fields, not just the keys
+            old_image = payload["dynamodb"].get("OldImage")
+            item = add_partition_fields(
+                decode_image(old_image or {}, route.decode_plan)
+            )
+            unpartitioned = [
+                column for column in route.partition_columns if item.get(column) is None
+            ]
+            if unpartitioned:
+                metrics.count("invalid_unpartitioned_delete")
+                print(
+                    f"Failed to transform record {record_id}: delete has no "
+                    f"{', '.join(unpartitioned)} to find its partition"
+                )
+                return {
+                    "recordId": record_id,
+                    "result": "ProcessingFailed",
+                    "data": record["data"],
+                }
+            operation = "delete"
+            moved = None
+        else:
+            metrics.debug("dropped", recordId=record_id, eventName=event_name)
+            return {"recordId": record_id, "result": "Dropped", "data": record["data"]}
 
-            # Encode the transformed data
-            output_record = {
-                "recordId": record["recordId"],
-                "result": "Ok",
-                "data": base64.b64encode(
-                    json.dumps(item, cls=DecimalEncoder).encode("utf-8")
-                ).decode("utf-8"),
+        # Reject records the Iceberg table would refuse, before Firehose retries them
+        invalid = validate(item, route.validation_plan)
+        if invalid:
+            column, reason = invalid
+            metrics.count(f"invalid_{reason}")
+            metrics.debug("invalid", recordId=record_id, column=column, reason=reason)
+            return {
+                "recordId": record_id,
+                "result": "ProcessingFailed",
+                "data": record["data"],
             }
-            output.append(output_record)
+    except Exception as e:
+        print(f"Failed to transform record {record_id}: {str(e)}")
+        return {
+            "recordId": record_id,
+            "result": "ProcessingFailed",
+            "data": record["data"],
+        }
+    finally:
+        metrics.add_time("decode", time.perf_counter() - started)
 
-    print("Successfully processed {} records.".format(len(event["records"])))
+    return Change(
+        item,
+        operation,
+        payload["dynamodb"].get("ApproximateCreationDateTime", 0),
+        route,
+        moved,
+        bool(payload.get(PARTITION_MOVE_FIELD)),
+    )
 
-    return {"records": output}
+
+def add_partition_fields(item):
+    # Derive the UTC date, hour and minute partition fields
+    if "timestamp" in item:
+        item["date"], item["hour"], item["minute"] = partition_fields(
+            int(item["timestamp"])
+        )
+    return item
+
+
+def encode_record(record_id, change, metrics):
+    started = time.perf_counter()
+    # Encode the transformed data, keeping decimals exact
+    data = dumps(change.item)
+    metrics.bytes_out += len(data)
+    output_record = {
+        "recordId": record_id,
+        "result": "Ok",
+        "data": base64.b64encode(data).decode("ascii"),
+    }
+    table_name = change.route.table_name
+    if table_name:
+        output_record["metadata"] = {
+            "otfMetadata": {
+                "destinationDatabaseName": DESTINATION_DATABASE,
+                "destinationTableName": table_name,
+                "operation": change.operation,
+            }
+        }
+        metrics.count(f"routed_{table_name}")
+    metrics.add_time("encode", time.perf_counter() - started)
+    metrics.debug(
+        "transformed",
+        recordId=record_id,
+        table=table_name,
+        operation=change.operation,
+    )
+    return output_record
@@ -0,0 +1,226 @@
+"""Wait for Athena queries with adaptive polling.
+
+Polling starts at INITIAL_INTERVAL_SECONDS and grows by BACKOFF_FACTOR up to
+MAX_INTERVAL_SECONDS. A DDL statement that finishes in under a second is
+therefore seen within about a second, while long queries are not polled
+more than every few seconds. All pending queries are checked together with
+BatchGetQueryExecution, at most BATCH_LIMIT ids per call.
+
+A throttled or failed status call is retried with exponential backoff, up
+to MAX_ATTEMPTS times. When a batch still fails, only the queries of that
+batch fail.
+
+wait_for_queries() blocks until every query has finished. QueryWaiter is
+the asyncio API: any number of coroutines can await their own queries, and
+one background task polls all of them together. A waiter that times out
+stops waiting without affecting other waiters on the same query.
+
+    waiter = QueryWaiter(athena)
+    executions = await asyncio.gather(*(waiter.run(sql, **options) for sql in queries))
+"""
+
+import asyncio
+import random
+import time
+
+from botocore.exceptions import ClientError
+from botocore.exceptions import ConnectionError as BotocoreConnectionError
+
+TERMINAL_STATES = {"SUCCEEDED", "FAILED", "CANCELLED"}
+
+# BatchGetQueryExecution accepts up to 50 query execution ids
+BATCH_LIMIT = 50
+
+INITIAL_INTERVAL_SECONDS = 0.25
+MAX_INTERVAL_SECONDS = 5.0
+BACKOFF_FACTOR = 1.5
+DEFAULT_TIMEOUT_SECONDS = 300
+
+# Retries of a BatchGetQueryExecution call that was throttled or failed on
+# the service side
+MAX_ATTEMPTS = 4
+BASE_BACKOFF_SECONDS = 0.2
+MAX_BACKOFF_SECONDS = 2.0
+RETRYABLE_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "InternalServerException",
+}
+
+
+def next_interval(interval, max_interval=MAX_INTERVAL_SECONDS):
+    # Grows the interval, with up to 10% jitter so that many waiters started
+    # together do not poll in lockstep
+    return min(max_interval, interval * BACKOFF_FACTOR) * random.uniform(0.9, 1.0)
+
+
+def state(execution):
+    return execution["Status"]["State"]
+
+
+def backoff_seconds(attempt):
+    # Exponential backoff with full jitter
+    return random.uniform(
+        0, min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * (2**attempt))
+    )
+
+
+def is_retryable(error):
+    if isinstance(error, ClientError):
+        return error.response["Error"]["Code"] in RETRYABLE_ERROR_CODES
+    return isinstance(error, BotocoreConnectionError)
+
+
+def get_query_batch(athena, query_execution_ids, sleep=time.sleep):
+    # Returns {id: QueryExecution} for one call of at most BATCH_LIMIT ids.
+    # Ids Athena did not process are left out, so the caller asks for them
+    # again.
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            response = athena.batch_get_query_execution(
+                QueryExecutionIds=list(query_execution_ids)
+            )
+            break
+        except Exception as e:
+            if not is_retryable(e) or attempt == MAX_ATTEMPTS - 1:
+                raise
+            sleep(backoff_seconds(attempt))
+    return {
+        execution["QueryExecutionId"]: execution
+        for execution in response.get("QueryExecutions", [])
+    }
+
+
+def batches(query_execution_ids):
+    ids = list(query_execution_ids)
+    return [
+        ids[start : start + BATCH_LIMIT] for start in range(0, len(ids), BATCH_LIMIT)
+    ]
+
+
+def get_query_executions(athena, query_execution_ids, sleep=time.sleep):
+    # Returns {id: QueryExecution} for the ids Athena processed
+    executions = {}
+    for batch in batches(query_execution_ids):
+        executions.update(get_query_batch(athena, batch, sleep))
+    return executions
+
+
+def wait_for_queries(
+    athena,
+    query_execution_ids,
+    timeout=DEFAULT_TIMEOUT_SECONDS,
+    initial_interval=INITIAL_INTERVAL_SECONDS,
+    max_interval=MAX_INTERVAL_SECONDS,
+    sleep=time.sleep,
+    clock=time.monotonic,
+):
+    # Returns {id: QueryExecution} once every query is in a terminal state
+    deadline = clock() + timeout
+    pending = set(query_execution_ids)
+    finished = {}
+    interval = initial_interval
+    while True:
+        for query_id, execution in get_query_executions(athena, pending, sleep).items():
+            if state(execution) in TERMINAL_STATES:
+                finished[query_id] = execution
+                pending.discard(query_id)
+        if not pending:
+            return finished
+        remaining = deadline - clock()
+        if remaining <= 0:
+            raise TimeoutError(f"Athena queries timed out: {sorted(pending)}")
+        sleep(min(interval, remaining))
+        interval = next_interval(interval, max_interval)
+
+
+def wait_for_query(athena, query_execution_id, **kwargs):
+    # Returns the final state of one query
+    executions = wait_for_queries(athena, [query_execution_id], **kwargs)
+    return state(executions[query_execution_id])
+
+
+class QueryWaiter:
+    # Shares one polling task between all coroutines waiting on this client.
+    # boto3 calls run in worker threads, so the event loop is not blocked.
+    def __init__(
+        self,
+        athena,
+        initial_interval=INITIAL_INTERVAL_SECONDS,
+        max_interval=MAX_INTERVAL_SECONDS,
+    ):
+        self.athena = athena
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        # One future per query, shared by its waiters, and the number of
+        # coroutines waiting on it
+        self.futures = {}
+        self.waiters = {}
+        self.interval = initial_interval
+        self.poller = None
+        self.polls = 0
+
+    async def start(self, query_string, **kwargs):
+        response = await asyncio.to_thread(
+            self.athena.start_query_execution, QueryString=query_string, **kwargs
+        )
+        return response["QueryExecutionId"]
+
+    async def wait(self, query_execution_id, timeout=DEFAULT_TIMEOUT_SECONDS):
+        # Returns the QueryExecution once the query is in a terminal state
+        future = self.futures.get(query_execution_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.futures[query_execution_id] = future
+            # A new query is likely to finish soon, so poll quickly again
+            self.interval = self.initial_interval
+        self.waiters[query_execution_id] = self.waiters.get(query_execution_id, 0) + 1
+        if self.poller is None or self.poller.done():
+            self.poller = asyncio.create_task(self._poll())
+        try:
+            # The shield keeps a timeout from cancelling the shared future
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Athena query timed out: {query_execution_id}")
+        finally:
+            self.waiters[query_execution_id] -= 1
+            if not self.waiters[query_execution_id]:
+                # Nobody waits on the query any more, so it is no longer polled
+                del self.waiters[query_execution_id]
+                if self.futures.get(query_execution_id) is future:
+                    del self.futures[query_execution_id]
+
+    async def run(self, query_string, timeout=DEFAULT_TIMEOUT_SECONDS, **kwargs):
+        return await self.wait(await self.start(query_string, **kwargs), timeout)
+
+    def _resolve(self, query_id, result=None, error=None):
+        future = self.futures.pop(query_id, None)
+        if future is None or future.done():
+            return
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    async def _poll(self):
+        while self.futures:
+            await asyncio.sleep(self.interval)
+            self.interval = next_interval(self.interval, self.max_interval)
+            pending = batches(self.futures)
+            results = await asyncio.gather(
+                *(
+                    asyncio.to_thread(get_query_batch, self.athena, batch)
+                    for batch in pending
+                ),
+                return_exceptions=True,
+            )
+            self.polls += 1
+            for batch, result in zip(pending, results):
+                if isinstance(result, Exception):
+                    # The retries are used up, so the queries of this batch fail
+                    for query_id in batch:
+                        self._resolve(query_id, error=result)
+                    continue
+                for query_id, execution in result.items():
+                    if state(execution) in TERMINAL_STATES:
+                        self._resolve(query_id, execution)
@@ -0,0 +1,124 @@
+"""Build the trimmed boto3 layer used by the custom resource Lambda.
+
+Installs requirements-layers.txt into boto3-layer/python, removes the botocore
+service models and boto3 resource models the functions do not call, and
+precompiles the remaining modules.
+
+Precompiling matters because /opt is read-only in Lambda, so a layer without
+matching .pyc files is compiled from source on every cold start. The .pyc
+files are only usable by the same Python minor version as the Lambda runtime,
+so run this script with that interpreter:
+
+    python3.13 scripts/build_boto3_layer.py
+"""
+
+import argparse
+import compileall
+import os
+import py_compile
+import shutil
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runtime of the Lambda functions in stack/pipeline.py
+LAMBDA_PYTHON_VERSION = (3, 13)
+
+# Services called through the layer's boto3; the maintenance Lambda reads the
+# Iceberg metadata file with S3
+KEEP_SERVICES = {"s3tables", "s3"}
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def prune_models(data_dir, keep):
+    # Service models are directories; files at the top level (endpoints,
+    # partitions, retry and default configuration) are shared and kept
+    removed = 0
+    if not os.path.isdir(data_dir):
+        return removed
+    for name in os.listdir(data_dir):
+        path = os.path.join(data_dir, name)
+        if os.path.isdir(path) and name not in keep:
+            shutil.rmtree(path)
+            removed += 1
+    return removed
+
+
+def build(target, requirements, keep):
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "pip",
+            "install",
+            "--quiet",
+            "--no-compile",
+            "-r",
+            requirements,
+            "-t",
+            target,
+        ],
+        check=True,
+    )
+    installed = directory_size(target)
+
+    removed = prune_models(os.path.join(target, "botocore", "data"), keep)
+    removed += prune_models(os.path.join(target, "boto3", "data"), keep)
+    for root, dirs, _ in os.walk(target):
+        for name in list(dirs):
+            if name == "__pycache__":
+                shutil.rmtree(os.path.join(root, name))
+                dirs.remove(name)
+
+    if sys.version_info[:2] == LAMBDA_PYTHON_VERSION:
+        # Asset zips do not keep file modification times, so timestamp-based
+        # .pyc files would be treated as stale and recompiled on every cold start
+        compileall.compile_dir(
+            target,
+            quiet=1,
+            invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+        )
+    else:
+        print(
+            f"Skipping precompilation: running Python "
+            f"{sys.version_info[0]}.{sys.version_info[1]}, the functions run "
+            f"Python {LAMBDA_PYTHON_VERSION[0]}.{LAMBDA_PYTHON_VERSION[1]}"
+        )
+
+    print(f"Removed {removed} unused service and resource models")
+    print(
+        f"Layer size: {installed / 2**20:.1f} MiB installed, "
+        f"{directory_size(target) / 2**20:.1f} MiB after trimming"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--target", default=os.path.join(PROJECT_ROOT, "boto3-layer", "python")
+    )
+    parser.add_argument(
+        "--requirements", default=os.path.join(PROJECT_ROOT, "requirements-layers.txt")
+    )
+    parser.add_argument(
+        "--keep-service",
+        action="append",
+        default=[],
+        help="additional botocore service model to keep",
+    )
+    args = parser.parse_args()
+    build(args.target, args.requirements, KEEP_SERVICES | set(args.keep_service))
+
+
+if __name__ == "__main__":
+    main()
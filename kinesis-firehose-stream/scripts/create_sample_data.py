@@ -1,9 +1,76 @@
+"""Write sample transactions to the financial-transactions table.
+
+Without --profile, writes uniformly random inserts from the last hour. With
+--profile, replays a seeded event stream (skew, bursts, late arrivals and
+MODIFY/REMOVE against existing keys) from scripts/generation_profiles.py.
+
+The hour ends at --end-time. With --seed it defaults to SEEDED_ANCHOR_TIME
+instead of the current time, so a seed writes the same rows on every run.
+"""
+
+import argparse
 import boto3
 import random
 import time
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
-import uuid
+
+# Value domains for the generated transactions
+MERCHANT_CATEGORIES = [
+    "RETAIL",
+    "DINING",
+    "TRAVEL",
+    "ENTERTAINMENT",
+    "HEALTHCARE",
+    "UTILITIES",
+    "FINANCIAL_SERVICES",
+]
+
+PAYMENT_METHODS = [
+    "CREDIT_CARD",
+    "DEBIT_CARD",
+    "DIGITAL_WALLET",
+    "BANK_TRANSFER",
+]
+
+TRANSACTION_TYPES = ["PURCHASE", "REFUND", "PAYMENT", "TRANSFER", "WITHDRAWAL"]
+
+CURRENCIES = ["USD", "EUR", "GBP", "INR"]
+
+RISK_SCORES = ["LOW", "MEDIUM", "HIGH"]
+
+REGIONS = ["US_EAST", "US_WEST", "EU", "APAC"]
+
+STATUSES = ["APPROVED", "DECLINED", "PENDING_REVIEW", "FLAGGED"]
+
+# Flattened transaction_metadata and fraud_indicators values
+DEVICE_TYPES = ["MOBILE", "WEB", "POS", "ATM"]
+AUTHENTICATION_METHODS = ["2FA", "BIOMETRIC", "PIN", "PASSWORD"]
+VELOCITY_CHECKS = ["PASS", "FLAG", "REVIEW"]
+AMOUNT_THRESHOLDS = ["NORMAL", "HIGH", "VERY_HIGH"]
+LOCATION_RISKS = ["LOW", "MEDIUM", "HIGH"]
+PATTERN_MATCHES = ["NORMAL", "SUSPICIOUS"]
+
+# Time that seeded data is generated around when no time is given
+SEEDED_ANCHOR_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def anchor_time(seed=None, value=None):
+    # value when given, otherwise a fixed time for seeded runs and the current
+    # time for unseeded ones
+    if value is not None:
+        return value
+    if seed is not None:
+        return SEEDED_ANCHOR_TIME
+    return datetime.now(timezone.utc)
+
+
+def parse_time(value):
+    # ISO 8601 time for --end-time and --start-time, UTC unless it has an offset
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
 
 
 class CreateSampleData:
@@ -14,56 +81,48 @@ class CreateSampleData:
         self.table = self.dynamodb.Table(self.table_name)
 
     @staticmethod
-    def generate_transaction(timestamp, customer_base=1000):
-        merchant_categories = [
-            "RETAIL",
-            "DINING",
-            "TRAVEL",
-            "ENTERTAINMENT",
-            "HEALTHCARE",
-            "UTILITIES",
-            "FINANCIAL_SERVICES",
-        ]
+    def generate_amount(rng=random):
+        return Decimal(str(round(rng.uniform(10, 1000), 2)))
 
-        payment_methods = [
-            "CREDIT_CARD",
-            "DEBIT_CARD",
-            "DIGITAL_WALLET",
-            "BANK_TRANSFER",
-        ]
-
-        transaction_types = ["PURCHASE", "REFUND", "PAYMENT", "TRANSFER", "WITHDRAWAL"]
-
-        currencies = ["USD", "EUR", "GBP", "INR"]
-
-        risk_scores = ["LOW", "MEDIUM", "HIGH"]
-
-        regions = ["US_EAST", "US_WEST", "EU", "APAC"]
+    @staticmethod
+    def generate_transaction(
+        timestamp,
+        customer_base=1000,
+        rng=random,
+        customer_number=None,
+        merchant_number=None,
+    ):
+        # rng is the global random module by default; pass a seeded random.Random
+        # for reproducible data
+        if customer_number is None:
+            customer_number = rng.randint(1, customer_base)
+        if merchant_number is None:
+            merchant_number = rng.randint(1, 1000)
 
         # Generate values for what used to be nested fields
-        device_type = random.choice(["MOBILE", "WEB", "POS", "ATM"])
-        authentication_method = random.choice(["2FA", "BIOMETRIC", "PIN", "PASSWORD"])
-        merchant_id = f"MERCH_{random.randint(1, 1000):04d}"
+        device_type = rng.choice(DEVICE_TYPES)
+        authentication_method = rng.choice(AUTHENTICATION_METHODS)
+        merchant_id = f"MERCH_{merchant_number:04d}"
 
-        velocity_check = random.choice(["PASS", "FLAG", "REVIEW"])
-        amount_threshold = random.choice(["NORMAL", "HIGH", "VERY_HIGH"])
-        location_risk = random.choice(["LOW", "MEDIUM", "HIGH"])
-        pattern_match = random.choice(["NORMAL", "SUSPICIOUS"])
+        velocity_check = rng.choice(VELOCITY_CHECKS)
+        amount_threshold = rng.choice(AMOUNT_THRESHOLDS)
+        location_risk = rng.choice(LOCATION_RISKS)
+        pattern_match = rng.choice(PATTERN_MATCHES)
 
         return {
-            "transaction_id": f"TXN_{uuid.uuid4().hex[:16]}",
+            "transaction_id": f"TXN_{rng.getrandbits(64):016x}",
             "timestamp": int(timestamp.timestamp() * 1000),
-            "customer_id": f"CUST_{str(random.randint(1, customer_base)).zfill(6)}",
+            "customer_id": f"CUST_{str(customer_number).zfill(6)}",
             "date": timestamp.strftime("%Y-%m-%d"),
             "hour": int(timestamp.hour),
             "minute": int(timestamp.minute),
-            "transaction_type": random.choice(transaction_types),
-            "amount": Decimal(str(round(random.uniform(10, 1000), 2))),
-            "currency": random.choice(currencies),
-            "merchant_category": random.choice(merchant_categories),
-            "payment_method": random.choice(payment_methods),
-            "region": random.choice(regions),
-            "risk_score": random.choice(risk_scores),
+            "transaction_type": rng.choice(TRANSACTION_TYPES),
+            "amount": CreateSampleData.generate_amount(rng),
+            "currency": rng.choice(CURRENCIES),
+            "merchant_category": rng.choice(MERCHANT_CATEGORIES),
+            "payment_method": rng.choice(PAYMENT_METHODS),
+            "region": rng.choice(REGIONS),
+            "risk_score": rng.choice(RISK_SCORES),
             # Flattened transaction_metadata fields
             "device_type": device_type,
             "authentication_method": authentication_method,
@@ -73,32 +132,40 @@ class CreateSampleData:
             "amount_threshold": amount_threshold,
             "location_risk": location_risk,
             "pattern_match": pattern_match,
-            "status": random.choice(
-                ["APPROVED", "DECLINED", "PENDING_REVIEW", "FLAGGED"]
-            ),
+            "status": rng.choice(STATUSES),
             "processing_timestamp": int(
-                (
-                    timestamp + timedelta(milliseconds=random.randint(100, 1000))
-                ).timestamp()
+                (timestamp + timedelta(milliseconds=rng.randint(100, 1000))).timestamp()
                 * 1000
             ),
         }
 
-    def batch_write_transactions(self, num_transactions=100):
-        end_time = datetime.now()
-        start_time = end_time - timedelta(hours=1)  # Generate last hour of data
-
-        # Generate random timestamps within the last hour
+    @staticmethod
+    def generate_timestamps(
+        num_transactions, window=timedelta(hours=1), rng=random, end_time=None
+    ):
+        end_time = end_time or datetime.now(timezone.utc)
+        start_time = end_time - window  # Generate last hour of data by default
+
+        # Generate random timestamps within the window
+        window_seconds = int(window.total_seconds())
         timestamps = [
-            start_time + timedelta(seconds=random.randint(0, 3600))
+            start_time + timedelta(seconds=rng.randint(0, window_seconds))
             for _ in range(num_transactions)
         ]
         timestamps.sort()  # Sort timestamps for more realistic data
+        return timestamps
+
+    def batch_write_transactions(self, num_transactions=100, seed=None, end_time=None):
+        # A seed without end_time writes the same transactions on every run
+        rng = random.Random(seed)
+        timestamps = self.generate_timestamps(
+            num_transactions, rng=rng, end_time=anchor_time(seed, end_time)
+        )
 
         try:
             with self.table.batch_writer() as batch:
                 for timestamp in timestamps:
-                    transaction = self.generate_transaction(timestamp)
+                    transaction = self.generate_transaction(timestamp, rng=rng)
                     batch.put_item(Item=transaction)
 
             print(f"Successfully wrote {num_transactions} transactions")
@@ -107,11 +174,60 @@ class CreateSampleData:
             print(f"Error writing to DynamoDB: {str(e)}")
             raise
 
+    def write_events(self, events):
+        # Applies (event_name, item) pairs from a TransactionEventGenerator. Later
+        # writes to a key already in the pending batch replace the earlier one.
+        counts = {"INSERT": 0, "MODIFY": 0, "REMOVE": 0}
+        try:
+            with self.table.batch_writer(
+                overwrite_by_pkeys=["transaction_id", "timestamp"]
+            ) as batch:
+                for event_name, item in events:
+                    if event_name == "REMOVE":
+                        batch.delete_item(Key=item)
+                    else:
+                        batch.put_item(Item=item)
+                    counts[event_name] += 1
+
+            print(f"Successfully applied events: {counts}")
+
+        except Exception as e:
+            print(f"Error writing to DynamoDB: {str(e)}")
+            raise
+        return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="Generation profile from scripts/generation_profiles.py, e.g. skewed or cdc",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--end-time",
+        type=parse_time,
+        default=None,
+        help="End of the generated hour, e.g. 2024-01-01T00:00:00Z",
+    )
+    args = parser.parse_args(argv)
 
-def main():
     sample = CreateSampleData()
+    end_time = anchor_time(args.seed, args.end_time)
+
+    if args.profile is None:
+        sample.batch_write_transactions(args.count, args.seed, end_time)
+        return
+
+    from generation_profiles import TransactionEventGenerator, get_profile
 
-    sample.batch_write_transactions()
+    generator = TransactionEventGenerator(get_profile(args.profile, args.seed))
+    window = timedelta(hours=1)
+    sample.write_events(
+        generator.events(args.count, start_time=end_time - window, window=window)
+    )
 
 
 if __name__ == "__main__":
@@ -1,12 +1,14 @@
+import argparse
 import boto3
 import random
 import time
-from datetime import datetime, timedelta
+from datetime import timedelta
 from decimal import Decimal
-import uuid
 
+from create_sample_data import SEEDED_ANCHOR_TIME, anchor_time, parse_time
 
-def create_sample_order():
+
+def create_sample_order(rng=random, end_time=None):
     # Product categories and their price ranges
     categories = {
         "Electronics": (299.99, 1299.99),
@@ -20,24 +22,25 @@ def create_sample_order():
     regions = ["East", "West", "North", "South", "Central"]
     payment_methods = ["Credit Card", "Debit Card", "PayPal", "Bank Transfer"]
 
-    # Generate random timestamp within last 90 days
-    end_date = datetime.now()
+    # Generate random timestamp within the 90 days before end_time. The fixed
+    # default keeps orders from a seeded rng the same on every run.
+    end_date = end_time or SEEDED_ANCHOR_TIME
     start_date = end_date - timedelta(days=90)
-    random_timestamp = random.uniform(start_date.timestamp(), end_date.timestamp())
+    random_timestamp = rng.uniform(start_date.timestamp(), end_date.timestamp())
 
     # Generate 1-5 items per order
-    num_items = random.randint(1, 5)
+    num_items = rng.randint(1, 5)
     items = []
     total_amount = Decimal("0.0")
 
     for _ in range(num_items):
-        category = random.choice(list(categories.keys()))
+        category = rng.choice(list(categories.keys()))
         min_price, max_price = categories[category]
-        price = round(Decimal(str(random.uniform(min_price, max_price))), 2)
-        quantity = random.randint(1, 5)
+        price = round(Decimal(str(rng.uniform(min_price, max_price))), 2)
+        quantity = rng.randint(1, 5)
 
         item = {
-            "productId": f"PROD{uuid.uuid4().hex[:8].upper()}",
+            "productId": f"PROD{rng.getrandbits(32):08X}",
             "category": category,
             "price": price,
             "quantity": quantity,
@@ -46,21 +49,24 @@ def create_sample_order():
         total_amount += price * Decimal(str(quantity))
 
     order = {
-        "orderId": f"ORD{uuid.uuid4().hex[:8].upper()}",
+        "orderId": f"ORD{rng.getrandbits(32):08X}",
         "timestamp": int(random_timestamp * 1000),  # Convert to milliseconds
-        "customerId": f"CUST{uuid.uuid4().hex[:8].upper()}",
+        "customerId": f"CUST{rng.getrandbits(32):08X}",
         "items": items,
         "totalAmount": round(total_amount, 2),
-        "region": random.choice(regions),
-        "paymentMethod": random.choice(payment_methods),
+        "region": rng.choice(regions),
+        "paymentMethod": rng.choice(payment_methods),
     }
 
     return order
 
 
-def batch_write_orders(table_name, num_orders=1000):
+def batch_write_orders(table_name, num_orders=1000, seed=None, end_time=None):
     dynamodb = boto3.resource("dynamodb")
     table = dynamodb.Table(table_name)
+    # A fixed seed writes the same orders on every run
+    rng = random.Random(seed)
+    end_time = anchor_time(seed, end_time)
 
     # Process in batches of 25 (DynamoDB batch write limit)
     batch_size = 25
@@ -72,7 +78,7 @@ def batch_write_orders(table_name, num_orders=1000):
     try:
         with table.batch_writer() as batch:
             for _ in range(num_orders):
-                order = create_sample_order()
+                order = create_sample_order(rng, end_time)
                 batch.put_item(Item=order)
                 orders_processed += 1
 
@@ -98,14 +104,9 @@ def create_orders_table(table_name):
     try:
         table = dynamodb.create_table(
             TableName=table_name,
-            KeySchema=[
-                {"AttributeName": "orderId", "KeyType": "HASH"},
-                {"AttributeName": "timestamp", "KeyType": "RANGE"},
-            ],
-            AttributeDefinitions=[
-                {"AttributeName": "orderId", "AttributeType": "S"},
-                {"AttributeName": "timestamp", "AttributeType": "N"},
-            ],
+            # Keyed like the orders table the pipeline creates for an orders route
+            KeySchema=[{"AttributeName": "orderId", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "orderId", "AttributeType": "S"}],
             ProvisionedThroughput={"ReadCapacityUnits": 5, "WriteCapacityUnits": 5},
         )
 
@@ -122,13 +123,24 @@ def create_orders_table(table_name):
         return False
 
 
-def main():
-    table_name = "Orders"
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write sample orders to DynamoDB")
+    parser.add_argument("--table", default="orders")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--end-time",
+        type=parse_time,
+        default=None,
+        help="End of the 90 days of orders, e.g. 2024-01-01T00:00:00Z",
+    )
+    args = parser.parse_args(argv)
+    table_name = args.table
 
     # Create table if it doesn't exist
     if create_orders_table(table_name):
         # Write sample orders
-        batch_write_orders(table_name)
+        batch_write_orders(table_name, args.count, args.seed, args.end_time)
     else:
         print("Failed to create/verify table. Exiting...")
 
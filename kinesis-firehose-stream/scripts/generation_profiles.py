@@ -0,0 +1,184 @@
+import bisect
+import copy
+import itertools
+import random
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta, timezone
+
+from create_sample_data import STATUSES, CreateSampleData, anchor_time
+
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    seed: int = 0
+    customer_base: int = 1000
+    merchant_base: int = 1000
+    # Zipf exponents for customer and merchant popularity, 0 is uniform
+    customer_skew: float = 0.0
+    merchant_skew: float = 0.0
+    # Chance that an arrival starts a burst of back-to-back events
+    burst_probability: float = 0.0
+    burst_size: int = 50
+    burst_spacing_ms: int = 2
+    # Events whose timestamp lags their arrival by up to late_max_seconds
+    late_fraction: float = 0.0
+    late_max_seconds: int = 3600
+    # Events whose timestamp is jittered backwards by up to out_of_order_max_ms
+    out_of_order_fraction: float = 0.0
+    out_of_order_max_ms: int = 5000
+    # Share of events that update or delete an existing key instead of inserting
+    modify_fraction: float = 0.0
+    remove_fraction: float = 0.0
+
+    def validate(self):
+        for name in (
+            "burst_probability",
+            "late_fraction",
+            "out_of_order_fraction",
+            "modify_fraction",
+            "remove_fraction",
+        ):
+            value = getattr(self, name)
+            if not 0 <= value <= 1:
+                raise ValueError(f"{name}={value} must be between 0 and 1")
+        if self.modify_fraction + self.remove_fraction > 1:
+            raise ValueError("modify_fraction + remove_fraction must not exceed 1")
+        if self.customer_skew < 0 or self.merchant_skew < 0:
+            raise ValueError("Zipf skew must not be negative")
+        return self
+
+
+PROFILES = {
+    # Matches the original CreateSampleData output, but reproducible
+    "uniform": GenerationProfile(),
+    # A few customers and merchants account for most of the traffic
+    "skewed": GenerationProfile(customer_skew=1.2, merchant_skew=1.1),
+    "bursty": GenerationProfile(
+        customer_skew=1.2, merchant_skew=1.1, burst_probability=0.01
+    ),
+    # Late and out-of-order arrivals that land in earlier partitions
+    "late": GenerationProfile(late_fraction=0.05, out_of_order_fraction=0.2),
+    # Updates and deletes against existing keys, exercising the upsert path
+    "cdc": GenerationProfile(
+        customer_skew=1.2,
+        merchant_skew=1.1,
+        burst_probability=0.01,
+        late_fraction=0.02,
+        out_of_order_fraction=0.1,
+        modify_fraction=0.3,
+        remove_fraction=0.05,
+    ),
+}
+
+
+def get_profile(name, seed=None):
+    if name not in PROFILES:
+        raise ValueError(
+            f"Unknown profile '{name}', expected one of {sorted(PROFILES)}"
+        )
+    profile = PROFILES[name]
+    if seed is not None:
+        profile = replace(profile, seed=seed)
+    return profile.validate()
+
+
+class ZipfSampler:
+    # Draws ranks 1..n with probability proportional to 1 / rank**skew
+    def __init__(self, n, skew, rng):
+        self.rng = rng
+        self.cumulative = list(
+            itertools.accumulate(1.0 / rank**skew for rank in range(1, n + 1))
+        )
+        self.total = self.cumulative[-1]
+
+    def sample(self):
+        return bisect.bisect(self.cumulative, self.rng.random() * self.total) + 1
+
+
+class TransactionEventGenerator:
+    def __init__(self, profile):
+        self.profile = profile.validate()
+        self.rng = random.Random(profile.seed)
+        self.customers = ZipfSampler(
+            profile.customer_base, profile.customer_skew, self.rng
+        )
+        self.merchants = ZipfSampler(
+            profile.merchant_base, profile.merchant_skew, self.rng
+        )
+        # Items that have been written and not deleted, for MODIFY and REMOVE
+        self.live = []
+
+    def arrivals(self, num_events, start_ms, window_ms):
+        # Poisson arrivals over the window, with occasional tightly spaced bursts
+        rng = self.rng
+        mean_gap_ms = window_ms / max(num_events, 1)
+        now = start_ms
+        burst_left = 0
+        for _ in range(num_events):
+            if burst_left:
+                burst_left -= 1
+                now += rng.randint(0, self.profile.burst_spacing_ms)
+            else:
+                now += int(rng.expovariate(1.0 / mean_gap_ms)) if mean_gap_ms else 0
+                if rng.random() < self.profile.burst_probability:
+                    burst_left = self.profile.burst_size - 1
+            yield now
+
+    def event_time(self, arrival_ms):
+        rng = self.rng
+        if rng.random() < self.profile.late_fraction:
+            return arrival_ms - rng.randint(0, self.profile.late_max_seconds * 1000)
+        if rng.random() < self.profile.out_of_order_fraction:
+            return arrival_ms - rng.randint(0, self.profile.out_of_order_max_ms)
+        return arrival_ms
+
+    def insert(self, event_ms):
+        timestamp = datetime.fromtimestamp(event_ms / 1000, tz=timezone.utc)
+        item = CreateSampleData.generate_transaction(
+            timestamp,
+            self.profile.customer_base,
+            rng=self.rng,
+            customer_number=self.customers.sample(),
+            merchant_number=self.merchants.sample(),
+        )
+        self.live.append(item)
+        return item
+
+    def modify(self, arrival_ms):
+        # Same key, new status and amount, as a later state of the transaction
+        index = self.rng.randrange(len(self.live))
+        item = copy.copy(self.live[index])
+        item["status"] = self.rng.choice(STATUSES)
+        item["amount"] = CreateSampleData.generate_amount(self.rng)
+        item["processing_timestamp"] = max(arrival_ms, item["timestamp"] + 1)
+        self.live[index] = item
+        return item
+
+    def remove(self):
+        # Swap-pop keeps removal O(1)
+        index = self.rng.randrange(len(self.live))
+        self.live[index], self.live[-1] = self.live[-1], self.live[index]
+        item = self.live.pop()
+        return {
+            "transaction_id": item["transaction_id"],
+            "timestamp": item["timestamp"],
+        }
+
+    def events(self, num_events, start_time=None, window=timedelta(hours=1)):
+        # Yields (event_name, item) in arrival order; REMOVE events carry only the
+        # key. Without start_time the events fill the window before the fixed
+        # anchor time, so that the seed alone decides the events.
+        if start_time is None:
+            start_time = anchor_time(self.profile.seed) - window
+        start_ms = int(start_time.timestamp() * 1000)
+        window_ms = int(window.total_seconds() * 1000)
+        modify_cutoff = self.profile.remove_fraction + self.profile.modify_fraction
+
+        for arrival_ms in self.arrivals(num_events, start_ms, window_ms):
+            choice = self.rng.random() if self.live else 1.0
+            if choice < self.profile.remove_fraction:
+                yield "REMOVE", self.remove()
+            elif choice < modify_cutoff:
+                yield "MODIFY", self.modify(arrival_ms)
+            else:
+                yield "INSERT", self.insert(self.event_time(arrival_ms))
@@ -0,0 +1,119 @@
+"""Report `python -X importtime` totals for each Lambda handler.
+
+Imports every handler module in a fresh interpreter, with the layers it gets
+in Lambda on sys.path, and reports the cumulative import time of the module
+(including the clients it creates at import) and its heaviest imports. With
+--check, exits non-zero when a handler is over its budget.
+
+    python scripts/import_time_report.py --repeat 5 --check
+
+Run it with the Lambda runtime's Python version to get comparable numbers.
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARED_LAYER = os.path.join(PROJECT_ROOT, "lambda", "shared", "python")
+BOTO3_LAYER = os.path.join(PROJECT_ROOT, "boto3-layer", "python")
+
+# Handler -> layers attached to it in the stacks
+HANDLER_LAYERS = {
+    "transform": [SHARED_LAYER],
+    "firehose": [SHARED_LAYER],
+    "custom_resource": [BOTO3_LAYER, SHARED_LAYER],
+    "maintenance": [BOTO3_LAYER, SHARED_LAYER],
+}
+
+# Import-time budgets in milliseconds, measured on a warm disk cache
+IMPORT_BUDGETS_MS = {
+    "transform": 50,
+    "firehose": 400,
+    "custom_resource": 450,
+    "maintenance": 550,
+}
+
+ENVIRONMENT = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "FIREHOSE_DELIVERY_STREAM": "report",
+    "TABLE_BUCKET_ARN": "arn:aws:s3tables:us-east-1:000000000000:bucket/report",
+    "NAMESPACE": "analytics",
+    "TABLE_NAME": "transactions",
+    "MAINTENANCE_SETTINGS": "{}",
+}
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_times(handler):
+    # Returns the cumulative import time of index and of each module it imports
+    # directly, in microseconds, for one cold import
+    environment = dict(os.environ, **ENVIRONMENT)
+    environment["PYTHONPATH"] = os.pathsep.join(
+        path for path in HANDLER_LAYERS[handler] if os.path.isdir(path)
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import index"],
+        cwd=os.path.join(PROJECT_ROOT, "lambda", handler),
+        env=environment,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # A module is reported after everything it imports, one level deeper
+    children = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        _, cumulative_us, indent, module = match.groups()
+        depth = len(indent) // 2
+        if depth == 1:
+            children.append((module, int(cumulative_us)))
+        elif depth == 0:
+            if module == "index":
+                return int(cumulative_us), children
+            children = []
+    raise RuntimeError(f"No import time reported for {handler}")
+
+
+def report(handler, repeat, top):
+    # The fastest run is the least disturbed by other work on the machine
+    total_us, children = min(
+        (import_times(handler) for _ in range(repeat)), key=lambda run: run[0]
+    )
+    # What is left is the handler's own module body: clients, decode plans, etc.
+    body_us = total_us - sum(us for _, us in children)
+    children = children + [("index (module body)", body_us)]
+    heaviest = sorted(children, key=lambda child: child[1], reverse=True)[:top]
+    return total_us / 1000, [(module, us / 1000) for module, us in heaviest]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("handlers", nargs="*", default=sorted(HANDLER_LAYERS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--check", action="store_true", help="enforce the budgets")
+    args = parser.parse_args()
+
+    over_budget = []
+    for handler in args.handlers:
+        total_ms, heaviest = report(handler, args.repeat, args.top)
+        budget_ms = IMPORT_BUDGETS_MS[handler]
+        status = "ok" if total_ms <= budget_ms else "OVER BUDGET"
+        print(f"{handler}: {total_ms:.1f} ms (budget {budget_ms} ms) {status}")
+        for module, cumulative_ms in heaviest:
+            print(f"    {cumulative_ms:8.1f} ms  {module}")
+        if total_ms > budget_ms:
+            over_budget.append(handler)
+
+    if args.check and over_budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""Write DynamoDB-style change records straight to the Kinesis data stream.
+
+Generates change events with a generation profile and writes them in the JSON
+format DynamoDB uses for Kinesis, so the rest of the pipeline cannot tell
+them apart from table changes. This is useful for backfills and load tests
+that should skip the DynamoDB table.
+
+By default the records are aggregated the way the Kinesis Producer Library
+does it: user records that hash to the same shard are packed into one Kinesis
+record of up to --max-bytes, which is sent with an explicit hash key for
+that shard. Firehose de-aggregates them before the transform Lambda sees
+them. Aggregation counts far fewer records against the shard's 1,000
+records/sec write limit, and each record is billed in whole PUT payload
+units.
+
+Examples:
+    python scripts/kinesis_producer.py --stream-name <stream> --count 100000
+    python scripts/kinesis_producer.py --stream-name <stream> --no-aggregate
+
+    # Offline against moto
+    python scripts/kinesis_producer.py --moto --count 10000
+"""
+
+import argparse
+import bisect
+import hashlib
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+import boto3
+from botocore.exceptions import ClientError
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+from create_sample_data import anchor_time, parse_time
+from generation_profiles import PROFILES, TransactionEventGenerator, get_profile
+from harness.events import StreamRecordBuilder, kinesis_payload
+from kpl import AggregatedRecord
+
+# KPL default AggregationMaxSize; a Kinesis record can hold up to 1 MiB
+DEFAULT_MAX_BYTES = 50 * 1024
+
+# PutRecords limits per call
+PUT_RECORDS_LIMIT = 500
+PUT_RECORDS_BYTES = 5 * 1024 * 1024
+
+THROTTLE_ERROR_CODES = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+}
+
+
+def hash_key(partition_key):
+    # Kinesis maps a partition key to a shard by the MD5 of the key
+    return int.from_bytes(hashlib.md5(partition_key.encode("utf-8")).digest(), "big")
+
+
+def open_shards(client, stream_name):
+    shards = []
+    kwargs = {"StreamName": stream_name}
+    while True:
+        response = client.list_shards(**kwargs)
+        shards.extend(
+            shard
+            for shard in response["Shards"]
+            if "EndingSequenceNumber" not in shard["SequenceNumberRange"]
+        )
+        if not response.get("NextToken"):
+            return shards
+        kwargs = {"NextToken": response["NextToken"]}
+
+
+class ShardAggregator:
+    # One aggregate per shard, so every user record still lands on the shard
+    # its own partition key maps to and keeps its order relative to that key
+    def __init__(self, shards, max_bytes=DEFAULT_MAX_BYTES):
+        self.starting_keys = sorted(
+            int(shard["HashKeyRange"]["StartingHashKey"]) for shard in shards
+        )
+        self.max_bytes = max_bytes
+        self.pending = {}
+
+    def add(self, partition_key, data):
+        # Returns a PutRecords entry when the shard's aggregate is full
+        shard = bisect.bisect_right(self.starting_keys, hash_key(partition_key)) - 1
+        pending = self.pending.get(shard)
+        entry = None
+        if pending is not None:
+            aggregated = pending[1]
+            added = aggregated.encoded_size(partition_key, data)
+            if aggregated.size + added > self.max_bytes:
+                entry = self._entry(shard, *pending)
+                pending = None
+        if pending is None:
+            # The first user record's key is the Kinesis record's partition key
+            pending = self.pending[shard] = (partition_key, AggregatedRecord())
+        pending[1].add(partition_key, data)
+        return entry
+
+    def flush(self):
+        entries = [
+            self._entry(shard, *pending) for shard, pending in self.pending.items()
+        ]
+        self.pending = {}
+        return entries
+
+    def _entry(self, shard, partition_key, aggregated):
+        return {
+            "Data": aggregated.payload(),
+            "PartitionKey": partition_key,
+            "ExplicitHashKey": str(self.starting_keys[shard]),
+        }
+
+
+def change_records(profile, count, start_time=None):
+    # (partition_key, payload) pairs in the format DynamoDB writes to Kinesis
+    generator = TransactionEventGenerator(profile)
+    builder = StreamRecordBuilder()
+    start_time = start_time or datetime.now(timezone.utc)
+    arrival_ms = int(start_time.timestamp() * 1000)
+    for event_name, item in generator.events(count, start_time=start_time):
+        stream_record = builder.build(event_name, item, arrival_ms)
+        yield item["transaction_id"], kinesis_payload(stream_record)
+
+
+def put_records(client, stream_name, entries, stats, max_attempts=8):
+    for attempt in range(max_attempts):
+        if attempt:
+            time.sleep(random.uniform(0, min(1.0, 0.025 * 2**attempt)))
+        try:
+            response = client.put_records(StreamName=stream_name, Records=entries)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in THROTTLE_ERROR_CODES:
+                stats["throttled"] += len(entries)
+                continue
+            raise
+        stats["calls"] += 1
+        # Failed entries keep their position in the response
+        failed = [
+            entry
+            for entry, result in zip(entries, response["Records"])
+            if "ErrorCode" in result
+        ]
+        stats["records"] += len(entries) - len(failed)
+        if not failed:
+            return
+        stats["throttled"] += len(failed)
+        entries = failed
+    stats["errors"] += len(entries)
+
+
+def batches(entries):
+    # Groups PutRecords entries within the per-call record and size limits
+    batch, size = [], 0
+    for entry in entries:
+        entry_size = len(entry["Data"]) + len(entry["PartitionKey"])
+        if batch and (
+            len(batch) == PUT_RECORDS_LIMIT or size + entry_size > PUT_RECORDS_BYTES
+        ):
+            yield batch
+            batch, size = [], 0
+        batch.append(entry)
+        size += entry_size
+    if batch:
+        yield batch
+
+
+def produce(client, stream_name, records, aggregate=True, max_bytes=DEFAULT_MAX_BYTES):
+    stats = {"user_records": 0, "records": 0, "calls": 0, "throttled": 0, "errors": 0}
+    if aggregate:
+        aggregator = ShardAggregator(open_shards(client, stream_name), max_bytes)
+
+    def entries():
+        for partition_key, data in records:
+            stats["user_records"] += 1
+            if not aggregate:
+                yield {"Data": data, "PartitionKey": partition_key}
+                continue
+            entry = aggregator.add(partition_key, data)
+            if entry:
+                yield entry
+        if aggregate:
+            yield from aggregator.flush()
+
+    started = time.monotonic()
+    for batch in batches(entries()):
+        put_records(client, stream_name, batch, stats)
+    stats["elapsed_seconds"] = time.monotonic() - started
+    return stats
+
+
+def print_report(stats):
+    print(
+        f"Wrote {stats['user_records']} change records as {stats['records']} "
+        f"Kinesis records in {stats['calls']} PutRecords calls "
+        f"({stats['elapsed_seconds']:.1f} s)"
+    )
+    print(f"  throttled: {stats['throttled']}")
+    print(f"  errors:    {stats['errors']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stream-name", default="transactions")
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="cdc")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--start-time",
+        type=parse_time,
+        default=None,
+        help="Time of the first change, e.g. 2024-01-01T00:00:00Z; fixed with "
+        "--seed, the current time otherwise",
+    )
+    parser.add_argument("--no-aggregate", dest="aggregate", action="store_false")
+    parser.add_argument("--max-bytes", type=int, default=DEFAULT_MAX_BYTES)
+    parser.add_argument(
+        "--shards", type=int, default=1, help="shards of the stream created in moto"
+    )
+    parser.add_argument("--region", default=os.environ.get("AWS_REGION", "us-east-1"))
+    parser.add_argument("--endpoint-url", default=None)
+    parser.add_argument("--moto", action="store_true")
+    return parser.parse_args(argv)
+
+
+def run(args):
+    client = boto3.client(
+        "kinesis", region_name=args.region, endpoint_url=args.endpoint_url
+    )
+    if args.moto:
+        # moto starts with an empty account, so the stream has to be created
+        client.create_stream(StreamName=args.stream_name, ShardCount=args.shards)
+    records = change_records(
+        get_profile(args.profile, args.seed),
+        args.count,
+        anchor_time(args.seed, args.start_time),
+    )
+    return produce(
+        client,
+        args.stream_name,
+        records,
+        aggregate=args.aggregate,
+        max_bytes=args.max_bytes,
+    )
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.moto:
+        from moto import mock_aws
+
+        with mock_aws():
+            stats = run(args)
+    else:
+        stats = run(args)
+    print_report(stats)
+    return stats
+
+
+if __name__ == "__main__":
+    main()
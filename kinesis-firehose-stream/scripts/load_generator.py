@@ -0,0 +1,375 @@
+"""High-throughput synthetic load generator for the financial-transactions table.
+
+Runs a pool of writer processes, each with its own boto3 session. Each writer
+generates whole column blocks with NumPy, zips them into DynamoDB items and
+writes them with BatchWriteItem, paced by a token bucket that follows a
+ramp-then-hold rate profile. At the end it reports achieved writes/sec,
+throttles and BatchWriteItem latency percentiles.
+
+Examples:
+    # 20,000 writes/sec for 5 minutes, ramping up over the first minute
+    python scripts/load_generator.py --target-tps 20000 --duration 300 --ramp 60 --workers 16
+
+    # Offline against DynamoDB Local
+    python scripts/load_generator.py --endpoint-url http://localhost:8000 \\
+        --create-table --target-tps 2000 --duration 30
+
+    # Offline against moto (every worker writes to its own in-memory table)
+    python scripts/load_generator.py --moto --target-tps 1000 --duration 10
+"""
+
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import boto3
+import numpy as np
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from create_sample_data import (
+    AMOUNT_THRESHOLDS,
+    AUTHENTICATION_METHODS,
+    CURRENCIES,
+    DEVICE_TYPES,
+    LOCATION_RISKS,
+    MERCHANT_CATEGORIES,
+    PATTERN_MATCHES,
+    PAYMENT_METHODS,
+    REGIONS,
+    RISK_SCORES,
+    STATUSES,
+    TRANSACTION_TYPES,
+    VELOCITY_CHECKS,
+)
+
+TABLE_NAME = "financial-transactions"
+BATCH_WRITE_LIMIT = 25
+THROTTLE_ERROR_CODES = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+}
+
+# Columns drawn uniformly from a fixed set of values
+CATEGORY_COLUMNS = [
+    ("transaction_type", TRANSACTION_TYPES),
+    ("currency", CURRENCIES),
+    ("merchant_category", MERCHANT_CATEGORIES),
+    ("payment_method", PAYMENT_METHODS),
+    ("region", REGIONS),
+    ("risk_score", RISK_SCORES),
+    ("device_type", DEVICE_TYPES),
+    ("authentication_method", AUTHENTICATION_METHODS),
+    ("velocity_check", VELOCITY_CHECKS),
+    ("amount_threshold", AMOUNT_THRESHOLDS),
+    ("location_risk", LOCATION_RISKS),
+    ("pattern_match", PATTERN_MATCHES),
+    ("status", STATUSES),
+]
+
+
+def zipf_weights(n, skew):
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    return weights / weights.sum()
+
+
+def draw_ids(rng, size, n, weights=None):
+    if weights is None:
+        return rng.integers(1, n + 1, size)
+    return rng.choice(n, size, p=weights) + 1
+
+
+def generate_block(
+    rng, size, now_ms, customer_base=1000, customer_weights=None, merchant_weights=None
+):
+    # Generate every column for `size` transactions at once, then zip into items.
+    # The optional weights give Zipf-skewed customer and merchant popularity.
+    timestamps = now_ms + np.sort(rng.integers(0, 1000, size))
+    minutes = timestamps // 60_000
+    dates = timestamps.astype("datetime64[ms]").astype("datetime64[D]").astype(str)
+    columns = [
+        rng.integers(0, 2**63, size, dtype=np.int64).tolist(),
+        timestamps.tolist(),
+        draw_ids(rng, size, customer_base, customer_weights).tolist(),
+        dates.tolist(),
+        ((minutes % 1440) // 60).tolist(),
+        (minutes % 60).tolist(),
+        np.round(rng.uniform(10, 1000, size), 2).tolist(),
+        draw_ids(rng, size, 1000, merchant_weights).tolist(),
+        (timestamps + rng.integers(100, 1001, size)).tolist(),
+    ]
+    categories = [
+        np.asarray(values)[rng.integers(0, len(values), size)].tolist()
+        for _, values in CATEGORY_COLUMNS
+    ]
+    category_names = [name for name, _ in CATEGORY_COLUMNS]
+
+    items = []
+    for row in zip(*columns, *categories):
+        (
+            txn,
+            timestamp,
+            customer,
+            date,
+            hour,
+            minute,
+            amount,
+            merchant,
+            processing_timestamp,
+        ) = row[:9]
+        item = {
+            "transaction_id": {"S": f"TXN_{txn:016x}"},
+            "timestamp": {"N": str(timestamp)},
+            "customer_id": {"S": f"CUST_{customer:06d}"},
+            "date": {"S": date},
+            "hour": {"N": str(hour)},
+            "minute": {"N": str(minute)},
+            "amount": {"N": f"{amount:.2f}"},
+            "merchant_id": {"S": f"MERCH_{merchant:04d}"},
+            "processing_timestamp": {"N": str(processing_timestamp)},
+        }
+        for name, value in zip(category_names, row[9:]):
+            item[name] = {"S": value}
+        items.append(item)
+    return items
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(BATCH_WRITE_LIMIT, rate)
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+
+    def set_rate(self, rate):
+        self._refill()
+        self.rate = rate
+        self.burst = max(BATCH_WRITE_LIMIT, rate)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, count):
+        # Blocks until `count` tokens are available
+        while True:
+            self._refill()
+            if self.tokens >= count:
+                self.tokens -= count
+                return
+            missing = count - self.tokens
+            time.sleep(missing / self.rate if self.rate > 0 else 0.05)
+
+
+def target_rate(elapsed, target, ramp_seconds):
+    # Linear ramp from zero to the target, then hold
+    if ramp_seconds and elapsed < ramp_seconds:
+        return max(target * elapsed / ramp_seconds, 1.0)
+    return target
+
+
+def create_table(client, table_name):
+    try:
+        client.create_table(
+            TableName=table_name,
+            KeySchema=[
+                {"AttributeName": "transaction_id", "KeyType": "HASH"},
+                {"AttributeName": "timestamp", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "transaction_id", "AttributeType": "S"},
+                {"AttributeName": "timestamp", "AttributeType": "N"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        client.get_waiter("table_exists").wait(TableName=table_name)
+    except client.exceptions.ResourceInUseException:
+        pass
+
+
+def write_batch(client, table_name, items, stats, max_attempts=8):
+    requests = [{"PutRequest": {"Item": item}} for item in items]
+    for attempt in range(max_attempts):
+        if attempt:
+            time.sleep(random.uniform(0, min(1.0, 0.025 * 2**attempt)))
+        started = time.perf_counter()
+        try:
+            response = client.batch_write_item(RequestItems={table_name: requests})
+        except ClientError as e:
+            stats["latencies_ms"].append((time.perf_counter() - started) * 1e3)
+            if e.response["Error"]["Code"] in THROTTLE_ERROR_CODES:
+                stats["throttled"] += len(requests)
+                continue
+            stats["errors"] += len(requests)
+            return
+        stats["latencies_ms"].append((time.perf_counter() - started) * 1e3)
+
+        unprocessed = response.get("UnprocessedItems", {}).get(table_name, [])
+        stats["written"] += len(requests) - len(unprocessed)
+        if not unprocessed:
+            return
+        stats["throttled"] += len(unprocessed)
+        requests = unprocessed
+    stats["errors"] += len(requests)
+
+
+def run_worker(config, worker_index):
+    session = boto3.Session(region_name=config["region"])
+    client = session.client(
+        "dynamodb",
+        endpoint_url=config["endpoint_url"],
+        # Throttles are counted and retried here rather than hidden in botocore
+        config=Config(retries={"mode": "standard", "max_attempts": 1}),
+    )
+    if config["create_table"]:
+        create_table(client, config["table"])
+
+    seed = config["seed"]
+    rng = np.random.default_rng(None if seed is None else seed + worker_index)
+    customer_weights = merchant_weights = None
+    if config["customer_skew"]:
+        customer_weights = zipf_weights(
+            config["customer_base"], config["customer_skew"]
+        )
+    if config["merchant_skew"]:
+        merchant_weights = zipf_weights(1000, config["merchant_skew"])
+    share = 1.0 / config["workers"]
+    bucket = TokenBucket(target_rate(0, config["target_tps"], config["ramp"]) * share)
+    stats = {"written": 0, "throttled": 0, "errors": 0, "latencies_ms": []}
+
+    started = time.monotonic()
+    while True:
+        elapsed = time.monotonic() - started
+        if elapsed >= config["duration"]:
+            break
+        items = generate_block(
+            rng,
+            config["block_size"],
+            int(time.time() * 1000),
+            config["customer_base"],
+            customer_weights,
+            merchant_weights,
+        )
+        for offset in range(0, len(items), BATCH_WRITE_LIMIT):
+            elapsed = time.monotonic() - started
+            if elapsed >= config["duration"]:
+                break
+            bucket.set_rate(
+                target_rate(elapsed, config["target_tps"], config["ramp"]) * share
+            )
+            batch = items[offset : offset + BATCH_WRITE_LIMIT]
+            bucket.acquire(len(batch))
+            write_batch(client, config["table"], batch, stats)
+
+    stats["elapsed"] = time.monotonic() - started
+    return stats
+
+
+def _worker_main(config, worker_index):
+    if config["moto"]:
+        from moto import mock_aws
+
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+        with mock_aws():
+            return run_worker(config, worker_index)
+    return run_worker(config, worker_index)
+
+
+def summarize(results, elapsed):
+    latencies = np.concatenate(
+        [np.asarray(r["latencies_ms"], dtype=float) for r in results] or [np.empty(0)]
+    )
+    written = sum(r["written"] for r in results)
+    report = {
+        "written": written,
+        "throttled": sum(r["throttled"] for r in results),
+        "errors": sum(r["errors"] for r in results),
+        "elapsed_seconds": elapsed,
+        "writes_per_second": written / elapsed if elapsed else 0.0,
+        "batch_calls": int(latencies.size),
+    }
+    if latencies.size:
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        report.update(latency_p50_ms=p50, latency_p90_ms=p90, latency_p99_ms=p99)
+    return report
+
+
+def print_report(report):
+    print(f"Wrote {report['written']} items in {report['elapsed_seconds']:.1f} s")
+    print(f"  writes/sec:  {report['writes_per_second']:.0f}")
+    print(f"  throttled:   {report['throttled']}")
+    print(f"  errors:      {report['errors']}")
+    if report["batch_calls"]:
+        print(
+            f"  BatchWriteItem latency p50/p90/p99: "
+            f"{report['latency_p50_ms']:.1f} / {report['latency_p90_ms']:.1f} / "
+            f"{report['latency_p99_ms']:.1f} ms over {report['batch_calls']} calls"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Synthetic load generator for the DynamoDB source table"
+    )
+    parser.add_argument("--table", default=TABLE_NAME)
+    parser.add_argument("--target-tps", type=float, default=1000)
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--ramp", type=float, default=0, help="ramp-up seconds")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--block-size", type=int, default=500)
+    parser.add_argument("--customer-base", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--customer-skew", type=float, default=0.0, help="Zipf exponent, 0 is uniform"
+    )
+    parser.add_argument(
+        "--merchant-skew", type=float, default=0.0, help="Zipf exponent, 0 is uniform"
+    )
+    parser.add_argument("--region", default=os.environ.get("AWS_REGION", "us-east-1"))
+    parser.add_argument("--endpoint-url", default=None)
+    parser.add_argument("--create-table", action="store_true")
+    parser.add_argument("--moto", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = {
+        "table": args.table,
+        "target_tps": args.target_tps,
+        "duration": args.duration,
+        "ramp": args.ramp,
+        "workers": args.workers,
+        "block_size": args.block_size,
+        "customer_base": args.customer_base,
+        "customer_skew": args.customer_skew,
+        "merchant_skew": args.merchant_skew,
+        "seed": args.seed,
+        "region": args.region,
+        "endpoint_url": args.endpoint_url,
+        # moto starts with an empty account, so the table always has to be created
+        "create_table": args.create_table or args.moto,
+        "moto": args.moto,
+    }
+
+    started = time.monotonic()
+    # A worker that fails, for example because the endpoint cannot be reached,
+    # raises its exception here once the other workers have finished
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(_worker_main, config, i) for i in range(args.workers)
+        ]
+        worker_results = [future.result() for future in futures]
+
+    report = summarize(worker_results, time.monotonic() - started)
+    print_report(report)
+    return report
+
+
+if __name__ == "__main__":
+    main()
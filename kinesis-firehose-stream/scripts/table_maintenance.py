@@ -0,0 +1,110 @@
+"""Apply and report the S3 Tables maintenance of the transactions table.
+
+Uses the table names and the table_maintenance settings from the CDK
+context, the same ones the scheduled maintenance Lambda gets.
+
+apply sets the compaction and snapshot management configuration of the table
+and the unreferenced file removal of its table bucket, skipping the ones that
+are already set. report prints the table's files now and around the last
+compaction, and the status of each maintenance job.
+
+Examples:
+    python scripts/table_maintenance.py apply
+    python scripts/table_maintenance.py report
+"""
+
+import argparse
+import dataclasses
+import os
+import sys
+from datetime import datetime, timezone
+
+import boto3
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+from harness.replay import load_context
+from maintenance import apply_maintenance, job_status, read_table_metadata, table_stats
+from stack.maintenance import get_table_maintenance_settings
+
+
+def table_bucket_arn(session, table_bucket_name):
+    account = session.client("sts").get_caller_identity()["Account"]
+    return (
+        f"arn:aws:s3tables:{session.region_name}:{account}:bucket/{table_bucket_name}"
+    )
+
+
+def print_file_stats(label, stats):
+    print(
+        f"  {label:<18} {stats['data_files']:>7} data files, "
+        f"{stats['delete_files']:>6} delete files, "
+        f"avg {stats['avg_file_bytes'] / 1024 / 1024:.1f} MiB, "
+        f"{stats['records']} records"
+    )
+
+
+def print_report(stats, statuses):
+    if not stats["current"]:
+        print("The table has no snapshots yet")
+    else:
+        print_file_stats("current", stats["current"])
+    compaction = stats["last_compaction"]
+    if compaction:
+        committed = datetime.fromtimestamp(
+            compaction["timestamp_ms"] / 1000, timezone.utc
+        )
+        print(f"Last compaction: snapshot {compaction['snapshot_id']} at {committed}")
+        print_file_stats("before", compaction["before"])
+        print_file_stats("after", compaction["after"])
+    else:
+        print("No compaction in the snapshot history")
+    print("Maintenance jobs:")
+    for maintenance_type, status in sorted(statuses.items()):
+        line = f"  {maintenance_type:<32} {status.get('status')}"
+        if status.get("lastRunTimestamp"):
+            line += f", last run {status['lastRunTimestamp']}"
+        if status.get("failureMessage"):
+            line += f": {status['failureMessage']}"
+        print(line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["apply", "report"])
+    parser.add_argument(
+        "--table-bucket-arn",
+        default=None,
+        help="defaults to the table bucket of the CDK context in this account",
+    )
+    parser.add_argument("--region", default=os.environ.get("AWS_REGION"))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    context = load_context()
+    settings = get_table_maintenance_settings(context.get("table_maintenance"))
+    session = boto3.Session(region_name=args.region)
+    s3tables = session.client("s3tables")
+    table = (
+        args.table_bucket_arn
+        or table_bucket_arn(session, context["table_bucket_name"]),
+        context["namespace"],
+        context["table_name"],
+    )
+
+    if args.command == "apply":
+        changed = apply_maintenance(s3tables, *table, dataclasses.asdict(settings))
+        for maintenance_type in changed:
+            print(f"Updated the {maintenance_type} maintenance configuration")
+        if not changed:
+            print("The maintenance configuration is up to date")
+    else:
+        metadata = read_table_metadata(s3tables, session.client("s3"), *table)
+        print_report(table_stats(metadata), job_status(s3tables, *table))
+
+
+if __name__ == "__main__":
+    main()
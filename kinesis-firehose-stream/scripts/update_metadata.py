@@ -1,10 +1,20 @@
+import argparse
 import boto3
-import time
+import os
+import sys
 import json
 from botocore.exceptions import ClientError
 
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+from athena_waiter import wait_for_query
+from iceberg_metadata import commit_table_metadata
+from table_resolver import TableResolver
+from table_spec import athena_ddl, load_table_definition, table_metadata
+
 # Ensure that the principal (User or Role) that you use to run this script has
-# permissions to access S3 Tables, Glue and Athena. Also grant lakeformation
+# permissions to access S3 Tables (including s3tables:GetTableData and
+# s3tables:PutTableData on the table), and Glue and Athena for --athena. Also grant lakeformation
 # permissions to the principal (User or Role) that to query the table.
 # aws lakeformation grant-permissions \
 #   --principal '{"DataLakePrincipalIdentifier": "arn:aws:iam::123456789012:user/johndoe"}' \
@@ -15,12 +25,16 @@ from botocore.exceptions import ClientError
 class UpdateMetadata:
     def __init__(self):
         self.s3tables = boto3.client("s3tables")
+        self.s3 = boto3.client("s3")
         self.sts = boto3.client("sts")
         self.glue = boto3.client("glue")
         self.athena = boto3.client("athena")
 
         self.account_id = self.sts.get_caller_identity()["Account"]
         self.region = boto3.Session().region_name
+        self.resolver = TableResolver(
+            self.s3tables, region=self.region, account=self.account_id
+        )
 
         self.table_bucket_name = "streamtablebucket"  # HARD CODED - Update if required
         self.namespace = "analytics"  # HARD CODED - Update if required
@@ -30,36 +44,40 @@ class UpdateMetadata:
 
     def get_table_bucket_arn(self):
         try:
-            response = self.s3tables.list_table_buckets()
-            table_bucket_arn = None
-            # Loop through the table buckets to find the matching one
-            for table_bucket in response.get("tableBuckets", []):
-                if table_bucket["name"] == self.table_bucket_name:
-                    table_bucket_arn = table_bucket["arn"]
-                    break
-            return table_bucket_arn
+            # Looked up once and cached for the rest of the run
+            return self.resolver.table_bucket_arn(self.table_bucket_name)
         except Exception as e:
             print(f"Error getting table bucket ARN: {e}")
             raise
 
-    def _wait_for_athena_query(self, query_execution_id, timeout=300, interval=10):
-        start_time = time.time()
-        while (time.time() - start_time) < timeout:
-            status = self.athena.get_query_execution(
-                QueryExecutionId=query_execution_id
-            )["QueryExecution"]["Status"]["State"]
-
-            if status in ["SUCCEEDED", "FAILED", "CANCELLED"]:
-                return status
-            time.sleep(interval)
+    def _wait_for_athena_query(self, query_execution_id, timeout=300):
+        # Polls quickly at first and backs off, instead of a fixed 10 s sleep
+        return wait_for_query(self.athena, query_execution_id, timeout=timeout)
 
-        raise TimeoutError("Athena query timed out")
+    # Writes the Iceberg metadata file for the schema, partition spec and write order
+    # in tabledefinition.json to the table's warehouse location and commits it with
+    # the table's version token. A table that already has metadata keeps its
+    # snapshots; only a changed schema, spec or sort order is added.
+    def update_metadata(self):
+        location = commit_table_metadata(
+            self.s3tables,
+            self.s3,
+            self.get_table_bucket_arn(),
+            self.namespace,
+            self.table,
+            table_metadata(load_table_definition())["iceberg"],
+        )
+        if location:
+            print(f"Updated table metadata location to {location}")
+        else:
+            print("Table metadata is up to date")
 
+    # Previous route, for principals without access to the table data.
     # The table created in the S3 tables does not have any schema/metadata associated with it
     # Currently DDLs for S3 tables are supported only from Apache Spark Clients (Glue/EMR)
     # We are using this workaround to avoid using Glue or EMR. The hack is to create a temporary ICEBERG table with desired schema.
     # Extract the warehouse_location and metadata JSON from the temporary table and update it to the S3 Table.
-    def update_metadata(self):
+    def update_metadata_with_athena(self):
 
         response = self.s3tables.get_table(
             tableBucketARN=self.get_table_bucket_arn(),
@@ -69,52 +87,11 @@ class UpdateMetadata:
         warehouse_location = response["warehouseLocation"]
         version_token = response["versionToken"]
 
-        # query = f"""
-        # CREATE TABLE IF NOT EXISTS default.{self.temp_table_name}(id string, name string)
-        # LOCATION '{warehouse_location}'
-        # TBLPROPERTIES ( 'table_type'= 'ICEBERG' )
-        # """
-
-        query = f"""
-        CREATE TABLE IF NOT EXISTS default.{self.temp_table} (
-            -- Primary identifiers
-            transaction_id STRING,
-            timestamp BIGINT,
-            customer_id STRING,
-            
-            -- Transaction details
-            date DATE,
-            hour INT,
-            minute INT,
-            transaction_type STRING,
-            amount DECIMAL(12,2),
-            currency STRING,
-            merchant_category STRING,
-            payment_method STRING,
-            region STRING,
-            risk_score STRING,
-            status STRING,
-            processing_timestamp BIGINT,
-            
-            -- Transaction metadata
-            transaction_metadata STRUCT<
-                device_type: STRING,
-                authentication_method: STRING,
-                merchant_id: STRING
-            >,
-            
-            -- Fraud indicators
-            fraud_indicators STRUCT<
-                velocity_check: STRING,
-                amount_threshold: STRING,
-                location_risk: STRING,
-                pattern_match: STRING
-            >
+        # Same schema and partition spec as the custom resource uses, from
+        # tabledefinition.json. Athena DDL cannot set the write order.
+        query = athena_ddl(
+            load_table_definition(), "default", self.temp_table, warehouse_location
         )
-        PARTITIONED BY (date)
-        LOCATION '{warehouse_location}'
-        TBLPROPERTIES ( 'table_type'= 'ICEBERG' )
-        """
 
         response = self.athena.start_query_execution(
             QueryString=query,
@@ -149,15 +126,27 @@ class UpdateMetadata:
 
 
 def main():
+    parser = argparse.ArgumentParser(
+        description="Set the schema of the S3 table from tabledefinition.json"
+    )
+    parser.add_argument(
+        "--athena",
+        action="store_true",
+        help="create the metadata through a temporary Athena table instead",
+    )
+    args = parser.parse_args()
 
     update = UpdateMetadata()
 
     try:
         print(f"Updating metadata....")
 
-        update.update_metadata()
+        if args.athena:
+            update.update_metadata_with_athena()
+        else:
+            update.update_metadata()
 
-        print(f"Successfully updated metadata {u'\u2713'}")
+        print("Successfully updated metadata \u2713")
 
     except Exception as e:
         print(f"Failed to Update metadata: {e}")
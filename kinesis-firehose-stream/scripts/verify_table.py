@@ -0,0 +1,116 @@
+"""Run consistency checks on the S3 table with concurrent Athena queries.
+
+All checks are started at once and awaited together with
+athena_waiter.QueryWaiter:
+    rows             rows in the table
+    duplicate_keys   transaction_ids that appear in more than one row
+    missing_keys     rows without a transaction_id
+    rows_<date>      rows in each of the last --days date partitions
+
+Table names come from the CDK context. The exit code is non-zero when a
+query fails or the table has duplicate or missing keys.
+
+Examples:
+    python scripts/verify_table.py --output-location s3://bucket/query-results/
+    python scripts/verify_table.py --work-group primary --days 30
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import boto3
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+from athena_waiter import QueryWaiter
+from harness.replay import load_context
+
+
+def check_queries(table, days, today=None):
+    today = today or date.today()
+    queries = {
+        "rows": f"SELECT COUNT(*) FROM {table}",
+        "duplicate_keys": (
+            f"SELECT COUNT(*) FROM (SELECT transaction_id FROM {table} "
+            "GROUP BY transaction_id HAVING COUNT(*) > 1)"
+        ),
+        "missing_keys": f"SELECT COUNT(*) FROM {table} WHERE transaction_id IS NULL",
+    }
+    # One query per date partition, so each only reads its own partition
+    for offset in range(days):
+        day = (today - timedelta(days=offset)).isoformat()
+        queries[f"rows_{day}"] = (
+            f"SELECT COUNT(*) FROM {table} WHERE \"date\" = DATE '{day}'"
+        )
+    return queries
+
+
+def scalar_result(athena, query_execution_id):
+    response = athena.get_query_results(QueryExecutionId=query_execution_id)
+    rows = response["ResultSet"]["Rows"]
+    # The first row holds the column names
+    return int(rows[1]["Data"][0]["VarCharValue"])
+
+
+async def run_checks(athena, queries, options):
+    waiter = QueryWaiter(athena)
+    executions = await asyncio.gather(
+        *(waiter.run(query, **options) for query in queries.values())
+    )
+    results = {}
+    for name, execution in zip(queries, executions):
+        status = execution["Status"]
+        if status["State"] == "SUCCEEDED":
+            results[name] = await asyncio.to_thread(
+                scalar_result, athena, execution["QueryExecutionId"]
+            )
+        else:
+            results[name] = f"{status['State']}: {status.get('StateChangeReason')}"
+    return results, waiter.polls
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--work-group", default="primary")
+    parser.add_argument("--output-location", default=None)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--region", default=os.environ.get("AWS_REGION"))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    context = load_context()
+    athena = boto3.client("athena", region_name=args.region)
+    options = {
+        "WorkGroup": args.work_group,
+        "QueryExecutionContext": {
+            "Catalog": f"s3tablescatalog/{context['table_bucket_name']}",
+            "Database": context["namespace"],
+        },
+    }
+    if args.output_location:
+        options["ResultConfiguration"] = {"OutputLocation": args.output_location}
+
+    queries = check_queries(context["table_name"], args.days)
+    start = time.monotonic()
+    results, polls = asyncio.run(run_checks(athena, queries, options))
+    print(
+        f"{len(queries)} queries in {time.monotonic() - start:.1f} s "
+        f"({polls} status polls)"
+    )
+    for name, value in results.items():
+        print(f"  {name:<20} {value}")
+
+    failed = [value for value in results.values() if isinstance(value, str)]
+    if failed or results["duplicate_keys"] or results["missing_keys"]:
+        sys.exit(1)
+    return results
+
+
+if __name__ == "__main__":
+    main()
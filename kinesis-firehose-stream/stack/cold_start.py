@@ -0,0 +1,29 @@
+from dataclasses import dataclass
+
+from stack.settings import check_range, load_settings
+
+
+@dataclass(frozen=True)
+class ColdStartSettings:
+    # Restore published versions of the stream Lambda from an initialized snapshot
+    snap_start: bool = False
+    # Execution environments kept initialized for the stream Lambda, 0 to disable
+    provisioned_concurrency: int = 0
+
+    def validate(self):
+        check_range("provisioned_concurrency", self.provisioned_concurrency, 0, 1000)
+        # Lambda does not allow both on the same function version
+        if self.snap_start and self.provisioned_concurrency:
+            raise ValueError(
+                "snap_start and provisioned_concurrency cannot be used together"
+            )
+        return self
+
+    @property
+    def needs_alias(self):
+        # Both only apply to published versions, so callers must invoke an alias
+        return self.snap_start or self.provisioned_concurrency > 0
+
+
+def get_cold_start_settings(context_value=None):
+    return load_settings(ColdStartSettings, context_value, "lambda_cold_start")
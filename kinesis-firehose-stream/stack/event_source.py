@@ -0,0 +1,34 @@
+from dataclasses import dataclass
+
+from stack.settings import check_range, load_settings
+
+
+@dataclass(frozen=True)
+class StreamEventSourceSettings:
+    # Concurrent batches per shard; records with the same key stay in order
+    parallelization_factor: int = 1
+    # How long to gather records before invoking, 0 to invoke as soon as possible
+    max_batching_window_seconds: int = 0
+    # Split a failing batch in two and retry each half
+    bisect_batch_on_error: bool = True
+    # Let the function return batchItemFailures instead of failing the whole batch
+    report_batch_item_failures: bool = True
+    # -1 retries until the records expire from the stream
+    maximum_retry_attempts: int = 10
+    # Send metadata about batches that exhausted their retries to an SQS queue
+    on_failure_destination: bool = True
+
+    def validate(self):
+        # Limits for DynamoDB Streams event source mappings
+        check_range("parallelization_factor", self.parallelization_factor, 1, 10)
+        check_range(
+            "max_batching_window_seconds", self.max_batching_window_seconds, 0, 300
+        )
+        check_range("maximum_retry_attempts", self.maximum_retry_attempts, -1, 10000)
+        return self
+
+
+def get_stream_event_source_settings(context_value=None):
+    return load_settings(
+        StreamEventSourceSettings, context_value, "stream_event_source"
+    )
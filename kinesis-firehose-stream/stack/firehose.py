@@ -4,11 +4,18 @@ from aws_cdk import (
     Stack,
     aws_kinesisfirehose as firehose,
     aws_lambda as lambda_,
+    aws_lambda_event_sources as lambda_events,
     aws_iam as iam,
+    aws_sqs as sqs,
     custom_resources as cr,
     CfnOutput,
 )
 from constructs import Construct
+from stack.cold_start import get_cold_start_settings
+from stack.event_source import get_stream_event_source_settings
+from stack.profiles import get_deployment_profile
+from stack.shared_layer import table_spec
+from stack.table_routes import get_table_routing_settings
 
 
 class FirehoseStack(Stack):
@@ -27,6 +34,45 @@ class FirehoseStack(Stack):
         table_name = self.node.try_get_context("table_name")
         namespace = self.node.try_get_context("namespace")
         stream_type = self.node.try_get_context("stream_type")
+        table_routing = get_table_routing_settings(
+            self.node.try_get_context("table_routes"), table_name, stream_type
+        )
+        profile = get_deployment_profile(
+            self.node.try_get_context("deployment_profile")
+        )
+        firehose_max_concurrency = (
+            self.node.try_get_context("firehose_max_concurrency") or 4
+        )
+        cold_start = get_cold_start_settings(
+            self.node.try_get_context("lambda_cold_start")
+        )
+        snap_start = (
+            lambda_.SnapStartConf.ON_PUBLISHED_VERSIONS
+            if cold_start.snap_start
+            else None
+        )
+
+        # Logging and metrics settings shared by the Lambda functions
+        observability_environment = {
+            "DEBUG_SAMPLE_RATE": str(
+                self.node.try_get_context("debug_sample_rate") or 0
+            ),
+        }
+        metrics_namespace = self.node.try_get_context("metrics_namespace")
+        if metrics_namespace:
+            observability_environment["METRICS_NAMESPACE"] = metrics_namespace
+
+        # Shared layer with the decoder, serializer, metrics and table definition.
+        # The table definition is a symlink to tabledefinition.json, so follow it.
+        shared_layer = lambda_.LayerVersion(
+            self,
+            "SharedLayer",
+            code=lambda_.Code.from_asset(
+                "lambda/shared", follow_symlinks=cdk.SymlinkFollowMode.ALWAYS
+            ),
+            compatible_runtimes=[lambda_.Runtime.PYTHON_3_13],
+            description="Shared library for the Lambda functions",
+        )
 
         # Create the Firehose delivery stream based on stream_type
         if stream_type == "kinesis":
@@ -53,7 +99,13 @@ class FirehoseStack(Stack):
                             "logs:PutLogEvents",
                         ],
                         resources=["*"],
-                    )
+                    ),
+                    # Deletes of the old rows of items that moved partition
+                    iam.PolicyStatement(
+                        effect=iam.Effect.ALLOW,
+                        actions=["kinesis:PutRecords"],
+                        resources=[kinesis_stream_arn],
+                    ),
                 ],
             )
 
@@ -65,8 +117,27 @@ class FirehoseStack(Stack):
                 runtime=lambda_.Runtime.PYTHON_3_13,
                 handler="index.handler",
                 code=lambda_.Code.from_asset("lambda/transform"),
+                layers=[shared_layer],
+                memory_size=profile.lambda_memory_mb,
+                environment={
+                    # Used to route each record, including deletes, to its table
+                    "DESTINATION_DATABASE": resource_link_arn,
+                    "DESTINATION_TABLE": table_name,
+                    "TABLE_ROUTES": json.dumps(table_routing.environment()),
+                    # Keep only the newest change per transaction in each batch
+                    "COLLAPSE_UPDATES": str(
+                        bool(self.node.try_get_context("collapse_updates"))
+                    ).lower(),
+                    # Stream to put the deletes of moved items back on
+                    "SOURCE_STREAM_ARN": kinesis_stream_arn,
+                    **observability_environment,
+                },
                 role=transform_lambda_role,
-                timeout=cdk.Duration.seconds(60),
+                timeout=cdk.Duration.seconds(profile.lambda_timeout_seconds),
+                snap_start=snap_start,
+            )
+            transform_target = invocation_target(
+                self, "KinesisTransformLambdaAlias", transform_lambda, cold_start
             )
 
             # Create Firehose with Kinesis as source and data transformation
@@ -90,15 +161,12 @@ class FirehoseStack(Stack):
                         role_arn=firehose_role_arn,
                     ),
                     buffering_hints=firehose.CfnDeliveryStream.BufferingHintsProperty(
-                        interval_in_seconds=60, size_in_m_bs=1
+                        interval_in_seconds=profile.destination_buffer_interval_seconds,
+                        size_in_m_bs=profile.destination_buffer_size_mb,
+                    ),
+                    destination_table_configuration_list=destination_tables(
+                        table_routing, resource_link_arn
                     ),
-                    destination_table_configuration_list=[
-                        firehose.CfnDeliveryStream.DestinationTableConfigurationProperty(
-                            destination_table_name=table_name,
-                            destination_database_name=resource_link_arn,
-                            unique_keys=["transaction_id"],
-                        )
-                    ],
                     cloud_watch_logging_options=firehose.CfnDeliveryStream.CloudWatchLoggingOptionsProperty(
                         enabled=True,
                         log_group_name=f"/aws/firehose/{table_name}",
@@ -115,15 +183,19 @@ class FirehoseStack(Stack):
                                 parameters=[
                                     firehose.CfnDeliveryStream.ProcessorParameterProperty(
                                         parameter_name="LambdaArn",
-                                        parameter_value=transform_lambda.function_arn,
+                                        parameter_value=transform_target.function_arn,
                                     ),
                                     firehose.CfnDeliveryStream.ProcessorParameterProperty(
                                         parameter_name="BufferSizeInMBs",
-                                        parameter_value="1",
+                                        parameter_value=str(
+                                            profile.processor_buffer_size_mb
+                                        ),
                                     ),
                                     firehose.CfnDeliveryStream.ProcessorParameterProperty(
                                         parameter_name="BufferIntervalInSeconds",
-                                        parameter_value="60",
+                                        parameter_value=str(
+                                            profile.processor_buffer_interval_seconds
+                                        ),
                                     ),
                                 ],
                             )
@@ -134,6 +206,9 @@ class FirehoseStack(Stack):
         else:  # stream_type == "dynamodb" - use Direct PUT
             # Create Firehose with Direct PUT as source
             dynamodb_table_stream_arn = cdk.Fn.import_value("DynamoDBTableStreamARN")
+            event_source_settings = get_stream_event_source_settings(
+                self.node.try_get_context("stream_event_source")
+            )
             delivery_stream = firehose.CfnDeliveryStream(
                 self,
                 "MyDeliveryStream",
@@ -150,15 +225,12 @@ class FirehoseStack(Stack):
                         role_arn=firehose_role_arn,
                     ),
                     buffering_hints=firehose.CfnDeliveryStream.BufferingHintsProperty(
-                        interval_in_seconds=60, size_in_m_bs=1
+                        interval_in_seconds=profile.destination_buffer_interval_seconds,
+                        size_in_m_bs=profile.destination_buffer_size_mb,
+                    ),
+                    destination_table_configuration_list=destination_tables(
+                        table_routing, resource_link_arn
                     ),
-                    destination_table_configuration_list=[
-                        firehose.CfnDeliveryStream.DestinationTableConfigurationProperty(
-                            destination_table_name=table_name,
-                            destination_database_name=resource_link_arn,
-                            unique_keys=["transaction_id"],
-                        )
-                    ],
                     cloud_watch_logging_options=firehose.CfnDeliveryStream.CloudWatchLoggingOptionsProperty(
                         enabled=True,
                         log_group_name=f"/aws/firehose/{table_name}",
@@ -167,6 +239,9 @@ class FirehoseStack(Stack):
                     retry_options=firehose.CfnDeliveryStream.RetryOptionsProperty(
                         duration_in_seconds=300
                     ),
+                    processing_configuration=direct_put_routing(
+                        table_routing, resource_link_arn
+                    ),
                 ),
             )
 
@@ -232,6 +307,26 @@ class FirehoseStack(Stack):
             lambda_role.add_managed_policy(firehose_write_policy)
             lambda_role.add_managed_policy(cloudwatch_write_policy)
 
+            # Batches that exhaust their retries are recorded here instead of
+            # blocking the shard until the records expire
+            on_failure = None
+            failure_environment = {}
+            if event_source_settings.on_failure_destination:
+                stream_failure_queue = sqs.Queue(
+                    self,
+                    "StreamFailureQueue",
+                    encryption=sqs.QueueEncryption.SQS_MANAGED,
+                    enforce_ssl=True,
+                    retention_period=cdk.Duration.days(14),
+                )
+                on_failure = lambda_events.SqsDlq(stream_failure_queue)
+                # The Lambda sends records that can never be delivered to the
+                # same queue, so they do not hold back the shard either
+                failure_environment["FAILURE_QUEUE_URL"] = (
+                    stream_failure_queue.queue_url
+                )
+                stream_failure_queue.grant_send_messages(lambda_role)
+
             # Create Lambda function to process DynamoDB stream and write to Firehose
             dynamo_to_firehose_lambda = lambda_.Function(
                 self,
@@ -239,20 +334,53 @@ class FirehoseStack(Stack):
                 runtime=lambda_.Runtime.PYTHON_3_13,
                 handler="index.handler",
                 code=lambda_.Code.from_asset("lambda/firehose"),
+                layers=[shared_layer],
+                memory_size=profile.lambda_memory_mb,
                 environment={
                     "FIREHOSE_DELIVERY_STREAM": delivery_stream.ref,
+                    "FIREHOSE_MAX_CONCURRENCY": str(firehose_max_concurrency),
+                    # Table definition of the route, and its explode setting
+                    "TABLE_ROUTES": json.dumps(table_routing.environment()),
+                    "REPORT_BATCH_ITEM_FAILURES": str(
+                        event_source_settings.report_batch_item_failures
+                    ).lower(),
+                    **failure_environment,
+                    **observability_environment,
                 },
                 role=lambda_role,
-                timeout=cdk.Duration.seconds(180),
+                timeout=cdk.Duration.seconds(profile.lambda_timeout_seconds),
+                snap_start=snap_start,
+            )
+            forwarder_target = invocation_target(
+                self,
+                "DynamoToFirehoseLambdaAlias",
+                dynamo_to_firehose_lambda,
+                cold_start,
             )
 
             event_source = lambda_.EventSourceMapping(
                 self,
                 "DynamoStreamEventSource",
                 event_source_arn=dynamodb_table_stream_arn,
-                target=dynamo_to_firehose_lambda,
+                target=forwarder_target,
                 starting_position=lambda_.StartingPosition.TRIM_HORIZON,
-                batch_size=100,
+                batch_size=profile.event_source_batch_size,
+                parallelization_factor=event_source_settings.parallelization_factor,
+                max_batching_window=(
+                    cdk.Duration.seconds(
+                        event_source_settings.max_batching_window_seconds
+                    )
+                    if event_source_settings.max_batching_window_seconds
+                    else None
+                ),
+                bisect_batch_on_error=event_source_settings.bisect_batch_on_error,
+                report_batch_item_failures=event_source_settings.report_batch_item_failures,
+                retry_attempts=(
+                    event_source_settings.maximum_retry_attempts
+                    if event_source_settings.maximum_retry_attempts >= 0
+                    else None
+                ),
+                on_failure=on_failure,
                 enabled=True,
             )
 
@@ -273,3 +401,78 @@ class FirehoseStack(Stack):
             ),
             export_name="FirehoseDeliveryStreamARN",
         )
+
+
+def destination_tables(table_routing, database_name):
+    # One destination table per route and child table; the transform Lambda
+    # names the table of each record in its otfMetadata
+    return [
+        firehose.CfnDeliveryStream.DestinationTableConfigurationProperty(
+            destination_table_name=table_name,
+            destination_database_name=database_name,
+            unique_keys=list(unique_keys),
+        )
+        for table_name, unique_keys in table_routing.destinations()
+    ]
+
+
+def direct_put_routing(table_routing, database_name):
+    # Direct PUT records carry no otfMetadata, so Firehose reads the table and
+    # operation of each record with a JQ query. Rows with the index column of
+    # a child table go to that table, the others to the route's table. Rows
+    # the DynamoDB Streams Lambda marks for deletion are deleted, and all
+    # others are upserted on their unique keys, so a replayed or modified
+    # item replaces its rows instead of adding them again.
+    (route,) = table_routing.routes
+    table = json.dumps(route.table_name)
+    if route.explode is not None:
+        table = (
+            "(if has("
+            + json.dumps(route.explode.index_column)
+            + ") then "
+            + json.dumps(route.explode.table_name)
+            + " else "
+            + table
+            + " end)"
+        )
+    query = (
+        "{destinationDatabaseName: "
+        + json.dumps(database_name)
+        + ", destinationTableName: "
+        + table
+        + ", operation: (."
+        + table_spec.OPERATION_FIELD
+        + ' // "update")}'
+    )
+    return firehose.CfnDeliveryStream.ProcessingConfigurationProperty(
+        enabled=True,
+        processors=[
+            firehose.CfnDeliveryStream.ProcessorProperty(
+                type="MetadataExtraction",
+                parameters=[
+                    firehose.CfnDeliveryStream.ProcessorParameterProperty(
+                        parameter_name="MetadataExtractionQuery",
+                        parameter_value=query,
+                    ),
+                    firehose.CfnDeliveryStream.ProcessorParameterProperty(
+                        parameter_name="JsonParsingEngine",
+                        parameter_value="JQ-1.6",
+                    ),
+                ],
+            )
+        ],
+    )
+
+
+def invocation_target(scope, construct_id, function, cold_start):
+    # SnapStart and provisioned concurrency only apply to published versions, so
+    # the event source has to invoke an alias instead of $LATEST
+    if not cold_start.needs_alias:
+        return function
+    return lambda_.Alias(
+        scope,
+        construct_id,
+        alias_name="live",
+        version=function.current_version,
+        provisioned_concurrent_executions=cold_start.provisioned_concurrency or None,
+    )
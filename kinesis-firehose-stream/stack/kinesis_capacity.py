@@ -0,0 +1,88 @@
+import math
+from dataclasses import dataclass
+
+from stack.settings import check_range, load_settings
+
+# Per-shard Kinesis Data Streams limits
+SHARD_WRITE_RECORDS_PER_SECOND = 1000
+SHARD_WRITE_BYTES_PER_SECOND = 1024 * 1024
+SHARD_READ_BYTES_PER_SECOND = 2 * 1024 * 1024
+
+
+def calculate_shard_count(
+    peak_records_per_second,
+    average_record_size_bytes,
+    shared_consumers=1,
+    target_utilization=0.8,
+):
+    # Shards needed so that neither the write limits nor the read throughput shared
+    # by the standard consumers exceed target_utilization at the declared peak
+    peak_bytes_per_second = peak_records_per_second * average_record_size_bytes
+    capacity = target_utilization
+    return max(
+        1,
+        math.ceil(
+            peak_records_per_second / (SHARD_WRITE_RECORDS_PER_SECOND * capacity)
+        ),
+        math.ceil(peak_bytes_per_second / (SHARD_WRITE_BYTES_PER_SECOND * capacity)),
+        math.ceil(
+            peak_bytes_per_second
+            * shared_consumers
+            / (SHARD_READ_BYTES_PER_SECOND * capacity)
+        ),
+    )
+
+
+@dataclass(frozen=True)
+class KinesisStreamSettings:
+    # "on_demand" or "provisioned"
+    stream_mode: str = "on_demand"
+    # Provisioned mode: explicit shard count, or derived from the declared peak
+    shard_count: int = None
+    peak_records_per_second: int = None
+    average_record_size_bytes: int = None
+    target_utilization: float = 0.8
+    # Readers that share the 2 MB/s per shard read throughput, Firehose
+    # included; enhanced fan-out readers are not counted
+    shared_consumers: int = 1
+    retention_hours: int = 24
+
+    def validate(self):
+        if self.stream_mode not in ("on_demand", "provisioned"):
+            raise ValueError(
+                f"stream_mode={self.stream_mode} must be 'on_demand' or 'provisioned'"
+            )
+        check_range("retention_hours", self.retention_hours, 24, 8760)
+        if not 0 < self.target_utilization <= 1:
+            raise ValueError(
+                f"target_utilization={self.target_utilization} must be in (0, 1]"
+            )
+        if self.shard_count is not None and self.shard_count < 1:
+            raise ValueError(f"shard_count={self.shard_count} must be at least 1")
+        if self.shared_consumers < 1:
+            raise ValueError(
+                f"shared_consumers={self.shared_consumers} must be at least 1"
+            )
+        if self.stream_mode == "provisioned" and self.shard_count is None:
+            if not (self.peak_records_per_second and self.average_record_size_bytes):
+                raise ValueError(
+                    "Provisioned mode needs shard_count, or peak_records_per_second "
+                    "and average_record_size_bytes"
+                )
+        if self.stream_mode == "on_demand" and self.shard_count is not None:
+            raise ValueError("shard_count can only be set in provisioned mode")
+        return self
+
+    def resolved_shard_count(self):
+        if self.shard_count is not None:
+            return self.shard_count
+        return calculate_shard_count(
+            self.peak_records_per_second,
+            self.average_record_size_bytes,
+            shared_consumers=self.shared_consumers,
+            target_utilization=self.target_utilization,
+        )
+
+
+def get_kinesis_stream_settings(context_value=None):
+    return load_settings(KinesisStreamSettings, context_value, "kinesis_stream")
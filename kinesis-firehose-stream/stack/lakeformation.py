@@ -10,6 +10,7 @@ from aws_cdk import (
     CfnOutput,
 )
 from constructs import Construct
+from stack.table_routes import get_table_routing_settings
 
 
 class LakeFormationStack(Stack):
@@ -22,6 +23,9 @@ class LakeFormationStack(Stack):
         table_name = self.node.try_get_context("table_name")
         namespace = self.node.try_get_context("namespace")
         stream_type = self.node.try_get_context("stream_type")
+        table_routing = get_table_routing_settings(
+            self.node.try_get_context("table_routes"), table_name, stream_type
+        )
 
         # Get the CDK deployment role, add permissions and register as Lakeformation Administrator
         cdk_role = iam.Role.from_role_arn(
@@ -225,22 +229,28 @@ class LakeFormationStack(Stack):
             ],
         )
 
-        # Grant to Catalog / tablebucket / namespace / table
-        lf_permissions_table = lakeformation.CfnPermissions(
-            self,
-            "GrantPermissionsToTable",
-            data_lake_principal=lakeformation.CfnPermissions.DataLakePrincipalProperty(
-                data_lake_principal_identifier=firehose_role.role_arn
-            ),
-            resource=lakeformation.CfnPermissions.ResourceProperty(
-                table_resource=lakeformation.CfnPermissions.TableResourceProperty(
-                    catalog_id=f"{cdk.Aws.ACCOUNT_ID}:s3tablescatalog/{table_bucket_name}",
-                    database_name=namespace,
-                    name=table_name,
+        # Grant to Catalog / tablebucket / namespace / table, for every table the
+        # delivery stream writes to
+        for route_table_name in table_routing.table_names:
+            lf_permissions_table = lakeformation.CfnPermissions(
+                self,
+                (
+                    "GrantPermissionsToTable"
+                    if route_table_name == table_name
+                    else f"GrantPermissionsToTable-{route_table_name}"
                 ),
-            ),
-            permissions=["ALL"],
-        )
+                data_lake_principal=lakeformation.CfnPermissions.DataLakePrincipalProperty(
+                    data_lake_principal_identifier=firehose_role.role_arn
+                ),
+                resource=lakeformation.CfnPermissions.ResourceProperty(
+                    table_resource=lakeformation.CfnPermissions.TableResourceProperty(
+                        catalog_id=f"{cdk.Aws.ACCOUNT_ID}:s3tablescatalog/{table_bucket_name}",
+                        database_name=namespace,
+                        name=route_table_name,
+                    ),
+                ),
+                permissions=["ALL"],
+            )
 
         CfnOutput(
             self,
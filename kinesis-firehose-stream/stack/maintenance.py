@@ -0,0 +1,151 @@
+import dataclasses
+import json
+from dataclasses import dataclass
+
+import aws_cdk as cdk
+from aws_cdk import (
+    Stack,
+    aws_events as events,
+    aws_events_targets as targets,
+    aws_iam as iam,
+    aws_lambda as lambda_,
+)
+from constructs import Construct
+
+from stack.settings import check_range, load_settings
+
+COMPACTION_STRATEGIES = ("auto", "binpack", "sort", "z-order")
+MAX_INT = 2**31 - 1
+
+
+@dataclass(frozen=True)
+class TableMaintenanceSettings:
+    # Deploy the scheduled maintenance Lambda
+    enabled: bool = True
+    # How often the Lambda re-applies the configuration and reports statistics
+    schedule_hours: int = 24
+    # Compaction of small data and delete files into files of about this size
+    compaction: bool = True
+    target_file_size_mb: int = 512
+    # None keeps the S3 Tables default; sort uses the write order of the table
+    compaction_strategy: str = None
+    # Expiry of snapshots older than max_snapshot_age_hours, keeping at least
+    # min_snapshots_to_keep
+    snapshot_management: bool = True
+    min_snapshots_to_keep: int = 1
+    max_snapshot_age_hours: int = 120
+    # Table bucket wide: files no snapshot references are marked noncurrent
+    # after unreferenced_days and deleted non_current_days later
+    unreferenced_file_removal: bool = True
+    unreferenced_days: int = 3
+    non_current_days: int = 10
+
+    def validate(self):
+        # Limits of the S3 Tables maintenance API
+        check_range("schedule_hours", self.schedule_hours, 1, 168)
+        check_range("target_file_size_mb", self.target_file_size_mb, 64, 512)
+        for name in (
+            "min_snapshots_to_keep",
+            "max_snapshot_age_hours",
+            "unreferenced_days",
+            "non_current_days",
+        ):
+            check_range(name, getattr(self, name), 1, MAX_INT)
+        if self.compaction_strategy not in (None,) + COMPACTION_STRATEGIES:
+            raise ValueError(
+                f"compaction_strategy={self.compaction_strategy} must be one of "
+                f"{list(COMPACTION_STRATEGIES)}"
+            )
+        return self
+
+
+def get_table_maintenance_settings(context_value=None):
+    return load_settings(TableMaintenanceSettings, context_value, "table_maintenance")
+
+
+class TableMaintenance(Construct):
+    # Scheduled Lambda that applies the S3 Tables maintenance configuration of
+    # one table and its table bucket, and reports the table's file statistics
+    def __init__(
+        self,
+        scope,
+        construct_id,
+        table_bucket_name,
+        namespace,
+        table_name,
+        settings,
+        layers,
+        environment=None,
+    ):
+        super().__init__(scope, construct_id)
+        stack = Stack.of(self)
+        table_bucket_arn = f"arn:aws:s3tables:{stack.region}:{stack.account}:bucket/{table_bucket_name}"
+
+        role = iam.Role(
+            self,
+            "Role",
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
+            description="Role for the S3 Tables maintenance Lambda function",
+        )
+        role.add_managed_policy(
+            iam.ManagedPolicy.from_aws_managed_policy_name(
+                "service-role/AWSLambdaBasicExecutionRole"
+            )
+        )
+        role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    "s3tables:GetTableBucketMaintenanceConfiguration",
+                    "s3tables:PutTableBucketMaintenanceConfiguration",
+                ],
+                resources=[table_bucket_arn],
+            )
+        )
+        role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    "s3tables:GetTableMaintenanceConfiguration",
+                    "s3tables:PutTableMaintenanceConfiguration",
+                    "s3tables:GetTableMaintenanceJobStatus",
+                    "s3tables:GetTableMetadataLocation",
+                    # Reads the Iceberg metadata file through the S3 API
+                    "s3tables:GetTableData",
+                ],
+                # Table ARNs end in a table id that S3 Tables generates, so the
+                # table is matched by its namespace and name instead
+                resources=[f"{table_bucket_arn}/table/*"],
+                conditions={
+                    "StringEquals": {
+                        "s3tables:namespace": namespace,
+                        "s3tables:tableName": table_name,
+                    }
+                },
+            )
+        )
+
+        self.function = lambda_.Function(
+            self,
+            "Function",
+            runtime=lambda_.Runtime.PYTHON_3_13,
+            handler="index.handler",
+            code=lambda_.Code.from_asset("lambda/maintenance"),
+            timeout=cdk.Duration.minutes(1),
+            layers=layers,
+            environment={
+                "TABLE_BUCKET_ARN": table_bucket_arn,
+                "NAMESPACE": namespace,
+                "TABLE_NAME": table_name,
+                "MAINTENANCE_SETTINGS": json.dumps(dataclasses.asdict(settings)),
+                **(environment or {}),
+            },
+            role=role,
+        )
+
+        events.Rule(
+            self,
+            "Schedule",
+            schedule=events.Schedule.rate(cdk.Duration.hours(settings.schedule_hours)),
+            targets=[targets.LambdaFunction(self.function)],
+        )
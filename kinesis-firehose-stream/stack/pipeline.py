@@ -13,6 +13,10 @@ from aws_cdk import (
     CfnOutput,
 )
 from constructs import Construct
+from stack.kinesis_capacity import get_kinesis_stream_settings
+from stack.maintenance import TableMaintenance, get_table_maintenance_settings
+from stack.table_layout import get_table_layout_settings
+from stack.table_routes import SAMPLE_SOURCE_TABLE, get_table_routing_settings
 
 
 class PipelineStack(Stack):
@@ -26,16 +30,51 @@ class PipelineStack(Stack):
         namespace = self.node.try_get_context("namespace")
         bucket_name = f"{self.node.try_get_context('bucket_name')}-{self.account}"
         stream_type = self.node.try_get_context("stream_type")
+        debug_sample_rate = self.node.try_get_context("debug_sample_rate") or 0
+        metrics_namespace = self.node.try_get_context("metrics_namespace")
+        table_routing = get_table_routing_settings(
+            self.node.try_get_context("table_routes"), table_name, stream_type
+        )
+        # The table_layout overrides apply to the table_name table, so they are
+        # checked against its definition
+        table_layout = get_table_layout_settings(
+            self.node.try_get_context("table_layout"),
+            table_routing.table_definition(table_name),
+        )
+        # Every table the delivery stream writes to
+        tables = table_routing.resource_properties()
+        tables[table_routing.table_names.index(table_name)].update(
+            table_layout.resource_properties()
+        )
 
         # Create the resources based on the stream type
         if stream_type == "kinesis":
-            # First create Kinesis Data Stream
-            kinesis_stream = kinesis.Stream(
-                self,
-                "MyKinesisStream",
-                stream_mode=kinesis.StreamMode.ON_DEMAND,
-                encryption=kinesis.StreamEncryption.MANAGED,
+            kinesis_settings = get_kinesis_stream_settings(
+                self.node.try_get_context("kinesis_stream")
             )
+
+            # First create Kinesis Data Stream
+            if kinesis_settings.stream_mode == "provisioned":
+                kinesis_stream = kinesis.Stream(
+                    self,
+                    "MyKinesisStream",
+                    stream_mode=kinesis.StreamMode.PROVISIONED,
+                    shard_count=kinesis_settings.resolved_shard_count(),
+                    retention_period=cdk.Duration.hours(
+                        kinesis_settings.retention_hours
+                    ),
+                    encryption=kinesis.StreamEncryption.MANAGED,
+                )
+            else:
+                kinesis_stream = kinesis.Stream(
+                    self,
+                    "MyKinesisStream",
+                    stream_mode=kinesis.StreamMode.ON_DEMAND,
+                    retention_period=cdk.Duration.hours(
+                        kinesis_settings.retention_hours
+                    ),
+                    encryption=kinesis.StreamEncryption.MANAGED,
+                )
             kinesis_stream.apply_removal_policy(RemovalPolicy.DESTROY)
 
             # Then create DynamoDB table with Kinesis integration
@@ -57,7 +96,9 @@ class PipelineStack(Stack):
                 point_in_time_recovery=True,
             )
 
-        else:  # stream_type == "dynamodb"
+        elif (
+            table_routing.source_table == SAMPLE_SOURCE_TABLE
+        ):  # stream_type == "dynamodb"
             # First create DynamoDB table with streams enabled
             dynamodb_table = dynamodb.Table(
                 self,
@@ -77,6 +118,30 @@ class PipelineStack(Stack):
                 point_in_time_recovery=True,
             )
 
+        else:  # stream_type == "dynamodb" with a route of another table
+            # The route's source table, keyed on its unique keys, so that the
+            # DynamoDB Streams Lambda reads the items its definition describes
+            (route,) = table_routing.routes
+            key_schema = [
+                dynamodb.Attribute(
+                    name=name, type=dynamodb.AttributeType[attribute_type]
+                )
+                for name, attribute_type in route.source_key_schema()
+            ]
+            dynamodb_table = dynamodb.Table(
+                self,
+                route.source_table,
+                table_name=route.source_table,
+                partition_key=key_schema[0],
+                sort_key=key_schema[1] if len(key_schema) > 1 else None,
+                billing_mode=dynamodb.BillingMode.PROVISIONED,
+                read_capacity=10,
+                write_capacity=10,
+                stream=dynamodb.StreamViewType.NEW_AND_OLD_IMAGES,
+                removal_policy=cdk.RemovalPolicy.DESTROY,
+                point_in_time_recovery=True,
+            )
+
         # Create Lambda Layer, Lambda function to interact with S3 tables APIs
         # boto3 layer to override default version in Lambda to enable support for s3tables APIs
         boto3_layer = lambda_.LayerVersion(
@@ -87,6 +152,21 @@ class PipelineStack(Stack):
             description="Boto3 library",
         )
 
+        # Shared layer with the instrumentation helpers used by every Lambda
+        shared_layer = lambda_.LayerVersion(
+            self,
+            "SharedLayer",
+            code=lambda_.Code.from_asset(
+                "lambda/shared", follow_symlinks=cdk.SymlinkFollowMode.ALWAYS
+            ),
+            compatible_runtimes=[lambda_.Runtime.PYTHON_3_13],
+            description="Shared library for the Lambda functions",
+        )
+
+        manage_s3_table_environment = {"DEBUG_SAMPLE_RATE": str(debug_sample_rate)}
+        if metrics_namespace:
+            manage_s3_table_environment["METRICS_NAMESPACE"] = metrics_namespace
+
         # Create the IAM role for the Lambda function
         manage_s3_table_role = iam.Role(
             self,
@@ -122,15 +202,13 @@ class PipelineStack(Stack):
             handler="index.handler",
             code=lambda_.Code.from_asset("lambda/custom_resource"),
             timeout=cdk.Duration.minutes(5),
-            layers=[boto3_layer],
+            layers=[boto3_layer, shared_layer],
+            environment=manage_s3_table_environment,
             role=manage_s3_table_role,  # Assign the role to the Lambda function
         )
 
-        # Create Custom Resource to invoke Lambda
-        s3_table_custom_resource = cr.AwsCustomResource(
-            self,
-            "S3TableCustomResource",
-            on_create=cr.AwsSdkCall(
+        def table_call(request_type, physical_resource_id):
+            return cr.AwsSdkCall(
                 service="Lambda",
                 action="invoke",
                 parameters={
@@ -138,38 +216,30 @@ class PipelineStack(Stack):
                     "InvocationType": "RequestResponse",
                     "Payload": json.dumps(
                         {
-                            "RequestType": "Create",
+                            "RequestType": request_type,
                             "StackId": self.stack_id,
                             "ResourceProperties": {
                                 "table_bucket_name": table_bucket_name,
                                 "table_name": table_name,
                                 "namespace": namespace,
+                                "tables": tables,
                             },
                         }
                     ),
                 },
-                physical_resource_id=cr.PhysicalResourceId.of("S3TableCreation"),
-            ),
-            on_delete=cr.AwsSdkCall(
-                service="Lambda",
-                action="invoke",
-                parameters={
-                    "FunctionName": manage_s3_table_lambda.function_name,
-                    "InvocationType": "RequestResponse",
-                    "Payload": json.dumps(
-                        {
-                            "RequestType": "Delete",
-                            "StackId": self.stack_id,
-                            "ResourceProperties": {
-                                "table_bucket_name": table_bucket_name,
-                                "table_name": table_name,
-                                "namespace": namespace,
-                            },
-                        }
-                    ),
-                },
-                physical_resource_id=cr.PhysicalResourceId.of("S3TableDeletion"),
-            ),
+                physical_resource_id=cr.PhysicalResourceId.of(physical_resource_id),
+            )
+
+        # Create Custom Resource to invoke Lambda
+        s3_table_custom_resource = cr.AwsCustomResource(
+            self,
+            "S3TableCustomResource",
+            on_create=table_call("Create", "S3TableCreation"),
+            # Adds the tables of new routes and applies changed definitions and
+            # layouts. The physical id stays the same, so CloudFormation does
+            # not replace the resource and delete the tables.
+            on_update=table_call("Update", "S3TableCreation"),
+            on_delete=table_call("Delete", "S3TableDeletion"),
             policy=cr.AwsCustomResourcePolicy.from_statements(
                 [
                     iam.PolicyStatement(
@@ -182,6 +252,23 @@ class PipelineStack(Stack):
         # Ensure Custom Resource is created after the Lambda and Bucket
         s3_table_custom_resource.node.add_dependency(manage_s3_table_lambda)
 
+        # Scheduled S3 Tables maintenance of the table and its table bucket
+        table_maintenance_settings = get_table_maintenance_settings(
+            self.node.try_get_context("table_maintenance")
+        )
+        if table_maintenance_settings.enabled:
+            table_maintenance = TableMaintenance(
+                self,
+                "TableMaintenance",
+                table_bucket_name=table_bucket_name,
+                namespace=namespace,
+                table_name=table_name,
+                settings=table_maintenance_settings,
+                layers=[boto3_layer, shared_layer],
+                environment=manage_s3_table_environment,
+            )
+            table_maintenance.node.add_dependency(s3_table_custom_resource)
+
         # Add CfnOutput for DynamoDB table
         CfnOutput(
             self,
@@ -0,0 +1,87 @@
+from dataclasses import dataclass
+
+from stack.settings import check_range
+
+
+@dataclass(frozen=True)
+class DeploymentProfile:
+    # Iceberg destination buffering
+    destination_buffer_interval_seconds: int
+    destination_buffer_size_mb: int
+    # Lambda processor buffering (Kinesis path)
+    processor_buffer_interval_seconds: int
+    processor_buffer_size_mb: float
+    # Stream Lambda function (transform or DynamoDB forwarder)
+    lambda_memory_mb: int
+    lambda_timeout_seconds: int
+    # DynamoDB Streams event source mapping
+    event_source_batch_size: int
+
+    def validate(self):
+        # Service limits for Firehose, Lambda processors and DynamoDB Streams
+        check_range(
+            "destination_buffer_interval_seconds",
+            self.destination_buffer_interval_seconds,
+            0,
+            900,
+        )
+        check_range(
+            "destination_buffer_size_mb", self.destination_buffer_size_mb, 1, 128
+        )
+        check_range(
+            "processor_buffer_interval_seconds",
+            self.processor_buffer_interval_seconds,
+            60,
+            900,
+        )
+        check_range("processor_buffer_size_mb", self.processor_buffer_size_mb, 0.2, 3)
+        check_range("lambda_memory_mb", self.lambda_memory_mb, 128, 10240)
+        # Firehose waits at most 5 minutes for a transform invocation
+        check_range("lambda_timeout_seconds", self.lambda_timeout_seconds, 1, 300)
+        check_range("event_source_batch_size", self.event_source_batch_size, 1, 10000)
+        return self
+
+
+DEFAULT_PROFILE = "balanced"
+
+DEPLOYMENT_PROFILES = {
+    # Small, frequent flushes: rows are queryable quickly, at the cost of many files
+    "low-latency": DeploymentProfile(
+        destination_buffer_interval_seconds=30,
+        destination_buffer_size_mb=1,
+        processor_buffer_interval_seconds=60,
+        processor_buffer_size_mb=0.2,
+        lambda_memory_mb=256,
+        lambda_timeout_seconds=60,
+        event_source_batch_size=100,
+    ),
+    "balanced": DeploymentProfile(
+        destination_buffer_interval_seconds=120,
+        destination_buffer_size_mb=32,
+        processor_buffer_interval_seconds=60,
+        processor_buffer_size_mb=1,
+        lambda_memory_mb=512,
+        lambda_timeout_seconds=120,
+        event_source_batch_size=500,
+    ),
+    # Large Parquet files for scan-heavy workloads, delivered every few minutes
+    "bulk": DeploymentProfile(
+        destination_buffer_interval_seconds=900,
+        destination_buffer_size_mb=128,
+        processor_buffer_interval_seconds=300,
+        processor_buffer_size_mb=3,
+        lambda_memory_mb=1024,
+        lambda_timeout_seconds=300,
+        event_source_batch_size=1000,
+    ),
+}
+
+
+def get_deployment_profile(name=None):
+    name = name or DEFAULT_PROFILE
+    if name not in DEPLOYMENT_PROFILES:
+        raise ValueError(
+            f"Unknown deployment_profile '{name}', "
+            f"expected one of {sorted(DEPLOYMENT_PROFILES)}"
+        )
+    return DEPLOYMENT_PROFILES[name].validate()
@@ -0,0 +1,22 @@
+from dataclasses import fields
+
+
+def check_range(name, value, minimum, maximum):
+    if not minimum <= value <= maximum:
+        raise ValueError(f"{name}={value} must be between {minimum} and {maximum}")
+
+
+def check_known_settings(settings_class, context_value, context_key):
+    # Rejects keys that are not fields of settings_class, so that a misspelt
+    # setting fails the synth instead of being ignored
+    known = {field.name for field in fields(settings_class)}
+    unknown = set(context_value) - known
+    if unknown:
+        raise ValueError(f"Unknown {context_key} settings: {sorted(unknown)}")
+
+
+def load_settings(settings_class, context_value, context_key, *validate_args):
+    # Settings from a context object; missing keys keep the field defaults
+    context_value = context_value or {}
+    check_known_settings(settings_class, context_value, context_key)
+    return settings_class(**context_value).validate(*validate_args)
@@ -0,0 +1,22 @@
+import importlib.util
+import os
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAYER_DIR = os.path.join(PROJECT_ROOT, "lambda", "shared", "python")
+
+
+def _load_layer_module(name):
+    # Loads a module of the shared layer from its file. The layer's modules
+    # import each other as top-level modules, the way Lambda puts the layer on
+    # the path, so only modules that import nothing from the layer load here.
+    spec = importlib.util.spec_from_file_location(
+        f"shared_layer_{name}", os.path.join(LAYER_DIR, f"{name}.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Routes and table layouts are checked against the same table definitions, with
+# the same code, that the custom resource creates the tables from
+table_spec = _load_layer_module("table_spec")
@@ -0,0 +1,45 @@
+from dataclasses import dataclass
+
+from stack.settings import load_settings
+from stack.shared_layer import table_spec
+
+
+@dataclass(frozen=True)
+class TableLayoutSettings:
+    # Partition expressions in Athena syntax, e.g. ["date", "bucket(16, customer_id)"].
+    # None keeps the partition spec of tabledefinition.json.
+    partition_by: tuple = None
+    # Sort columns of the write order, e.g. ["timestamp"] or ["timestamp desc"].
+    # None keeps the write order of tabledefinition.json.
+    sort_by: tuple = None
+
+    def validate(self, table_definition=None):
+        for name in ("partition_by", "sort_by"):
+            value = getattr(self, name)
+            if value is not None and not isinstance(value, (list, tuple)):
+                raise ValueError(f"{name} must be a list of expressions")
+        # Raises ValueError for unknown columns and transforms that do not fit
+        # the column type
+        self.metadata(table_definition or table_spec.load_table_definition())
+        return self
+
+    def metadata(self, table_definition):
+        return table_spec.table_metadata(
+            table_definition, self.partition_by, self.sort_by
+        )
+
+    def resource_properties(self):
+        # Only the overrides are passed to the custom resource
+        return {
+            name: list(getattr(self, name))
+            for name in ("partition_by", "sort_by")
+            if getattr(self, name) is not None
+        }
+
+
+def get_table_layout_settings(context_value=None, table_definition=None):
+    # table_definition is the definition of the table the overrides apply to;
+    # None is tabledefinition.json
+    return load_settings(
+        TableLayoutSettings, context_value, "table_layout", table_definition
+    )
@@ -0,0 +1,300 @@
+import os
+import re
+from dataclasses import dataclass, fields
+
+from stack.settings import check_known_settings
+from stack.shared_layer import table_spec
+
+ANY_SOURCE = "*"
+
+# DynamoDB table the pipeline creates for changes of any table
+SAMPLE_SOURCE_TABLE = "financial-transactions"
+
+# DynamoDB key attribute types of the column types a key can have
+KEY_ATTRIBUTE_TYPES = {
+    "string": "STRING",
+    "int": "NUMBER",
+    "long": "NUMBER",
+    "binary": "BINARY",
+}
+
+# S3 table names are lowercase letters, numbers and underscores
+TABLE_NAME = re.compile(r"^[a-z0-9][a-z0-9_]{0,254}$")
+
+
+@dataclass(frozen=True)
+class ExplodeSettings:
+    # DynamoDB list attribute whose maps become rows of the child table
+    attribute: str
+    # S3 table that receives one row per list element
+    table_name: str
+    # File in tabledefinitions/ with the schema of the child table
+    definition: str
+    # Int or long column of the child table with the element's position
+    index_column: str
+    # Columns Firehose upserts on. None is the parent's unique keys and
+    # index_column.
+    unique_keys: tuple = None
+
+    def validate(self, parent):
+        if not isinstance(self.table_name, str) or not TABLE_NAME.match(
+            self.table_name
+        ):
+            raise ValueError(f"Invalid table_name in explode: {self.table_name!r}")
+        path = table_spec.definition_path(self.definition)
+        if path is None or not os.path.exists(path):
+            raise ValueError(
+                f"No table definition {self.definition!r} in tabledefinitions/"
+            )
+        columns = {
+            field["name"]: field["type"]
+            for field in table_spec.schema_fields(
+                table_spec.load_table_definition(path)
+            )
+        }
+        if columns.get(self.index_column) not in ("int", "long"):
+            raise ValueError(
+                f"index_column of {self.table_name} must be an int or long column "
+                f"of its definition: {self.index_column!r}"
+            )
+        parent_columns = {
+            field["name"]: field["type"]
+            for field in table_spec.schema_fields(parent.table_definition())
+        }
+        if self.attribute in parent_columns and not table_spec.is_nested(
+            parent_columns[self.attribute]
+        ):
+            raise ValueError(
+                f"{self.attribute} is a {parent_columns[self.attribute]} column of "
+                f"{parent.table_name} and cannot be exploded"
+            )
+        missing = [key for key in self.child_unique_keys(parent) if key not in columns]
+        if missing:
+            raise ValueError(
+                f"unique_keys of {self.table_name} are not columns of its "
+                f"definition: {missing}"
+            )
+        return self
+
+    def child_unique_keys(self, parent):
+        if self.unique_keys:
+            return self.unique_keys
+        return (*parent.unique_keys, self.index_column)
+
+    def environment(self, parent):
+        return {
+            "attribute": self.attribute,
+            "table_name": self.table_name,
+            "definition": self.definition,
+            "index_column": self.index_column,
+            "unique_keys": list(self.child_unique_keys(parent)),
+        }
+
+
+@dataclass(frozen=True)
+class TableRoute:
+    # S3 table that receives the changes
+    table_name: str
+    # DynamoDB table whose changes are written to it. "*" takes the changes of
+    # every DynamoDB table without a route of its own.
+    source_table: str = ANY_SOURCE
+    # File in tabledefinitions/ with the schema, partition spec and write order
+    # of the table. None is tabledefinition.json.
+    definition: str = None
+    # Columns Firehose upserts and deletes on
+    unique_keys: tuple = ("transaction_id",)
+    # Writes a nested list attribute to a child table as well, one row per
+    # element. Only the dynamodb stream type can send more than one row for a
+    # change.
+    explode: ExplodeSettings = None
+
+    def validate(self):
+        if not isinstance(self.table_name, str) or not TABLE_NAME.match(
+            self.table_name
+        ):
+            raise ValueError(f"Invalid table_name in table_routes: {self.table_name!r}")
+        path = table_spec.definition_path(self.definition)
+        if path is not None and not os.path.exists(path):
+            raise ValueError(
+                f"No table definition {self.definition!r} in tabledefinitions/"
+            )
+        if not self.unique_keys:
+            raise ValueError(f"unique_keys of {self.table_name} must not be empty")
+        columns = {
+            field["name"] for field in table_spec.schema_fields(self.table_definition())
+        }
+        missing = [key for key in self.unique_keys if key not in columns]
+        if missing:
+            raise ValueError(
+                f"unique_keys of {self.table_name} are not columns of its "
+                f"definition: {missing}"
+            )
+        if self.explode is not None:
+            self.explode.validate(self)
+        return self
+
+    def table_definition(self):
+        return table_spec.load_table_definition(
+            table_spec.definition_path(self.definition)
+        )
+
+    def source_key_schema(self):
+        # [(attribute, DynamoDB attribute type)] of a source table created for
+        # the route: its unique keys, as partition key and optional sort key
+        if len(self.unique_keys) > 2:
+            raise ValueError(
+                f"unique_keys of {self.table_name} need at most two columns to key "
+                f"its source table {self.source_table}"
+            )
+        columns = {
+            field["name"]: field["type"]
+            for field in table_spec.schema_fields(self.table_definition())
+        }
+        key_schema = []
+        for key in self.unique_keys:
+            attribute_type = KEY_ATTRIBUTE_TYPES.get(columns[key])
+            if attribute_type is None:
+                raise ValueError(
+                    f"{key} of {self.table_name} is a {columns[key]} column and "
+                    f"cannot key its source table {self.source_table}"
+                )
+            key_schema.append((key, attribute_type))
+        return key_schema
+
+    def destinations(self):
+        # (table_name, unique_keys) of every S3 table the route writes to
+        destinations = [(self.table_name, self.unique_keys)]
+        if self.explode is not None:
+            destinations.append(
+                (self.explode.table_name, self.explode.child_unique_keys(self))
+            )
+        return destinations
+
+    def environment(self):
+        # Entry of the stream Lambdas' TABLE_ROUTES
+        environment = {
+            "source_table": self.source_table,
+            "table_name": self.table_name,
+            "definition": self.definition,
+            "unique_keys": list(self.unique_keys),
+        }
+        if self.explode is not None:
+            environment["explode"] = self.explode.environment(self)
+        return environment
+
+    def resource_properties(self):
+        # Entries of the custom resource's tables list
+        properties = {"table_name": self.table_name}
+        if self.definition is not None:
+            properties["definition"] = self.definition
+        if self.explode is None:
+            return [properties]
+        child = {
+            "table_name": self.explode.table_name,
+            "definition": self.explode.definition,
+        }
+        return [properties, child]
+
+
+@dataclass(frozen=True)
+class TableRoutingSettings:
+    routes: tuple
+
+    def validate(self, table_name, stream_type=None):
+        names = self.table_names
+        sources = [route.source_table for route in self.routes]
+        for label, values in (("table_name", names), ("source_table", sources)):
+            duplicates = sorted({value for value in values if values.count(value) > 1})
+            if duplicates:
+                raise ValueError(f"Duplicate {label} in table_routes: {duplicates}")
+        if table_name not in names:
+            raise ValueError(f"table_routes must include the {table_name} table")
+        # Only the transform Lambda of the kinesis stream type sets the
+        # destination table of each record
+        if len(self.routes) > 1 and stream_type != "kinesis":
+            raise ValueError(
+                "table_routes with more than one table need stream_type kinesis"
+            )
+        # A Firehose transform Lambda returns exactly one record per input
+        # record, so only the DynamoDB Streams forwarder can add child rows
+        if stream_type != "dynamodb" and any(route.explode for route in self.routes):
+            raise ValueError("explode in table_routes needs stream_type dynamodb")
+        if stream_type == "dynamodb" and self.source_table != SAMPLE_SOURCE_TABLE:
+            self.routes[0].source_key_schema()
+        return self
+
+    @property
+    def source_table(self):
+        # DynamoDB table the dynamodb stream type reads: the source_table of
+        # its only route, or the sample table for a route of any table
+        source_table = self.routes[0].source_table
+        return SAMPLE_SOURCE_TABLE if source_table == ANY_SOURCE else source_table
+
+    @property
+    def table_names(self):
+        # Every S3 table of the delivery stream, child tables included
+        return [name for route in self.routes for name, _ in route.destinations()]
+
+    def table_definition(self, table_name):
+        # Definition of any table in table_names
+        for route in self.routes:
+            if route.table_name == table_name:
+                return route.table_definition()
+            if route.explode is not None and route.explode.table_name == table_name:
+                return table_spec.load_table_definition(
+                    table_spec.definition_path(route.explode.definition)
+                )
+        raise ValueError(f"No table {table_name!r} in table_routes")
+
+    def destinations(self):
+        return [
+            destination for route in self.routes for destination in route.destinations()
+        ]
+
+    def environment(self):
+        return [route.environment() for route in self.routes]
+
+    def resource_properties(self):
+        # In the order of table_names
+        return [
+            properties
+            for route in self.routes
+            for properties in route.resource_properties()
+        ]
+
+
+def get_table_routing_settings(context_value=None, table_name=None, stream_type=None):
+    # Without table_routes, every change goes to the table_name table
+    if not context_value:
+        routes = (TableRoute(table_name).validate(),)
+    else:
+        if not isinstance(context_value, list):
+            raise ValueError("table_routes must be a list of routes")
+        routes = []
+        for route in context_value:
+            check_known_settings(TableRoute, route, "table_routes")
+            if "unique_keys" in route:
+                route = dict(route, unique_keys=tuple(route["unique_keys"]))
+            if route.get("explode") is not None:
+                route = dict(route, explode=get_explode_settings(route["explode"]))
+            routes.append(TableRoute(**route).validate())
+        routes = tuple(routes)
+    return TableRoutingSettings(routes).validate(table_name, stream_type)
+
+
+def get_explode_settings(context_value):
+    if not isinstance(context_value, dict):
+        raise ValueError("explode in table_routes must be an object")
+    check_known_settings(ExplodeSettings, context_value, "explode")
+    missing = sorted(
+        field.name
+        for field in fields(ExplodeSettings)
+        if field.name not in context_value and field.name != "unique_keys"
+    )
+    if missing:
+        raise ValueError(f"Missing explode settings: {missing}")
+    if context_value.get("unique_keys"):
+        context_value = dict(
+            context_value, unique_keys=tuple(context_value["unique_keys"])
+        )
+    return ExplodeSettings(**context_value)
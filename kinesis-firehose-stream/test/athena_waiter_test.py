@@ -0,0 +1,258 @@
+import asyncio
+import os
+import sys
+import pytest
+import boto3
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.join(PROJECT_ROOT, "scripts"))
+import athena_waiter
+from athena_waiter import (
+    INITIAL_INTERVAL_SECONDS,
+    MAX_INTERVAL_SECONDS,
+    QueryWaiter,
+    wait_for_queries,
+    wait_for_query,
+)
+from verify_table import check_queries, run_checks
+
+
+class ScriptedAthena:
+    # Athena stand-in whose queries step through a scripted list of states, one
+    # state per status poll; the last state repeats
+    def __init__(self, scripts=None, default=("QUEUED", "RUNNING", "SUCCEEDED")):
+        self.scripts = {key: list(states) for key, states in (scripts or {}).items()}
+        self.default = default
+        self.batch_sizes = []
+        self.unprocessed = set()
+        self.started = 0
+
+    def start_query_execution(self, QueryString, **kwargs):
+        self.started += 1
+        query_id = f"q{self.started}"
+        self.scripts.setdefault(query_id, list(self.default))
+        return {"QueryExecutionId": query_id}
+
+    def _execution(self, query_id):
+        states = self.scripts[query_id]
+        current = states.pop(0) if len(states) > 1 else states[0]
+        return {"QueryExecutionId": query_id, "Status": {"State": current}}
+
+    def batch_get_query_execution(self, QueryExecutionIds):
+        assert len(QueryExecutionIds) <= 50
+        self.batch_sizes.append(len(QueryExecutionIds))
+        unprocessed = [i for i in QueryExecutionIds if i in self.unprocessed]
+        self.unprocessed -= set(unprocessed)
+        return {
+            "QueryExecutions": [
+                self._execution(i) for i in QueryExecutionIds if i not in unprocessed
+            ],
+            "UnprocessedQueryExecutionIds": [
+                {"QueryExecutionId": i, "ErrorCode": "Throttled"} for i in unprocessed
+            ],
+        }
+
+    def get_query_results(self, QueryExecutionId):
+        return {
+            "ResultSet": {
+                "Rows": [
+                    {"Data": [{"VarCharValue": "_col0"}]},
+                    {"Data": [{"VarCharValue": "0"}]},
+                ]
+            }
+        }
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def __call__(self):
+        return self.now
+
+
+def test_fast_query_is_seen_within_a_second():
+    athena = ScriptedAthena({"q": ["QUEUED", "RUNNING", "RUNNING", "SUCCEEDED"]})
+    clock = FakeClock()
+
+    assert wait_for_query(athena, "q", sleep=clock.sleep, clock=clock) == "SUCCEEDED"
+
+    assert len(clock.sleeps) == 3
+    assert clock.sleeps[0] == INITIAL_INTERVAL_SECONDS
+    assert clock.now < 1.5
+
+
+def test_polling_backs_off_to_the_maximum_interval():
+    athena = ScriptedAthena({"q": ["RUNNING"] * 40 + ["FAILED"]})
+    clock = FakeClock()
+
+    executions = wait_for_queries(athena, ["q"], sleep=clock.sleep, clock=clock)
+
+    assert executions["q"]["Status"]["State"] == "FAILED"
+    assert max(clock.sleeps) <= MAX_INTERVAL_SECONDS
+    assert clock.sleeps[-1] > 0.8 * MAX_INTERVAL_SECONDS
+
+
+def test_many_queries_are_polled_in_batches_of_fifty():
+    ids = [f"q{i}" for i in range(120)]
+    athena = ScriptedAthena({i: ["RUNNING", "SUCCEEDED"] for i in ids})
+    athena.unprocessed = {"q7", "q99"}
+    clock = FakeClock()
+
+    executions = wait_for_queries(athena, ids, sleep=clock.sleep, clock=clock)
+
+    assert set(executions) == set(ids)
+    # Two polls of 120 ids, then the two ids Athena did not process
+    assert athena.batch_sizes == [50, 50, 20, 50, 50, 20, 2]
+
+
+def test_wait_times_out():
+    athena = ScriptedAthena({"q": ["RUNNING"]})
+    clock = FakeClock()
+
+    with pytest.raises(TimeoutError, match="q"):
+        wait_for_queries(athena, ["q"], timeout=10, sleep=clock.sleep, clock=clock)
+    assert clock.now == pytest.approx(10)
+
+
+def test_waiter_accepts_the_batch_get_query_execution_response():
+    athena = boto3.client("athena", region_name="us-east-1")
+    with Stubber(athena) as stubber:
+        stubber.add_response(
+            "batch_get_query_execution",
+            {
+                "QueryExecutions": [
+                    {"QueryExecutionId": "q1", "Status": {"State": "SUCCEEDED"}}
+                ],
+                "UnprocessedQueryExecutionIds": [],
+            },
+            {"QueryExecutionIds": ["q1"]},
+        )
+        assert wait_for_query(athena, "q1") == "SUCCEEDED"
+
+
+def test_async_waiter_shares_polls_between_queries():
+    athena = ScriptedAthena(
+        {f"q{i}": ["QUEUED"] * (i % 4) + ["SUCCEEDED"] for i in range(1, 41)}
+    )
+    waiter = QueryWaiter(athena, initial_interval=0.001, max_interval=0.002)
+
+    async def run_all():
+        return await asyncio.gather(*(waiter.run(f"SELECT {i}") for i in range(40)))
+
+    executions = asyncio.run(run_all())
+
+    assert [e["QueryExecutionId"] for e in executions] == [
+        f"q{i}" for i in range(1, 41)
+    ]
+    assert all(e["Status"]["State"] == "SUCCEEDED" for e in executions)
+    # 40 queries that need up to 4 polls each, seen in a few shared polls
+    assert waiter.polls <= 6
+    assert max(athena.batch_sizes) <= 50
+
+
+def test_async_wait_times_out_without_stopping_other_queries():
+    athena = ScriptedAthena({"slow": ["RUNNING"], "fast": ["RUNNING", "SUCCEEDED"]})
+    waiter = QueryWaiter(athena, initial_interval=0.001, max_interval=0.002)
+
+    async def run_both():
+        return await asyncio.gather(
+            waiter.wait("slow", timeout=0.05),
+            waiter.wait("fast"),
+            return_exceptions=True,
+        )
+
+    slow, fast = asyncio.run(run_both())
+
+    assert isinstance(slow, TimeoutError)
+    assert fast["Status"]["State"] == "SUCCEEDED"
+
+
+class FailingAthena(ScriptedAthena):
+    # Raises the scripted errors for calls that ask for a given id, one error
+    # per call
+    def __init__(self, errors, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.errors = {key: list(codes) for key, codes in errors.items()}
+
+    def batch_get_query_execution(self, QueryExecutionIds):
+        for query_id in QueryExecutionIds:
+            codes = self.errors.get(query_id)
+            if codes:
+                raise ClientError(
+                    {"Error": {"Code": codes.pop(0), "Message": "error"}},
+                    "BatchGetQueryExecution",
+                )
+        return super().batch_get_query_execution(QueryExecutionIds)
+
+
+def test_throttled_polls_are_retried(monkeypatch):
+    monkeypatch.setattr(athena_waiter, "backoff_seconds", lambda attempt: 0)
+    athena = FailingAthena({"q": ["ThrottlingException", "ThrottlingException"]})
+    athena.scripts["q"] = ["SUCCEEDED"]
+    clock = FakeClock()
+
+    assert wait_for_query(athena, "q", sleep=clock.sleep, clock=clock) == "SUCCEEDED"
+    assert athena.batch_sizes == [1]
+
+
+def test_a_failing_batch_only_fails_its_own_queries(monkeypatch):
+    monkeypatch.setattr(athena_waiter, "backoff_seconds", lambda attempt: 0)
+    ids = [f"q{i}" for i in range(60)]
+    # q55 is in the second batch, and its calls fail for good
+    athena = FailingAthena(
+        {"q55": ["AccessDeniedException"]},
+        {query_id: ["RUNNING", "SUCCEEDED"] for query_id in ids},
+    )
+    waiter = QueryWaiter(athena, initial_interval=0.001, max_interval=0.002)
+
+    async def wait_all():
+        return await asyncio.gather(
+            *(waiter.wait(query_id) for query_id in ids), return_exceptions=True
+        )
+
+    results = asyncio.run(wait_all())
+
+    failed = [
+        ids[i] for i, result in enumerate(results) if isinstance(result, Exception)
+    ]
+    assert failed == ids[50:]
+    assert all(result["Status"]["State"] == "SUCCEEDED" for result in results[:50])
+
+
+def test_a_timed_out_waiter_leaves_the_query_to_the_others():
+    athena = ScriptedAthena({"q": ["RUNNING"] * 30 + ["SUCCEEDED"]})
+    waiter = QueryWaiter(athena, initial_interval=0.001, max_interval=0.002)
+
+    async def wait_twice():
+        return await asyncio.gather(
+            waiter.wait("q", timeout=0.005),
+            waiter.wait("q"),
+            return_exceptions=True,
+        )
+
+    impatient, patient = asyncio.run(wait_twice())
+
+    assert isinstance(impatient, TimeoutError)
+    assert patient["Status"]["State"] == "SUCCEEDED"
+    assert waiter.futures == {} and waiter.waiters == {}
+
+
+def test_verify_table_runs_every_check_concurrently():
+    athena = ScriptedAthena()
+    queries = check_queries("transactions", days=30)
+
+    results, polls = asyncio.run(run_checks(athena, queries, {"WorkGroup": "primary"}))
+
+    assert len(results) == 33
+    assert set(results.values()) == {0}
+    assert athena.started == 33
+    assert polls < 10
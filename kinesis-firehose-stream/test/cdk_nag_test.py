@@ -39,6 +39,19 @@ def create_test_stack(stack_class, stack_name):
                 },
             ],
         )
+        NagSuppressions.add_resource_suppressions_by_path(
+            stack,
+            "/PipelineStack/TableMaintenance/Role/DefaultPolicy/Resource",
+            [
+                {
+                    "id": "AwsSolutions-IAM5",
+                    "reason": "Table ARNs end in a table id that S3 Tables generates when the custom resource creates the table. The statement only allows the maintenance actions, and its s3tables:namespace and s3tables:tableName conditions limit it to the maintained table.",
+                    "applies_to": [
+                        "Resource::arn:aws:s3tables:<AWS::Region>:<AWS::AccountId>:bucket/streamtablebucket/table/*"
+                    ],
+                }
+            ],
+        )
 
     if stack_name == "FirehoseStack":
         NagSuppressions.add_stack_suppressions(
@@ -48,6 +61,10 @@ def create_test_stack(stack_class, stack_name):
                     "id": "AwsSolutions-KDF1",
                     "reason": "The Kinesis Data Firehose delivery stream does not have server-side encryption enabled. This is a sample application and hence suppressing this error.",
                 },
+                {
+                    "id": "AwsSolutions-SQS3",
+                    "reason": "The SQS queue is the on-failure destination of the DynamoDB stream event source mapping, so it is itself the dead-letter queue.",
+                },
             ],
         )
 
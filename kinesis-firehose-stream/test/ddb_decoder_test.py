@@ -0,0 +1,85 @@
+import os
+import sys
+from decimal import Decimal
+import pytest
+
+sys.path.append(
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "lambda",
+        "shared",
+        "python",
+    )
+)
+from ddb_decoder import build_decode_plan, decode_image, load_decode_plan
+
+
+def test_schema_columns_are_decoded_to_iceberg_types():
+    plan = load_decode_plan()
+    item = decode_image(
+        {
+            "transaction_id": {"S": "TXN_1"},
+            "timestamp": {"N": "1700000000123"},
+            "hour": {"N": "7"},
+            "date": {"S": "2023-11-14"},
+            "amount": {"N": "12.5"},
+            "status": {"NULL": True},
+        },
+        plan,
+    )
+    assert item == {
+        "transaction_id": "TXN_1",
+        "timestamp": 1700000000123,
+        "hour": 7,
+        "date": "2023-11-14",
+        "amount": Decimal("12.50"),
+        "status": None,
+    }
+    assert str(item["amount"]) == "12.50"
+
+
+def test_unknown_attributes_are_unwrapped_recursively():
+    item = decode_image(
+        {
+            "items": {
+                "L": [
+                    {"M": {"sku": {"S": "A"}, "qty": {"N": "2"}}},
+                    {"M": {"sku": {"S": "B"}, "price": {"N": "9.99"}}},
+                ]
+            },
+            "flag": {"BOOL": False},
+            "tags": {"SS": ["x", "y"]},
+        },
+        build_decode_plan([]),
+    )
+    assert item == {
+        "items": [{"sku": "A", "qty": 2}, {"sku": "B", "price": Decimal("9.99")}],
+        "flag": False,
+        "tags": ["x", "y"],
+    }
+
+
+def test_type_mismatches_are_coerced_to_the_column_type():
+    plan = build_decode_plan(
+        [
+            {"name": "customer_id", "type": "string"},
+            {"name": "count", "type": "long"},
+            {"name": "price", "type": "decimal(12,2)"},
+        ]
+    )
+    item = decode_image(
+        {"customer_id": {"N": "42"}, "count": {"S": "7"}, "price": {"S": "1.005"}},
+        plan,
+    )
+    assert item == {"customer_id": "42", "count": 7, "price": Decimal("1.00")}
+
+
+def test_fractional_values_are_not_truncated_into_integer_columns():
+    plan = build_decode_plan([{"name": "count", "type": "long"}])
+
+    assert decode_image({"count": {"N": "12.0"}}, plan) == {"count": 12}
+    assert decode_image({"count": {"S": "1e3"}}, plan) == {"count": 1000}
+    with pytest.raises(ValueError, match="Non-integral"):
+        decode_image({"count": {"N": "12.7"}}, plan)
+    with pytest.raises(ValueError, match="Invalid integer"):
+        decode_image({"count": {"S": "twelve"}}, plan)
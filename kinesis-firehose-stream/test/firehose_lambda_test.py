@@ -0,0 +1,297 @@
+import importlib.util
+import json
+import os
+import threading
+import sys
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+LAMBDA_PATH = os.path.join(PROJECT_ROOT, "lambda", "firehose", "index.py")
+
+
+class StubFirehoseClient:
+    def __init__(self, failures_per_call=None):
+        # failures_per_call[i] is the set of positions that fail on call i
+        self.failures_per_call = failures_per_call or []
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def put_record_batch(self, DeliveryStreamName, Records):
+        with self.lock:
+            failing = (
+                self.failures_per_call[len(self.calls)]
+                if len(self.calls) < len(self.failures_per_call)
+                else set()
+            )
+            self.calls.append(Records)
+        responses = [
+            (
+                {
+                    "ErrorCode": "ServiceUnavailableException",
+                    "ErrorMessage": "slow down",
+                }
+                if i in failing
+                else {"RecordId": f"id-{i}"}
+            )
+            for i in range(len(Records))
+        ]
+        return {"FailedPutCount": len(failing), "RequestResponses": responses}
+
+
+class StubQueueClient:
+    def __init__(self, failing_ids=()):
+        self.failing_ids = set(failing_ids)
+        self.messages = []
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.messages.extend(json.loads(entry["MessageBody"]) for entry in Entries)
+        failed = [entry for entry in Entries if entry["Id"] in self.failing_ids]
+        return {
+            "Successful": [],
+            "Failed": [
+                {"Id": entry["Id"], "SenderFault": False, "Code": "InternalError"}
+                for entry in failed
+            ],
+        }
+
+
+def load_forwarder(monkeypatch, concurrency="1", report_batch_item_failures="true"):
+    monkeypatch.setenv("FIREHOSE_DELIVERY_STREAM", "test-stream")
+    monkeypatch.setenv("FIREHOSE_MAX_CONCURRENCY", concurrency)
+    monkeypatch.setenv("REPORT_BATCH_ITEM_FAILURES", report_batch_item_failures)
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    spec = importlib.util.spec_from_file_location("firehose_index", LAMBDA_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, "backoff_seconds", lambda attempt: 0)
+    return module
+
+
+@pytest.fixture
+def forwarder(monkeypatch):
+    return load_forwarder(monkeypatch)
+
+
+def stream_event(count, event_name="INSERT", padding=0, keys=None):
+    return {
+        "Records": [
+            {
+                "eventName": event_name,
+                "dynamodb": {
+                    "SequenceNumber": str(1000 + i),
+                    "NewImage": {
+                        "transaction_id": {"S": f"TXN_{i % keys if keys else i}"},
+                        "version": {"N": str(i)},
+                        "amount": {"N": "10.50"},
+                        "note": {"S": "x" * padding},
+                    },
+                },
+            }
+            for i in range(count)
+        ]
+    }
+
+
+def test_records_are_packed_into_batches(forwarder):
+    client = StubFirehoseClient()
+    forwarder.firehose_client = client
+
+    response = forwarder.handler(stream_event(1200), None)
+
+    assert response == {"batchItemFailures": []}
+    assert [len(records) for records in client.calls] == [500, 500, 200]
+    item = json.loads(client.calls[0][0]["Data"])
+    assert item["transaction_id"] == "TXN_0"
+    assert item["amount"] == "10.50"
+
+
+def test_batches_respect_the_byte_limit(forwarder):
+    client = StubFirehoseClient()
+    forwarder.firehose_client = client
+
+    forwarder.handler(stream_event(10, padding=900 * 1024), None)
+
+    for records in client.calls:
+        assert sum(len(r["Data"]) for r in records) <= forwarder.MAX_BATCH_BYTES
+    assert sum(len(records) for records in client.calls) == 10
+
+
+def test_only_failed_entries_are_retried(forwarder):
+    client = StubFirehoseClient(failures_per_call=[{1, 3}])
+    forwarder.firehose_client = client
+
+    response = forwarder.handler(stream_event(5), None)
+
+    assert response == {"batchItemFailures": []}
+    assert len(client.calls) == 2
+    retried = [json.loads(r["Data"])["transaction_id"] for r in client.calls[1]]
+    assert retried == ["TXN_1", "TXN_3"]
+
+
+def test_exhausted_retries_are_reported_as_batch_item_failures(forwarder, capsys):
+    client = StubFirehoseClient(
+        failures_per_call=[{2}] + [{0}] * (forwarder.MAX_ATTEMPTS - 1)
+    )
+    forwarder.firehose_client = client
+
+    response = forwarder.handler(stream_event(3), None)
+
+    assert len(client.calls) == forwarder.MAX_ATTEMPTS
+    assert response == {"batchItemFailures": [{"itemIdentifier": "1002"}]}
+    summary = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert summary["records_sent"] == 2
+    assert summary["records_failed"] == 1
+
+
+def test_failed_entries_are_resent_with_later_entries_of_their_key(forwarder):
+    # TXN_0 changes at positions 0, 2 and 4; the change at 2 fails and the
+    # one at 4 is delivered
+    client = StubFirehoseClient(failures_per_call=[{2}])
+    forwarder.firehose_client = client
+
+    response = forwarder.handler(stream_event(5, keys=2), None)
+
+    assert response == {"batchItemFailures": []}
+    retried = [json.loads(r["Data"])["version"] for r in client.calls[1]]
+    assert retried == [2, 4]
+    versions = [
+        item["version"]
+        for records in client.calls
+        for item in map(json.loads, (r["Data"] for r in records))
+        if item["transaction_id"] == "TXN_0"
+    ]
+    assert versions[-1] == 4
+
+
+def test_lane_stops_at_a_batch_that_gives_up(forwarder, monkeypatch):
+    monkeypatch.setattr(forwarder, "MAX_BATCH_RECORDS", 2)
+    client = StubFirehoseClient(
+        failures_per_call=[{1}] + [{0}] * (forwarder.MAX_ATTEMPTS - 1)
+    )
+    forwarder.firehose_client = client
+
+    response = forwarder.handler(stream_event(5), None)
+
+    # The later batches are not sent, and are replayed after the failed record
+    assert len(client.calls) == forwarder.MAX_ATTEMPTS
+    assert response == {
+        "batchItemFailures": [
+            {"itemIdentifier": sequence_number}
+            for sequence_number in ("1001", "1002", "1003", "1004")
+        ]
+    }
+
+
+def test_remove_events_delete_the_old_image(forwarder):
+    client = StubFirehoseClient()
+    forwarder.firehose_client = client
+    event = stream_event(3, event_name="REMOVE")
+    for record in event["Records"]:
+        record["dynamodb"]["OldImage"] = record["dynamodb"].pop("NewImage")
+
+    response = forwarder.handler(event, None)
+
+    assert response == {"batchItemFailures": []}
+    (records,) = client.calls
+    rows = [json.loads(record["Data"]) for record in records]
+    assert [row["transaction_id"] for row in rows] == ["TXN_0", "TXN_1", "TXN_2"]
+    assert {row["_operation"] for row in rows} == {"delete"}
+    # The delete row holds the old values, to find the row's partition
+    assert rows[0]["amount"] == "10.50"
+
+
+def test_modify_events_are_upserts_without_deletes(forwarder):
+    client = StubFirehoseClient()
+    forwarder.firehose_client = client
+    event = stream_event(1, event_name="MODIFY")
+    (record,) = event["Records"]
+    record["dynamodb"]["OldImage"] = dict(
+        record["dynamodb"]["NewImage"], amount={"N": "1.00"}
+    )
+
+    forwarder.handler(event, None)
+
+    ((row,),) = [[json.loads(r["Data"]) for r in records] for records in client.calls]
+    assert "_operation" not in row and row["amount"] == "10.50"
+
+
+def test_concurrent_lanes_keep_per_key_order(monkeypatch):
+    forwarder = load_forwarder(monkeypatch, concurrency="4")
+    client = StubFirehoseClient()
+    forwarder.firehose_client = client
+    monkeypatch.setattr(forwarder, "MAX_BATCH_RECORDS", 10)
+
+    response = forwarder.handler(stream_event(200, keys=7), None)
+
+    assert response == {"batchItemFailures": []}
+    assert sum(len(records) for records in client.calls) == 200
+    versions = {}
+    for records in client.calls:
+        for record in records:
+            item = json.loads(record["Data"])
+            versions.setdefault(item["transaction_id"], []).append(item["version"])
+    assert len(versions) == 7
+    for key_versions in versions.values():
+        assert key_versions == sorted(key_versions)
+
+
+def test_failures_fail_the_invocation_without_item_reporting(monkeypatch):
+    forwarder = load_forwarder(monkeypatch, report_batch_item_failures="false")
+    forwarder.firehose_client = StubFirehoseClient(
+        failures_per_call=[{0}] * forwarder.MAX_ATTEMPTS
+    )
+
+    with pytest.raises(RuntimeError, match="1 records could not be sent"):
+        forwarder.handler(stream_event(2), None)
+
+
+def test_undecodable_records_go_to_the_failure_queue(forwarder, capsys):
+    forwarder.firehose_client = client = StubFirehoseClient()
+    forwarder.sqs_client = queue = StubQueueClient()
+    forwarder.FAILURE_QUEUE_URL = "https://sqs.us-east-1.amazonaws.com/1/queue"
+    event = stream_event(3)
+    event["Records"][1]["dynamodb"]["NewImage"]["amount"] = {"N": "12.5.0"}
+
+    response = forwarder.handler(event, None)
+
+    # The record would fail the same way on every retry, so it is not retried
+    assert response == {"batchItemFailures": []}
+    assert len(client.calls[0]) == 2
+    (message,) = queue.messages
+    assert (message["reason"], message["sequenceNumber"]) == ("invalid", "1001")
+    summary = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert summary["rejected_invalid"] == 1
+    assert summary["records_dead_lettered"] == 1
+
+
+def test_rejected_records_are_retried_when_the_queue_fails(forwarder):
+    forwarder.firehose_client = StubFirehoseClient()
+    forwarder.sqs_client = StubQueueClient(failing_ids={"0"})
+    forwarder.FAILURE_QUEUE_URL = "https://sqs.us-east-1.amazonaws.com/1/queue"
+    event = stream_event(2)
+    event["Records"][0]["dynamodb"]["NewImage"]["amount"] = {"S": "n/a"}
+
+    response = forwarder.handler(event, None)
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "1000"}]}
+
+
+def test_oversized_records_are_rejected_without_a_retry(forwarder, capsys):
+    forwarder.firehose_client = client = StubFirehoseClient()
+    forwarder.sqs_client = queue = StubQueueClient()
+    forwarder.FAILURE_QUEUE_URL = "https://sqs.us-east-1.amazonaws.com/1/queue"
+    event = stream_event(2)
+    event["Records"][0]["dynamodb"]["NewImage"]["note"] = {"S": "x" * 1024 * 1024}
+    event["Records"][0]["dynamodb"]["Keys"] = {"transaction_id": {"S": "TXN_0"}}
+
+    response = forwarder.handler(event, None)
+
+    assert response == {"batchItemFailures": []}
+    assert len(client.calls[0]) == 1
+    (message,) = queue.messages
+    assert message["reason"] == "oversized"
+    assert message["keys"] == {"transaction_id": {"S": "TXN_0"}}
+    output = capsys.readouterr().out
+    assert "Rejected record 1000 (oversized)" in output
+    assert json.loads(output.strip().splitlines()[-1])["rejected_oversized"] == 1
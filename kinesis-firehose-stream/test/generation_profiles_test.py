@@ -0,0 +1,144 @@
+import os
+import random
+import sys
+from collections import Counter
+from datetime import datetime, timezone
+import boto3
+import pytest
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+)
+from create_sample_data import CreateSampleData
+from create_sample_orders import create_sample_order
+from generation_profiles import (
+    GenerationProfile,
+    TransactionEventGenerator,
+    get_profile,
+)
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def events(profile, count=2000):
+    return list(TransactionEventGenerator(profile).events(count, start_time=START))
+
+
+def test_same_seed_gives_identical_events():
+    assert events(get_profile("cdc", seed=7)) == events(get_profile("cdc", seed=7))
+    assert events(get_profile("cdc", seed=7)) != events(get_profile("cdc", seed=8))
+
+
+def test_seeded_rng_makes_sample_generators_reproducible():
+    timestamp = datetime(2024, 1, 1, 12, 30, tzinfo=timezone.utc)
+    assert CreateSampleData.generate_transaction(
+        timestamp, rng=random.Random(1)
+    ) == CreateSampleData.generate_transaction(timestamp, rng=random.Random(1))
+    assert create_sample_order(random.Random(1)) == create_sample_order(
+        random.Random(1)
+    )
+
+
+def test_skewed_profile_concentrates_customers():
+    uniform = Counter(item["customer_id"] for _, item in events(get_profile("uniform")))
+    skewed = Counter(item["customer_id"] for _, item in events(get_profile("skewed")))
+    assert skewed.most_common(1)[0][1] > 5 * uniform.most_common(1)[0][1]
+    assert skewed.most_common(1)[0][0] == "CUST_000001"
+
+
+def test_cdc_profile_modifies_and_removes_existing_keys():
+    live = {}
+    counts = Counter()
+    for event_name, item in events(get_profile("cdc"), 5000):
+        key = (item["transaction_id"], item["timestamp"])
+        counts[event_name] += 1
+        if event_name == "INSERT":
+            assert key not in live
+            live[key] = item
+        elif event_name == "MODIFY":
+            assert key in live
+            assert item["processing_timestamp"] > item["timestamp"]
+            live[key] = item
+        else:
+            assert set(item) == {"transaction_id", "timestamp"}
+            del live[key]
+
+    assert 0.25 < counts["MODIFY"] / 5000 < 0.35
+    assert 0.03 < counts["REMOVE"] / 5000 < 0.07
+
+
+def test_late_profile_produces_out_of_order_timestamps():
+    timestamps = [item["timestamp"] for _, item in events(get_profile("late"))]
+    regressions = sum(b < a for a, b in zip(timestamps, timestamps[1:]))
+    assert regressions > 100
+    assert min(timestamps) < int(START.timestamp() * 1000)
+
+
+def test_bursts_pack_arrivals_together():
+    profile = GenerationProfile(burst_probability=0.05, burst_size=20)
+    timestamps = [item["timestamp"] for _, item in events(profile)]
+    gaps = [b - a for a, b in zip(timestamps, timestamps[1:])]
+    # About half of the arrivals fall inside a burst, against almost none without
+    assert sum(gap <= profile.burst_spacing_ms for gap in gaps) > 0.4 * len(gaps)
+
+
+def test_invalid_profile_is_rejected():
+    with pytest.raises(ValueError, match="must not exceed 1"):
+        GenerationProfile(modify_fraction=0.8, remove_fraction=0.3).validate()
+    with pytest.raises(ValueError, match="Unknown profile"):
+        get_profile("chaos")
+
+
+def scan_after(write, create_table):
+    moto = pytest.importorskip("moto")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        create_table()
+        write()
+        client = boto3.client("dynamodb")
+        items = client.scan(TableName=client.list_tables()["TableNames"][0])["Items"]
+    return sorted(items, key=repr)
+
+
+def create_transactions_table():
+    boto3.client("dynamodb").create_table(
+        TableName="financial-transactions",
+        KeySchema=[
+            {"AttributeName": "transaction_id", "KeyType": "HASH"},
+            {"AttributeName": "timestamp", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "transaction_id", "AttributeType": "S"},
+            {"AttributeName": "timestamp", "AttributeType": "N"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
+@pytest.mark.parametrize("profile", [[], ["--profile", "cdc"]])
+def test_seeded_sample_data_runs_write_identical_rows(profile):
+    import create_sample_data
+
+    def run():
+        return scan_after(
+            lambda: create_sample_data.main(["--seed", "5", "--count", "50", *profile]),
+            create_transactions_table,
+        )
+
+    first = run()
+    assert first and run() == first
+
+
+def test_seeded_sample_order_runs_write_identical_orders():
+    import create_sample_orders
+
+    def run():
+        return scan_after(
+            lambda: create_sample_orders.batch_write_orders("orders", 20, seed=5),
+            lambda: create_sample_orders.create_orders_table("orders"),
+        )
+
+    first = run()
+    assert first and run() == first
@@ -0,0 +1,231 @@
+import json
+import os
+import sys
+import pytest
+
+pytest.importorskip("moto")
+import boto3
+from moto import mock_aws
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+import iceberg_metadata
+from iceberg_metadata import commit_table_metadata, read_metadata_file
+from table_spec import load_table_definition, table_metadata
+
+ICEBERG = table_metadata(load_table_definition())["iceberg"]
+NAMESPACE = "analytics"
+TABLE_NAME = "transactions"
+
+
+@pytest.fixture
+def table():
+    with mock_aws():
+        s3tables = boto3.client("s3tables", region_name="us-east-1")
+        s3 = boto3.client("s3", region_name="us-east-1")
+        bucket_arn = s3tables.create_table_bucket(name="streamtablebucket")["arn"]
+        s3tables.create_namespace(tableBucketARN=bucket_arn, namespace=[NAMESPACE])
+        s3tables.create_table(
+            tableBucketARN=bucket_arn,
+            namespace=NAMESPACE,
+            name=TABLE_NAME,
+            format="ICEBERG",
+        )
+        yield s3tables, s3, bucket_arn
+
+
+def commit(table, iceberg=ICEBERG, **kwargs):
+    s3tables, s3, bucket_arn = table
+    return commit_table_metadata(
+        s3tables, s3, bucket_arn, NAMESPACE, TABLE_NAME, iceberg, **kwargs
+    )
+
+
+def current_metadata(table):
+    s3tables, s3, bucket_arn = table
+    location = s3tables.get_table_metadata_location(
+        tableBucketARN=bucket_arn, namespace=NAMESPACE, name=TABLE_NAME
+    )["metadataLocation"]
+    return location, read_metadata_file(s3, location)
+
+
+def with_column(iceberg, field):
+    fields = iceberg["schema"]["fields"] + [field]
+    return dict(iceberg, schema={"fields": fields})
+
+
+def test_first_commit_writes_a_valid_iceberg_table(table):
+    location = commit(table, properties={"write.format.default": "parquet"})
+
+    assert location.endswith(".metadata.json")
+    assert location.rsplit("/", 1)[-1].startswith("00000-")
+    _, metadata = current_metadata(table)
+    assert metadata["properties"] == {"write.format.default": "parquet"}
+    assert [f["transform"] for f in metadata["partition-specs"][0]["fields"]] == [
+        "identity",
+        "bucket[16]",
+    ]
+    assert metadata["default-sort-order-id"] == 1
+
+    # The file parses as Iceberg v2 table metadata
+    pyiceberg_metadata = pytest.importorskip("pyiceberg.table.metadata")
+    parsed = pyiceberg_metadata.TableMetadataUtil.parse_raw(json.dumps(metadata))
+    assert parsed.schema().find_field("amount").field_type.precision == 12
+    assert parsed.spec().fields[1].transform.num_buckets == 16
+
+
+def test_schema_change_adds_a_schema_and_keeps_history(table):
+    first_location = commit(table)
+    assert commit(table) is None
+
+    new_location = commit(
+        table,
+        with_column(ICEBERG, {"id": 23, "name": "channel", "type": "string"}),
+    )
+
+    assert new_location.rsplit("/", 1)[-1].startswith("00001-")
+    _, metadata = current_metadata(table)
+    assert metadata["current-schema-id"] == 1
+    assert [s["schema-id"] for s in metadata["schemas"]] == [0, 1]
+    assert metadata["last-column-id"] == 23
+    assert metadata["default-spec-id"] == 0
+    assert metadata["metadata-log"][0]["metadata-file"] == first_location
+
+
+def test_same_schema_from_another_writer_is_not_added_again(table):
+    commit(table)
+    location, metadata = current_metadata(table)
+    # Keys another engine writes with the same columns
+    (schema,) = metadata["schemas"]
+    schema["identifier-field-ids"] = []
+    schema["fields"][0]["doc"] = "Set by another writer"
+    del schema["fields"][1]["required"]
+
+    assert iceberg_metadata.updated_table_metadata(metadata, ICEBERG, location) is None
+    updated = iceberg_metadata.updated_table_metadata(
+        metadata, ICEBERG, location, properties={"owner": "analytics"}
+    )
+    assert updated["schemas"] == metadata["schemas"]
+    assert updated["current-schema-id"] == 0
+
+
+def test_partition_change_keeps_existing_partition_field_ids(table):
+    commit(table)
+    repartitioned = table_metadata(
+        load_table_definition(), ["date", "bucket(16, customer_id)", "region"]
+    )["iceberg"]
+
+    commit(table, repartitioned)
+
+    _, metadata = current_metadata(table)
+    spec = metadata["partition-specs"][metadata["default-spec-id"]]
+    assert [f["field-id"] for f in spec["fields"]] == [1000, 1001, 1002]
+    assert metadata["last-partition-id"] == 1002
+
+
+@pytest.mark.parametrize(
+    "field, message",
+    [
+        ({"id": 3, "name": "customer_id", "type": "long"}, "cannot change"),
+        ({"id": 20, "name": "location_risk", "type": "int"}, "cannot change"),
+        ({"id": 23, "name": "channel", "type": "string", "required": True}, "optional"),
+    ],
+)
+def test_incompatible_schema_changes_are_rejected(table, field, message):
+    commit(table)
+    fields = [f for f in ICEBERG["schema"]["fields"] if f["id"] != field["id"]]
+    with pytest.raises(ValueError, match=message):
+        commit(table, with_column(dict(ICEBERG, schema={"fields": fields}), field))
+
+
+def test_dropped_column_ids_are_not_reused(table):
+    fields = [f for f in ICEBERG["schema"]["fields"] if f["name"] != "pattern_match"]
+    commit(table)
+    commit(table, dict(ICEBERG, schema={"fields": fields}))
+
+    with pytest.raises(ValueError, match="reuses field id 22"):
+        commit(
+            table,
+            with_column(
+                dict(ICEBERG, schema={"fields": fields}),
+                {"id": 22, "name": "channel", "type": "string"},
+            ),
+        )
+
+
+class RacingS3Tables:
+    # Commits a competing metadata file just before the first update, so the
+    # version token read by the writer is stale
+    def __init__(self, client, compete):
+        self.client = client
+        self.compete = compete
+        self.updates = 0
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def update_table_metadata_location(self, **kwargs):
+        self.updates += 1
+        if self.compete:
+            compete, self.compete = self.compete, None
+            compete()
+        return self.client.update_table_metadata_location(**kwargs)
+
+
+def test_conflicting_commit_is_rebuilt_and_retried(table, monkeypatch):
+    monkeypatch.setattr(iceberg_metadata, "backoff_seconds", lambda attempt: 0)
+    s3tables, s3, bucket_arn = table
+    commit(table)
+    competitor = with_column(ICEBERG, {"id": 23, "name": "channel", "type": "string"})
+    racing = RacingS3Tables(s3tables, lambda: commit(table, competitor))
+
+    location = commit_table_metadata(
+        racing,
+        s3,
+        bucket_arn,
+        NAMESPACE,
+        TABLE_NAME,
+        with_column(competitor, {"id": 24, "name": "store_id", "type": "string"}),
+    )
+
+    assert racing.updates == 2
+    current_location, metadata = current_metadata(table)
+    assert current_location == location
+    # The retry evolved the competitor's metadata rather than overwriting it
+    assert len(metadata["metadata-log"]) == 2
+    assert [s["schema-id"] for s in metadata["schemas"]] == [0, 1, 2]
+
+
+def test_commit_gives_up_after_max_attempts(table, monkeypatch):
+    monkeypatch.setattr(iceberg_metadata, "backoff_seconds", lambda attempt: 0)
+    s3tables, s3, bucket_arn = table
+    commit(table)
+
+    class AlwaysStale(RacingS3Tables):
+        def update_table_metadata_location(self, **kwargs):
+            self.updates += 1
+            commit(
+                table,
+                with_column(
+                    ICEBERG,
+                    {
+                        "id": 22 + self.updates,
+                        "name": f"c{self.updates}",
+                        "type": "string",
+                    },
+                ),
+            )
+            return self.client.update_table_metadata_location(**kwargs)
+
+    racing = AlwaysStale(s3tables, None)
+    with pytest.raises(s3tables.exceptions.ConflictException):
+        commit_table_metadata(
+            racing,
+            s3,
+            bucket_arn,
+            NAMESPACE,
+            TABLE_NAME,
+            with_column(ICEBERG, {"id": 30, "name": "channel", "type": "string"}),
+            max_attempts=3,
+        )
+    assert racing.updates == 3
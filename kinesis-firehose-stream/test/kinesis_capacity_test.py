@@ -0,0 +1,72 @@
+import os
+import sys
+import pytest
+from aws_cdk import App
+from aws_cdk.assertions import Template
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from stack.kinesis_capacity import calculate_shard_count, get_kinesis_stream_settings
+from stack.pipeline import PipelineStack
+
+
+def test_shard_count_follows_the_tightest_limit():
+    # Record count bound: 4000 small records/s at 80% of 1000 records/s per shard
+    assert calculate_shard_count(4000, 100) == 5
+    # Write throughput bound: 2000 x 2 KiB = 4 MiB/s at 80% of 1 MiB/s per shard
+    assert calculate_shard_count(2000, 2048) == 5
+    # Read bound with three shared consumers: 3 x 1.5 MiB/s at 80% of 2 MiB/s
+    assert calculate_shard_count(1536, 1024, shared_consumers=3) == 3
+    assert calculate_shard_count(1, 1) == 1
+
+
+def test_settings_are_validated():
+    with pytest.raises(ValueError, match="needs shard_count"):
+        get_kinesis_stream_settings({"stream_mode": "provisioned"})
+    with pytest.raises(ValueError, match="only be set in provisioned mode"):
+        get_kinesis_stream_settings({"shard_count": 2})
+    with pytest.raises(ValueError, match="retention_hours"):
+        get_kinesis_stream_settings({"retention_hours": 12})
+    with pytest.raises(ValueError, match="shard_count=0"):
+        get_kinesis_stream_settings({"stream_mode": "provisioned", "shard_count": 0})
+    with pytest.raises(ValueError, match="shared_consumers"):
+        get_kinesis_stream_settings({"shared_consumers": 0})
+
+
+def test_shared_consumers_setting_sizes_the_read_throughput():
+    settings = get_kinesis_stream_settings(
+        {
+            "stream_mode": "provisioned",
+            "peak_records_per_second": 1536,
+            "average_record_size_bytes": 1024,
+            "shared_consumers": 3,
+        }
+    )
+    assert settings.resolved_shard_count() == 3
+
+
+def test_provisioned_stream_from_declared_peak():
+    app = App(
+        context={
+            "table_bucket_name": "streamtablebucket",
+            "table_name": "transactions",
+            "namespace": "analytics",
+            "bucket_name": "streambucket",
+            "stream_type": "kinesis",
+            "kinesis_stream": {
+                "stream_mode": "provisioned",
+                "peak_records_per_second": 4000,
+                "average_record_size_bytes": 600,
+                "retention_hours": 48,
+            },
+        }
+    )
+    template = Template.from_stack(PipelineStack(app, "PipelineStack"))
+
+    template.has_resource_properties(
+        "AWS::Kinesis::Stream",
+        {
+            "ShardCount": 5,
+            "RetentionPeriodHours": 48,
+            "StreamModeDetails": {"StreamMode": "PROVISIONED"},
+        },
+    )
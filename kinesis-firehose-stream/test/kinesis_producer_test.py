@@ -0,0 +1,83 @@
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("moto")
+from moto import mock_aws
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, "scripts"))
+import boto3
+from generation_profiles import get_profile
+from kinesis_producer import ShardAggregator, change_records, hash_key, produce
+from kpl import deaggregate, is_aggregated
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def shard_records(client, stream_name):
+    # Data of every record in the stream, by shard
+    records = {}
+    for shard in client.list_shards(StreamName=stream_name)["Shards"]:
+        iterator = client.get_shard_iterator(
+            StreamName=stream_name,
+            ShardId=shard["ShardId"],
+            ShardIteratorType="TRIM_HORIZON",
+        )["ShardIterator"]
+        data = client.get_records(ShardIterator=iterator, Limit=10000)["Records"]
+        records[shard["ShardId"]] = (shard, [record["Data"] for record in data])
+    return records
+
+
+def test_aggregator_flushes_at_max_bytes():
+    aggregator = ShardAggregator(
+        [{"HashKeyRange": {"StartingHashKey": "0"}}], max_bytes=1000
+    )
+    entries = [aggregator.add(f"TXN_{i}", b"x" * 100) for i in range(30)]
+    entries = [entry for entry in entries if entry] + aggregator.flush()
+
+    assert all(len(entry["Data"]) <= 1000 for entry in entries)
+    assert sum(len(deaggregate(entry["Data"])) for entry in entries) == 30
+    assert entries[0]["PartitionKey"] == "TXN_0"
+
+
+@mock_aws
+def test_aggregated_records_land_on_the_shard_of_each_key(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    client = boto3.client("kinesis")
+    client.create_stream(StreamName="transactions", ShardCount=4)
+    records = list(change_records(get_profile("cdc", 1), 2000, START))
+
+    stats = produce(client, "transactions", records, max_bytes=20 * 1024)
+
+    assert stats["user_records"] == 2000 and stats["errors"] == 0
+    assert stats["records"] < 200
+    received = []
+    for shard, shard_data in shard_records(client, "transactions").values():
+        low = int(shard["HashKeyRange"]["StartingHashKey"])
+        high = int(shard["HashKeyRange"]["EndingHashKey"])
+        for data in shard_data:
+            assert is_aggregated(data)
+            for partition_key, user_data in deaggregate(data):
+                assert low <= hash_key(partition_key) <= high
+                received.append((partition_key, user_data))
+    # Every change arrives, and the changes of a key keep their order
+    assert sorted(received) == sorted(records)
+    for key in {key for key, _ in records[:50]}:
+        assert [d for k, d in received if k == key] == [
+            d for k, d in records if k == key
+        ]
+
+
+@mock_aws
+def test_single_record_puts_without_aggregation(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    client = boto3.client("kinesis")
+    client.create_stream(StreamName="transactions", ShardCount=1)
+    records = list(change_records(get_profile("uniform", 1), 600, START))
+
+    stats = produce(client, "transactions", records, aggregate=False)
+
+    assert stats["records"] == 600 and stats["calls"] == 2
@@ -0,0 +1,57 @@
+import hashlib
+import os
+import sys
+
+sys.path.append(
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "lambda",
+        "shared",
+        "python",
+    )
+)
+from kpl import MAGIC, AggregatedRecord, aggregate, deaggregate, is_aggregated
+
+RECORDS = [
+    ("TXN_1", b'{"eventName": "INSERT"}'),
+    ("TXN_2", b"x" * 300),
+    ("TXN_1", b'{"eventName": "MODIFY"}'),
+    ("TXN_é", b""),
+]
+
+
+def test_round_trip_keeps_keys_and_order():
+    payload = aggregate(RECORDS)
+
+    assert is_aggregated(payload)
+    assert deaggregate(payload) == RECORDS
+
+
+def test_plain_and_corrupted_records_are_not_aggregates():
+    payload = aggregate(RECORDS)
+
+    assert not is_aggregated(b'{"eventName": "INSERT"}')
+    assert not is_aggregated(MAGIC)
+    assert not is_aggregated(payload[:-1] + bytes([payload[-1] ^ 1]))
+
+
+def test_size_is_known_before_adding():
+    aggregated = AggregatedRecord()
+    for partition_key, data in RECORDS * 50:
+        expected = aggregated.size + aggregated.encoded_size(partition_key, data)
+        aggregated.add(partition_key, data)
+        assert aggregated.size == expected
+
+    assert len(aggregated) == 200
+    assert len(aggregated.payload()) == aggregated.size
+
+
+def test_explicit_hash_keys_and_tags_are_skipped():
+    # partition_key_table "k", explicit_hash_key_table "1", and one record with
+    # an explicit hash key index and a tag
+    record = b"\x08\x00\x10\x00\x1a\x02hi\x22\x03\x0a\x01t"
+    message = b"\x0a\x01k" + b"\x12\x011" + b"\x1a" + bytes([len(record)]) + record
+    payload = MAGIC + message + hashlib.md5(message).digest()
+
+    assert is_aggregated(payload)
+    assert deaggregate(payload) == [("k", b"hi")]
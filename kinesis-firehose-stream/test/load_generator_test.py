@@ -0,0 +1,115 @@
+import os
+import sys
+import time
+import pytest
+
+np = pytest.importorskip("numpy")
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+)
+from create_sample_data import CreateSampleData
+from load_generator import TokenBucket, generate_block, summarize, target_rate
+
+
+def test_generate_block_matches_sample_data_columns():
+    now_ms = 1_700_000_000_000
+    items = generate_block(np.random.default_rng(7), 50, now_ms)
+
+    assert len(items) == 50
+    expected = set(
+        CreateSampleData.generate_transaction(
+            CreateSampleData.generate_timestamps(1)[0]
+        )
+    )
+    for item in items:
+        assert set(item) == expected
+        assert now_ms <= int(item["timestamp"]["N"]) < now_ms + 1000
+        assert item["date"] == {"S": "2023-11-14"}
+        assert item["hour"] == {"N": "22"}
+        assert item["minute"] == {"N": "13"}
+        assert len(item["amount"]["N"].split(".")[1]) == 2
+
+
+def test_generate_block_is_reproducible_for_a_seed():
+    first = generate_block(np.random.default_rng(3), 10, 0)
+    second = generate_block(np.random.default_rng(3), 10, 0)
+    assert first == second
+
+
+def test_rate_profile_ramps_then_holds():
+    assert target_rate(5, 1000, 10) == 500
+    assert target_rate(10, 1000, 10) == 1000
+    assert target_rate(5, 1000, 0) == 1000
+
+
+def test_token_bucket_paces_acquisitions():
+    bucket = TokenBucket(rate=1000)
+    started = time.monotonic()
+    bucket.acquire(25)
+    bucket.acquire(25)
+    # The bucket starts empty, so two batches of 25 at 1000 tokens/sec take 50 ms
+    assert time.monotonic() - started >= 0.045
+
+
+def test_worker_writes_against_moto():
+    moto = pytest.importorskip("moto")
+    from load_generator import run_worker
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    config = {
+        "table": "financial-transactions",
+        "target_tps": 500,
+        "duration": 0.5,
+        "ramp": 0,
+        "workers": 1,
+        "block_size": 100,
+        "customer_base": 1000,
+        "customer_skew": 1.2,
+        "merchant_skew": 0.0,
+        "seed": 1,
+        "region": "us-east-1",
+        "endpoint_url": None,
+        "create_table": True,
+        "moto": True,
+    }
+    with moto.mock_aws():
+        stats = run_worker(config, 0)
+
+    assert stats["written"] > 0
+    assert stats["errors"] == 0
+    report = summarize([stats], stats["elapsed"])
+    assert report["written"] == stats["written"]
+    assert report["latency_p50_ms"] <= report["latency_p99_ms"]
+
+
+def test_zipf_weights_concentrate_on_low_ranks():
+    from load_generator import draw_ids, zipf_weights
+
+    ids = draw_ids(np.random.default_rng(0), 10_000, 1000, zipf_weights(1000, 1.2))
+    assert ids.min() >= 1 and ids.max() <= 1000
+    # Rank 1 alone takes well over the uniform 0.1% share
+    assert (ids == 1).mean() > 0.1
+
+
+def test_worker_errors_reach_main(monkeypatch):
+    from botocore.exceptions import EndpointConnectionError
+    from load_generator import main
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    # Nothing listens on the endpoint, as when DynamoDB Local is not running
+    started = time.monotonic()
+    with pytest.raises(EndpointConnectionError):
+        main(
+            [
+                "--endpoint-url",
+                "http://127.0.0.1:9",
+                "--duration",
+                "1",
+                "--workers",
+                "2",
+            ]
+        )
+    assert time.monotonic() - started < 30
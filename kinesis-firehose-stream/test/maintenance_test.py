@@ -0,0 +1,246 @@
+import dataclasses
+import gzip
+import io
+import json
+import os
+import sys
+import pytest
+import boto3
+from aws_cdk import App
+from aws_cdk.assertions import Match, Template
+from botocore.stub import Stubber
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+from maintenance import (
+    COMPACTION,
+    SNAPSHOT_MANAGEMENT,
+    UNREFERENCED_FILE_REMOVAL,
+    apply_maintenance,
+    read_table_metadata,
+    table_stats,
+)
+from stack.maintenance import get_table_maintenance_settings
+from stack.pipeline import PipelineStack
+
+TABLE_BUCKET_ARN = "arn:aws:s3tables:us-east-1:123456789012:bucket/streamtablebucket"
+TABLE = {"tableBucketARN": TABLE_BUCKET_ARN, "namespace": "analytics", "name": "t"}
+SETTINGS = dataclasses.asdict(
+    get_table_maintenance_settings({"target_file_size_mb": 256})
+)
+
+
+def configuration(status, settings_type, settings):
+    return {"status": status, "settings": {settings_type: settings}}
+
+
+def snapshot(snapshot_id, parent_id, timestamp_ms, operation, **summary):
+    return {
+        "snapshot-id": snapshot_id,
+        "parent-snapshot-id": parent_id,
+        "timestamp-ms": timestamp_ms,
+        "summary": {"operation": operation, **summary},
+    }
+
+
+def test_settings_are_validated():
+    with pytest.raises(ValueError, match="Unknown table_maintenance settings"):
+        get_table_maintenance_settings({"target_file_size": 512})
+    with pytest.raises(ValueError, match="target_file_size_mb"):
+        get_table_maintenance_settings({"target_file_size_mb": 1024})
+    with pytest.raises(ValueError, match="compaction_strategy"):
+        get_table_maintenance_settings({"compaction_strategy": "zorder"})
+
+
+def test_apply_only_updates_configurations_that_differ():
+    s3tables = boto3.client("s3tables", region_name="us-east-1")
+    with Stubber(s3tables) as stubber:
+        stubber.add_response(
+            "get_table_maintenance_configuration",
+            {
+                "tableARN": f"{TABLE_BUCKET_ARN}/table/1",
+                "configuration": {
+                    # Service default, so the compaction target is changed
+                    COMPACTION: configuration(
+                        "enabled", COMPACTION, {"targetFileSizeMB": 512}
+                    ),
+                    # Already set; the extra setting returned is not compared
+                    SNAPSHOT_MANAGEMENT: configuration(
+                        "enabled",
+                        SNAPSHOT_MANAGEMENT,
+                        {"minSnapshotsToKeep": 1, "maxSnapshotAgeHours": 120},
+                    ),
+                },
+            },
+            TABLE,
+        )
+        stubber.add_response(
+            "put_table_maintenance_configuration",
+            {},
+            dict(
+                TABLE,
+                type=COMPACTION,
+                value=configuration("enabled", COMPACTION, {"targetFileSizeMB": 256}),
+            ),
+        )
+        stubber.add_response(
+            "get_table_bucket_maintenance_configuration",
+            {
+                "tableBucketARN": TABLE_BUCKET_ARN,
+                "configuration": {
+                    UNREFERENCED_FILE_REMOVAL: configuration(
+                        "enabled",
+                        UNREFERENCED_FILE_REMOVAL,
+                        {"unreferencedDays": 3, "nonCurrentDays": 10},
+                    )
+                },
+            },
+            {"tableBucketARN": TABLE_BUCKET_ARN},
+        )
+
+        changed = apply_maintenance(s3tables, *TABLE.values(), SETTINGS)
+
+    assert changed == [COMPACTION]
+
+
+def test_read_table_metadata_decompresses_gzip_metadata():
+    location = "s3://warehouse--table-s3/metadata/00001-abc.gz.metadata.json"
+    s3tables = boto3.client("s3tables", region_name="us-east-1")
+    s3 = boto3.client("s3", region_name="us-east-1")
+    with Stubber(s3tables) as s3tables_stubber, Stubber(s3) as s3_stubber:
+        s3tables_stubber.add_response(
+            "get_table_metadata_location",
+            {
+                "versionToken": "v1",
+                "metadataLocation": location,
+                "warehouseLocation": "s3://warehouse--table-s3",
+            },
+            TABLE,
+        )
+        s3_stubber.add_response(
+            "get_object",
+            {"Body": io.BytesIO(gzip.compress(b'{"format-version": 2}'))},
+            {
+                "Bucket": "warehouse--table-s3",
+                "Key": "metadata/00001-abc.gz.metadata.json",
+            },
+        )
+        metadata = read_table_metadata(s3tables, s3, *TABLE.values())
+
+    assert metadata == {"format-version": 2}
+
+
+def test_table_stats_compare_the_last_compaction_with_its_parent():
+    metadata = {
+        "current-snapshot-id": 4,
+        "snapshots": [
+            snapshot(1, None, 1000, "append", **{"total-data-files": "10"}),
+            snapshot(
+                2,
+                1,
+                2000,
+                "overwrite",
+                **{
+                    "total-data-files": "40",
+                    "total-delete-files": "20",
+                    "total-files-size": "6000",
+                    "total-records": "900",
+                },
+            ),
+            snapshot(
+                3,
+                2,
+                3000,
+                "replace",
+                **{
+                    "total-data-files": "2",
+                    "total-delete-files": "0",
+                    "total-files-size": "4000",
+                    "total-records": "800",
+                },
+            ),
+            snapshot(
+                4,
+                3,
+                4000,
+                "append",
+                **{"total-data-files": "3", "total-files-size": "4300"},
+            ),
+        ],
+    }
+
+    stats = table_stats(metadata)
+
+    assert stats["current"]["data_files"] == 3
+    assert stats["current"]["avg_file_bytes"] == 1433
+    compaction = stats["last_compaction"]
+    assert compaction["snapshot_id"] == 3
+    assert compaction["before"]["data_files"] == 40
+    assert compaction["before"]["delete_files"] == 20
+    assert compaction["before"]["avg_file_bytes"] == 100
+    assert compaction["after"]["avg_file_bytes"] == 2000
+    assert table_stats(None) == {"current": None, "last_compaction": None}
+
+
+def synth_pipeline_stack(**context):
+    app = App(
+        context={
+            "table_bucket_name": "streamtablebucket",
+            "table_name": "transactions",
+            "namespace": "analytics",
+            "bucket_name": "streambucket",
+            "stream_type": "dynamodb",
+            **context,
+        }
+    )
+    return Template.from_stack(PipelineStack(app, "PipelineStack"))
+
+
+def test_pipeline_schedules_the_maintenance_lambda():
+    template = synth_pipeline_stack(
+        table_maintenance={"schedule_hours": 6, "target_file_size_mb": 256}
+    )
+
+    template.has_resource_properties(
+        "AWS::Events::Rule", {"ScheduleExpression": "rate(6 hours)"}
+    )
+    function = template.find_resources(
+        "AWS::Lambda::Function",
+        {"Properties": {"Environment": {"Variables": {"TABLE_NAME": "transactions"}}}},
+    )
+    (properties,) = [resource["Properties"] for resource in function.values()]
+    variables = properties["Environment"]["Variables"]
+    assert variables["NAMESPACE"] == "analytics"
+    assert json.loads(variables["MAINTENANCE_SETTINGS"])["target_file_size_mb"] == 256
+    template.has_resource_properties(
+        "AWS::IAM::Policy",
+        {
+            "PolicyDocument": {
+                "Statement": Match.array_with(
+                    [
+                        Match.object_like(
+                            {
+                                "Action": Match.array_with(
+                                    ["s3tables:PutTableMaintenanceConfiguration"]
+                                ),
+                                # Only the maintained table, whatever its id
+                                "Condition": {
+                                    "StringEquals": {
+                                        "s3tables:namespace": "analytics",
+                                        "s3tables:tableName": "transactions",
+                                    }
+                                },
+                            }
+                        )
+                    ]
+                )
+            }
+        },
+    )
+
+
+def test_maintenance_lambda_can_be_disabled():
+    template = synth_pipeline_stack(table_maintenance={"enabled": False})
+
+    template.resource_count_is("AWS::Events::Rule", 0)
@@ -0,0 +1,345 @@
+import importlib.util
+import json
+import os
+import random
+import sys
+from decimal import Decimal
+import pytest
+from aws_cdk import App
+from aws_cdk.assertions import Match, Template
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+sys.path.append(os.path.join(PROJECT_ROOT, "scripts"))
+from create_sample_orders import create_sample_order
+from ddb_decoder import build_decode_plan, decode_image
+from explode import build_explode_plan, explode, split_image
+from harness.events import to_attribute_values
+from iceberg_metadata import new_table_metadata, updated_table_metadata
+from stack.firehose import FirehoseStack
+from stack.pipeline import PipelineStack
+from stack.table_routes import get_table_routing_settings
+from table_spec import (
+    athena_ddl,
+    definition_path,
+    load_table_definition,
+    partition_spec,
+    schema_fields,
+    table_metadata,
+)
+
+LAMBDA_PATH = os.path.join(PROJECT_ROOT, "lambda", "firehose", "index.py")
+
+ORDERS = load_table_definition(definition_path("orders.json"))
+ORDER_FIELDS = schema_fields(ORDERS)
+
+EXPLODE = {
+    "attribute": "items",
+    "table_name": "order_items",
+    "definition": "order_items.json",
+    "index_column": "itemIndex",
+}
+ORDER_ROUTES = [
+    {
+        "source_table": "orders",
+        "table_name": "orders",
+        "definition": "orders.json",
+        "unique_keys": ["orderId"],
+        "explode": EXPLODE,
+    }
+]
+
+CONTEXT = {
+    "table_bucket_name": "streamtablebucket",
+    "table_name": "orders",
+    "namespace": "analytics",
+    "bucket_name": "streambucket",
+    "stream_type": "dynamodb",
+    "table_routes": ORDER_ROUTES,
+}
+
+
+def order_image(seed=1):
+    return to_attribute_values(create_sample_order(random.Random(seed)))
+
+
+def test_nested_columns_are_decoded_to_their_iceberg_types():
+    image = order_image()
+    image["items"]["L"][0]["M"]["giftWrap"] = {"BOOL": True}
+
+    item = decode_image(image, build_decode_plan(ORDER_FIELDS))
+
+    first = item["items"][0]
+    # Struct members that are not in the schema are left out
+    assert first.keys() == {"productId", "category", "price", "quantity"}
+    assert isinstance(first["price"], Decimal) and first["price"].as_tuple()[2] == -2
+    assert isinstance(first["quantity"], int)
+    assert len(item["items"]) == len(image["items"]["L"])
+
+
+def test_null_and_set_values_fill_nested_columns():
+    plan = build_decode_plan(
+        [
+            {"name": "tags", "type": {"type": "list", "element": "string"}},
+            {
+                "name": "counts",
+                "type": {"type": "map", "key": "string", "value": "int"},
+            },
+            {"name": "items", "type": ORDER_FIELDS[-1]["type"]},
+        ]
+    )
+
+    item = decode_image(
+        {
+            "tags": {"SS": ["a", "b"]},
+            "counts": {"M": {"x": {"N": "1"}, "y": {"NULL": True}}},
+            "items": {"NULL": True},
+        },
+        plan,
+    )
+
+    assert item == {"tags": ["a", "b"], "counts": {"x": 1, "y": None}, "items": None}
+
+
+def test_nested_columns_use_schema_v2():
+    iceberg = table_metadata(ORDERS)["iceberg"]
+
+    assert "schema" not in iceberg
+    assert iceberg["schemaV2"]["type"] == "struct"
+    assert all("required" in field for field in iceberg["schemaV2"]["fields"])
+    ddl = athena_ddl(ORDERS, "analytics", "orders", "s3://bucket/orders")
+    assert (
+        "`items` ARRAY<STRUCT<productId:STRING, category:STRING, "
+        "price:DECIMAL(12,2), quantity:INT>>" in ddl
+    )
+    with pytest.raises(ValueError, match="nested column"):
+        partition_spec(ORDER_FIELDS, ["items"])
+
+
+def test_nested_field_ids_count_towards_the_last_column_id():
+    iceberg = table_metadata(ORDERS)["iceberg"]
+    metadata = new_table_metadata(iceberg, "s3://bucket/orders")
+    assert metadata["last-column-id"] == 15
+
+    element = ORDER_FIELDS[-1]["type"]["element"]
+    changed = json.loads(json.dumps(iceberg))
+    changed["schemaV2"]["fields"][-1]["type"] = dict(
+        element, type="struct", fields=element["fields"][:2]
+    )
+    with pytest.raises(ValueError, match="cannot change its type"):
+        updated_table_metadata(metadata, changed, "s3://bucket/orders/metadata")
+
+
+def test_items_are_exploded_into_child_rows():
+    plan = build_explode_plan(EXPLODE, ORDER_FIELDS)
+    image = order_image()
+
+    parent, elements = split_image(image, plan)
+    item = decode_image(parent, build_decode_plan(ORDER_FIELDS))
+    rows = explode(item, elements, plan)
+
+    # orders.json has an items column, so the parent row keeps the list
+    assert parent is image and len(item["items"]) == len(elements)
+    assert [row["itemIndex"] for row in rows] == list(range(len(elements)))
+    assert {row["orderId"] for row in rows} == {item["orderId"]}
+    assert rows[0].keys() == {
+        "orderId",
+        "itemIndex",
+        "productId",
+        "category",
+        "price",
+        "quantity",
+        "customerId",
+        "timestamp",
+    }
+
+
+def test_attribute_is_left_out_of_a_parent_without_the_column():
+    fields = [field for field in ORDER_FIELDS if field["name"] != "items"]
+    plan = build_explode_plan(EXPLODE, fields)
+    image = order_image()
+    image["items"]["L"].insert(1, {"S": "not an item"})
+
+    parent, elements = split_image(image, plan)
+    rows = explode(decode_image(parent, build_decode_plan(fields)), elements, plan)
+
+    assert "items" not in parent and "items" in image
+    assert elements is image["items"]["L"]
+    # Elements that are not maps are skipped and keep their position
+    assert [row["itemIndex"] for row in rows] == [
+        i for i in range(len(elements)) if i != 1
+    ]
+
+
+def test_explode_settings_are_validated():
+    with pytest.raises(ValueError, match="needs stream_type dynamodb"):
+        get_table_routing_settings(ORDER_ROUTES, "orders", "kinesis")
+    with pytest.raises(ValueError, match="Unknown explode settings"):
+        get_table_routing_settings(
+            [dict(ORDER_ROUTES[0], explode=dict(EXPLODE, column="items"))],
+            "orders",
+            "dynamodb",
+        )
+    with pytest.raises(ValueError, match="int or long column"):
+        get_table_routing_settings(
+            [dict(ORDER_ROUTES[0], explode=dict(EXPLODE, index_column="productId"))],
+            "orders",
+            "dynamodb",
+        )
+    with pytest.raises(ValueError, match="cannot be exploded"):
+        get_table_routing_settings(
+            [dict(ORDER_ROUTES[0], explode=dict(EXPLODE, attribute="region"))],
+            "orders",
+            "dynamodb",
+        )
+
+    settings = get_table_routing_settings(ORDER_ROUTES, "orders", "dynamodb")
+    assert settings.destinations() == [
+        ("orders", ("orderId",)),
+        ("order_items", ("orderId", "itemIndex")),
+    ]
+    assert [table["table_name"] for table in settings.resource_properties()] == [
+        "orders",
+        "order_items",
+    ]
+
+
+class StubFirehoseClient:
+    def __init__(self):
+        self.calls = []
+
+    def put_record_batch(self, DeliveryStreamName, Records):
+        self.calls.append(Records)
+        responses = [{"RecordId": str(i)} for i in range(len(Records))]
+        return {"FailedPutCount": 0, "RequestResponses": responses}
+
+
+def test_forwarder_sends_the_order_and_its_items(monkeypatch, capsys):
+    settings = get_table_routing_settings(ORDER_ROUTES, "orders", "dynamodb")
+    monkeypatch.setenv("FIREHOSE_DELIVERY_STREAM", "test-stream")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("TABLE_ROUTES", json.dumps(settings.environment()))
+    spec = importlib.util.spec_from_file_location("firehose_index", LAMBDA_PATH)
+    forwarder = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(forwarder)
+    forwarder.firehose_client = client = StubFirehoseClient()
+    image = order_image()
+    event = {
+        "Records": [
+            {
+                "eventName": "INSERT",
+                "dynamodb": {"SequenceNumber": "1", "NewImage": image},
+            }
+        ]
+    }
+
+    response = forwarder.handler(event, None)
+
+    assert response == {"batchItemFailures": []}
+    (records,) = client.calls
+    rows = [json.loads(record["Data"]) for record in records]
+    assert len(rows) == 1 + len(image["items"]["L"])
+    assert rows[0]["items"][0]["price"] == rows[1]["price"]
+    assert [row["itemIndex"] for row in rows[1:]] == list(range(len(rows) - 1))
+    summary = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert summary["rows_exploded"] == len(rows) - 1
+    # One stream record, sent as the order row and its item rows
+    assert summary["records_sent"] == 1
+    assert summary["rows_sent"] == len(rows)
+
+
+def test_shortened_and_removed_orders_delete_their_item_rows(monkeypatch):
+    settings = get_table_routing_settings(ORDER_ROUTES, "orders", "dynamodb")
+    monkeypatch.setenv("FIREHOSE_DELIVERY_STREAM", "test-stream")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("TABLE_ROUTES", json.dumps(settings.environment()))
+    spec = importlib.util.spec_from_file_location("firehose_index", LAMBDA_PATH)
+    forwarder = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(forwarder)
+    forwarder.firehose_client = client = StubFirehoseClient()
+    old_image = order_image()
+    while len(old_image["items"]["L"]) < 3:
+        old_image["items"]["L"].append(old_image["items"]["L"][0])
+    new_image = json.loads(json.dumps(old_image))
+    del new_image["items"]["L"][1:]
+    new_image["items"]["L"][0]["M"]["category"] = {"S": "moved"}
+    event = {
+        "Records": [
+            {
+                "eventName": "MODIFY",
+                "dynamodb": {
+                    "SequenceNumber": "1",
+                    "OldImage": old_image,
+                    "NewImage": new_image,
+                },
+            },
+            {
+                "eventName": "REMOVE",
+                "dynamodb": {"SequenceNumber": "2", "OldImage": new_image},
+            },
+        ]
+    }
+
+    assert forwarder.handler(event, None) == {"batchItemFailures": []}
+
+    (records,) = client.calls
+    rows = [json.loads(record["Data"]) for record in records]
+    operations = [(row.get("_operation"), row.get("itemIndex")) for row in rows]
+    old_count = len(old_image["items"]["L"])
+    # The MODIFY deletes every old item first: item 0 moved to another
+    # category partition and the others are past the end of the new list
+    assert operations == [
+        *(("delete", index) for index in range(old_count)),
+        (None, None),
+        (None, 0),
+        ("delete", None),
+        ("delete", 0),
+    ]
+    assert rows[0]["category"] == old_image["items"]["L"][0]["M"]["category"]["S"]
+    assert {row["orderId"] for row in rows} == {rows[0]["orderId"]}
+
+
+def test_delivery_stream_routes_items_to_the_child_table():
+    template = Template.from_stack(FirehoseStack(App(context=CONTEXT), "FirehoseStack"))
+
+    template.has_resource_properties(
+        "AWS::KinesisFirehose::DeliveryStream",
+        {
+            "IcebergDestinationConfiguration": Match.object_like(
+                {
+                    "DestinationTableConfigurationList": [
+                        Match.object_like({"DestinationTableName": "orders"}),
+                        Match.object_like(
+                            {
+                                "DestinationTableName": "order_items",
+                                "UniqueKeys": ["orderId", "itemIndex"],
+                            }
+                        ),
+                    ],
+                    "ProcessingConfiguration": {
+                        "Enabled": True,
+                        "Processors": [
+                            Match.object_like({"Type": "MetadataExtraction"})
+                        ],
+                    },
+                }
+            )
+        },
+    )
+    (stream,) = template.find_resources("AWS::KinesisFirehose::DeliveryStream").values()
+    assert 'if has(\\"itemIndex\\") then \\"order_items\\"' in json.dumps(stream)
+    assert 'operation: (._operation // \\"update\\")' in json.dumps(stream)
+
+    # The pipeline streams the route's source table, keyed on its unique keys
+    pipeline = Template.from_stack(PipelineStack(App(context=CONTEXT), "PipelineStack"))
+    pipeline.has_resource_properties(
+        "AWS::DynamoDB::Table",
+        {
+            "TableName": "orders",
+            "KeySchema": [{"AttributeName": "orderId", "KeyType": "HASH"}],
+            "StreamSpecification": {"StreamViewType": "NEW_AND_OLD_IMAGES"},
+        },
+    )
+    (resource,) = pipeline.find_resources("Custom::AWS").values()
+    assert "order_items.json" in json.dumps(resource["Properties"]["Create"])
@@ -0,0 +1,65 @@
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "lambda",
+        "shared",
+        "python",
+    )
+)
+from partitions import (
+    civil_date,
+    epoch_day,
+    murmur3_32,
+    partition_fields,
+    partition_transform,
+)
+
+
+def test_partition_fields_match_utc_datetime():
+    rng = random.Random(42)
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    for _ in range(10_000):
+        millis = rng.randint(-(10**12), 5 * 10**12)
+        dt = epoch + timedelta(milliseconds=millis)
+        assert partition_fields(millis) == (dt.strftime("%Y-%m-%d"), dt.hour, dt.minute)
+
+
+def test_leap_day_and_year_boundaries():
+    assert partition_fields(951782400000) == ("2000-02-29", 0, 0)
+    assert partition_fields(1704067199999) == ("2023-12-31", 23, 59)
+    assert partition_fields(1704067200000) == ("2024-01-01", 0, 0)
+
+
+def test_epoch_day_is_the_inverse_of_civil_date():
+    rng = random.Random(7)
+    for days in [
+        0,
+        -1,
+        59,
+        11016,
+        *(rng.randrange(-700000, 700000) for _ in range(500)),
+    ]:
+        date = datetime(1970, 1, 1) + timedelta(days=days)
+        assert epoch_day(date.year, date.month, date.day) == days
+        assert civil_date(days) == date.date().isoformat()
+
+
+def test_bucket_transform_matches_iceberg_hashes():
+    # Hash values from the Iceberg spec's appendix
+    assert murmur3_32((34).to_bytes(8, "little")) == 2017239379
+    assert murmur3_32("iceberg".encode()) == 1210000089
+    bucket = partition_transform("bucket[16]", "long")
+    assert bucket(34) == 2017239379 % 16
+    assert partition_transform("bucket[16]", "string")("iceberg") == 1210000089 % 16
+
+
+def test_date_transforms_keep_a_prefix_of_the_date():
+    assert partition_transform("identity", "date")("2023-11-14") == "2023-11-14"
+    assert partition_transform("month", "date")("2023-11-14") == "2023-11"
+    assert partition_transform("year", "date")("2023-11-14") == "2023"
+    assert partition_transform("truncate[3]", "string")("CUST_1") == "CUS"
@@ -0,0 +1,231 @@
+import dataclasses
+import json
+import os
+import sys
+import pytest
+from aws_cdk import App
+from aws_cdk.assertions import Match, Template
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from stack.cold_start import get_cold_start_settings
+from stack.event_source import get_stream_event_source_settings
+from stack.firehose import FirehoseStack
+from stack.profiles import DEPLOYMENT_PROFILES, get_deployment_profile
+
+
+def synth_firehose_stack(stream_type, profile_name, **context):
+    app = App(
+        context={
+            "table_bucket_name": "streamtablebucket",
+            "table_name": "transactions",
+            "namespace": "analytics",
+            "bucket_name": "streambucket",
+            "stream_type": stream_type,
+            "deployment_profile": profile_name,
+            **context,
+        }
+    )
+    return Template.from_stack(FirehoseStack(app, "FirehoseStack"))
+
+
+@pytest.mark.parametrize("profile_name", sorted(DEPLOYMENT_PROFILES))
+def test_profiles_are_within_service_limits(profile_name):
+    get_deployment_profile(profile_name)
+
+
+def test_unknown_profile_is_rejected():
+    with pytest.raises(ValueError, match="Unknown deployment_profile"):
+        get_deployment_profile("turbo")
+
+
+def test_out_of_range_setting_is_rejected():
+    profile = dataclasses.replace(
+        DEPLOYMENT_PROFILES["bulk"], destination_buffer_size_mb=256
+    )
+    with pytest.raises(ValueError, match="destination_buffer_size_mb"):
+        profile.validate()
+
+
+@pytest.mark.parametrize("profile_name", sorted(DEPLOYMENT_PROFILES))
+def test_kinesis_stack_applies_profile(profile_name):
+    profile = DEPLOYMENT_PROFILES[profile_name]
+    template = synth_firehose_stack("kinesis", profile_name)
+
+    template.has_resource_properties(
+        "AWS::KinesisFirehose::DeliveryStream",
+        {
+            "IcebergDestinationConfiguration": Match.object_like(
+                {
+                    "BufferingHints": {
+                        "IntervalInSeconds": profile.destination_buffer_interval_seconds,
+                        "SizeInMBs": profile.destination_buffer_size_mb,
+                    },
+                    "ProcessingConfiguration": {
+                        "Enabled": True,
+                        "Processors": [
+                            Match.object_like(
+                                {
+                                    "Parameters": Match.array_with(
+                                        [
+                                            {
+                                                "ParameterName": "BufferSizeInMBs",
+                                                "ParameterValue": str(
+                                                    profile.processor_buffer_size_mb
+                                                ),
+                                            },
+                                            {
+                                                "ParameterName": "BufferIntervalInSeconds",
+                                                "ParameterValue": str(
+                                                    profile.processor_buffer_interval_seconds
+                                                ),
+                                            },
+                                        ]
+                                    )
+                                }
+                            )
+                        ],
+                    },
+                }
+            )
+        },
+    )
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "MemorySize": profile.lambda_memory_mb,
+            "Timeout": profile.lambda_timeout_seconds,
+        },
+    )
+
+
+@pytest.mark.parametrize("profile_name", sorted(DEPLOYMENT_PROFILES))
+def test_dynamodb_stack_applies_profile(profile_name):
+    profile = DEPLOYMENT_PROFILES[profile_name]
+    template = synth_firehose_stack("dynamodb", profile_name)
+
+    template.has_resource_properties(
+        "AWS::KinesisFirehose::DeliveryStream",
+        {
+            "IcebergDestinationConfiguration": Match.object_like(
+                {
+                    "BufferingHints": {
+                        "IntervalInSeconds": profile.destination_buffer_interval_seconds,
+                        "SizeInMBs": profile.destination_buffer_size_mb,
+                    }
+                }
+            )
+        },
+    )
+    template.has_resource_properties(
+        "AWS::Lambda::EventSourceMapping",
+        {"BatchSize": profile.event_source_batch_size},
+    )
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "MemorySize": profile.lambda_memory_mb,
+            "Timeout": profile.lambda_timeout_seconds,
+        },
+    )
+
+
+def test_stream_event_source_settings_come_from_context():
+    template = synth_firehose_stack(
+        "dynamodb",
+        "balanced",
+        stream_event_source={
+            "parallelization_factor": 4,
+            "max_batching_window_seconds": 5,
+            "bisect_batch_on_error": True,
+            "report_batch_item_failures": True,
+            "maximum_retry_attempts": 3,
+            "on_failure_destination": True,
+        },
+    )
+
+    template.has_resource_properties(
+        "AWS::Lambda::EventSourceMapping",
+        {
+            "ParallelizationFactor": 4,
+            "MaximumBatchingWindowInSeconds": 5,
+            "BisectBatchOnFunctionError": True,
+            "FunctionResponseTypes": ["ReportBatchItemFailures"],
+            "MaximumRetryAttempts": 3,
+            "DestinationConfig": {
+                "OnFailure": {"Destination": Match.any_value()}
+            },
+        },
+    )
+    template.resource_count_is("AWS::SQS::Queue", 1)
+
+
+def test_invalid_stream_event_source_settings_are_rejected():
+    with pytest.raises(ValueError, match="parallelization_factor"):
+        get_stream_event_source_settings({"parallelization_factor": 11})
+    with pytest.raises(ValueError, match="Unknown stream_event_source"):
+        get_stream_event_source_settings({"batch_size": 10})
+
+
+@pytest.mark.parametrize(
+    "stream_type, invoker",
+    [
+        ("kinesis", "AWS::KinesisFirehose::DeliveryStream"),
+        ("dynamodb", "AWS::Lambda::EventSourceMapping"),
+    ],
+)
+def test_snap_start_invokes_a_published_alias(stream_type, invoker):
+    template = synth_firehose_stack(
+        stream_type, "balanced", lambda_cold_start={"snap_start": True}
+    )
+
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {"SnapStart": {"ApplyOn": "PublishedVersions"}},
+    )
+    aliases = template.find_resources("AWS::Lambda::Alias")
+    assert len(aliases) == 1
+    # The stream Lambda is invoked through the alias, not $LATEST
+    (alias_id,) = aliases
+    (invoker_resource,) = template.find_resources(invoker).values()
+    assert alias_id in json.dumps(invoker_resource["Properties"])
+
+
+def test_provisioned_concurrency_is_set_on_the_alias():
+    template = synth_firehose_stack(
+        "dynamodb", "balanced", lambda_cold_start={"provisioned_concurrency": 2}
+    )
+
+    template.has_resource_properties(
+        "AWS::Lambda::Alias",
+        {"ProvisionedConcurrencyConfig": {"ProvisionedConcurrentExecutions": 2}},
+    )
+
+
+def test_cold_start_defaults_keep_latest():
+    template = synth_firehose_stack("dynamodb", "balanced")
+    template.resource_count_is("AWS::Lambda::Alias", 0)
+
+
+def test_invalid_cold_start_settings_are_rejected():
+    with pytest.raises(ValueError, match="cannot be used together"):
+        get_cold_start_settings({"snap_start": True, "provisioned_concurrency": 1})
+    with pytest.raises(ValueError, match="Unknown lambda_cold_start"):
+        get_cold_start_settings({"snapstart": True})
+
+
+@pytest.mark.parametrize("collapse_updates", [False, True])
+def test_collapse_updates_reaches_the_transform_lambda(collapse_updates):
+    template = synth_firehose_stack(
+        "kinesis", "balanced", collapse_updates=collapse_updates
+    )
+
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Environment": {
+                "Variables": Match.object_like(
+                    {"COLLAPSE_UPDATES": str(collapse_updates).lower()}
+                )
+            }
+        },
+    )
@@ -0,0 +1,117 @@
+import os
+import sys
+import pytest
+
+pytest.importorskip("pyiceberg")
+pytest.importorskip("pyarrow")
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from harness.buffering import Buffer
+from harness.replay import load_context, replay
+from harness.warehouse import LocalWarehouse
+
+# 30 second destination buffer, so a slow source produces several commits
+LOW_LATENCY_CONTEXT = dict(load_context(), deployment_profile="low-latency")
+
+
+def test_buffer_flushes_on_size_count_and_interval():
+    buffer = Buffer(size_bytes=100, interval_seconds=1, max_records=3)
+    assert buffer.add("a", 60, 0) is None
+    assert buffer.add("b", 60, 10) == ["a", "b"]
+
+    buffer.add("c", 1, 20)
+    buffer.add("d", 1, 30)
+    assert buffer.add("e", 1, 40) == ["c", "d", "e"]
+
+    buffer.add("f", 1, 100)
+    assert not buffer.expired(1099)
+    assert buffer.expired(1100)
+
+
+def test_kinesis_replay_upserts_and_deletes_by_transaction_id(tmp_path):
+    report = replay(
+        "kinesis",
+        str(tmp_path),
+        profile="cdc",
+        count=1500,
+        source_rate=10,
+        context=LOW_LATENCY_CONTEXT,
+    )
+
+    assert report["iceberg_commits"] > 1
+    assert report["lambda_failures"] == 0
+    assert report["checks"]["consistent"], report["checks"]
+    assert report["checks"]["expected_rows"] < 1500
+
+
+def test_kinesis_replay_of_aggregated_records(tmp_path):
+    report = replay(
+        "kinesis",
+        str(tmp_path),
+        profile="cdc",
+        count=1500,
+        source_rate=10,
+        context=LOW_LATENCY_CONTEXT,
+        aggregate=True,
+    )
+
+    assert report["kinesis_records"] < report["stages"]["source"]["records"]
+    assert report["lambda_failures"] == 0
+    assert report["checks"]["consistent"], report["checks"]
+
+
+def test_kinesis_replay_with_collapsed_updates(tmp_path):
+    report = replay(
+        "kinesis",
+        str(tmp_path),
+        profile="cdc",
+        count=1500,
+        context=dict(load_context(), collapse_updates=True),
+    )
+
+    # Fewer changes reach the table, and it still matches the source
+    assert report["stages"]["iceberg"]["records"] < 1500
+    assert report["checks"]["consistent"], report["checks"]
+
+
+def test_dynamodb_replay_of_inserts_matches_source(tmp_path):
+    report = replay(
+        "dynamodb",
+        str(tmp_path),
+        profile="skewed",
+        count=1000,
+        source_rate=10,
+        context=LOW_LATENCY_CONTEXT,
+    )
+
+    assert report["iceberg_commits"] > 1
+    assert report["checks"]["consistent"], report["checks"]
+    for stage in report["stages"].values():
+        assert stage["records"] > 0 and stage["bytes_per_second"] > 0
+
+
+def test_dynamodb_replay_applies_updates_and_deletes(tmp_path):
+    # Direct PUT rows are upserted, and the rows of removed items are deleted
+    report = replay("dynamodb", str(tmp_path), profile="cdc", count=1000)
+
+    assert report["checks"]["consistent"], report["checks"]
+    assert report["checks"]["duplicates"] == 0
+
+
+def test_deletes_apply_within_the_partition_of_the_delete_row(tmp_path):
+    warehouse = LocalWarehouse(str(tmp_path))
+    row = {
+        "transaction_id": "TXN_1",
+        "timestamp": 1709251200000,
+        "customer_id": "CUST_7",
+        "date": "2024-03-01",
+    }
+    warehouse.commit([("update", row), ("update", dict(row, transaction_id="TXN_2"))])
+
+    # A delete without the partition columns, as a keys-only REMOVE would send,
+    # lands in another partition and misses the row
+    warehouse.commit([("delete", {"transaction_id": "TXN_1"})])
+    assert len(warehouse.rows()) == 2
+
+    warehouse.commit([("delete", dict(row))])
+    assert [r["transaction_id"] for r in warehouse.rows()] == ["TXN_2"]
@@ -0,0 +1,32 @@
+import os
+import sys
+from decimal import Decimal
+import pytest
+
+sys.path.append(
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "lambda",
+        "shared",
+        "python",
+    )
+)
+from serializer import BACKENDS, get_serializer
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_decimals_are_written_as_exact_strings(backend):
+    try:
+        serializer = get_serializer(backend)
+    except ImportError:
+        pytest.skip(f"{backend} is not installed")
+
+    data = serializer.dumps(
+        {"amount": Decimal("1234567890.10"), "timestamp": 1700000000123}
+    )
+
+    assert isinstance(data, bytes)
+    assert serializer.loads(data) == {
+        "amount": "1234567890.10",
+        "timestamp": 1700000000123,
+    }
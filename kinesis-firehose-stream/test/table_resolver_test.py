@@ -0,0 +1,214 @@
+import datetime
+import importlib
+import os
+import sys
+import pytest
+import boto3
+from botocore.stub import Stubber
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+from table_resolver import TableResolver, table_bucket_arn_for
+
+REGION = "us-east-1"
+ACCOUNT = "123456789012"
+CREATED_AT = datetime.datetime(2025, 1, 1)
+
+
+def bucket(name):
+    return {
+        "arn": table_bucket_arn_for(REGION, ACCOUNT, name),
+        "name": name,
+        "ownerAccountId": ACCOUNT,
+        "createdAt": CREATED_AT,
+    }
+
+
+def table(bucket_name, namespace, name):
+    return {
+        "namespace": [namespace],
+        "name": name,
+        "type": "customer",
+        "tableARN": f"{table_bucket_arn_for(REGION, ACCOUNT, bucket_name)}/table/{name}",
+        "createdAt": CREATED_AT,
+        "modifiedAt": CREATED_AT,
+    }
+
+
+def add_bucket_pages(stubber, *pages):
+    # One ListTableBuckets response per page, chained by continuation tokens
+    for index, names in enumerate(pages):
+        response = {"tableBuckets": [bucket(name) for name in names]}
+        expected = {}
+        if index + 1 < len(pages):
+            response["continuationToken"] = f"page-{index + 1}"
+        if index:
+            expected["continuationToken"] = f"page-{index}"
+        stubber.add_response("list_table_buckets", response, expected)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def s3tables():
+    client = boto3.client("s3tables", region_name=REGION)
+    with Stubber(client) as stubber:
+        yield client, stubber
+        # Every stubbed response was used, and nothing more was called
+        stubber.assert_no_pending_responses()
+
+
+def test_bucket_arn_is_found_on_a_later_page_and_cached(s3tables):
+    client, stubber = s3tables
+    add_bucket_pages(stubber, ["bucket-a", "bucket-b"], ["streamtablebucket"])
+    resolver = TableResolver(client)
+
+    for _ in range(3):
+        assert resolver.table_bucket_arn("streamtablebucket") == (
+            table_bucket_arn_for(REGION, ACCOUNT, "streamtablebucket")
+        )
+    assert resolver.table_bucket_arn("bucket-a").endswith("bucket/bucket-a")
+
+
+def test_unknown_bucket_is_relisted_once(s3tables):
+    client, stubber = s3tables
+    add_bucket_pages(stubber, ["bucket-a"])
+    add_bucket_pages(stubber, ["bucket-a", "streamtablebucket"])
+    add_bucket_pages(stubber, ["bucket-a", "streamtablebucket"])
+    resolver = TableResolver(client)
+
+    assert resolver.table_bucket_arn("bucket-a")
+    # Created since the first listing
+    assert resolver.table_bucket_arn("streamtablebucket")
+    assert resolver.table_bucket_arn("missing") is None
+
+
+def test_cached_listing_expires_after_the_ttl(s3tables):
+    client, stubber = s3tables
+    add_bucket_pages(stubber, ["streamtablebucket"])
+    add_bucket_pages(stubber, ["streamtablebucket"])
+    clock = FakeClock()
+    resolver = TableResolver(client, ttl_seconds=60, clock=clock)
+
+    resolver.table_bucket_arn("streamtablebucket")
+    clock.now = 59
+    resolver.table_bucket_arn("streamtablebucket")
+    clock.now = 60
+    resolver.table_bucket_arn("streamtablebucket")
+
+
+def test_invalidate_drops_the_cached_listing(s3tables):
+    client, stubber = s3tables
+    add_bucket_pages(stubber, ["streamtablebucket"])
+    add_bucket_pages(stubber, ["bucket-a"])
+    resolver = TableResolver(client)
+
+    assert resolver.table_bucket_arn("streamtablebucket")
+    resolver.invalidate("streamtablebucket")
+    assert resolver.table_bucket_arn("bucket-a")
+
+
+def test_bucket_arn_is_confirmed_directly_when_the_account_is_known(s3tables):
+    client, stubber = s3tables
+    arn = table_bucket_arn_for(REGION, ACCOUNT, "streamtablebucket")
+    stubber.add_response(
+        "get_table_bucket", bucket("streamtablebucket"), {"tableBucketARN": arn}
+    )
+    stubber.add_client_error(
+        "get_table_bucket", "NotFoundException", http_status_code=404
+    )
+    resolver = TableResolver(client, region=REGION, account=ACCOUNT)
+
+    assert resolver.table_bucket_arn("streamtablebucket") == arn
+    assert resolver.table_bucket_arn("streamtablebucket") == arn
+    # A missing bucket is not cached, so it is found once it is created
+    assert resolver.table_bucket_arn("missing") is None
+    assert ("bucket", "missing") not in resolver.cache
+
+
+def test_table_arns_are_listed_once_per_bucket(s3tables):
+    client, stubber = s3tables
+    arn = table_bucket_arn_for(REGION, ACCOUNT, "streamtablebucket")
+    stubber.add_response("get_table_bucket", bucket("streamtablebucket"))
+    stubber.add_response(
+        "list_tables",
+        {
+            "tables": [table("streamtablebucket", "analytics", "transactions")],
+            "continuationToken": "page-1",
+        },
+        {"tableBucketARN": arn},
+    )
+    stubber.add_response(
+        "list_tables",
+        {"tables": [table("streamtablebucket", "analytics", "orders")]},
+        {"tableBucketARN": arn, "continuationToken": "page-1"},
+    )
+    resolver = TableResolver(client, region=REGION, account=ACCOUNT)
+
+    assert resolver.table_arn("streamtablebucket", "analytics", "orders") == (
+        f"{arn}/table/orders"
+    )
+    assert resolver.table_arn("streamtablebucket", "analytics", "transactions")
+    assert set(resolver.tables("streamtablebucket")) == {
+        ("analytics", "transactions"),
+        ("analytics", "orders"),
+    }
+
+
+class CountingS3Tables:
+    # S3 Tables stand-in that records every call
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(**kwargs):
+            self.calls.append(name)
+            return {"arn": kwargs.get("tableBucketARN")}
+
+        return call
+
+
+def test_custom_resource_delete_resolves_the_bucket_by_function_arn(monkeypatch):
+    monkeypatch.syspath_prepend(os.path.join(PROJECT_ROOT, "lambda", "custom_resource"))
+    monkeypatch.setenv("AWS_DEFAULT_REGION", REGION)
+    monkeypatch.setenv("AWS_REGION", REGION)
+    sys.modules.pop("index", None)
+    custom_resource = importlib.import_module("index")
+    client = CountingS3Tables()
+    monkeypatch.setattr(custom_resource, "s3tables_client", client)
+    context = type(
+        "Context",
+        (),
+        {
+            "function_name": "ManageS3TableLambda",
+            "aws_request_id": "1",
+            "invoked_function_arn": (
+                f"arn:aws:lambda:{REGION}:{ACCOUNT}:function:ManageS3TableLambda"
+            ),
+        },
+    )()
+    event = {
+        "RequestType": "Delete",
+        "StackId": "stack",
+        "ResourceProperties": {
+            "table_bucket_name": "streamtablebucket",
+            "table_name": "transactions",
+            "namespace": "analytics",
+        },
+    }
+
+    custom_resource.handler(event, context)
+
+    assert client.calls == [
+        "get_table_bucket",
+        "delete_table",
+        "delete_namespace",
+        "delete_table_bucket",
+    ]
+    sys.modules.pop("index", None)
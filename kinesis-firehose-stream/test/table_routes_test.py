@@ -0,0 +1,353 @@
+import base64
+import importlib
+import importlib.util
+import json
+import os
+import random
+import sys
+import pytest
+import boto3
+from aws_cdk import App
+from aws_cdk.assertions import Match, Template
+from botocore.stub import Stubber
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+sys.path.append(os.path.join(PROJECT_ROOT, "scripts"))
+from create_sample_orders import create_sample_order
+from harness.events import to_attribute_values
+from stack.firehose import FirehoseStack
+from stack.pipeline import PipelineStack
+from stack.table_routes import get_table_routing_settings
+
+LAMBDA_PATH = os.path.join(PROJECT_ROOT, "lambda", "transform", "index.py")
+
+TABLE_ROUTES = [
+    {"source_table": "financial-transactions", "table_name": "transactions"},
+    {
+        "source_table": "orders",
+        "table_name": "orders",
+        "definition": "orders.json",
+        "unique_keys": ["orderId"],
+    },
+]
+
+CONTEXT = {
+    "table_bucket_name": "streamtablebucket",
+    "table_name": "transactions",
+    "namespace": "analytics",
+    "bucket_name": "streambucket",
+    "stream_type": "kinesis",
+    "table_routes": TABLE_ROUTES,
+}
+
+
+def load_transform(monkeypatch, collapse_updates=False):
+    settings = get_table_routing_settings(TABLE_ROUTES, "transactions", "kinesis")
+    monkeypatch.setenv("DESTINATION_DATABASE", "firehoses3tableresourcelink")
+    monkeypatch.setenv("DESTINATION_TABLE", "transactions")
+    monkeypatch.setenv("TABLE_ROUTES", json.dumps(settings.environment()))
+    monkeypatch.setenv("COLLAPSE_UPDATES", str(collapse_updates).lower())
+    spec = importlib.util.spec_from_file_location("transform_index", LAMBDA_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def firehose_record(record_id, table_name, event_name, keys, image=None):
+    dynamodb = {"ApproximateCreationDateTime": 1700000000200, "Keys": keys}
+    if image is not None:
+        dynamodb["OldImage" if event_name == "REMOVE" else "NewImage"] = image
+    payload = {"eventName": event_name, "tableName": table_name, "dynamodb": dynamodb}
+    data = base64.b64encode(json.dumps(payload).encode()).decode()
+    return {"recordId": record_id, "data": data}
+
+
+def transaction(record_id, event_name="INSERT", transaction_id="TXN_1"):
+    keys = to_attribute_values(
+        {"transaction_id": transaction_id, "timestamp": 1700000000123}
+    )
+    image = dict(keys, **to_attribute_values({"amount": "12.50"}))
+    return firehose_record(record_id, "financial-transactions", event_name, keys, image)
+
+
+def order(record_id, event_name="INSERT", order_id=None):
+    item = create_sample_order(random.Random(record_id))
+    if order_id:
+        item["orderId"] = order_id
+    keys = to_attribute_values({"orderId": item["orderId"]})
+    return firehose_record(
+        record_id, "orders", event_name, keys, to_attribute_values(item)
+    )
+
+
+def decoded(output_record):
+    return json.loads(base64.b64decode(output_record["data"]))
+
+
+def test_routes_are_validated():
+    with pytest.raises(ValueError, match="Unknown table_routes settings"):
+        get_table_routing_settings([{"table": "orders"}], "orders", "kinesis")
+    with pytest.raises(ValueError, match="Duplicate table_name"):
+        get_table_routing_settings(
+            [TABLE_ROUTES[0], dict(TABLE_ROUTES[1], table_name="transactions")],
+            "transactions",
+            "kinesis",
+        )
+    with pytest.raises(ValueError, match="must include the transactions table"):
+        get_table_routing_settings(TABLE_ROUTES[1:], "transactions", "kinesis")
+    with pytest.raises(ValueError, match="need stream_type kinesis"):
+        get_table_routing_settings(TABLE_ROUTES, "transactions", "dynamodb")
+    with pytest.raises(ValueError, match="not columns"):
+        get_table_routing_settings(
+            [TABLE_ROUTES[0], dict(TABLE_ROUTES[1], unique_keys=["order_id"])],
+            "transactions",
+            "kinesis",
+        )
+    with pytest.raises(ValueError, match="No table definition"):
+        get_table_routing_settings(
+            [TABLE_ROUTES[0], dict(TABLE_ROUTES[1], definition="customers.json")],
+            "transactions",
+            "kinesis",
+        )
+
+    # Without table_routes, every change goes to the table_name table
+    (route,) = get_table_routing_settings(None, "transactions", "dynamodb").routes
+    assert (route.source_table, route.unique_keys) == ("*", ("transaction_id",))
+
+
+def test_changes_are_routed_by_their_source_table(monkeypatch):
+    transform = load_transform(monkeypatch)
+    event = {
+        "records": [
+            transaction("1"),
+            order("2"),
+            order("3", "REMOVE"),
+            firehose_record("4", "customers", "INSERT", {}, {}),
+        ]
+    }
+
+    output = transform.handler(event, None)["records"]
+
+    assert [r["result"] for r in output] == ["Ok", "Ok", "Ok", "Dropped"]
+    metadata = [r["metadata"]["otfMetadata"] for r in output[:3]]
+    assert [(m["destinationTableName"], m["operation"]) for m in metadata] == [
+        ("transactions", "update"),
+        ("orders", "update"),
+        ("orders", "delete"),
+    ]
+    # Each table's columns are typed by its own definition
+    row = decoded(output[1])
+    assert isinstance(row["totalAmount"], str) and "." in row["totalAmount"]
+    assert row["date"] and row["hour"] is not None
+    # The delete carries the partition columns of the removed order
+    assert decoded(output[2])["date"] and decoded(output[2])["customerId"]
+
+
+def test_invalid_order_is_rejected_by_the_orders_schema(monkeypatch):
+    transform = load_transform(monkeypatch)
+    record = order("1")
+    payload = json.loads(base64.b64decode(record["data"]))
+    del payload["dynamodb"]["NewImage"]["orderId"]
+    record["data"] = base64.b64encode(json.dumps(payload).encode()).decode()
+
+    (output,) = transform.handler({"records": [record]}, None)["records"]
+
+    assert output["result"] == "ProcessingFailed"
+
+
+def test_updates_are_collapsed_per_table(monkeypatch):
+    transform = load_transform(monkeypatch, collapse_updates=True)
+    event = {
+        "records": [
+            transaction("1", transaction_id="SAME"),
+            order("2", order_id="SAME"),
+            order("3", "MODIFY", order_id="SAME"),
+        ]
+    }
+
+    output = transform.handler(event, None)["records"]
+
+    # Equal key values in different tables are different rows
+    assert [r["result"] for r in output] == ["Ok", "Dropped", "Ok"]
+
+
+def test_delivery_stream_has_a_destination_table_per_route():
+    template = Template.from_stack(FirehoseStack(App(context=CONTEXT), "FirehoseStack"))
+
+    template.has_resource_properties(
+        "AWS::KinesisFirehose::DeliveryStream",
+        {
+            "IcebergDestinationConfiguration": Match.object_like(
+                {
+                    "DestinationTableConfigurationList": [
+                        Match.object_like(
+                            {
+                                "DestinationTableName": "transactions",
+                                "UniqueKeys": ["transaction_id"],
+                            }
+                        ),
+                        Match.object_like(
+                            {
+                                "DestinationTableName": "orders",
+                                "UniqueKeys": ["orderId"],
+                            }
+                        ),
+                    ]
+                }
+            )
+        },
+    )
+    (function,) = [
+        resource
+        for resource in template.find_resources("AWS::Lambda::Function").values()
+        if "TABLE_ROUTES"
+        in resource["Properties"].get("Environment", {}).get("Variables", {})
+    ]
+    routes = json.loads(
+        function["Properties"]["Environment"]["Variables"]["TABLE_ROUTES"]
+    )
+    assert [route["source_table"] for route in routes] == [
+        "financial-transactions",
+        "orders",
+    ]
+
+
+def test_custom_resource_creates_every_routed_table(monkeypatch):
+    template = Template.from_stack(PipelineStack(App(context=CONTEXT), "PipelineStack"))
+    (resource,) = template.find_resources("Custom::AWS").values()
+    create = "".join(
+        part
+        for part in resource["Properties"]["Create"]["Fn::Join"][1]
+        if isinstance(part, str)
+    )
+    assert '\\"definition\\": \\"orders.json\\"' in create
+
+    monkeypatch.syspath_prepend(os.path.join(PROJECT_ROOT, "lambda", "custom_resource"))
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    sys.modules.pop("index", None)
+    custom_resource = importlib.import_module("index")
+    s3tables = boto3.client("s3tables", region_name="us-east-1")
+    monkeypatch.setattr(custom_resource, "s3tables_client", s3tables)
+    bucket_arn = "arn:aws:s3tables:us-east-1:123456789012:bucket/streamtablebucket"
+    tables = [{"table_name": "transactions"}, TABLE_ROUTES[1]]
+
+    with Stubber(s3tables) as stubber:
+        stubber.add_response("create_table_bucket", {"arn": bucket_arn})
+        stubber.add_response(
+            "create_namespace",
+            {"tableBucketARN": bucket_arn, "namespace": ["analytics"]},
+        )
+        # Stubber checks both metadata arguments against the S3 Tables API model
+        for table in tables:
+            stubber.add_response(
+                "create_table",
+                {
+                    "tableARN": f"{bucket_arn}/table/{table['table_name']}",
+                    "versionToken": "1",
+                },
+                {
+                    "tableBucketARN": bucket_arn,
+                    "namespace": "analytics",
+                    "name": table["table_name"],
+                    "format": "ICEBERG",
+                    "metadata": custom_resource.create_metadata(table),
+                },
+            )
+        custom_resource.handler(
+            {
+                "RequestType": "Create",
+                "StackId": "stack",
+                "ResourceProperties": {
+                    "table_bucket_name": "streamtablebucket",
+                    "table_name": "transactions",
+                    "namespace": "analytics",
+                    "tables": tables,
+                },
+            },
+            None,
+        )
+        stubber.assert_no_pending_responses()
+
+    orders = custom_resource.create_metadata(TABLE_ROUTES[1])["iceberg"]
+    assert orders["schemaV2"]["fields"][0]["name"] == "orderId"
+    sys.modules.pop("index", None)
+
+
+def test_custom_resource_update_adds_new_tables_and_applies_layouts(monkeypatch):
+    pytest.importorskip("moto")
+    from moto import mock_aws
+    from iceberg_metadata import read_metadata_file
+
+    monkeypatch.syspath_prepend(os.path.join(PROJECT_ROOT, "lambda", "custom_resource"))
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_REGION", "us-east-1")
+    context = type(
+        "Context",
+        (),
+        {
+            "function_name": "ManageS3TableLambda",
+            "aws_request_id": "1",
+            "invoked_function_arn": (
+                "arn:aws:lambda:us-east-1:123456789012:function:ManageS3TableLambda"
+            ),
+        },
+    )()
+
+    def event(request_type, tables):
+        return {
+            "RequestType": request_type,
+            "StackId": "stack",
+            "ResourceProperties": {
+                "table_bucket_name": "streamtablebucket",
+                "table_name": "transactions",
+                "namespace": "analytics",
+                "tables": tables,
+            },
+        }
+
+    with mock_aws():
+        sys.modules.pop("index", None)
+        custom_resource = importlib.import_module("index")
+        s3tables = boto3.client("s3tables", region_name="us-east-1")
+        s3 = boto3.client("s3", region_name="us-east-1")
+        monkeypatch.setattr(custom_resource, "s3tables_client", s3tables)
+        monkeypatch.setattr(custom_resource, "s3_client", s3)
+
+        custom_resource.handler(
+            event("Create", [{"table_name": "transactions"}]), context
+        )
+        # A route and a partition layout added after the first deploy
+        tables = [
+            {"table_name": "transactions", "partition_by": ["date"]},
+            TABLE_ROUTES[1],
+        ]
+        custom_resource.handler(event("Update", tables), context)
+
+        bucket_arn = "arn:aws:s3tables:us-east-1:123456789012:bucket/streamtablebucket"
+        names = {
+            table["name"]
+            for table in s3tables.list_tables(tableBucketARN=bucket_arn)["tables"]
+        }
+        assert names == {"transactions", "orders"}
+        location = s3tables.get_table_metadata_location(
+            tableBucketARN=bucket_arn, namespace="analytics", name="transactions"
+        )["metadataLocation"]
+        metadata = read_metadata_file(s3, location)
+        (spec,) = [
+            spec
+            for spec in metadata["partition-specs"]
+            if spec["spec-id"] == metadata["default-spec-id"]
+        ]
+        assert [field["name"] for field in spec["fields"]] == ["date"]
+
+        # Running it again changes nothing
+        custom_resource.handler(event("Update", tables), context)
+        assert (
+            s3tables.get_table_metadata_location(
+                tableBucketARN=bucket_arn, namespace="analytics", name="transactions"
+            )["metadataLocation"]
+            == location
+        )
+    sys.modules.pop("index", None)
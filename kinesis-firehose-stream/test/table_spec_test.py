@@ -0,0 +1,188 @@
+import importlib
+import json
+import os
+import re
+import sys
+import pytest
+import boto3
+from aws_cdk import App
+from aws_cdk.assertions import Template
+from botocore.stub import Stubber
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+from stack.pipeline import PipelineStack
+from stack.table_layout import get_table_layout_settings
+from table_resolver import TableResolver
+from table_spec import (
+    athena_ddl,
+    load_table_definition,
+    partition_spec,
+    schema_fields,
+    sort_order,
+    table_metadata,
+)
+
+TABLE_DEFINITION = load_table_definition()
+FIELDS = schema_fields(TABLE_DEFINITION)
+
+
+def test_table_definition_spec_matches_its_expressions():
+    iceberg = TABLE_DEFINITION["metadata"]["iceberg"]
+    assert iceberg["partitionSpec"] == partition_spec(
+        FIELDS, ["date", "bucket(16, customer_id)"]
+    )
+    assert iceberg["writeOrder"] == sort_order(FIELDS, ["timestamp"])
+    assert [field["id"] for field in FIELDS] == list(range(1, len(FIELDS) + 1))
+
+
+def test_partition_spec_from_expressions():
+    spec = partition_spec(FIELDS, ["month(date)", "truncate(4, region)"])
+    assert spec["fields"] == [
+        {"sourceId": 4, "transform": "month", "name": "date_month", "fieldId": 1000},
+        {
+            "sourceId": 12,
+            "transform": "truncate[4]",
+            "name": "region_truncate",
+            "fieldId": 1001,
+        },
+    ]
+    order = sort_order(FIELDS, ["timestamp desc", "customer_id"])
+    assert [
+        (f["sourceId"], f["direction"], f["nullOrder"]) for f in order["fields"]
+    ] == [
+        (2, "desc", "nulls-last"),
+        (3, "asc", "nulls-first"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "expression, message",
+    [
+        # timestamp holds epoch milliseconds in a long column
+        ("day(timestamp)", "day cannot be applied to long"),
+        ("bucket(customer_id)", "Wrong number of arguments"),
+        ("bucket(16, card_number)", "Unknown column"),
+        ("zorder(customer_id)", "Unsupported transform"),
+        ("bucket(16 customer_id)", "Invalid expression"),
+    ],
+)
+def test_invalid_expressions_are_rejected(expression, message):
+    with pytest.raises(ValueError, match=message):
+        partition_spec(FIELDS, [expression])
+
+
+def test_athena_ddl_has_the_table_schema_and_partitions():
+    ddl = athena_ddl(TABLE_DEFINITION, "default", "temptable", "s3://warehouse")
+
+    columns = re.findall(r"^    `(\w+)` (\S+?),?$", ddl, re.MULTILINE)
+    assert [name for name, _ in columns] == [field["name"] for field in FIELDS]
+    assert ("amount", "DECIMAL(12,2)") in columns
+    assert "PARTITIONED BY (`date`, bucket(16, `customer_id`))" in ddl
+    assert "STRUCT" not in ddl
+
+
+def test_custom_resource_creates_the_table_with_partitions_and_write_order(
+    monkeypatch,
+):
+    monkeypatch.syspath_prepend(os.path.join(PROJECT_ROOT, "lambda", "custom_resource"))
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    sys.modules.pop("index", None)
+    custom_resource = importlib.import_module("index")
+    s3tables = boto3.client("s3tables", region_name="us-east-1")
+    bucket_arn = "arn:aws:s3tables:us-east-1:123456789012:bucket/streamtablebucket"
+    metadata = table_metadata(TABLE_DEFINITION, ["bucket(8, customer_id)"])
+
+    with Stubber(s3tables) as stubber:
+        stubber.add_response("create_table_bucket", {"arn": bucket_arn})
+        stubber.add_response(
+            "create_namespace",
+            {"tableBucketARN": bucket_arn, "namespace": ["analytics"]},
+        )
+        # Stubber validates the metadata against the S3 Tables API model
+        stubber.add_response(
+            "create_table",
+            {"tableARN": f"{bucket_arn}/table/1", "versionToken": "1"},
+            {
+                "tableBucketARN": bucket_arn,
+                "namespace": "analytics",
+                "name": "transactions",
+                "format": "ICEBERG",
+                "metadata": metadata,
+            },
+        )
+        custom_resource.create_tables(
+            s3tables,
+            TableResolver(s3tables),
+            "streamtablebucket",
+            ["analytics"],
+            [("transactions", metadata)],
+        )
+
+    iceberg = metadata["iceberg"]
+    assert iceberg["partitionSpec"]["fields"][0]["transform"] == "bucket[8]"
+    assert (
+        iceberg["writeOrder"] == TABLE_DEFINITION["metadata"]["iceberg"]["writeOrder"]
+    )
+    sys.modules.pop("index", None)
+
+
+def test_table_layout_overrides_reach_the_custom_resource():
+    app = App(
+        context={
+            "table_bucket_name": "streamtablebucket",
+            "table_name": "transactions",
+            "namespace": "analytics",
+            "bucket_name": "streambucket",
+            "stream_type": "dynamodb",
+            "table_layout": {"partition_by": ["date", "bucket(32, customer_id)"]},
+        }
+    )
+    template = Template.from_stack(PipelineStack(app, "PipelineStack"))
+
+    # The Create call is a JSON string joined with the function name and stack id
+    (resource,) = template.find_resources("Custom::AWS").values()
+    create = "".join(
+        part
+        for part in resource["Properties"]["Create"]["Fn::Join"][1]
+        if isinstance(part, str)
+    )
+    partition_by = json.dumps({"partition_by": ["date", "bucket(32, customer_id)"]})
+    assert json.dumps(partition_by[1:-1])[1:-1] in create
+    assert "sort_by" not in create
+
+
+def test_invalid_table_layout_is_rejected():
+    with pytest.raises(ValueError, match="Unknown table_layout settings"):
+        get_table_layout_settings({"partition": ["date"]})
+    with pytest.raises(ValueError, match="day cannot be applied"):
+        get_table_layout_settings({"partition_by": ["day(timestamp)"]})
+
+
+def test_table_layout_is_checked_against_the_routed_table():
+    context = {
+        "table_bucket_name": "streamtablebucket",
+        "table_name": "orders",
+        "namespace": "analytics",
+        "bucket_name": "streambucket",
+        "stream_type": "dynamodb",
+        "table_routes": [
+            {
+                "table_name": "orders",
+                "definition": "orders.json",
+                "unique_keys": ["orderId"],
+            }
+        ],
+    }
+    # customer_id is a column of tabledefinition.json, but not of orders.json
+    with pytest.raises(ValueError, match="customer_id"):
+        PipelineStack(
+            App(context=dict(context, table_layout={"partition_by": ["customer_id"]})),
+            "PipelineStack",
+        )
+
+    PipelineStack(
+        App(context=dict(context, table_layout={"partition_by": ["customerId"]})),
+        "PipelineStack",
+    )
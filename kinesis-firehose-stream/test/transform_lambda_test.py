@@ -0,0 +1,354 @@
+import base64
+import importlib.util
+import json
+import os
+import sys
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+LAMBDA_PATH = os.path.join(PROJECT_ROOT, "lambda", "transform", "index.py")
+
+
+def load_transform(monkeypatch, collapse_updates=False):
+    monkeypatch.setenv("DESTINATION_DATABASE", "firehoses3tableresourcelink")
+    monkeypatch.setenv("DESTINATION_TABLE", "transactions")
+    monkeypatch.setenv("COLLAPSE_UPDATES", str(collapse_updates).lower())
+    spec = importlib.util.spec_from_file_location("transform_index", LAMBDA_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def transform(monkeypatch):
+    return load_transform(monkeypatch)
+
+
+def firehose_record(record_id, payload):
+    data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    return {"recordId": record_id, "data": base64.b64encode(data).decode()}
+
+
+def change(
+    event_name, transaction_id="TXN_1", created_ms=1700000000200, status="APPROVED"
+):
+    keys = {
+        "transaction_id": {"S": transaction_id},
+        "timestamp": {"N": "1700000000123"},
+    }
+    image = dict(
+        keys, customer_id={"S": "CUST_1"}, amount={"N": "12.5"}, status={"S": status}
+    )
+    return {
+        "eventName": event_name,
+        "dynamodb": {
+            "ApproximateCreationDateTime": created_ms,
+            "Keys": keys,
+            "NewImage": image,
+            "OldImage": image,
+        },
+    }
+
+
+def decoded(output_record):
+    return json.loads(base64.b64decode(output_record["data"]))
+
+
+def test_every_record_gets_a_result(transform):
+    event = {
+        "records": [
+            firehose_record("1", change("INSERT")),
+            firehose_record("2", change("MODIFY")),
+            firehose_record("3", change("REMOVE")),
+            firehose_record("4", {"eventName": "UNKNOWN"}),
+            firehose_record("5", b"not json"),
+        ]
+    }
+
+    output = transform.handler(event, None)["records"]
+
+    assert [(r["recordId"], r["result"]) for r in output] == [
+        ("1", "Ok"),
+        ("2", "Ok"),
+        ("3", "Ok"),
+        ("4", "Dropped"),
+        ("5", "ProcessingFailed"),
+    ]
+
+
+def test_upserts_carry_typed_values_and_partition_fields(transform):
+    output = transform.handler(
+        {"records": [firehose_record("1", change("INSERT"))]}, None
+    )
+    record = output["records"][0]
+
+    assert record["metadata"]["otfMetadata"] == {
+        "destinationDatabaseName": "firehoses3tableresourcelink",
+        "destinationTableName": "transactions",
+        "operation": "update",
+    }
+    item = decoded(record)
+    assert item["amount"] == "12.50"
+    assert item["timestamp"] == 1700000000123
+    assert {"date", "hour", "minute"} <= item.keys()
+
+
+def test_remove_becomes_a_delete_in_the_partition_of_the_old_image(transform):
+    output = transform.handler(
+        {"records": [firehose_record("1", change("REMOVE"))]}, None
+    )
+    record = output["records"][0]
+
+    assert record["metadata"]["otfMetadata"]["operation"] == "delete"
+    item = decoded(record)
+    assert item["transaction_id"] == "TXN_1"
+    # The partition columns, derived as for an upsert
+    assert (item["date"], item["customer_id"]) == ("2023-11-14", "CUST_1")
+
+
+def test_remove_without_partition_columns_fails(transform, capsys):
+    keys_only = change("REMOVE")
+    del keys_only["dynamodb"]["OldImage"]
+    no_customer = change("REMOVE")
+    del no_customer["dynamodb"]["OldImage"]["customer_id"]
+    event = {
+        "records": [
+            firehose_record("1", keys_only),
+            firehose_record("2", no_customer),
+        ]
+    }
+
+    output = transform.handler(event, None)["records"]
+
+    assert [r["result"] for r in output] == ["ProcessingFailed", "ProcessingFailed"]
+    summary = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert summary["invalid_unpartitioned_delete"] == 2
+
+
+def test_one_summary_line_per_invocation(transform, capsys):
+    event = {
+        "records": [firehose_record(str(i), change("INSERT")) for i in range(50)]
+        + [firehose_record("bad", b"not json")]
+    }
+
+    transform.handler(event, None)
+
+    lines = capsys.readouterr().out.strip().splitlines()
+    summary = json.loads(lines[-1])
+    assert summary["function"] == "transform"
+    assert summary["records_in"] == 51
+    assert summary["records_ok"] == 50
+    assert summary["records_failed"] == 1
+    assert summary["bytes_out"] > 0
+    assert {"decode_ms", "encode_ms"} <= summary.keys()
+    assert len(lines) == 2  # the summary and the error for the bad record
+
+
+def test_invalid_records_fail_with_a_reason_count(transform, capsys):
+    missing_key = change("INSERT")
+    del missing_key["dynamodb"]["NewImage"]["transaction_id"]
+    too_large = change("MODIFY")
+    too_large["dynamodb"]["NewImage"]["amount"] = {"N": "12345678901.5"}
+    event = {
+        "records": [
+            firehose_record("1", missing_key),
+            firehose_record("2", too_large),
+            firehose_record("3", change("INSERT")),
+        ]
+    }
+
+    output = transform.handler(event, None)["records"]
+
+    assert [r["result"] for r in output] == [
+        "ProcessingFailed",
+        "ProcessingFailed",
+        "Ok",
+    ]
+    assert output[0]["data"] == event["records"][0]["data"]
+    summary = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert summary["invalid_missing_required"] == 1
+    assert summary["invalid_precision_overflow"] == 1
+    assert summary["records_failed"] == 2
+
+
+def test_single_record_aggregates_are_unpacked(transform, capsys):
+    from kpl import aggregate
+
+    payload = json.dumps(change("INSERT")).encode()
+    event = {
+        "records": [
+            firehose_record("1", aggregate([("TXN_1", payload)])),
+            firehose_record("2", aggregate([("TXN_1", payload), ("TXN_2", payload)])),
+        ]
+    }
+
+    output = transform.handler(event, None)["records"]
+
+    assert [r["result"] for r in output] == ["Ok", "ProcessingFailed"]
+    assert decoded(output[0])["transaction_id"] == "TXN_1"
+    summary = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert summary["aggregated_in"] == 1
+    assert summary["aggregated_not_expanded"] == 1
+
+
+def test_collapse_keeps_the_newest_change_per_key(monkeypatch, capsys):
+    transform = load_transform(monkeypatch, collapse_updates=True)
+    event = {
+        "records": [
+            firehose_record("1", change("INSERT", created_ms=1, status="PENDING")),
+            firehose_record("2", change("MODIFY", created_ms=3, status="APPROVED")),
+            firehose_record("3", change("INSERT", "TXN_2")),
+            # Arrives after a newer change to the same key
+            firehose_record("4", change("MODIFY", created_ms=2, status="DECLINED")),
+            firehose_record("5", change("MODIFY", "TXN_2")),
+            firehose_record("6", b"not json"),
+        ]
+    }
+
+    output = transform.handler(event, None)["records"]
+
+    assert [r["result"] for r in output] == [
+        "Dropped",
+        "Ok",
+        "Dropped",
+        "Dropped",
+        "Ok",
+        "ProcessingFailed",
+    ]
+    assert decoded(output[1])["status"] == "APPROVED"
+    assert output[0]["data"] == event["records"][0]["data"]
+    summary = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert summary["records_superseded"] == 3
+    assert summary["collapse_ratio"] == 0.6
+
+
+def test_collapse_turns_insert_then_remove_into_a_delete(monkeypatch):
+    transform = load_transform(monkeypatch, collapse_updates=True)
+    event = {
+        "records": [
+            firehose_record("1", change("INSERT")),
+            firehose_record("2", change("REMOVE")),
+        ]
+    }
+
+    output = transform.handler(event, None)["records"]
+
+    assert [r["result"] for r in output] == ["Dropped", "Ok"]
+    assert output[1]["metadata"]["otfMetadata"]["operation"] == "delete"
+
+
+def test_collapse_is_off_by_default(transform):
+    event = {"records": [firehose_record(str(i), change("MODIFY")) for i in range(3)]}
+
+    output = transform.handler(event, None)["records"]
+
+    assert [r["result"] for r in output] == ["Ok", "Ok", "Ok"]
+
+
+class StubKinesis:
+    def __init__(self):
+        self.puts = []
+
+    def put_records(self, StreamARN, Records):
+        self.puts.append((StreamARN, Records))
+        return {"Records": [{"SequenceNumber": "1"} for _ in Records]}
+
+
+def moved_change(customer_id):
+    payload = change("MODIFY")
+    new_image = dict(payload["dynamodb"]["NewImage"], customer_id={"S": customer_id})
+    payload["dynamodb"]["NewImage"] = new_image
+    return payload
+
+
+@pytest.fixture
+def kinesis(transform, monkeypatch):
+    stub = StubKinesis()
+    monkeypatch.setattr(transform, "SOURCE_STREAM_ARN", "arn:stream")
+    monkeypatch.setattr(transform, "kinesis_client", stub)
+    return stub
+
+
+def test_modify_to_another_partition_deletes_the_old_row(transform, kinesis):
+    # CUST_1 and CUST_2 fall in different customer_id buckets
+    output = transform.handler(
+        {"records": [firehose_record("1", moved_change("CUST_2"))]}, None
+    )
+
+    assert decoded(output["records"][0])["customer_id"] == "CUST_2"
+    ((stream_arn, entries),) = kinesis.puts
+    assert stream_arn == "arn:stream"
+    (entry,) = entries
+    assert entry["PartitionKey"]
+    remove = json.loads(entry["Data"])
+    assert remove["eventName"] == "REMOVE"
+
+    # Coming back through the stream, it deletes the row in the old partition
+    output = transform.handler({"records": [firehose_record("2", remove)]}, None)
+    record = output["records"][0]
+    assert record["metadata"]["otfMetadata"]["operation"] == "delete"
+    item = decoded(record)
+    assert (item["date"], item["customer_id"]) == ("2023-11-14", "CUST_1")
+    assert not kinesis.puts[1:]
+
+
+def test_modify_within_a_partition_puts_nothing(transform, kinesis):
+    transform.handler(
+        {
+            "records": [
+                firehose_record("1", change("MODIFY", status="DECLINED")),
+                # CUST_1 and CUST_17 share a customer_id bucket
+                firehose_record("2", moved_change("CUST_17")),
+            ]
+        },
+        None,
+    )
+
+    assert kinesis.puts == []
+
+
+def test_collapse_keeps_deletes_of_moved_rows(monkeypatch):
+    transform = load_transform(monkeypatch, collapse_updates=True)
+    stub = StubKinesis()
+    monkeypatch.setattr(transform, "SOURCE_STREAM_ARN", "arn:stream")
+    monkeypatch.setattr(transform, "kinesis_client", stub)
+    remove = moved_change("CUST_2")
+    remove["eventName"] = "REMOVE"
+    remove[transform.PARTITION_MOVE_FIELD] = True
+    event = {
+        "records": [
+            firehose_record("1", moved_change("CUST_2")),
+            firehose_record("2", change("MODIFY", created_ms=1700000000300)),
+            firehose_record("3", remove),
+        ]
+    }
+
+    output = transform.handler(event, None)["records"]
+
+    # A delete from the stream does not replace the newer row of its key
+    assert [r["result"] for r in output] == ["Dropped", "Ok", "Ok"]
+    # The item moved back to its old partition within the batch, where a
+    # delete would remove the newest row
+    assert stub.puts == []
+
+    output = transform.handler(
+        {"records": [firehose_record("1", moved_change("CUST_2"))] * 2}, None
+    )["records"]
+
+    # The superseded MODIFY still moved the item out of its old partition,
+    # which is deleted once
+    assert [r["result"] for r in output] == ["Dropped", "Ok"]
+    assert len(stub.puts[0][1]) == 1
+
+
+def test_unwritten_moves_fail_the_invocation(transform, kinesis, monkeypatch):
+    monkeypatch.setattr(transform, "backoff_seconds", lambda attempt: 0)
+    kinesis.put_records = lambda StreamARN, Records: {
+        "Records": [{"ErrorCode": "ProvisionedThroughputExceededException"}]
+    }
+
+    with pytest.raises(RuntimeError, match="1 partition moves"):
+        transform.handler(
+            {"records": [firehose_record("1", moved_change("CUST_2"))]}, None
+        )
@@ -0,0 +1,87 @@
+import os
+import subprocess
+import sys
+from decimal import Decimal
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, "lambda", "shared", "python"))
+from validator import build_validation_plan, load_validation_plan, validate
+
+VALID = {
+    "transaction_id": "TXN_1",
+    "timestamp": 1700000000123,
+    "date": "2023-11-14",
+    "hour": 22,
+    "minute": 13,
+    "amount": Decimal("9999999999.99"),
+    "status": "APPROVED",
+}
+
+
+def test_valid_items_pass():
+    plan = load_validation_plan()
+    assert validate(VALID, plan) is None
+    # Optional columns may be absent or null
+    assert validate({"transaction_id": "TXN_1", "amount": None}, plan) is None
+
+
+def test_reports_the_column_and_reason():
+    plan = load_validation_plan()
+    cases = [
+        ({"transaction_id": None}, ("transaction_id", "missing_required")),
+        ({"hour": 2**31}, ("hour", "out_of_range")),
+        ({"timestamp": -(2**63) - 1}, ("timestamp", "out_of_range")),
+        ({"amount": Decimal("-10000000000.00")}, ("amount", "precision_overflow")),
+        ({"date": "2023-13-01"}, ("date", "bad_format")),
+        ({"date": "2023-11-14T00:00"}, ("date", "bad_format")),
+        ({"date": "2024-02-31"}, ("date", "bad_format")),
+        ({"date": "2023-02-29"}, ("date", "bad_format")),
+        ({"date": "2023-04-00"}, ("date", "bad_format")),
+        ({"hour": "7"}, ("hour", "wrong_type")),
+        ({"amount": Decimal("NaN")}, ("amount", "wrong_type")),
+        ({"date": 20231114}, ("date", "wrong_type")),
+    ]
+    for change, expected in cases:
+        assert validate(dict(VALID, **change), plan) == expected
+
+
+def test_plan_follows_the_schema():
+    plan = build_validation_plan(
+        [
+            {"name": "id", "type": "long", "required": True},
+            {"name": "price", "type": "decimal(4, 1)"},
+            {"name": "tags", "type": {"type": "list", "element": "string"}},
+        ]
+    )
+    assert plan.required == ("id",)
+    assert [name for name, *_ in plan.bounded] == ["id", "price"]
+    assert validate({"id": 1, "price": Decimal("999.9")}, plan) is None
+    assert validate({"id": 1, "price": Decimal("1000.0")}, plan) == (
+        "price",
+        "precision_overflow",
+    )
+    assert validate({"price": Decimal("1.0")}, plan) == ("id", "missing_required")
+
+
+def test_leap_days_are_valid_dates():
+    plan = load_validation_plan()
+    assert validate(dict(VALID, date="2024-02-29"), plan) is None
+    assert validate(dict(VALID, date="2000-02-29"), plan) is None
+    assert validate(dict(VALID, date="1900-02-29"), plan) == ("date", "bad_format")
+
+
+def test_validation_stays_within_its_budget():
+    # The benchmark exits non-zero when validation takes longer than its
+    # per-record budget
+    result = subprocess.run(
+        [
+            sys.executable,
+            os.path.join(PROJECT_ROOT, "benchmarks", "validator_bench.py"),
+            "--records",
+            "20000",
+            "--check",
+        ],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr